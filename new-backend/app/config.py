@@ -69,12 +69,37 @@ class Settings(BaseSettings):
     instance_count: int = 4
     max_concurrent_tasks: int = 100
     sync_stores_mode: str = "leader"  # "leader" or "shard"
+    demper_feed_batch_size: int = 500        # Max products pulled from DB per scheduler feed
+    demper_feed_lookahead_seconds: int = 30  # Queue products that become due within this window
+    demper_flush_interval_seconds: float = 2.0  # Write-behind flush interval (max data loss on crash)
+    demper_flush_max_pending: int = 1000        # Buffered writes that trigger an early flush
+    session_cache_ttl_seconds: int = 300        # Re-check cached session version after this long
+
+    # Orders Engine (app.workers.orders_worker, stores sharded like demper products)
+    orders_instance_index: int = 0
+    orders_instance_count: int = 1
+    orders_max_concurrent_stores: int = 12    # Stores synced in parallel per shard
+    orders_poll_min_seconds: int = 120        # Stores with order changes in the last cycle
+    orders_poll_default_seconds: int = 480    # Cap for stores with open orders or WA automation on
+    orders_poll_max_seconds: int = 1800       # Idle stores back off up to this
 
     # Browser Farm
     browser_shards: int = 4
     max_concurrency_per_proxy: int = 8
+    proxy_stats_flush_interval_seconds: float = 5.0  # Proxy stats and state changes written to DB this often
+    distributed_proxy_state: bool = True     # Share proxy budgets, rests and dead marks across processes via Redis
+    proxy_budget_batch_size: int = 10        # Proxy requests reserved from Redis per round-trip
+    proxy_probe_enabled: bool = True         # Background health probes of pool proxies (API process)
+    proxy_probe_url: str = "http://www.gstatic.com/generate_204"  # Cheap request sent through each proxy
+    proxy_probe_interval_seconds: int = 300
+    proxy_probe_timeout_seconds: float = 10.0
+    proxy_probe_concurrency: int = 20
+    proxy_probe_max_failures: int = 3        # Consecutive failed probes before quarantine
+    proxy_probe_max_p95_ms: int = 5000       # Slower p95 (enough samples) means quarantine
+    proxy_quarantine_minutes: int = 30
     request_timeout_ms: int = 15000
     idle_context_ttl: int = 300
+    browser_idle_ttl: int = 900  # Seconds a shard with no contexts keeps Chromium running
     global_rps: int = 60  # Used by browser_farm (legacy)
 
     # Per-endpoint rate limits (based on rate limit testing 2026-02-08)
@@ -83,6 +108,18 @@ class Settings(BaseSettings):
     pricefeed_cooldown_seconds: int = 1800    # 30-min cooldown after pricefeed 429
     offers_ban_pause_seconds: int = 15        # Pause after 403 from offers API
     priority_check_interval_minutes: int = 3  # Priority products checked every 3 min
+    pricefeed_batch_size: int = 1             # SKUs per pricefeed upload (Kaspi documents 1 per request)
+    pricefeed_batch_window_ms: int = 200      # Wait for more SKUs before a multi-item upload
+    distributed_rate_limits: bool = True      # Share buckets/cooldowns across processes via Redis
+    rate_limit_batch_size: float = 2.0        # Tokens leased from Redis per round-trip (offers/orders)
+    orders_api_token_rps: float = 6.0         # Kaspi REST API (orders/products) per X-Auth-Token
+    orders_page_concurrency: int = 4          # Orders list pages fetched in parallel per store
+    product_image_concurrency: int = 4        # Product image lookups in flight during image backfill
+
+    # Competitor offers cache (in-process LRU + Redis)
+    offers_cache_ttl_seconds: int = 30           # Max age of a cached offers response (0 = disabled)
+    offers_cache_priority_ttl_seconds: int = 10  # Stricter max age for priority products
+    offers_cache_local_size: int = 2000          # Entries kept in the in-process LRU
 
     # Kaspi API
     kaspi_api_base_url: str = "https://kaspi.kz/shop/api"
@@ -101,6 +138,14 @@ class Settings(BaseSettings):
     waha_plus: bool = True  # WAHA Plus activated (supports multiple sessions, NOWEB engine)
     waha_otp_session: str = "default"  # WAHA session for OTP codes (active session on WAHA Plus)
 
+    # Order events dispatcher (order_events_outbox -> notifications / WhatsApp, runs in the orders worker)
+    order_events_concurrency: int = 8              # Events processed in parallel per orders worker
+    order_events_max_attempts: int = 5             # Then the event is marked failed
+    whatsapp_session_messages_per_minute: float = 20.0  # Order messages per WhatsApp session (user)
+    whatsapp_session_burst: int = 3
+    order_customer_cache_ttl_seconds: int = 3600   # Resolved order customers reused in memory
+    order_customer_cache_size: int = 5000
+
     # Railway Integration (optional, for per-user WAHA containers)
     railway_api_token: Optional[str] = None
     railway_project_id: Optional[str] = None
@@ -116,6 +161,7 @@ class Settings(BaseSettings):
     proxy6_api_key: Optional[str] = None
     proxy_pool_min_size: int = 500  # Minimum proxies in pool before auto-purchase
     proxy_auto_purchase: bool = True  # Enable automatic proxy purchasing
+    proxy_client_pool_size: int = 64  # Keep-alive HTTP clients per process (one per proxy URL, LRU)
 
     # TipTopPay (Billing)
     tiptoppay_public_id: Optional[str] = None
@@ -133,6 +179,11 @@ class Settings(BaseSettings):
     log_level: str = "INFO"
     log_file: str = "logs/app.log"
 
+    # Metrics (Prometheus text format)
+    metrics_port: int = 9100                     # Per-worker /metrics port, demper shards add instance_index (0 = off)
+    orders_metrics_port: int = 9200              # Orders engine shards add orders_instance_index (0 = off)
+    metrics_publish_interval_seconds: int = 15   # Snapshot to Redis for /health/metrics (0 = off)
+
     @model_validator(mode='after')
     def validate_secrets(self):
         if 'change-in-production' in self.secret_key:
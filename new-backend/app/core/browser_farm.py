@@ -26,7 +26,8 @@ class BrowserShard:
     Single browser shard managing multiple contexts.
 
     Each shard maintains a pool of browser contexts and handles
-    garbage collection of idle contexts.
+    garbage collection of idle contexts. Chromium is launched on first use
+    and closed again once the shard has been idle for browser_idle_ttl.
     """
 
     def __init__(self, shard_id: str):
@@ -36,9 +37,20 @@ class BrowserShard:
         self._lock = asyncio.Lock()
         self._playwright = None
         self._initialized = False
+        self._last_used = datetime.now()
+
+    @property
+    def is_running(self) -> bool:
+        return self._initialized
 
     async def initialize(self):
         """Initialize Playwright and browser"""
+        async with self._lock:
+            await self._launch()
+
+    async def _launch(self):
+        """Start Chromium if not running (caller holds _lock)"""
+        self._last_used = datetime.now()
         if self._initialized:
             return
 
@@ -60,12 +72,12 @@ class BrowserShard:
 
     async def get_context(self, proxy: Optional[Dict[str, str]] = None) -> BrowserContext:
         """Get or create browser context with optional proxy"""
-        if not self._initialized:
-            await self.initialize()
-
         proxy_key = f"{proxy.get('server', 'direct')}" if proxy else "direct"
 
         async with self._lock:
+            # Launch under the lock so an idle teardown cannot interleave
+            await self._launch()
+
             # Check if context exists and is still valid
             if proxy_key in self.contexts:
                 context, last_used = self.contexts[proxy_key]
@@ -211,27 +223,38 @@ class BrowserShard:
             for key in to_remove:
                 del self.contexts[key]
 
+            # No contexts left and unused for browser_idle_ttl: stop Chromium,
+            # the next get_context() launches it again
+            idle_ttl = timedelta(seconds=settings.browser_idle_ttl)
+            if self._initialized and not self.contexts and now - self._last_used > idle_ttl:
+                logger.info(f"Browser shard {self.shard_id} idle, shutting down")
+                await self._close_browser()
+
     async def close(self):
         """Close all contexts and browser"""
         async with self._lock:
-            for context, _ in self.contexts.values():
-                try:
-                    await context.close()
-                except Exception as e:
-                    logger.error(f"Error closing context: {e}")
+            await self._close_browser()
+
+    async def _close_browser(self):
+        """Close all contexts and browser (caller holds _lock)"""
+        for context, _ in self.contexts.values():
+            try:
+                await context.close()
+            except Exception as e:
+                logger.error(f"Error closing context: {e}")
 
-            self.contexts.clear()
+        self.contexts.clear()
 
-            if self.browser:
-                await self.browser.close()
-                self.browser = None
+        if self.browser:
+            await self.browser.close()
+            self.browser = None
 
-            if self._playwright:
-                await self._playwright.stop()
-                self._playwright = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
 
-            self._initialized = False
-            logger.info(f"Browser shard {self.shard_id} closed")
+        self._initialized = False
+        logger.info(f"Browser shard {self.shard_id} closed")
 
 
 class BrowserFarmSharded:
@@ -239,7 +262,8 @@ class BrowserFarmSharded:
     Sharded browser farm for distributed request handling.
 
     Manages multiple browser shards with automatic load balancing
-    and garbage collection.
+    and garbage collection. Creating the farm is cheap: no Chromium runs
+    until a shard is used, and idle shards are shut down again.
     """
 
     def __init__(self, num_shards: int = None):
@@ -249,13 +273,16 @@ class BrowserFarmSharded:
         self._running = False
 
     async def initialize(self):
-        """Initialize all shards"""
-        await asyncio.gather(*[shard.initialize() for shard in self.shards])
+        """Start garbage collection; shards launch Chromium on first use"""
         self._running = True
 
         # Start garbage collection task
         self._gc_task = asyncio.create_task(self._gc_loop())
-        logger.info(f"Browser farm initialized with {self.num_shards} shards")
+        logger.info(f"Browser farm initialized with {self.num_shards} shards (lazy)")
+
+    async def warm_up(self):
+        """Launch every shard now instead of on first use"""
+        await asyncio.gather(*[shard.initialize() for shard in self.shards])
 
     def _pick_shard(self, proxy: Optional[Dict[str, str]] = None) -> BrowserShard:
         """Pick shard based on proxy (for consistent routing)"""
@@ -309,7 +336,12 @@ browser_farm: Optional[BrowserFarmSharded] = None
 
 
 async def get_browser_farm() -> BrowserFarmSharded:
-    """Get global browser farm instance"""
+    """
+    Get global browser farm instance.
+
+    Call it only on paths that need Playwright (Kaspi login); shards start
+    Chromium on their first request.
+    """
     global browser_farm
     if browser_farm is None:
         try:
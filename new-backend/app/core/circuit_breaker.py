@@ -18,6 +18,8 @@ from enum import Enum
 from typing import Optional
 from dataclasses import dataclass
 
+from .metrics import get_metrics
+
 logger = logging.getLogger(__name__)
 
 
@@ -228,6 +230,24 @@ def get_all_circuit_breakers() -> dict[str, CircuitBreaker]:
     return _circuit_breakers.copy()
 
 
+# closed=0, half_open=1, open=2
+_STATE_METRIC_VALUES = {
+    CircuitState.CLOSED: 0,
+    CircuitState.HALF_OPEN: 1,
+    CircuitState.OPEN: 2,
+}
+
+get_metrics().gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state (0=closed, 1=half_open, 2=open)",
+    ["circuit"],
+    callback=lambda: {
+        (name,): _STATE_METRIC_VALUES[breaker.state]
+        for name, breaker in _circuit_breakers.items()
+    },
+)
+
+
 # Pre-configured circuit breakers for common services
 
 def get_kaspi_circuit_breaker() -> CircuitBreaker:
@@ -0,0 +1,341 @@
+"""
+Metrics - Prometheus counters, gauges and histograms (prometheus_client).
+
+Every process (API, each demper shard, orders worker) keeps its own registry:
+- served locally by MetricsExporter on settings.metrics_port
+  (+ instance index for demper shards) with prometheus_client's HTTP server
+- published as Prometheus text to Redis every settings.metrics_publish_interval_seconds,
+  so GET /health/metrics on the API can render all processes at once with an
+  `instance` label (stale snapshots are dropped)
+
+Processes forked on one host (uvicorn --workers) share their counters through
+prometheus_client multiprocess mode when PROMETHEUS_MULTIPROC_DIR is set (an
+empty directory, wiped on every deploy). Callback metrics are read at
+collection time and only cover the process that serves the scrape.
+
+Instruments are cheap (no I/O) and safe to call from hot paths.
+Label values must have bounded cardinality (status codes, limiter names,
+modules) - never product or merchant IDs.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple, Union
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    disable_created_metrics,
+    generate_latest,
+    start_http_server,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+from prometheus_client.multiprocess import MultiProcessCollector
+from prometheus_client.parser import text_string_to_metric_families
+from prometheus_client.registry import Collector
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Queue lag can reach minutes when shards are undersized
+LAG_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# *_created series double the output and nothing reads them
+disable_created_metrics()
+
+
+class CallbackMetric(Collector):
+    """
+    Counter or gauge whose values are read from a callback at collection time.
+
+    Reads totals kept elsewhere (e.g. OffersCache.stats, queue lengths)
+    instead of duplicating them. The callback returns {label values: value}.
+    """
+
+    def __init__(
+        self,
+        family: type,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Dict[LabelValues, float]],
+    ):
+        self._family = family
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def describe(self):
+        return [self._family(self.name, self.documentation, labels=self.labelnames)]
+
+    def collect(self):
+        family = self._family(self.name, self.documentation, labels=self.labelnames)
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.debug(f"Metric callback {self.name} failed: {e}")
+            values = {}
+        for key, value in values.items():
+            family.add_metric([str(label) for label in key], value)
+        yield family
+
+
+class MetricsRegistry:
+    """Named metrics of one process, created once and shared by name."""
+
+    def __init__(self):
+        self.registry = CollectorRegistry()
+        self._metrics: Dict[str, Union[Counter, Gauge, Histogram, CallbackMetric]] = {}
+        self._callbacks = CollectorRegistry()
+        self._exposed: Optional[CollectorRegistry] = None
+
+    def counter(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ) -> Union[Counter, CallbackMetric]:
+        """Get or create a counter; a callback replaces any previous one."""
+        if callback is not None:
+            return self._register_callback(CounterMetricFamily, name, documentation, labelnames, callback)
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ) -> Union[Gauge, CallbackMetric]:
+        """Get or create a gauge; a callback replaces any previous one."""
+        if callback is not None:
+            return self._register_callback(GaugeMetricFamily, name, documentation, labelnames, callback)
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(
+                name, documentation, labelnames, registry=self.registry, **kwargs
+            )
+        return metric
+
+    def _register_callback(self, family, name, documentation, labelnames, callback) -> CallbackMetric:
+        metric = self._metrics.get(name)
+        if isinstance(metric, CallbackMetric):
+            metric.callback = callback
+            return metric
+        metric = self._metrics[name] = CallbackMetric(family, name, documentation, labelnames, callback)
+        self.registry.register(metric)
+        self._callbacks.register(metric)
+        return metric
+
+    def exposed_registry(self) -> CollectorRegistry:
+        """
+        Registry to serve: this process's metrics, or in multiprocess mode the
+        instruments of every process on the host plus this one's callbacks.
+        """
+        if self._exposed is None:
+            if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+                self._exposed = CollectorRegistry()
+                MultiProcessCollector(self._exposed)
+                self._exposed.register(self._callbacks)
+            else:
+                self._exposed = self.registry
+        return self._exposed
+
+    def snapshot(self) -> str:
+        """Current state in Prometheus text format."""
+        return generate_latest(self.exposed_registry()).decode()
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels) -> Iterator[Dict[str, str]]:
+    """
+    Observe elapsed seconds into a labelled histogram.
+
+    Yields the label dict so the caller can fill in labels known only at the
+    end (e.g. the response status); the initial values cover exceptions.
+    """
+    started = time.monotonic()
+    try:
+        yield labels
+    finally:
+        histogram.labels(**labels).observe(time.monotonic() - started)
+
+
+# ============================================================================
+# Merging snapshots of several processes
+# ============================================================================
+
+class _Snapshots(Collector):
+    """Metric families of several processes, each sample labelled with its instance."""
+
+    def __init__(self):
+        self._families: Dict[str, Metric] = {}
+
+    def add(self, instance: str, text: str):
+        for family in text_string_to_metric_families(text):
+            merged = self._families.get(family.name)
+            if merged is None:
+                merged = self._families[family.name] = Metric(
+                    family.name, family.documentation, family.type, family.unit
+                )
+            for sample in family.samples:
+                merged.samples.append(sample._replace(labels={"instance": instance, **sample.labels}))
+
+    def collect(self):
+        return list(self._families.values())
+
+
+# ============================================================================
+# Exporters: local HTTP endpoint + Redis snapshot publishing
+# ============================================================================
+
+class MetricsExporter:
+    """Serves this process's metrics over HTTP and publishes snapshots to Redis."""
+
+    def __init__(self, instance: str, port: int = 0, publish_interval: float = 15.0):
+        """
+        Initialize exporter.
+
+        Args:
+            instance: Process name used as the `instance` label (e.g. "demper-0")
+            port: Local /metrics port (0 = don't serve)
+            publish_interval: Seconds between Redis snapshots (0 = don't publish)
+        """
+        self.instance = instance
+        self.port = port
+        self.publish_interval = publish_interval
+        self._server = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.port:
+            try:
+                self._server, _ = start_http_server(self.port, registry=get_metrics().exposed_registry())
+                logger.info(f"Metrics served on :{self.port}/metrics ({self.instance})")
+            except OSError as e:
+                logger.warning(f"Metrics port {self.port} unavailable: {e}")
+        if self.publish_interval > 0:
+            self._task = asyncio.create_task(self._publish_loop(), name="metrics-publisher")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._server:
+            # shutdown() blocks until the serving thread exits
+            await asyncio.to_thread(self._server.shutdown)
+            self._server.server_close()
+            self._server = None
+        await self._remove_snapshot()
+
+    async def _publish_loop(self):
+        while True:
+            await self.publish()
+            await asyncio.sleep(self.publish_interval)
+
+    async def publish(self):
+        try:
+            from .redis import get_redis, RedisKeyspace
+            client = await get_redis()
+            payload = json.dumps({"ts": time.time(), "metrics": get_metrics().snapshot()})
+            await client.hset(RedisKeyspace.METRICS_SNAPSHOTS, self.instance, payload)
+        except Exception as e:
+            logger.debug(f"Metrics publish failed: {e}")
+
+    async def _remove_snapshot(self):
+        try:
+            from .redis import get_redis, RedisKeyspace
+            client = await get_redis()
+            await client.hdel(RedisKeyspace.METRICS_SNAPSHOTS, self.instance)
+        except Exception as e:
+            logger.debug(f"Metrics snapshot cleanup failed: {e}")
+
+
+async def cluster_snapshots(local_instance: str = "api") -> Dict[str, str]:
+    """
+    Prometheus text of this process plus every fresh snapshot published to Redis,
+    keyed by instance.
+
+    Snapshots older than 3 publish intervals (stopped or crashed processes)
+    are skipped.
+    """
+    from ..config import settings
+
+    texts = {local_instance: get_metrics().snapshot()}
+    max_age = max(settings.metrics_publish_interval_seconds, 1) * 3
+    try:
+        from .redis import get_redis, RedisKeyspace
+        client = await get_redis()
+        published = await client.hgetall(RedisKeyspace.METRICS_SNAPSHOTS)
+        now = time.time()
+        for instance, raw in sorted(published.items()):
+            if instance == local_instance:
+                continue
+            try:
+                entry = json.loads(raw)
+                if now - entry.get("ts", 0) > max_age:
+                    continue
+                texts[instance] = entry["metrics"]
+            except Exception as e:
+                logger.warning(f"Skipping unreadable metrics snapshot of {instance}: {e}")
+    except Exception as e:
+        logger.warning(f"Could not read published metrics: {e}")
+    return texts
+
+
+async def collect_cluster_metrics(local_instance: str = "api") -> str:
+    """Render this process's metrics plus every fresh published snapshot."""
+    snapshots = _Snapshots()
+    for instance, text in (await cluster_snapshots(local_instance)).items():
+        try:
+            snapshots.add(instance, text)
+        except Exception as e:
+            logger.warning(f"Skipping unreadable metrics snapshot of {instance}: {e}")
+
+    registry = CollectorRegistry(auto_describe=False)
+    registry.register(snapshots)
+    return generate_latest(registry).decode()
+
+
+# ============================================================================
+# Global registry
+# ============================================================================
+
+_registry: Optional[MetricsRegistry] = None
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get global metrics registry"""
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+    return _registry
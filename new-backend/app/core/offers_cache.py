@@ -0,0 +1,295 @@
+"""
+Competitor Offers Cache - two-tier cache for Kaspi offers API responses.
+
+The same (external_kaspi_id, city_id) is often requested several times within
+seconds: demper checks, preorder checks, manual check-demping/run-demping and
+get_competitor_price. Caching them cuts offers API spend and 403 risk.
+
+Tiers:
+- In-process LRU (no I/O, per process)
+- Redis hash per product (shared by all demper shards and the API process)
+
+Concurrent misses for the same key are coalesced into one upstream request
+(single-flight); if the leading request is cancelled, a waiting caller takes
+over. Entries carry their fetch timestamp, so each caller can ask
+for a stricter max_age than the default TTL (e.g. priority products). A caller
+only joins a request led with the same or a stricter max_age; a stricter
+caller leads its own request instead (and later callers join that one).
+
+Counters are per process; cluster_stats() sums the offers_cache_events_total
+snapshots every demper shard publishes (see core/metrics).
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from prometheus_client.parser import text_string_to_metric_families
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str]
+
+# After a Redis error, skip the shared tier for this many seconds
+REDIS_RETRY_SECONDS = 10.0
+
+EVENTS = ("local_hits", "redis_hits", "misses", "coalesced", "redis_errors")
+
+# Result handed to joiners when the leading fetch was cancelled: they retry
+# (one of them leads) instead of being cancelled themselves
+_LEADER_CANCELLED = object()
+
+
+class OffersCache:
+    """
+    LRU + Redis cache for offers responses, keyed by (product_id, city_id).
+    """
+
+    def __init__(self, ttl: float, local_size: int):
+        """
+        Initialize offers cache.
+
+        Args:
+            ttl: Default (and maximum) entry age in seconds
+            local_size: Max entries kept in the in-process LRU
+        """
+        self.ttl = ttl
+        self.local_size = local_size
+        self._local: "OrderedDict[CacheKey, Tuple[float, dict]]" = OrderedDict()
+        # key -> (leader's future, leader's max_age)
+        self._inflight: Dict[CacheKey, Tuple[asyncio.Future, float]] = {}
+        self._redis_retry_at = 0.0
+        self.stats = {event: 0 for event in EVENTS}
+
+    async def get_or_fetch(
+        self,
+        product_id: str,
+        city_id: str,
+        fetch: Callable[[], Awaitable[Optional[dict]]],
+        max_age: Optional[float] = None,
+    ) -> Optional[dict]:
+        """
+        Return cached offers or call `fetch` on a miss.
+
+        Empty results (None) are not cached, so a 403/400 is retried next time.
+
+        Args:
+            product_id: Kaspi external product ID
+            city_id: Kaspi city ID
+            fetch: Coroutine factory that performs the upstream request
+            max_age: Max acceptable entry age in seconds (capped at ttl)
+        """
+        key = (str(product_id), str(city_id))
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+
+        data = self._get_local(key, max_age)
+        if data is not None:
+            self.stats["local_hits"] += 1
+            return data
+
+        # The leader may answer from Redis with an entry up to its own max_age
+        # old, which is only good enough for callers at least as lenient
+        inflight = self._inflight.get(key)
+        while inflight is not None and max_age >= inflight[1]:
+            self.stats["coalesced"] += 1
+            data = await asyncio.shield(inflight[0])
+            if data is not _LEADER_CANCELLED:
+                return data
+            inflight = self._inflight.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        # Avoid "exception was never retrieved" when nobody else joined
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        leader = (future, max_age)
+        self._inflight[key] = leader
+        try:
+            stored = await self._get_shared(key)
+            if stored is not None and time.time() - stored[0] <= max_age:
+                self.stats["redis_hits"] += 1
+                self._set_local(key, stored[0], stored[1])
+                data = stored[1]
+            else:
+                self.stats["misses"] += 1
+                data = await fetch()
+                if data is not None:
+                    fetched_at = time.time()
+                    self._set_local(key, fetched_at, data)
+                    await self._set_shared(key, fetched_at, data)
+
+            future.set_result(data)
+            return data
+        except asyncio.CancelledError:
+            # Only the leader is cancelled; joiners fetch again
+            future.set_result(_LEADER_CANCELLED)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            # A stricter caller may have taken over the key meanwhile
+            if self._inflight.get(key) is leader:
+                del self._inflight[key]
+
+    async def invalidate(self, product_id: str):
+        """Drop all cities for a product (e.g. after our own price change)."""
+        product_id = str(product_id)
+        for key in [k for k in self._local if k[0] == product_id]:
+            del self._local[key]
+
+        if not self._redis_available():
+            return
+        try:
+            from .redis import get_redis, RedisKeyspace
+            client = await get_redis()
+            await client.delete(RedisKeyspace.offers_cache(product_id))
+        except Exception as e:
+            self._mark_redis_error(e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of this process for monitoring."""
+        return {
+            **_with_hit_rate(self.stats),
+            "local_entries": len(self._local),
+            "inflight": len(self._inflight),
+            "ttl_seconds": self.ttl,
+        }
+
+    # ------------------------------------------------------------------
+    # Local tier
+    # ------------------------------------------------------------------
+
+    def _get_local(self, key: CacheKey, max_age: float) -> Optional[dict]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        fetched_at, data = entry
+        if time.time() - fetched_at > self.ttl:
+            del self._local[key]
+            return None
+        if time.time() - fetched_at > max_age:
+            return None
+        self._local.move_to_end(key)
+        return data
+
+    def _set_local(self, key: CacheKey, fetched_at: float, data: dict):
+        self._local[key] = (fetched_at, data)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Shared tier (Redis hash per product, one field per city)
+    # ------------------------------------------------------------------
+
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_retry_at
+
+    def _mark_redis_error(self, error: Exception):
+        self.stats["redis_errors"] += 1
+        if self._redis_available():
+            logger.warning(f"[OFFERS_CACHE] Redis unavailable ({error}), using local cache only")
+        self._redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+
+    async def _get_shared(self, key: CacheKey) -> Optional[Tuple[float, dict]]:
+        if not self._redis_available():
+            return None
+        try:
+            from .redis import get_redis, RedisKeyspace
+            client = await get_redis()
+            raw = await client.hget(RedisKeyspace.offers_cache(key[0]), key[1])
+            if not raw:
+                return None
+            entry = json.loads(raw)
+            return float(entry["ts"]), entry["data"]
+        except Exception as e:
+            self._mark_redis_error(e)
+            return None
+
+    async def _set_shared(self, key: CacheKey, fetched_at: float, data: dict):
+        if not self._redis_available():
+            return
+        try:
+            from .redis import get_redis, RedisKeyspace
+            client = await get_redis()
+            redis_key = RedisKeyspace.offers_cache(key[0])
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.hset(redis_key, key[1], json.dumps({"ts": fetched_at, "data": data}, ensure_ascii=False))
+                pipe.expire(redis_key, max(1, int(self.ttl)))
+                await pipe.execute()
+        except Exception as e:
+            self._mark_redis_error(e)
+
+
+def _with_hit_rate(stats: Dict[str, int]) -> Dict[str, Any]:
+    lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"] + stats["coalesced"]
+    hits = lookups - stats["misses"]
+    return {
+        **stats,
+        "lookups": lookups,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+    }
+
+
+async def cluster_stats() -> Dict[str, Any]:
+    """
+    Offers cache counters of every process, summed and per instance.
+
+    Read from the metrics snapshots published to Redis, so each demper
+    shard's numbers are up to one publish interval old.
+    """
+    from .metrics import cluster_snapshots
+
+    get_offers_cache()  # registers this process's counter before the snapshot
+    instances: Dict[str, Dict[str, Any]] = {}
+    total = {event: 0 for event in EVENTS}
+    for instance, text in (await cluster_snapshots()).items():
+        counts = {event: 0 for event in EVENTS}
+        found = False
+        try:
+            for family in text_string_to_metric_families(text):
+                if family.name != "offers_cache_events":
+                    continue
+                for sample in family.samples:
+                    event = sample.labels.get("event")
+                    if sample.name == "offers_cache_events_total" and event in counts:
+                        counts[event] += int(sample.value)
+                        found = True
+        except Exception as e:
+            logger.warning(f"[OFFERS_CACHE] Skipping unreadable metrics of {instance}: {e}")
+            continue
+        if not found:
+            continue  # process without an offers cache (e.g. orders worker)
+        instances[instance] = _with_hit_rate(counts)
+        for event, count in counts.items():
+            total[event] += count
+    return {"total": _with_hit_rate(total), "instances": instances}
+
+
+# ============================================================================
+# Global instance
+# ============================================================================
+
+_offers_cache: Optional[OffersCache] = None
+
+
+def get_offers_cache() -> OffersCache:
+    """Get global offers cache instance"""
+    global _offers_cache
+    if _offers_cache is None:
+        from ..config import settings
+        _offers_cache = OffersCache(
+            ttl=settings.offers_cache_ttl_seconds,
+            local_size=settings.offers_cache_local_size,
+        )
+        from .metrics import get_metrics
+        cache = _offers_cache
+        get_metrics().counter(
+            "offers_cache_events_total",
+            "Offers cache lookups by outcome",
+            ["event"],
+            callback=lambda: {(event,): count for event, count in cache.stats.items()},
+        )
+    return _offers_cache
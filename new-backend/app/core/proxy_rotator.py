@@ -1,24 +1,77 @@
 """
-Proxy Rotator - Manages automatic proxy rotation every 249 requests
+Proxy Rotator - schedules a user's requests across their proxy pool
 
 Supports per-module proxy pools:
 - demper: 70 proxies (1000 req/cycle every 3 min, 5 proxies/cycle, 42 min rest)
 - orders: 25 proxies (up to 1000 req/cycle every 10 min, 5 proxies/cycle, 50 min rest)
 - catalog: 5 proxies (20 req rarely, 1 proxy sufficient)
 - reserve: 0 proxies (uses catalog proxies when needed)
+
+Every request takes a lease (ProxyRotator.acquire) on one proxy and returns
+it when done. Concurrent requests are spread over all usable proxies:
+- at most settings.max_concurrency_per_proxy leases per proxy
+- each proxy serves 249 requests (not 250!), then rests 40 minutes
+- among free proxies, the least loaded one with the lowest recent failure
+  rate and latency wins
+- a request waits only while every usable proxy is at its concurrency
+  limit; if all are resting or dead, acquire() raises at once
+
+The request path does no database I/O: outcomes, rests and dead marks go
+to the proxy stats journal, which writes them to the proxies table in
+batches (see proxy_stats_journal).
+
+Budgets, rests and dead marks are shared by every process through Redis
+(settings.distributed_proxy_state), since each process has its own rotator:
+- proxy:usage:{id} counts the requests of the current window; rotators
+  reserve budget from it in batches of settings.proxy_budget_batch_size
+- the rotator that reserved the end of the window rests the proxy once its
+  leases are back, by setting proxy:lock:{id} = 'resting' for 40 minutes
+  (other processes finish at most one batch of their own meanwhile)
+- proxy:lock:{id} = 'dead' keeps a dead proxy out of every process
+- a window left unfinished (crashed process) expires after 40 minutes idle
+While Redis is unreachable each process falls back to its local budget.
 """
 
 import asyncio
 import logging
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Tuple
+from typing import Any, Optional, Dict, Tuple
 from uuid import UUID
 
+from ..config import settings
 from ..core.database import get_db_pool
+from ..core.http_client import evict_proxy_http_client
+from ..core.metrics import get_metrics
+from ..core.proxy_stats_journal import get_proxy_stats_journal
+from ..core.redis import PROXY_DEAD_TTL, RedisKeyspace, get_redis
 from ..models.proxy import Proxy
 
 logger = logging.getLogger(__name__)
 
+PROXY_REQUESTS = get_metrics().counter(
+    "proxy_requests_total",
+    "Kaspi requests through user proxies",
+    ["module", "result"],
+)
+PROXY_MARKED_DEAD = get_metrics().counter(
+    "proxy_marked_dead_total",
+    "Proxies marked dead for high failure rate",
+    ["module"],
+)
+PROXY_LEASE_WAIT_SECONDS = get_metrics().histogram(
+    "proxy_lease_wait_seconds",
+    "Time a request waited for a free proxy slot",
+    ["module"],
+)
+
+# Weight of the newest sample in the per-proxy latency / failure averages
+EWMA_ALPHA = 0.2
+
+# Budget spent by another process, not rested yet: ask Redis again after
+SPENT_RECHECK_SECONDS = 5
+
 
 class NoProxiesAllocatedError(Exception):
     """Raised when user has no proxies allocated for the specified module"""
@@ -30,17 +83,105 @@ class NoProxiesAvailableError(Exception):
     pass
 
 
+@dataclass
+class _ProxySlot:
+    """Scheduling state of one proxy in a rotator."""
+    proxy: Proxy
+    in_flight: int = 0
+    used: int = 0                          # requests of the current budget, reservations included
+    latency_ewma: Optional[float] = None   # seconds, successful requests only
+    failure_ewma: float = 0.0
+    grant: int = 0                         # budget reserved in Redis, not used yet
+    last_grant: bool = False               # holds the end of the window: rests the proxy
+    recheck_at: Optional[datetime] = None  # window spent elsewhere: skip until then
+    reserving: bool = False                # Redis budget reservation in flight
+
+    def usable(self, now: datetime) -> bool:
+        """Allocated, or resting with the rest window over."""
+        if self.recheck_at is not None and self.recheck_at > now:
+            return False
+        return self.proxy.status == 'allocated' or (
+            self.proxy.status == 'resting' and
+            (self.proxy.available_at is None or self.proxy.available_at <= now)
+        )
+
+    def score(self) -> tuple:
+        """Lower is better: load first, then failure rate bucket, latency, budget used."""
+        return (
+            self.in_flight,
+            round(self.failure_ewma, 1),
+            self.latency_ewma or 0.0,  # untried proxies get explored early
+            self.used,
+        )
+
+
+class ProxyLease:
+    """
+    One request's hold on a proxy.
+
+    Record each attempt made through the proxy, then release() (or use
+    `async with`). The lease reserves one request of the proxy's budget;
+    retries on the same lease count as further requests.
+    """
+
+    def __init__(self, rotator: "ProxyRotator", slot: _ProxySlot, granted: bool):
+        self._rotator = rotator
+        self._slot = slot
+        self._granted = granted  # reservation taken from the slot's Redis grant
+        self._records = 0
+        self._released = False
+
+    @property
+    def proxy(self) -> Proxy:
+        return self._slot.proxy
+
+    async def record(self, success: bool, latency: Optional[float] = None):
+        """
+        Record one request made through this proxy.
+
+        Args:
+            success: Whether request succeeded
+            latency: Request duration in seconds (successful requests)
+        """
+        if self._records:
+            self._slot.used += 1
+            self._slot.grant = max(0, self._slot.grant - 1)
+        self._records += 1
+        await self._rotator._record(self._slot, success, latency)
+
+    async def release(self):
+        if self._released:
+            return
+        self._released = True
+        if not self._records:
+            # Reservation not used
+            self._slot.used = max(0, self._slot.used - 1)
+            if self._granted:
+                self._slot.grant += 1
+        await self._rotator._release(self._slot)
+
+    async def __aenter__(self) -> "ProxyLease":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+
 class ProxyRotator:
     """
-    Manages proxy rotation for a user's specific module
+    Schedules requests over a user's proxies for one module
 
     Key features:
-    - Tracks request count in memory (fast!)
-    - Rotates after 249 requests (not 250!)
-    - Rests used proxies for 40 minutes
-    - Automatically selects next available proxy
+    - Tracks in-flight leases and request budgets in memory (fast!)
+    - Persists stats through the batched proxy stats journal
+    - Shares budgets, rests and dead marks with other processes via Redis
+    - Rests a proxy for 40 minutes after 249 requests (not 250!)
+    - Prefers idle proxies with low recent failure rate and latency
+    - Marks proxies with a high failure rate dead
     """
 
+    REST_MINUTES = 40
+
     def __init__(self, user_id: UUID, module: str = 'demper'):
         """
         Initialize ProxyRotator for specific user and module
@@ -51,14 +192,19 @@ class ProxyRotator:
         """
         self.user_id = user_id
         self.module = module
-        self.current_proxy: Optional[Proxy] = None
-        self.current_requests_count = 0
         self.max_requests_per_proxy = 249  # ⚠️ Not 250!
+        self.max_concurrency_per_proxy = settings.max_concurrency_per_proxy
+        self.budget_batch_size = max(1, min(settings.proxy_budget_batch_size, self.max_requests_per_proxy))
 
-        # In-memory cache of user's proxies for this module
-        self.user_proxies: list[Proxy] = []
+        # In-memory scheduling state of user's proxies for this module
+        self._slots: Dict[UUID, _ProxySlot] = {}
+        self._slot_freed = asyncio.Condition()
         self._initialized = False
 
+    @property
+    def user_proxies(self) -> list[Proxy]:
+        return [slot.proxy for slot in self._slots.values()]
+
     async def initialize(self):
         """
         Load user's proxies for this module from database into memory
@@ -85,102 +231,211 @@ class ProxyRotator:
                     f"User {self.user_id} has no proxies for module '{self.module}'"
                 )
 
-            self.user_proxies = [Proxy(**dict(row)) for row in rows]
-
-        # Select first available proxy
-        self.current_proxy = await self._get_next_available_proxy()
+        for row in rows:
+            proxy = Proxy(**dict(row))
+            self._slots[proxy.id] = _ProxySlot(proxy=proxy, used=proxy.requests_count)
         self._initialized = True
 
         logger.info(
             f"ProxyRotator initialized for user {self.user_id}, module '{self.module}': "
-            f"{len(self.user_proxies)} proxies loaded, current proxy: {self.current_proxy.id}"
+            f"{len(self._slots)} proxies loaded"
         )
 
-    async def _get_next_available_proxy(self) -> Proxy:
+    async def acquire(self) -> ProxyLease:
         """
-        Get next available proxy from user's pool
+        Lease the best free proxy for one request.
 
-        Priority:
-        1. status='allocated' (never used yet)
-        2. status='resting' but available_at <= NOW() (finished resting)
-        3. If all resting → take closest to available_at (wait if needed)
+        Waits only while every usable proxy is at max_concurrency_per_proxy
+        or has a budget reservation in flight. The Redis reservation runs
+        without the lock: the slot is marked reserving (skipped by other
+        acquirers), and taken under the lock again once it is back.
+
+        Raises:
+            NoProxiesAvailableError: All proxies are resting, out of budget or dead
         """
-        now = datetime.now(timezone.utc)
+        if not self._initialized:
+            await self.initialize()
 
-        # Filter available proxies
-        available = [
-            p for p in self.user_proxies
-            if p.status == 'allocated' or (
-                p.status == 'resting' and
-                (p.available_at is None or p.available_at <= now)
+        waited_since = None
+        while True:
+            async with self._slot_freed:
+                slot, busy = self._pick()
+                if slot is None:
+                    if not busy:
+                        raise NoProxiesAvailableError(self._unavailable_reason())
+                    # Every usable proxy is at its concurrency limit: wait for a release
+                    if waited_since is None:
+                        waited_since = asyncio.get_running_loop().time()
+                    await self._slot_freed.wait()
+                    continue
+                if slot.grant > 0:
+                    return self._lease(slot, True, waited_since)
+                slot.reserving = True
+
+            try:
+                reserved = await self._reserve_budget(slot)
+            except BaseException:
+                async with self._slot_freed:
+                    slot.reserving = False
+                    self._slot_freed.notify_all()
+                raise
+
+            async with self._slot_freed:
+                slot.reserving = False
+                # Waiters skipped this slot meanwhile
+                self._slot_freed.notify_all()
+                # Rested, dead or spent elsewhere, or taken to the limit meanwhile: pick again
+                if reserved and self._leasable(slot):
+                    return self._lease(slot, slot.grant > 0, waited_since)
+
+    def _lease(self, slot: _ProxySlot, granted: bool, waited_since: Optional[float]) -> ProxyLease:
+        """Take one request of the slot (lock held)."""
+        slot.in_flight += 1
+        slot.used += 1
+        slot.grant = max(0, slot.grant - 1)
+        if waited_since is not None:
+            PROXY_LEASE_WAIT_SECONDS.labels(module=self.module).observe(
+                asyncio.get_running_loop().time() - waited_since
             )
-        ]
+        return ProxyLease(self, slot, granted)
+
+    def _leasable(self, slot: _ProxySlot) -> bool:
+        """Still in the pool, usable, within budget and below the concurrency limit."""
+        return (
+            slot.proxy.id in self._slots
+            and slot.usable(datetime.now(timezone.utc))
+            and not self._budget_spent(slot)
+            and slot.in_flight < self.max_concurrency_per_proxy
+        )
 
-        if available:
-            return available[0]
+    def _pick(self) -> Tuple[Optional[_ProxySlot], bool]:
+        """(best free slot, whether some usable slot is only busy or reserving)"""
+        now = datetime.now(timezone.utc)
+        best = None
+        busy = False
+        for slot in self._slots.values():
+            if not slot.usable(now) or self._budget_spent(slot):
+                continue
+            if slot.reserving or slot.in_flight >= self.max_concurrency_per_proxy:
+                busy = True
+                continue
+            if best is None or slot.score() < best.score():
+                best = slot
+        return best, busy
+
+    def _budget_spent(self, slot: _ProxySlot) -> bool:
+        """This process may not start another request of the window."""
+        return (
+            slot.used >= self.max_requests_per_proxy
+            or (slot.last_grant and slot.grant <= 0)
+        )
 
-        # All proxies are resting - wait for nearest one
-        resting = [p for p in self.user_proxies if p.status == 'resting']
-        if resting:
-            next_proxy = min(resting, key=lambda p: p.available_at or now)
-            wait_seconds = (next_proxy.available_at - now).total_seconds()
+    async def _reserve_budget(self, slot: _ProxySlot) -> bool:
+        """
+        Reserve a batch of the proxy's window in Redis (called by acquire()
+        without the lock, with slot.reserving set).
 
-            if wait_seconds > 0:
-                logger.warning(
-                    f"All proxies resting for module '{self.module}', "
-                    f"waiting {wait_seconds:.1f}s for proxy {next_proxy.id}"
-                )
-                await asyncio.sleep(wait_seconds)
+        Returns:
+            False if the proxy turned out resting, dead or spent elsewhere
+            (slot state updated); True otherwise, also without Redis
+        """
+        result = await _reserve_shared_budget(
+            slot.proxy.id, self.budget_batch_size, self.max_requests_per_proxy, self.REST_MINUTES * 60,
+        )
+        if result is None:
+            return True  # Redis unavailable: local budget only
 
-            return next_proxy
+        state = result[0]
+        if state == 'ok':
+            slot.grant += int(result[1])
+            slot.last_grant = int(result[2]) >= self.max_requests_per_proxy
+            slot.recheck_at = None
+            return True
 
-        # All proxies are dead
-        raise NoProxiesAvailableError(
-            f"All proxies are dead or unavailable for user {self.user_id}, module '{self.module}'"
+        now = datetime.now(timezone.utc)
+        if state == 'spent':
+            # Another process holds the rest of the window and rests it when done
+            slot.recheck_at = now + timedelta(seconds=SPENT_RECHECK_SECONDS)
+        elif state == 'dead':
+            if self._slots.pop(slot.proxy.id, None) is not None:
+                slot.proxy.status = 'dead'
+                await evict_proxy_http_client(slot.proxy.url)
+                logger.info(f"Proxy {slot.proxy.id} (module='{self.module}') marked dead by another process")
+        else:
+            # Rested by another process
+            self._apply_resting(slot, now + timedelta(milliseconds=max(0, int(result[1]))))
+        return False
+
+    def _unavailable_reason(self) -> str:
+        if not self._slots:
+            return f"All proxies are dead or unavailable for user {self.user_id}, module '{self.module}'"
+        now = datetime.now(timezone.utc)
+        next_at = min(
+            (s.proxy.available_at for s in self._slots.values()
+             if s.proxy.status == 'resting' and s.proxy.available_at and s.proxy.available_at > now),
+            default=None,
+        )
+        return (
+            f"All {len(self._slots)} proxies resting or out of budget for user {self.user_id}, "
+            f"module '{self.module}'"
+            + (f", next available in {(next_at - now).total_seconds():.0f}s" if next_at else "")
         )
 
-    async def get_current_proxy(self) -> Proxy:
-        """
-        Get current proxy for use
+    async def _record(self, slot: _ProxySlot, success: bool, latency: Optional[float]):
+        proxy = slot.proxy
+        proxy.requests_count += 1
+        PROXY_REQUESTS.labels(module=self.module, result="success" if success else "failure").inc()
 
-        Automatically rotates after 249 requests!
-        """
-        if not self._initialized:
-            await self.initialize()
+        slot.failure_ewma += EWMA_ALPHA * ((0.0 if success else 1.0) - slot.failure_ewma)
+        if success:
+            proxy.success_count += 1
+            if latency is not None:
+                slot.latency_ewma = (
+                    latency if slot.latency_ewma is None
+                    else slot.latency_ewma + EWMA_ALPHA * (latency - slot.latency_ewma)
+                )
+        else:
+            proxy.failure_count += 1
 
-        # Check if rotation needed
-        if self.current_requests_count >= self.max_requests_per_proxy:
-            await self._rotate_proxy()
+            # Check failure rate
+            total_requests = proxy.success_count + proxy.failure_count
+            failure_rate = proxy.failure_count / total_requests if total_requests > 0 else 0
 
-        return self.current_proxy
+            # Mark as dead if high failure rate
+            if failure_rate > 0.5 and proxy.failure_count > 10 and proxy.id in self._slots:
+                logger.error(
+                    f"Proxy {proxy.id} (module='{self.module}') has high failure rate "
+                    f"({failure_rate:.1%}), marking as dead"
+                )
+                await self._mark_proxy_dead(proxy.id)
+                return
 
-    async def _rotate_proxy(self):
-        """
-        Rotate to next proxy
+        get_proxy_stats_journal().record(proxy.id, success)
 
-        Steps:
-        1. Current proxy → resting (40 minutes)
-        2. Get next available proxy
-        3. Reset request counter
-        """
-        if self.current_proxy:
-            # Send current proxy to rest
-            await self._set_proxy_resting(
-                self.current_proxy.id,
-                duration_minutes=40
-            )
+    async def _release(self, slot: _ProxySlot):
+        slot.in_flight = max(0, slot.in_flight - 1)
 
-            logger.info(
-                f"Proxy {self.current_proxy.id} (module='{self.module}') rotated after "
-                f"{self.current_requests_count} requests, resting 40 minutes"
-            )
+        # Budget spent and the last lease returned: send it to rest
+        if (
+            self._budget_spent(slot)
+            and slot.in_flight == 0
+            and slot.proxy.id in self._slots
+        ):
+            await self._rest_proxy(slot)
 
-        # Get next proxy
-        self.current_proxy = await self._get_next_available_proxy()
-        self.current_requests_count = 0
+        async with self._slot_freed:
+            self._slot_freed.notify()
 
+    async def _rest_proxy(self, slot: _ProxySlot):
+        """
+        Budget spent: drop keep-alive connections and rest the proxy
+        """
+        used = slot.used
+        await evict_proxy_http_client(slot.proxy.url)
+        await self._set_proxy_resting(slot.proxy.id, duration_minutes=self.REST_MINUTES)
         logger.info(
-            f"Switched to proxy {self.current_proxy.id} (module='{self.module}')"
+            f"Proxy {slot.proxy.id} (module='{self.module}') rested after "
+            f"{used} requests, resting {self.REST_MINUTES} minutes"
         )
 
     async def _set_proxy_resting(self, proxy_id: UUID, duration_minutes: int):
@@ -191,102 +446,168 @@ class ProxyRotator:
             proxy_id: Proxy UUID
             duration_minutes: Rest duration (typically 40)
         """
-        pool = await get_db_pool()
-        available_at = datetime.now(timezone.utc) + timedelta(minutes=duration_minutes)
-
-        async with pool.acquire() as conn:
-            await conn.execute(
-                """
-                UPDATE proxies
-                SET status = 'resting',
-                    available_at = $1,
-                    requests_count = 0
-                WHERE id = $2
-                """,
-                available_at,
-                proxy_id
-            )
+        rest_seconds = await _rest_shared(proxy_id, duration_minutes * 60)
+        if rest_seconds is None:
+            rest_seconds = duration_minutes * 60
+        available_at = datetime.now(timezone.utc) + timedelta(seconds=rest_seconds)
+        get_proxy_stats_journal().set_resting(proxy_id, available_at)
 
         # Update in-memory cache
-        for p in self.user_proxies:
-            if p.id == proxy_id:
-                p.status = 'resting'
-                p.available_at = available_at
-                p.requests_count = 0
+        slot = self._slots.get(proxy_id)
+        if slot:
+            self._apply_resting(slot, available_at)
+
+    @staticmethod
+    def _apply_resting(slot: _ProxySlot, available_at: datetime):
+        """In-memory side of a rest: the next window starts at available_at."""
+        slot.proxy.status = 'resting'
+        slot.proxy.available_at = available_at
+        slot.proxy.requests_count = 0
+        slot.used = 0
+        slot.grant = 0
+        slot.last_grant = False
+        slot.recheck_at = None
 
-    async def record_request(self, success: bool):
-        """
-        Record request usage
+    async def _mark_proxy_dead(self, proxy_id: UUID):
+        """Mark proxy as dead"""
+        slot = self._slots.pop(proxy_id, None)
+        PROXY_MARKED_DEAD.labels(module=self.module).inc()
+        get_proxy_stats_journal().set_dead(proxy_id)
+        await _mark_shared_dead(proxy_id)
 
-        Call this AFTER each Kaspi API request
+        # Close its pooled HTTP client (after in-flight requests finish)
+        if slot:
+            slot.proxy.status = 'dead'
+            await evict_proxy_http_client(slot.proxy.url)
 
-        Args:
-            success: Whether request succeeded
-        """
-        self.current_requests_count += 1
-        self.current_proxy.requests_count += 1
+        logger.error(f"Proxy {proxy_id} marked as dead")
 
-        if success:
-            self.current_proxy.success_count += 1
-        else:
-            self.current_proxy.failure_count += 1
+        # Waiters re-check: they may have to give up now
+        async with self._slot_freed:
+            self._slot_freed.notify_all()
+
+
+# ============================================================================
+# Redis-shared proxy state
+# ============================================================================
+
+# KEYS: usage, lock. ARGV: wanted, budget, window_ms.
+# Returns {'ok', granted, used_in_window}, {'spent', used_in_window} or
+# {lock state, lock pttl_ms}
+_RESERVE_SCRIPT = """
+local state = redis.call('GET', KEYS[2])
+if state then
+    return {state, redis.call('PTTL', KEYS[2])}
+end
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local granted = math.min(tonumber(ARGV[1]), tonumber(ARGV[2]) - used)
+if granted <= 0 then
+    return {'spent', used}
+end
+used = redis.call('INCRBY', KEYS[1], granted)
+redis.call('PEXPIRE', KEYS[1], ARGV[3])
+return {'ok', granted, used}
+"""
 
-            # Check failure rate
-            total_requests = self.current_proxy.success_count + self.current_proxy.failure_count
-            failure_rate = self.current_proxy.failure_count / total_requests if total_requests > 0 else 0
+# KEYS: usage, lock. ARGV: rest_ms. Starts the rest unless another process
+# already did; returns the remaining rest in ms
+_REST_SCRIPT = """
+redis.call('SET', KEYS[2], 'resting', 'PX', ARGV[1], 'NX')
+redis.call('DEL', KEYS[1])
+return redis.call('PTTL', KEYS[2])
+"""
 
-            # Mark as dead if high failure rate
-            if failure_rate > 0.5 and self.current_proxy.failure_count > 10:
-                logger.error(
-                    f"Proxy {self.current_proxy.id} (module='{self.module}') has high failure rate "
-                    f"({failure_rate:.1%}), marking as dead"
-                )
-                await self._mark_proxy_dead(self.current_proxy.id)
+# KEYS: usage, lock. ARGV: rest_ms. Rests the proxy for at least rest_ms
+# (never shortens a rest, never revives a dead proxy)
+_QUARANTINE_SCRIPT = """
+local state = redis.call('GET', KEYS[2])
+if state == 'dead' then
+    return 0
+end
+if not state or redis.call('PTTL', KEYS[2]) < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[2], 'resting', 'PX', ARGV[1])
+end
+return 1
+"""
 
-                # Rotate immediately
-                await self._rotate_proxy()
+# After a Redis error, use process-local budgets for this many seconds
+REDIS_RETRY_SECONDS = 10.0
 
-        # Update last_used_at in database periodically (every 50 requests)
-        if self.current_requests_count % 50 == 0:
-            await self._update_proxy_stats()
+_redis_retry_at: float = 0.0
+_scripts: Dict[str, Any] = {}
+_scripts_client = None
 
-    async def _mark_proxy_dead(self, proxy_id: UUID):
-        """Mark proxy as dead"""
-        pool = await get_db_pool()
 
-        async with pool.acquire() as conn:
-            await conn.execute(
-                "UPDATE proxies SET status = 'dead' WHERE id = $1",
-                proxy_id
-            )
+def _redis_available() -> bool:
+    return settings.distributed_proxy_state and time.monotonic() >= _redis_retry_at
 
-        # Remove from cache
-        self.user_proxies = [p for p in self.user_proxies if p.id != proxy_id]
 
-        logger.error(f"Proxy {proxy_id} marked as dead")
+def _mark_redis_unavailable(error: Exception):
+    global _redis_retry_at
+    if time.monotonic() >= _redis_retry_at:
+        logger.warning(
+            f"[PROXY] Redis unavailable ({error}), "
+            f"using process-local proxy budgets for {REDIS_RETRY_SECONDS:.0f}s"
+        )
+    _redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+
+
+async def _run_script(source: str, proxy_id: UUID, args: list) -> Optional[Any]:
+    """Run a proxy state script on (usage, lock) keys; None if Redis is unavailable."""
+    global _scripts_client
+    if not _redis_available():
+        return None
+
+    try:
+        client = await get_redis()
+        if _scripts_client is not client:
+            _scripts.clear()
+            _scripts_client = client
+        script = _scripts.get(source)
+        if script is None:
+            script = _scripts[source] = client.register_script(source)
+
+        key = str(proxy_id)
+        return await script(
+            keys=[RedisKeyspace.proxy_usage(key), RedisKeyspace.proxy_lock(key)],
+            args=args,
+        )
+    except Exception as e:
+        _mark_redis_unavailable(e)
+        return None
 
-    async def _update_proxy_stats(self):
-        """Update proxy statistics in database"""
-        if not self.current_proxy:
-            return
 
-        pool = await get_db_pool()
+async def _reserve_shared_budget(
+    proxy_id: UUID, wanted: int, budget: int, window_seconds: int,
+) -> Optional[list]:
+    return await _run_script(_RESERVE_SCRIPT, proxy_id, [wanted, budget, window_seconds * 1000])
 
-        async with pool.acquire() as conn:
-            await conn.execute(
-                """
-                UPDATE proxies
-                SET requests_count = $1,
-                    success_count = $2,
-                    failure_count = $3,
-                    last_used_at = NOW()
-                WHERE id = $4
-                """,
-                self.current_proxy.requests_count,
-                self.current_proxy.success_count,
-                self.current_proxy.failure_count,
-                self.current_proxy.id
-            )
+
+async def _rest_shared(proxy_id: UUID, rest_seconds: int) -> Optional[float]:
+    """Seconds the proxy rests (another process's rest wins), None without Redis."""
+    pttl = await _run_script(_REST_SCRIPT, proxy_id, [rest_seconds * 1000])
+    if pttl is None or int(pttl) <= 0:
+        return None
+    return int(pttl) / 1000
+
+
+async def _mark_shared_dead(proxy_id: UUID):
+    if not _redis_available():
+        return
+    try:
+        client = await get_redis()
+        await client.set(RedisKeyspace.proxy_lock(str(proxy_id)), "dead", ex=PROXY_DEAD_TTL)
+    except Exception as e:
+        _mark_redis_unavailable(e)
+
+
+async def quarantine_proxy_shared(proxy_id: UUID, seconds: int):
+    """
+    Keep a proxy out of every rotator for `seconds` (health prober).
+
+    Rotators holding budget for it notice on their next reservation.
+    """
+    await _run_script(_QUARANTINE_SCRIPT, proxy_id, [seconds * 1000])
 
 
 # Global cache: (user_id, module) → ProxyRotator
@@ -0,0 +1,203 @@
+"""
+Proxy stats journal - write-behind for the proxies table
+
+ProxyRotator runs in the request path of parse_product_by_sku and
+get_products, so it never touches the database itself. Request outcomes and
+state changes (resting, dead) go into this in-memory journal; a background
+task flushes it every settings.proxy_stats_flush_interval_seconds with one
+UPDATE ... FROM unnest(...) per kind:
+
+1. state changes (status, available_at; resting resets requests_count)
+2. counter deltas (requests_count, success_count, failure_count, last_used_at)
+
+Requests recorded after a rest in the same flush window count towards the
+new window, as they would with inline writes. A failed flush puts its
+entries back into the journal. Entries of a crashed process are lost; the
+rotator state is rebuilt from the table on restart anyway.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from uuid import UUID
+
+from .database import get_db_pool
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FLUSHES = get_metrics().counter(
+    "proxy_stats_flushes_total",
+    "Proxy stats journal flushes",
+    ["result"],
+)
+
+# Never revives a dead proxy, and a rest never ends before a later
+# available_at already in the table (health prober quarantine)
+_STATES_FLUSH_SQL = """
+    UPDATE proxies p
+    SET status = d.status,
+        available_at = GREATEST(p.available_at, d.available_at),
+        requests_count = CASE WHEN d.status = 'resting' THEN 0 ELSE p.requests_count END
+    FROM unnest($1::uuid[], $2::text[], $3::timestamptz[]) AS d(id, status, available_at)
+    WHERE p.id = d.id
+      AND p.status <> 'dead'
+"""
+
+_COUNTERS_FLUSH_SQL = """
+    UPDATE proxies p
+    SET requests_count = p.requests_count + d.requests,
+        success_count = p.success_count + d.successes,
+        failure_count = p.failure_count + d.failures,
+        last_used_at = GREATEST(p.last_used_at, d.last_used_at)
+    FROM unnest($1::uuid[], $2::int[], $3::int[], $4::int[], $5::timestamptz[])
+        AS d(id, requests, successes, failures, last_used_at)
+    WHERE p.id = d.id
+"""
+
+
+@dataclass
+class _Counters:
+    requests: int = 0
+    successes: int = 0
+    failures: int = 0
+    last_used_at: Optional[datetime] = None
+
+
+@dataclass
+class _StateChange:
+    status: str
+    available_at: Optional[datetime] = None
+
+
+class ProxyStatsJournal:
+    """In-memory journal of proxy stats, flushed to the proxies table in batches."""
+
+    def __init__(self, flush_interval: Optional[float] = None):
+        if flush_interval is None:
+            from ..config import settings
+            flush_interval = settings.proxy_stats_flush_interval_seconds
+        self.flush_interval = flush_interval
+        self._counters: Dict[UUID, _Counters] = {}
+        self._states: Dict[UUID, _StateChange] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def record(self, proxy_id: UUID, success: bool):
+        """One request through the proxy (no I/O)."""
+        counters = self._counters.get(proxy_id)
+        if counters is None:
+            counters = self._counters[proxy_id] = _Counters()
+        counters.requests += 1
+        if success:
+            counters.successes += 1
+        else:
+            counters.failures += 1
+        counters.last_used_at = datetime.now(timezone.utc)
+        self._ensure_flusher()
+
+    def set_resting(self, proxy_id: UUID, available_at: datetime):
+        """Proxy rests until available_at; its request window starts over."""
+        self._states[proxy_id] = _StateChange("resting", available_at)
+        counters = self._counters.get(proxy_id)
+        if counters is not None:
+            counters.requests = 0
+        self._ensure_flusher()
+
+    def set_dead(self, proxy_id: UUID):
+        self._states[proxy_id] = _StateChange("dead")
+        self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="proxy-stats-journal")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Write everything journaled so far."""
+        async with self._flush_lock:
+            states, self._states = self._states, {}
+            counters, self._counters = self._counters, {}
+            if not states and not counters:
+                return
+
+            try:
+                pool = await get_db_pool()
+                async with pool.acquire() as conn:
+                    async with conn.transaction():
+                        if states:
+                            await conn.execute(
+                                _STATES_FLUSH_SQL,
+                                list(states),
+                                [s.status for s in states.values()],
+                                [s.available_at for s in states.values()],
+                            )
+                        if counters:
+                            await conn.execute(
+                                _COUNTERS_FLUSH_SQL,
+                                list(counters),
+                                [c.requests for c in counters.values()],
+                                [c.successes for c in counters.values()],
+                                [c.failures for c in counters.values()],
+                                [c.last_used_at for c in counters.values()],
+                            )
+                JOURNAL_FLUSHES.labels(result="ok").inc()
+            except Exception as e:
+                JOURNAL_FLUSHES.labels(result="error").inc()
+                logger.warning(f"[PROXY_STATS] Flush of {len(states)} states / {len(counters)} proxies failed: {e}")
+                self._restore(states, counters)
+
+    def _restore(self, states: Dict[UUID, _StateChange], counters: Dict[UUID, _Counters]):
+        """Merge a failed flush back under entries journaled meanwhile."""
+        for proxy_id, state in states.items():
+            self._states.setdefault(proxy_id, state)
+        for proxy_id, old in counters.items():
+            if proxy_id in self._states and self._states[proxy_id] is not states.get(proxy_id):
+                # Rested again since: those requests belong to the old window
+                old.requests = 0
+            new = self._counters.get(proxy_id)
+            if new is None:
+                self._counters[proxy_id] = old
+                continue
+            new.requests += old.requests
+            new.successes += old.successes
+            new.failures += old.failures
+            new.last_used_at = max(filter(None, (new.last_used_at, old.last_used_at)), default=None)
+
+    async def close(self):
+        """Stop the flusher and write what is left."""
+        if self._task is not None:
+            # Not in the middle of a flush: its entries would be lost
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+_proxy_stats_journal: Optional[ProxyStatsJournal] = None
+
+
+def get_proxy_stats_journal() -> ProxyStatsJournal:
+    """Get global proxy stats journal instance"""
+    global _proxy_stats_journal
+    if _proxy_stats_journal is None:
+        _proxy_stats_journal = ProxyStatsJournal()
+    return _proxy_stats_journal
+
+
+async def close_proxy_stats_journal():
+    """Flush and stop the global journal (call before closing the DB pool)"""
+    global _proxy_stats_journal
+    if _proxy_stats_journal is not None:
+        await _proxy_stats_journal.close()
+        _proxy_stats_journal = None
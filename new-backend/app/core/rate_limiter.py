@@ -5,19 +5,44 @@ Provides:
 - Global rate limiter (legacy, used by browser_farm)
 - Offers rate limiter (per IP, 8 RPS)
 - Pricefeed rate limiter (per merchant account, 1.5 RPS)
+- Orders REST API rate limiter (per API token)
 - Pricefeed cooldown tracking (30-min ban after 429)
 - Offers ban pause (15s after 403)
+
+Offers, pricefeed and orders buckets, the pricefeed cooldowns and the offers
+ban pause are shared cluster-wide through Redis (DistributedTokenBucket), so
+all demper shards and the API process draw from one budget. When Redis is
+unreachable each process falls back to its own in-memory bucket.
 """
 
 import asyncio
+import hashlib
 import logging
 import time
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple, Union
 
 
 logger = logging.getLogger(__name__)
 
 
+_wait_histogram = None
+
+
+def _observe_wait(name: Optional[str], started: float):
+    """Record how long acquire() waited for tokens, per limiter name."""
+    global _wait_histogram
+    if name is None:
+        return
+    if _wait_histogram is None:
+        from .metrics import get_metrics
+        _wait_histogram = get_metrics().histogram(
+            "rate_limit_wait_seconds",
+            "Time spent waiting for rate limiter tokens",
+            ["limiter"],
+        )
+    _wait_histogram.labels(limiter=name).observe(time.monotonic() - started)
+
+
 class TokenBucket:
     """
     Token Bucket rate limiter for controlling request throughput.
@@ -25,15 +50,17 @@ class TokenBucket:
     Used to enforce RPS limits per endpoint/account.
     """
 
-    def __init__(self, rate: float, capacity: Optional[float] = None):
+    def __init__(self, rate: float, capacity: Optional[float] = None, name: Optional[str] = None):
         """
         Initialize token bucket.
 
         Args:
             rate: Tokens per second (RPS limit)
             capacity: Maximum bucket capacity (defaults to rate)
+            name: Limiter label for the wait-time metric (None = not recorded)
         """
         self.rate = rate
+        self.name = name
         self.capacity = capacity if capacity is not None else rate
         self.tokens = self.capacity
         self.last_update = time.monotonic()
@@ -48,6 +75,7 @@ class TokenBucket:
         Args:
             tokens: Number of tokens to acquire
         """
+        started = time.monotonic()
         while True:
             async with self._lock:
                 now = time.monotonic()
@@ -62,6 +90,7 @@ class TokenBucket:
 
                 if self.tokens >= tokens:
                     self.tokens -= tokens
+                    _observe_wait(self.name, started)
                     return
 
                 # Calculate wait time if not enough tokens
@@ -102,6 +131,267 @@ class TokenBucket:
         return min(self.capacity, self.tokens + elapsed * self.rate)
 
 
+# ============================================================================
+# Redis-backed distributed token bucket
+# ============================================================================
+
+# Refills the bucket from the Redis clock (shared by all processes), then grants
+# up to ARGV[3] tokens if at least ARGV[4] are available.
+# Returns {granted, seconds_to_wait} as strings to keep fractional values.
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local needed = tonumber(ARGV[4])
+local ttl_ms = tonumber(ARGV[5])
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local granted = 0
+local wait = 0
+if tokens >= needed then
+    granted = math.max(needed, math.min(requested, math.floor(tokens)))
+    tokens = tokens - granted
+else
+    wait = (needed - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], ttl_ms)
+return {tostring(granted), tostring(wait)}
+"""
+
+# After a Redis error, use process-local limits for this many seconds
+REDIS_RETRY_SECONDS = 10.0
+
+_redis_retry_at: float = 0.0
+_bucket_script = None
+_bucket_script_client = None
+
+
+def _redis_available() -> bool:
+    return time.monotonic() >= _redis_retry_at
+
+
+def _mark_redis_unavailable(error: Exception):
+    global _redis_retry_at
+    if _redis_available():
+        logger.warning(
+            f"[RATE_LIMIT] Redis unavailable ({error}), "
+            f"using process-local limits for {REDIS_RETRY_SECONDS:.0f}s"
+        )
+    _redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+
+
+async def _run_bucket_script(
+    key: str,
+    rate: float,
+    capacity: float,
+    requested: float,
+    needed: float,
+) -> Optional[Tuple[float, float]]:
+    """
+    Run the token bucket script against Redis.
+
+    Returns:
+        (granted, seconds_to_wait), or None if Redis is unavailable
+    """
+    global _bucket_script, _bucket_script_client
+    if not _redis_available():
+        return None
+
+    try:
+        from .redis import get_redis, RATE_LIMIT_TTL
+        client = await get_redis()
+        if _bucket_script is None or _bucket_script_client is not client:
+            _bucket_script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+            _bucket_script_client = client
+
+        granted, wait = await _bucket_script(
+            keys=[key],
+            args=[rate, capacity, requested, needed, RATE_LIMIT_TTL * 1000],
+        )
+        return float(granted), float(wait)
+    except Exception as e:
+        _mark_redis_unavailable(e)
+        return None
+
+
+class DistributedTokenBucket:
+    """
+    Cluster-wide token bucket stored in Redis.
+
+    Same acquire/try_acquire API as TokenBucket. Tokens are granted by Redis
+    in batches of up to batch_size and spent locally, so most acquires never
+    leave the process. Leased tokens expire after lease_ttl seconds, which
+    keeps an idle process from sitting on budget other shards could use.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        rate: float,
+        capacity: Optional[float] = None,
+        batch_size: float = 1.0,
+        lease_ttl: float = 1.0,
+        name: Optional[str] = None,
+    ):
+        """
+        Initialize distributed token bucket.
+
+        Args:
+            key: Redis key shared by every process using this bucket
+            rate: Tokens per second for the whole cluster
+            capacity: Maximum bucket capacity (defaults to rate)
+            batch_size: Max tokens leased from Redis per round-trip
+            lease_ttl: Seconds before unspent leased tokens are dropped
+            name: Limiter label for the wait-time metric (None = not recorded)
+        """
+        self.key = key
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.batch_size = max(1.0, min(float(batch_size), self.capacity))
+        self.lease_ttl = lease_ttl
+        self._leased = 0.0
+        self._lease_expires = 0.0
+        self._lock = asyncio.Lock()
+        # Used while Redis is unreachable
+        self._fallback = TokenBucket(rate=rate, capacity=capacity)
+
+    def _take_leased(self, tokens: float) -> bool:
+        if self._leased >= tokens and time.monotonic() < self._lease_expires:
+            self._leased -= tokens
+            return True
+        return False
+
+    async def _request(self, tokens: float) -> Optional[float]:
+        """
+        Lease a batch from Redis and take `tokens` from it.
+
+        Returns:
+            0.0 if acquired, seconds to wait if the bucket is empty,
+            None if Redis is unavailable
+        """
+        result = await _run_bucket_script(
+            self.key,
+            self.rate,
+            self.capacity,
+            max(tokens, self.batch_size),
+            tokens,
+        )
+        if result is None:
+            return None
+
+        granted, wait = result
+        if granted >= tokens:
+            self._leased = granted - tokens
+            self._lease_expires = time.monotonic() + self.lease_ttl
+            return 0.0
+        return max(wait, 0.001)
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Acquire tokens from the shared bucket, waiting if necessary.
+
+        Args:
+            tokens: Number of tokens to acquire
+        """
+        started = time.monotonic()
+        while True:
+            async with self._lock:
+                if self._take_leased(tokens):
+                    _observe_wait(self.name, started)
+                    return
+                wait_time = await self._request(tokens)
+
+            if wait_time is None:
+                await self._fallback.acquire(tokens)
+                _observe_wait(self.name, started)
+                return
+            if wait_time == 0.0:
+                _observe_wait(self.name, started)
+                return
+
+            # Wait outside the lock to allow other coroutines
+            await asyncio.sleep(wait_time)
+
+    async def try_acquire(self, tokens: float = 1.0) -> bool:
+        """
+        Try to acquire tokens without blocking.
+
+        Returns:
+            True if tokens were acquired, False otherwise
+        """
+        async with self._lock:
+            if self._take_leased(tokens):
+                return True
+            wait_time = await self._request(tokens)
+
+        if wait_time is None:
+            return await self._fallback.try_acquire(tokens)
+        return wait_time == 0.0
+
+    def get_available_tokens(self) -> float:
+        """Get tokens leased to this process (for monitoring)"""
+        if time.monotonic() >= self._lease_expires:
+            return 0.0
+        return self._leased
+
+
+RateLimiter = Union[TokenBucket, DistributedTokenBucket]
+
+
+def _make_bucket(
+    key: str,
+    rate: float,
+    capacity: Optional[float] = None,
+    batch_size: float = 1.0,
+    name: Optional[str] = None,
+) -> RateLimiter:
+    """Create a Redis-backed bucket, or a local one if distributed limits are disabled."""
+    from ..config import settings
+    if settings.distributed_rate_limits:
+        return DistributedTokenBucket(key, rate=rate, capacity=capacity, batch_size=batch_size, name=name)
+    return TokenBucket(rate=rate, capacity=capacity, name=name)
+
+
+async def _get_shared_ttl(key: str) -> Optional[float]:
+    """Remaining TTL of a shared flag key in seconds (0 if unset), None if Redis is unavailable."""
+    if not _redis_available():
+        return None
+    try:
+        from .redis import get_redis
+        client = await get_redis()
+        ttl_ms = await client.pttl(key)
+        return ttl_ms / 1000 if ttl_ms and ttl_ms > 0 else 0.0
+    except Exception as e:
+        _mark_redis_unavailable(e)
+        return None
+
+
+async def _set_shared_flag(key: str, seconds: float):
+    """Set a shared flag key that expires after `seconds`."""
+    if not _redis_available():
+        return
+    try:
+        from .redis import get_redis
+        client = await get_redis()
+        await client.set(key, "1", px=int(seconds * 1000))
+    except Exception as e:
+        _mark_redis_unavailable(e)
+
+
 # ============================================================================
 # Global rate limiter (legacy, used by browser_farm and catalog endpoint)
 # ============================================================================
@@ -114,7 +404,7 @@ def get_global_rate_limiter() -> TokenBucket:
     global global_rate_limiter
     if global_rate_limiter is None:
         from ..config import settings
-        global_rate_limiter = TokenBucket(rate=settings.global_rps)
+        global_rate_limiter = TokenBucket(rate=settings.global_rps, name="global")
     return global_rate_limiter
 
 
@@ -122,26 +412,38 @@ def get_global_rate_limiter() -> TokenBucket:
 # Offers rate limiter (public endpoint, per IP)
 # ============================================================================
 
-_offers_rate_limiter: Optional[TokenBucket] = None
+_offers_rate_limiter: Optional[RateLimiter] = None
 
 # Monotonic timestamp until which all offers requests should pause (403 ban)
 _offers_ban_until: float = 0.0
 
+# Shared ban state is re-read from Redis at most this often
+SHARED_STATE_POLL_SECONDS = 1.0
+_offers_ban_checked_at: float = 0.0
+
 
-def get_offers_rate_limiter() -> TokenBucket:
-    """Get rate limiter for offers API (public endpoint, per IP)"""
+def get_offers_rate_limiter() -> RateLimiter:
+    """Get rate limiter for offers API (public endpoint, per IP, shared by all shards)"""
     global _offers_rate_limiter
     if _offers_rate_limiter is None:
         from ..config import settings
-        _offers_rate_limiter = TokenBucket(rate=settings.offers_rps)
+        from .redis import RedisKeyspace
+        _offers_rate_limiter = _make_bucket(
+            RedisKeyspace.OFFERS_RATE_LIMIT,
+            rate=settings.offers_rps,
+            batch_size=settings.rate_limit_batch_size,
+            name="offers",
+        )
     return _offers_rate_limiter
 
 
 async def offers_ban_pause():
-    """Called when 403 received from offers API. Sets global pause."""
+    """Called when 403 received from offers API. Sets cluster-wide pause."""
     global _offers_ban_until
     from ..config import settings
+    from .redis import RedisKeyspace
     _offers_ban_until = time.monotonic() + settings.offers_ban_pause_seconds
+    await _set_shared_flag(RedisKeyspace.OFFERS_BAN, settings.offers_ban_pause_seconds)
     logger.warning(
         f"[RATE_LIMIT] Offers API 403 detected, "
         f"pausing all offers requests for {settings.offers_ban_pause_seconds}s"
@@ -149,9 +451,15 @@ async def offers_ban_pause():
 
 
 async def wait_for_offers_ban():
-    """Wait if currently in a 403 ban period for offers API."""
-    global _offers_ban_until
+    """Wait if currently in a 403 ban period for offers API (set by any process)."""
+    global _offers_ban_until, _offers_ban_checked_at
     now = time.monotonic()
+    if now - _offers_ban_checked_at >= SHARED_STATE_POLL_SECONDS:
+        _offers_ban_checked_at = now
+        from .redis import RedisKeyspace
+        remaining = await _get_shared_ttl(RedisKeyspace.OFFERS_BAN)
+        if remaining:
+            _offers_ban_until = max(_offers_ban_until, now + remaining)
     if _offers_ban_until > now:
         wait_time = _offers_ban_until - now
         logger.debug(f"[RATE_LIMIT] Waiting {wait_time:.1f}s for offers 403 ban to expire")
@@ -162,59 +470,147 @@ async def wait_for_offers_ban():
 # Pricefeed rate limiter (per merchant account — NOT per IP!)
 # ============================================================================
 
-_pricefeed_rate_limiters: Dict[str, TokenBucket] = {}
+_pricefeed_rate_limiters: Dict[str, RateLimiter] = {}
 
 # Cooldown tracking: merchant_uid -> monotonic timestamp when cooldown expires
 _pricefeed_cooldowns: Dict[str, float] = {}
 
+# merchant_uid -> monotonic timestamp of the last shared cooldown lookup
+_pricefeed_cooldown_checked_at: Dict[str, float] = {}
 
-def get_pricefeed_rate_limiter(merchant_uid: str) -> TokenBucket:
-    """Get rate limiter for pricefeed API for a specific merchant account."""
+
+def get_pricefeed_rate_limiter(merchant_uid: str) -> RateLimiter:
+    """Get rate limiter for pricefeed API for a specific merchant account (shared by all shards)."""
     if merchant_uid not in _pricefeed_rate_limiters:
         from ..config import settings
+        from .redis import RedisKeyspace
         # capacity=1 prevents bursts — at most 1 request can fire immediately
-        _pricefeed_rate_limiters[merchant_uid] = TokenBucket(
-            rate=settings.pricefeed_rps, capacity=1
+        _pricefeed_rate_limiters[merchant_uid] = _make_bucket(
+            RedisKeyspace.pricefeed_rate_limit(merchant_uid),
+            rate=settings.pricefeed_rps,
+            capacity=1,
+            name="pricefeed",
         )
     return _pricefeed_rate_limiters[merchant_uid]
 
 
-def mark_pricefeed_cooldown(merchant_uid: str):
-    """Mark a merchant as cooled down after 429 from pricefeed (30-min ban)."""
+async def mark_pricefeed_cooldown(merchant_uid: str):
+    """Mark a merchant as cooled down after 429 from pricefeed (30-min ban), for all processes."""
     from ..config import settings
+    from .redis import RedisKeyspace
     cooldown_until = time.monotonic() + settings.pricefeed_cooldown_seconds
     _pricefeed_cooldowns[merchant_uid] = cooldown_until
+    await _set_shared_flag(
+        RedisKeyspace.pricefeed_cooldown(merchant_uid),
+        settings.pricefeed_cooldown_seconds,
+    )
     logger.warning(
         f"[RATE_LIMIT] Pricefeed 429 for merchant {merchant_uid}: "
         f"cooling down for {settings.pricefeed_cooldown_seconds}s (30 min)"
     )
 
 
-def is_merchant_cooled_down(merchant_uid: str) -> bool:
-    """Check if a merchant is in pricefeed cooldown (after 429)."""
+async def is_merchant_cooled_down(merchant_uid: str) -> bool:
+    """Check if a merchant is in pricefeed cooldown (after 429 seen by any process)."""
+    now = time.monotonic()
     cooldown_until = _pricefeed_cooldowns.get(merchant_uid, 0.0)
-    if cooldown_until > time.monotonic():
+    if cooldown_until > now:
         return True
+
+    # Not cooled down locally — ask Redis, at most once per poll interval
+    if now - _pricefeed_cooldown_checked_at.get(merchant_uid, 0.0) >= SHARED_STATE_POLL_SECONDS:
+        _pricefeed_cooldown_checked_at[merchant_uid] = now
+        from .redis import RedisKeyspace
+        remaining = await _get_shared_ttl(RedisKeyspace.pricefeed_cooldown(merchant_uid))
+        if remaining:
+            _pricefeed_cooldowns[merchant_uid] = now + remaining
+            return True
+
     # Expired — clean up
     _pricefeed_cooldowns.pop(merchant_uid, None)
     return False
 
 
+def merchant_cooldown_remaining(merchant_uid: str) -> float:
+    """Seconds left of a cooldown seen by is_merchant_cooled_down() (0 if none)."""
+    return max(0.0, _pricefeed_cooldowns.get(merchant_uid, 0.0) - time.monotonic())
+
+
 # ============================================================================
 # Orders API rate limiter (MC GraphQL + REST API)
 # ============================================================================
 
-_orders_rate_limiter: Optional[TokenBucket] = None
+_orders_rate_limiter: Optional[RateLimiter] = None
 
 
-def get_orders_rate_limiter() -> TokenBucket:
+def get_orders_rate_limiter() -> RateLimiter:
     """
-    Get rate limiter for Orders API (MC GraphQL + REST API).
+    Get rate limiter for MC GraphQL orders calls (session cookies, one global budget).
 
     Conservative 6 RPS to avoid triggering limits on MC GraphQL endpoint.
     """
     global _orders_rate_limiter
     if _orders_rate_limiter is None:
+        from ..config import settings
+        from .redis import RedisKeyspace
         # 6 RPS is safe for MC GraphQL (conservative estimate)
-        _orders_rate_limiter = TokenBucket(rate=6.0)
+        _orders_rate_limiter = _make_bucket(
+            RedisKeyspace.ORDERS_RATE_LIMIT,
+            rate=6.0,
+            batch_size=settings.rate_limit_batch_size,
+            name="orders",
+        )
     return _orders_rate_limiter
+
+
+# ============================================================================
+# Kaspi REST API rate limiter (per X-Auth-Token)
+# ============================================================================
+
+_orders_token_rate_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_orders_token_rate_limiter(api_token: str) -> RateLimiter:
+    """
+    Get rate limiter for the Kaspi REST API (orders, products) for one API token.
+
+    The REST budget is per token, so stores never throttle each other. The
+    Redis key uses a hash of the token, never the token itself.
+    """
+    token_hash = hashlib.sha256(api_token.encode()).hexdigest()[:16]
+    if token_hash not in _orders_token_rate_limiters:
+        from ..config import settings
+        from .redis import RedisKeyspace
+        _orders_token_rate_limiters[token_hash] = _make_bucket(
+            RedisKeyspace.orders_token_rate_limit(token_hash),
+            rate=settings.orders_api_token_rps,
+            batch_size=settings.rate_limit_batch_size,
+            name="orders_token",
+        )
+    return _orders_token_rate_limiters[token_hash]
+
+
+# ============================================================================
+# WhatsApp rate limiter (per user WAHA session)
+# ============================================================================
+
+_whatsapp_rate_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_whatsapp_rate_limiter(user_id: str) -> RateLimiter:
+    """
+    Get rate limiter for order messages sent through one user's WhatsApp session.
+
+    Every user has a single WAHA session; bursts of template messages from one
+    number get it flagged as spam, so sends are paced cluster-wide.
+    """
+    if user_id not in _whatsapp_rate_limiters:
+        from ..config import settings
+        from .redis import RedisKeyspace
+        _whatsapp_rate_limiters[user_id] = _make_bucket(
+            RedisKeyspace.whatsapp_rate_limit(user_id),
+            rate=settings.whatsapp_session_messages_per_minute / 60,
+            capacity=settings.whatsapp_session_burst,
+            name="whatsapp",
+        )
+    return _whatsapp_rate_limiters[user_id]
@@ -53,6 +53,7 @@ async def get_redis() -> redis.Redis:
 # Default TTL values (seconds) for different key types
 DEFAULT_TTL = 3600          # 1 hour (general fallback)
 PROXY_TTL = 300             # 5 min
+PROXY_DEAD_TTL = 86400      # 24 hours (dead mark shared by proxy rotators)
 SESSION_TTL = 86400         # 24 hours
 RATE_LIMIT_TTL = 120        # 2 min
 CACHE_TTL = 600             # 10 min
@@ -62,7 +63,8 @@ WAHA_TTL = 3600             # 1 hour
 class RedisKeyspace:
     """Redis key namespaces for different data types"""
 
-    # Proxy coordination
+    # Proxy coordination (ProxyRotator): requests of the current window,
+    # and the 'resting' / 'dead' mark
     PROXY_PREFIX = "proxy:"
     PROXY_LOCK = "proxy:lock:{key}"
     PROXY_USAGE = "proxy:usage:{key}"
@@ -75,11 +77,22 @@ class RedisKeyspace:
     RATE_LIMIT_PREFIX = "ratelimit:"
     GLOBAL_RATE_LIMIT = "ratelimit:global"
     USER_RATE_LIMIT = "ratelimit:user:{user_id}"
+    OFFERS_RATE_LIMIT = "ratelimit:offers"
+    OFFERS_BAN = "ratelimit:offers:ban"
+    ORDERS_RATE_LIMIT = "ratelimit:orders"
+    ORDERS_TOKEN_RATE_LIMIT = "ratelimit:orders:token:{token_hash}"
+    PRICEFEED_RATE_LIMIT = "ratelimit:pricefeed:{merchant_uid}"
+    PRICEFEED_COOLDOWN = "ratelimit:pricefeed:cooldown:{merchant_uid}"
+    WHATSAPP_RATE_LIMIT = "ratelimit:whatsapp:{user_id}"
 
     # Cache
     CACHE_PREFIX = "cache:"
     PRODUCT_CACHE = "cache:product:{sku}"
     STORE_CACHE = "cache:store:{store_id}"
+    OFFERS_CACHE = "cache:offers:{product_id}"
+
+    # Metrics (hash: instance name -> JSON snapshot)
+    METRICS_SNAPSHOTS = "metrics:snapshots"
 
     # WAHA container management
     WAHA_PREFIX = "waha:"
@@ -102,6 +115,22 @@ class RedisKeyspace:
     def user_rate_limit(user_id: str) -> str:
         return f"ratelimit:user:{user_id}"
 
+    @staticmethod
+    def pricefeed_rate_limit(merchant_uid: str) -> str:
+        return f"ratelimit:pricefeed:{merchant_uid}"
+
+    @staticmethod
+    def orders_token_rate_limit(token_hash: str) -> str:
+        return f"ratelimit:orders:token:{token_hash}"
+
+    @staticmethod
+    def whatsapp_rate_limit(user_id: str) -> str:
+        return f"ratelimit:whatsapp:{user_id}"
+
+    @staticmethod
+    def pricefeed_cooldown(merchant_uid: str) -> str:
+        return f"ratelimit:pricefeed:cooldown:{merchant_uid}"
+
     @staticmethod
     def product_cache(sku: str) -> str:
         return f"cache:product:{sku}"
@@ -110,6 +139,10 @@ class RedisKeyspace:
     def store_cache(store_id: str) -> str:
         return f"cache:store:{store_id}"
 
+    @staticmethod
+    def offers_cache(product_id: str) -> str:
+        return f"cache:offers:{product_id}"
+
     @staticmethod
     def waha_container_status(user_id: str) -> str:
         return f"waha:container:{user_id}"
@@ -0,0 +1,139 @@
+"""
+Tests for the offers cache: single-flight respects each caller's max_age,
+and the monitoring stats cover every demper shard.
+
+Redis is mocked.
+
+Run with: pytest app/core/test_offers_cache.py -v
+"""
+
+import asyncio
+import json
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from . import offers_cache
+from .metrics import get_metrics
+from .offers_cache import OffersCache
+
+
+def _cache(shared=None) -> OffersCache:
+    """Cache whose Redis tier holds `shared` (a (fetched_at, data) entry) for every key."""
+    cache = OffersCache(ttl=30, local_size=100)
+    cache._get_shared = AsyncMock(return_value=shared)
+    cache._set_shared = AsyncMock()
+    return cache
+
+
+class SlowFetch:
+    """Upstream request that completes when released."""
+
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        return self.data
+
+
+@pytest.mark.asyncio
+class TestCoalescing:
+    """Joiners only share a leader whose result is fresh enough for them"""
+
+    async def test_lenient_joiner_coalesced(self):
+        cache = _cache()
+        fetch = SlowFetch({"offers": [1]})
+
+        leader = asyncio.create_task(cache.get_or_fetch("P1", "750000000", fetch, max_age=10))
+        await asyncio.sleep(0)
+        joiner = asyncio.create_task(cache.get_or_fetch("P1", "750000000", fetch, max_age=30))
+        await asyncio.sleep(0)
+        fetch.release.set()
+
+        assert await leader == await joiner == {"offers": [1]}
+        assert fetch.calls == 1
+        assert cache.stats["coalesced"] == 1
+
+    async def test_stricter_joiner_not_handed_older_entry(self):
+        # Redis entry 20s old: good for the default TTL, too old for priority
+        cache = _cache()
+        redis_read = asyncio.Event()
+
+        async def slow_shared(key):
+            await redis_read.wait()
+            return (time.time() - 20, {"offers": ["stale"]})
+
+        cache._get_shared = slow_shared
+        fetch = SlowFetch({"offers": ["fresh"]})
+        fetch.release.set()
+
+        leader = asyncio.create_task(cache.get_or_fetch("P1", "750000000", fetch, max_age=30))
+        await asyncio.sleep(0)
+        strict = asyncio.create_task(cache.get_or_fetch("P1", "750000000", fetch, max_age=10))
+        await asyncio.sleep(0)
+        redis_read.set()
+
+        assert await leader == {"offers": ["stale"]}
+        assert await strict == {"offers": ["fresh"]}
+        assert fetch.calls == 1
+        assert cache.stats["coalesced"] == 0
+        assert cache._inflight == {}
+
+    async def test_later_callers_join_stricter_leader(self):
+        cache = _cache()
+        lenient_fetch = SlowFetch({"offers": ["lenient"]})
+        strict_fetch = SlowFetch({"offers": ["strict"]})
+
+        lenient = asyncio.create_task(cache.get_or_fetch("P1", "750000000", lenient_fetch, max_age=30))
+        await asyncio.sleep(0)
+        strict = asyncio.create_task(cache.get_or_fetch("P1", "750000000", strict_fetch, max_age=10))
+        await asyncio.sleep(0)
+        late = asyncio.create_task(cache.get_or_fetch("P1", "750000000", lenient_fetch, max_age=30))
+        await asyncio.sleep(0)
+
+        lenient_fetch.release.set()
+        assert await lenient == {"offers": ["lenient"]}
+        # The first leader finishing does not drop the stricter one's entry
+        assert not late.done()
+
+        strict_fetch.release.set()
+        assert await strict == await late == {"offers": ["strict"]}
+        assert lenient_fetch.calls == strict_fetch.calls == 1
+        assert cache._inflight == {}
+
+
+@pytest.mark.asyncio
+class TestClusterStats:
+    """Counters are summed over the published shard snapshots"""
+
+    async def test_shards_summed(self):
+        cache = offers_cache.get_offers_cache()
+        saved = dict(cache.stats)
+        try:
+            cache.stats.update(local_hits=1, redis_hits=0, misses=3, coalesced=0, redis_errors=0)
+            shard = get_metrics().snapshot()
+            cache.stats.update(local_hits=4, misses=1)
+
+            redis = AsyncMock()
+            redis.hgetall.return_value = {
+                "demper-0": json.dumps({"ts": time.time(), "metrics": shard}),
+                "demper-1": json.dumps({"ts": time.time() - 3600, "metrics": shard}),
+                "orders-worker": json.dumps({"ts": time.time(), "metrics": "# no offers cache here\n"}),
+            }
+            with patch("app.core.redis.get_redis", AsyncMock(return_value=redis)):
+                stats = await offers_cache.cluster_stats()
+        finally:
+            cache.stats.update(saved)
+
+        assert set(stats["instances"]) == {"api", "demper-0"}
+        assert stats["instances"]["api"]["local_hits"] == 4
+        assert stats["instances"]["demper-0"]["misses"] == 3
+        assert stats["total"]["local_hits"] == 5
+        assert stats["total"]["misses"] == 4
+        assert stats["total"]["lookups"] == 9
+        assert stats["total"]["hit_rate"] == round(5 / 9, 4)
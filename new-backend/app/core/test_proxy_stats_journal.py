@@ -0,0 +1,93 @@
+"""
+Tests for the proxy stats journal flush: journaled state changes must not
+undo dead marks or shorten a quarantine written by the health prober.
+
+Needs TEST_DATABASE_URL (see app/conftest.py).
+
+Run with: pytest app/core/test_proxy_stats_journal.py -v
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from .proxy_stats_journal import ProxyStatsJournal
+
+
+async def _proxy(conn, port, status="allocated", available_at=None, requests_count=0):
+    return await conn.fetchval(
+        """
+        INSERT INTO proxies (host, port, status, available_at, requests_count)
+        VALUES ('127.0.0.1', $1, $2, $3, $4)
+        RETURNING id
+        """,
+        port, status, available_at, requests_count,
+    )
+
+
+async def _state(conn, proxy_id):
+    return await conn.fetchrow(
+        "SELECT status, available_at, requests_count FROM proxies WHERE id = $1", proxy_id
+    )
+
+
+@pytest.mark.asyncio
+class TestStatesFlush:
+    """State changes against rows changed by others"""
+
+    async def test_resting(self, db_pool):
+        rest_until = datetime.now(timezone.utc) + timedelta(minutes=5)
+        async with db_pool.acquire() as conn:
+            proxy_id = await _proxy(conn, 9001, requests_count=249)
+
+        journal = ProxyStatsJournal(flush_interval=3600)
+        journal.set_resting(proxy_id, rest_until)
+        await journal.flush()
+
+        async with db_pool.acquire() as conn:
+            state = await _state(conn, proxy_id)
+        assert state["status"] == "resting"
+        assert state["available_at"] == rest_until
+        assert state["requests_count"] == 0
+
+    async def test_dead_proxy_not_revived(self, db_pool):
+        async with db_pool.acquire() as conn:
+            proxy_id = await _proxy(conn, 9002, status="dead")
+
+        journal = ProxyStatsJournal(flush_interval=3600)
+        journal.set_resting(proxy_id, datetime.now(timezone.utc) + timedelta(minutes=5))
+        journal.record(proxy_id, success=False)
+        await journal.flush()
+
+        async with db_pool.acquire() as conn:
+            state = await _state(conn, proxy_id)
+        assert state["status"] == "dead"
+        assert state["available_at"] is None
+
+    async def test_quarantine_not_shortened(self, db_pool):
+        quarantined_until = datetime.now(timezone.utc) + timedelta(minutes=30)
+        async with db_pool.acquire() as conn:
+            proxy_id = await _proxy(conn, 9003, status="resting", available_at=quarantined_until)
+
+        journal = ProxyStatsJournal(flush_interval=3600)
+        journal.set_resting(proxy_id, datetime.now(timezone.utc) + timedelta(minutes=5))
+        await journal.flush()
+
+        async with db_pool.acquire() as conn:
+            state = await _state(conn, proxy_id)
+        assert state["status"] == "resting"
+        assert state["available_at"] == quarantined_until
+
+    async def test_set_dead(self, db_pool):
+        rest_until = datetime.now(timezone.utc) + timedelta(minutes=5)
+        async with db_pool.acquire() as conn:
+            proxy_id = await _proxy(conn, 9004, status="resting", available_at=rest_until)
+
+        journal = ProxyStatsJournal(flush_interval=3600)
+        journal.set_dead(proxy_id)
+        await journal.flush()
+
+        async with db_pool.acquire() as conn:
+            state = await _state(conn, proxy_id)
+        assert state["status"] == "dead"
+        assert state["available_at"] == rest_until
@@ -10,6 +10,7 @@ from .core.database import create_pool, close_pool
 from .core.redis import create_redis_client, close_redis_client
 from .core.logger import setup_logging
 from .core.http_client import close_http_client
+from .core.proxy_stats_journal import close_proxy_stats_journal
 
 
 class SecurityHeadersMiddleware:
@@ -116,12 +117,7 @@ async def lifespan(app: FastAPI):
         pool = await get_db_pool()
         asyncio.create_task(load_legal_docs_background(pool))
 
-        # Start periodic orders sync in background (every 60 min, auto-restart on crash)
-        logger.info("[STARTUP] Starting periodic orders sync in background...")
-        from .services.orders_sync_service import periodic_orders_sync
-        asyncio.create_task(_safe_background_task(
-            periodic_orders_sync, pool, name="orders_sync", restart_delay=60
-        ))
+        # Orders sync runs in the sharded orders worker (app.workers.orders_worker)
 
         # Start preorder status checker in background (every 5 min)
         logger.info("[STARTUP] Starting preorder checker in background...")
@@ -130,6 +126,14 @@ async def lifespan(app: FastAPI):
             periodic_preorder_check, pool, name="preorder_check", restart_delay=60
         ))
 
+        # Probe pool proxies in background (latency stats, quarantine)
+        if settings.proxy_probe_enabled:
+            logger.info("[STARTUP] Starting proxy prober in background...")
+            from .services.proxy_prober import periodic_proxy_probe
+            asyncio.create_task(_safe_background_task(
+                periodic_proxy_probe, pool, name="proxy_probe", restart_delay=60
+            ))
+
         total_elapsed = time.time() - total_start
         logger.info(f"[STARTUP] ✅ Application ready in {total_elapsed:.2f}s")
 
@@ -141,7 +145,9 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info("[SHUTDOWN] Shutting down application...")
+    # Shared keep-alive clients: merchant API, offers, Kaspi REST API, proxy pool
     await close_http_client()
+    await close_proxy_stats_journal()
     await close_pool()
     await close_redis_client()
     logger.info("[SHUTDOWN] Application shutdown complete")
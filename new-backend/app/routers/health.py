@@ -1,10 +1,12 @@
 """Health and monitoring endpoints"""
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 from typing import Annotated
 import asyncpg
 
 from ..core.database import get_db_pool
+from ..core.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, collect_cluster_metrics
+from ..core.offers_cache import cluster_stats as offers_cache_cluster_stats, get_offers_cache
 from ..models.proxy import ProxyPoolStatus
 from ..dependencies import get_current_user, get_current_admin_user
 
@@ -72,6 +74,38 @@ async def get_proxy_pool_status(
     )
 
 
+@router.get("/offers-cache")
+async def get_offers_cache_stats(
+    current_user: Annotated[dict, Depends(get_current_admin_user)],
+):
+    """
+    Get competitor offers cache statistics
+
+    Returns hit/miss counters summed over the API process and every demper
+    shard (`total`, from their published metrics snapshots), per instance
+    (`instances`), and this API process's local cache state (`api`).
+    """
+    return {
+        **await offers_cache_cluster_stats(),
+        "api": get_offers_cache().get_stats(),
+    }
+
+
+@router.get("/metrics")
+async def get_cluster_metrics(
+    current_user: Annotated[dict, Depends(get_current_admin_user)],
+):
+    """
+    Get metrics of all processes in Prometheus text format
+
+    Combines this API process's metrics with the latest snapshot published
+    by each demper shard and worker (labelled by `instance`). Each worker
+    also serves its own metrics unauthenticated on metrics_port for direct
+    scraping inside the private network.
+    """
+    return Response(content=await collect_cluster_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
 @router.get("/proxies/user/{user_id}")
 async def get_user_proxy_status(
     user_id: str,
@@ -3,7 +3,6 @@
 from fastapi import APIRouter, Body, Depends, HTTPException, status, BackgroundTasks
 from typing import Annotated, List, Optional, Dict, Any
 from pydantic import BaseModel
-import asyncio
 import asyncpg
 import uuid
 import logging
@@ -46,11 +45,11 @@ from ..services.kaspi_auth_service import (
     KaspiAuthError,
 )
 from ..services.api_parser import (
-    get_products,
+    iter_product_pages,
     sync_product,
     batch_sync_products,
     parse_product_by_sku,
-    fetch_product_image_url,
+    backfill_product_images,
 )
 from ..core.security import encrypt_session
 from ..utils.security import escape_like, clamp_page_size, DEMPING_SETTINGS_FIELDS, CITY_PRICE_FIELDS
@@ -681,6 +680,25 @@ async def verify_phone_auth(
         )
 
 
+_PRODUCTS_PAGE_UPSERT_SQL = """
+    INSERT INTO products (
+        store_id, kaspi_product_id, kaspi_sku, external_kaspi_id,
+        name, price, availabilities, bot_active, category, image_url
+    )
+    VALUES ($1, $2, $3, $4, $5, $6, $7, false, $8, $9)
+    ON CONFLICT (store_id, kaspi_product_id)
+    DO UPDATE SET
+        name = EXCLUDED.name,
+        price = EXCLUDED.price,
+        availabilities = EXCLUDED.availabilities,
+        kaspi_sku = COALESCE(EXCLUDED.kaspi_sku, products.kaspi_sku),
+        external_kaspi_id = COALESCE(EXCLUDED.external_kaspi_id, products.external_kaspi_id),
+        category = COALESCE(EXCLUDED.category, products.category),
+        image_url = COALESCE(EXCLUDED.image_url, products.image_url),
+        updated_at = NOW()
+"""
+
+
 async def _sync_store_products_task(store_id: str, merchant_id: str):
     """Background task to sync store products"""
     try:
@@ -717,37 +735,20 @@ async def _sync_store_products_task(store_id: str, merchant_id: str):
             session = decrypt_session(encrypted_guid)
             logger.debug(f"Decrypted session successfully, type: {type(session)}")
 
-            # Fetch products from Kaspi API
-            products = await get_products(merchant_id, session)
-
-            # Upsert products to database
-            # NOTE: We do NOT delete old products here because GraphQL and REST API
-            # return different kaspi_product_id formats (hex vs numeric_numeric),
-            # and deleting by ID mismatch would destroy user settings (bot_active, etc.)
-            for product_data in products:
+        # Stream the catalog from Kaspi and upsert each page as it arrives;
+        # a connection is held only while a page is written
+        # NOTE: We do NOT delete old products here because GraphQL and REST API
+        # return different kaspi_product_id formats (hex vs numeric_numeric),
+        # and deleting by ID mismatch would destroy user settings (bot_active, etc.)
+        products_count = 0
+        async for page in iter_product_pages(merchant_id, session):
+            records = []
+            for product_data in page:
                 # Convert availabilities dict to JSON string for PostgreSQL
                 availabilities = product_data.get('availabilities')
                 if isinstance(availabilities, dict):
                     availabilities = json.dumps(availabilities)
-
-                await conn.execute(
-                    """
-                    INSERT INTO products (
-                        store_id, kaspi_product_id, kaspi_sku, external_kaspi_id,
-                        name, price, availabilities, bot_active, category, image_url
-                    )
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, false, $8, $9)
-                    ON CONFLICT (store_id, kaspi_product_id)
-                    DO UPDATE SET
-                        name = $5,
-                        price = $6,
-                        availabilities = $7,
-                        kaspi_sku = COALESCE($3, products.kaspi_sku),
-                        external_kaspi_id = COALESCE($4, products.external_kaspi_id),
-                        category = COALESCE($8, products.category),
-                        image_url = COALESCE($9, products.image_url),
-                        updated_at = NOW()
-                    """,
+                records.append((
                     uuid.UUID(store_id),
                     product_data['kaspi_product_id'],
                     product_data.get('kaspi_sku'),
@@ -757,8 +758,13 @@ async def _sync_store_products_task(store_id: str, merchant_id: str):
                     availabilities,
                     product_data.get('category'),
                     product_data.get('image_url'),
-                )
+                ))
+
+            async with pool.acquire() as conn:
+                await conn.executemany(_PRODUCTS_PAGE_UPSERT_SQL, records)
+            products_count += len(records)
 
+        async with pool.acquire() as conn:
             # Update store products count and last sync
             await conn.execute(
                 """
@@ -766,31 +772,15 @@ async def _sync_store_products_task(store_id: str, merchant_id: str):
                 SET products_count = $1, last_sync = NOW()
                 WHERE id = $2
                 """,
-                len(products),
+                products_count,
                 uuid.UUID(store_id)
             )
 
-            logger.info(f"Synced {len(products)} products for store {store_id}")
+        logger.info(f"Synced {products_count} products for store {store_id}")
 
-            # Backfill images for products that don't have them
-            missing_images = await conn.fetch(
-                """SELECT id, external_kaspi_id FROM products
-                   WHERE store_id = $1 AND image_url IS NULL AND external_kaspi_id IS NOT NULL""",
-                uuid.UUID(store_id)
-            )
-            if missing_images:
-                logger.info(f"Backfilling images for {len(missing_images)} products in store {store_id}")
-                for product in missing_images:
-                    try:
-                        image_url = await fetch_product_image_url(product['external_kaspi_id'])
-                        if image_url:
-                            await conn.execute(
-                                "UPDATE products SET image_url = $1, updated_at = NOW() WHERE id = $2",
-                                image_url, product['id']
-                            )
-                    except Exception as img_err:
-                        logger.warning(f"Image backfill failed for {product['id']}: {img_err}")
-                    await asyncio.sleep(0.5)
+        # Backfill images for products that don't have them (concurrent,
+        # rate-limited, no connection held during lookups)
+        await backfill_product_images(store_id)
 
     except Exception as e:
         logger.error(f"Error syncing store {store_id}: {e}")
@@ -1853,24 +1843,22 @@ async def get_store_stats(
             uuid.UUID(store_id)
         )
 
-        # Get orders stats (exclude cancelled/returned)
+        # Get orders stats from the daily rollup (cancelled/returned are
+        # already excluded); week/month are the last 7/30 calendar days
         orders_stats = await conn.fetchrow(
             """
             SELECT
-                COUNT(*) FILTER (WHERE order_date >= CURRENT_DATE) as today_orders,
-                COALESCE(SUM(total_price) FILTER (WHERE order_date >= CURRENT_DATE), 0) as today_revenue,
-                COALESCE(SUM(
-                    (SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE order_id = orders.id)
-                ) FILTER (WHERE order_date >= CURRENT_DATE), 0) as today_items_sold,
-                COUNT(*) FILTER (WHERE order_date >= NOW() - INTERVAL '7 days') as week_orders,
-                COALESCE(SUM(total_price) FILTER (WHERE order_date >= NOW() - INTERVAL '7 days'), 0) as week_revenue,
-                COUNT(*) FILTER (WHERE order_date >= NOW() - INTERVAL '30 days') as month_orders,
-                COALESCE(SUM(total_price) FILTER (WHERE order_date >= NOW() - INTERVAL '30 days'), 0) as month_revenue,
-                COUNT(*) as total_orders,
-                COALESCE(SUM(total_price), 0) as total_revenue
-            FROM orders
+                COALESCE(SUM(orders) FILTER (WHERE date = CURRENT_DATE), 0) as today_orders,
+                COALESCE(SUM(revenue) FILTER (WHERE date = CURRENT_DATE), 0)::bigint as today_revenue,
+                COALESCE(SUM(items) FILTER (WHERE date = CURRENT_DATE), 0) as today_items_sold,
+                COALESCE(SUM(orders) FILTER (WHERE date > CURRENT_DATE - 7), 0) as week_orders,
+                COALESCE(SUM(revenue) FILTER (WHERE date > CURRENT_DATE - 7), 0)::bigint as week_revenue,
+                COALESCE(SUM(orders) FILTER (WHERE date > CURRENT_DATE - 30), 0) as month_orders,
+                COALESCE(SUM(revenue) FILTER (WHERE date > CURRENT_DATE - 30), 0)::bigint as month_revenue,
+                COALESCE(SUM(orders), 0) as total_orders,
+                COALESCE(SUM(revenue), 0)::bigint as total_revenue
+            FROM store_daily_sales
             WHERE store_id = $1
-                AND status NOT IN ('CANCELLED', 'CANCELLING', 'RETURNED')
             """,
             uuid.UUID(store_id)
         )
@@ -1932,22 +1920,14 @@ async def get_store_analytics(
             )
 
         days = {'7d': 7, '30d': 30, '90d': 90}[period]
-        start_date = datetime.utcnow() - timedelta(days=days)
+        start_date = (datetime.utcnow() - timedelta(days=days - 1)).date()
 
-        # Get daily stats from orders table (exclude cancelled/returned)
+        # Daily stats from the rollup (cancelled/returned already excluded)
         daily_data = await conn.fetch(
             """
-            SELECT
-                DATE(order_date) as date,
-                COUNT(*) as orders,
-                COALESCE(SUM(total_price), 0) as revenue,
-                COALESCE(SUM(
-                    (SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE order_id = orders.id)
-                ), 0) as items
-            FROM orders
-            WHERE store_id = $1 AND order_date >= $2
-                AND status NOT IN ('CANCELLED', 'CANCELLING', 'RETURNED')
-            GROUP BY DATE(order_date)
+            SELECT date, orders, revenue, items
+            FROM store_daily_sales
+            WHERE store_id = $1 AND date >= $2
             ORDER BY date ASC
             """,
             uuid.UUID(store_id),
@@ -2010,7 +1990,7 @@ async def get_top_products(
     if period not in ['7d', '30d', '90d']:
         period = '7d'
     days = {'7d': 7, '30d': 30, '90d': 90}[period]
-    start_date = datetime.utcnow() - timedelta(days=days)
+    start_date = (datetime.utcnow() - timedelta(days=days - 1)).date()
 
     async with pool.acquire() as conn:
         # Verify ownership
@@ -2025,26 +2005,33 @@ async def get_top_products(
                 detail="Store not found"
             )
 
-        # Get top products by sales (from order_items, filtered by period and status)
+        # Get top products by sales from the daily product rollup
+        # (cancelled/returned already excluded)
         products = await conn.fetch(
             """
             SELECT
-                COALESCE(p.id, oi.product_id) as id,
-                COALESCE(p.kaspi_sku, oi.sku) as kaspi_sku,
-                COALESCE(p.name, oi.name) as name,
+                COALESCE(p.id, t.product_id) as id,
+                COALESCE(p.kaspi_sku, t.sku) as kaspi_sku,
+                COALESCE(p.name, t.name) as name,
                 COALESCE(p.price, 0) as current_price,
-                SUM(oi.quantity) as sales_count,
-                SUM(oi.quantity * oi.price) as revenue
-            FROM order_items oi
-            JOIN orders o ON o.id = oi.order_id
-            LEFT JOIN products p ON p.id = oi.product_id
-            WHERE o.store_id = $1
-                AND o.order_date >= $3
-                AND o.status NOT IN ('CANCELLED', 'CANCELLING', 'RETURNED')
-            GROUP BY COALESCE(p.id, oi.product_id), COALESCE(p.kaspi_sku, oi.sku),
-                     COALESCE(p.name, oi.name), COALESCE(p.price, 0)
-            ORDER BY sales_count DESC
-            LIMIT $2
+                t.sales_count,
+                t.revenue
+            FROM (
+                SELECT
+                    product_key,
+                    product_id,
+                    MAX(sku) as sku,
+                    MAX(name) as name,
+                    SUM(quantity) as sales_count,
+                    SUM(revenue)::bigint as revenue
+                FROM store_daily_product_sales
+                WHERE store_id = $1 AND date >= $3
+                GROUP BY product_key, product_id
+                ORDER BY sales_count DESC
+                LIMIT $2
+            ) t
+            LEFT JOIN products p ON p.id = t.product_id
+            ORDER BY t.sales_count DESC
             """,
             uuid.UUID(store_id),
             limit,
@@ -2177,7 +2164,7 @@ async def get_order_breakdowns(
     if period not in ['7d', '30d', '90d']:
         period = '7d'
     days = {'7d': 7, '30d': 30, '90d': 90}[period]
-    start_date = datetime.utcnow() - timedelta(days=days)
+    start_date = (datetime.utcnow() - timedelta(days=days - 1)).date()
 
     async with pool.acquire() as conn:
         store = await conn.fetchrow(
@@ -2187,97 +2174,62 @@ async def get_order_breakdowns(
         if not store:
             raise HTTPException(status_code=404, detail="Store not found")
 
-        sid = uuid.UUID(store_id)
-        excluded = ('CANCELLED', 'CANCELLING', 'RETURNED')
-
-        # Payment mode breakdown
-        payment_rows = await conn.fetch(
-            """
-            SELECT payment_mode, COUNT(*) as cnt, COALESCE(SUM(total_price), 0) as rev
-            FROM orders
-            WHERE store_id = $1 AND order_date >= $2
-                AND status NOT IN ('CANCELLED', 'CANCELLING', 'RETURNED')
-            GROUP BY payment_mode
-            ORDER BY cnt DESC
-            """,
-            sid, start_date
-        )
-
-        # Delivery mode breakdown
-        delivery_rows = await conn.fetch(
+        # Payment mode, delivery mode and city groups from the daily
+        # breakdown rollup (cancelled/returned already excluded)
+        rows = await conn.fetch(
             """
-            SELECT delivery_mode, COUNT(*) as cnt, COALESCE(SUM(total_price), 0) as rev
-            FROM orders
-            WHERE store_id = $1 AND order_date >= $2
-                AND status NOT IN ('CANCELLED', 'CANCELLING', 'RETURNED')
-            GROUP BY delivery_mode
+            SELECT dimension, key, SUM(orders) as cnt, SUM(revenue)::bigint as rev
+            FROM store_daily_order_breakdowns
+            WHERE store_id = $1 AND date >= $2
+            GROUP BY dimension, key
             ORDER BY cnt DESC
             """,
-            sid, start_date
+            uuid.UUID(store_id), start_date
         )
-
-        # City breakdown (first part of delivery_address before comma)
-        city_rows = await conn.fetch(
+        delivery_cost_total = await conn.fetchval(
             """
-            SELECT
-                TRIM(SPLIT_PART(delivery_address, ',', 1)) as city,
-                COUNT(*) as cnt,
-                COALESCE(SUM(total_price), 0) as rev
-            FROM orders
-            WHERE store_id = $1 AND order_date >= $2
-                AND delivery_address IS NOT NULL AND delivery_address != ''
-                AND status NOT IN ('CANCELLED', 'CANCELLING', 'RETURNED')
-            GROUP BY TRIM(SPLIT_PART(delivery_address, ',', 1))
-            ORDER BY cnt DESC
+            SELECT COALESCE(SUM(delivery_cost), 0)::bigint
+            FROM store_daily_sales
+            WHERE store_id = $1 AND date >= $2
             """,
-            sid, start_date
-        )
-
-        # Total delivery cost for seller
-        delivery_cost_row = await conn.fetchrow(
-            """
-            SELECT COALESCE(SUM(delivery_cost), 0) as total
-            FROM orders
-            WHERE store_id = $1 AND order_date >= $2
-                AND status NOT IN ('CANCELLED', 'CANCELLING', 'RETURNED')
-            """,
-            sid, start_date
+            uuid.UUID(store_id), start_date
         )
 
     payment = [
         BreakdownItem(
-            label=PAYMENT_MODE_LABELS.get(r['payment_mode'] or '', r['payment_mode'] or 'Другое'),
-            key=r['payment_mode'] or '',
+            label=PAYMENT_MODE_LABELS.get(r['key'], r['key']),
+            key=r['key'],
             count=r['cnt'],
             revenue=r['rev'],
         )
-        for r in payment_rows if r['payment_mode']
+        for r in rows if r['dimension'] == 'payment'
     ]
 
     delivery = [
         BreakdownItem(
-            label=DELIVERY_MODE_LABELS.get(r['delivery_mode'] or '', r['delivery_mode'] or 'Другое'),
-            key=r['delivery_mode'] or '',
+            label=DELIVERY_MODE_LABELS.get(r['key'], r['key']),
+            key=r['key'],
             count=r['cnt'],
             revenue=r['rev'],
         )
-        for r in delivery_rows if r['delivery_mode']
+        for r in rows if r['dimension'] == 'delivery'
     ]
 
+    # City = first part of delivery_address before comma
     cities = [
         BreakdownItem(
-            label=r['city'],
+            label=r['key'],
             count=r['cnt'],
             revenue=r['rev'],
         )
-        for r in city_rows if r['city']
+        for r in rows if r['dimension'] == 'city'
     ]
 
     return OrderBreakdowns(
         payment=payment,
         delivery=delivery,
         cities=cities,
-        delivery_cost_total=delivery_cost_row['total'] if delivery_cost_row else 0,
+        delivery_cost_total=delivery_cost_total,
     )
 
 
@@ -2489,31 +2441,7 @@ async def sync_store_images(
         if not store:
             raise HTTPException(status_code=404, detail="Store not found")
 
-        products = await conn.fetch(
-            """SELECT id, external_kaspi_id FROM products
-               WHERE store_id = $1 AND image_url IS NULL AND external_kaspi_id IS NOT NULL""",
-            uuid.UUID(store_id)
-        )
-
-        updated = 0
-        for product in products:
-            try:
-                image_url = await fetch_product_image_url(product['external_kaspi_id'])
-                if image_url:
-                    await conn.execute(
-                        "UPDATE products SET image_url = $1, updated_at = NOW() WHERE id = $2",
-                        image_url,
-                        product['id']
-                    )
-                    updated += 1
-                    logger.info(f"Image saved for product {product['id']}: {image_url}")
-            except Exception as e:
-                logger.warning(f"Failed to fetch image for product {product['id']}: {e}")
-
-            # Rate limit delay
-            await asyncio.sleep(0.5)
-
-        return {"updated": updated, "total": len(products)}
+    return await backfill_product_images(store_id)
 
 
 @router.post("/stores/{store_id}/sync-prices", status_code=status.HTTP_202_ACCEPTED)
@@ -3554,6 +3482,7 @@ async def get_order_customer(
                 api_token=api_key,
                 order_code=order_code,
                 pool=pool,
+                store_id=store_id,
             )
 
             if customer_data:
@@ -17,9 +17,10 @@ import json
 import logging
 import random
 import re
+import time
 import uuid as uuid_module
 from datetime import datetime
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, List, Union, AsyncIterator
 from decimal import Decimal
 from uuid import UUID
 
@@ -38,15 +39,34 @@ from ..core.rate_limiter import (
     mark_pricefeed_cooldown,
 )
 from ..core.database import get_db_pool
-from ..core.http_client import get_http_client, get_offers_http_client
+from ..core.http_client import (
+    get_http_client,
+    get_offers_http_client,
+    acquire_proxy_http_client,
+    release_proxy_http_client,
+)
 from ..core.circuit_breaker import get_kaspi_circuit_breaker, CircuitOpenError
+from ..core.metrics import get_metrics, timed
+from ..core.offers_cache import get_offers_cache
 from ..core.proxy_rotator import get_user_proxy_rotator, NoProxiesAllocatedError, NoProxiesAvailableError
 from .kaspi_auth_service import get_active_session, validate_session, KaspiAuthError
-from .notification_service import create_notification, NotificationType, get_user_notification_settings
-from .order_event_processor import process_new_kaspi_order
+from .pricefeed_batcher import get_pricefeed_batcher
+from .sales_rollup import refresh_sales_rollups
 
 logger = logging.getLogger(__name__)
 
+# Per-attempt HTTP latency; status is the response code or "error" (transport failure)
+OFFERS_REQUEST_SECONDS = get_metrics().histogram(
+    "kaspi_offers_request_seconds",
+    "Offers API request latency",
+    ["status"],
+)
+PRICEFEED_REQUEST_SECONDS = get_metrics().histogram(
+    "kaspi_pricefeed_request_seconds",
+    "Pricefeed upload request latency",
+    ["status"],
+)
+
 
 # ============================================================================
 # Phone Number Utilities
@@ -265,16 +285,19 @@ def _map_offer(raw_offer: dict) -> dict:
 # Main API Functions
 # ============================================================================
 
-async def get_products(
+async def iter_product_pages(
     merchant_id: str,
     session: dict,
     page_size: int = 100,
     max_retries: int = 3,
     user_id: Optional[UUID] = None,
     use_proxy: bool = False
-) -> List[dict]:
+) -> AsyncIterator[List[dict]]:
     """
-    Fetch all products for a merchant using pagination.
+    Stream a merchant's products page by page.
+
+    Only one page is held at a time, so callers can write each page as it
+    arrives instead of collecting the whole catalog first.
 
     Args:
         merchant_id: Merchant UID
@@ -284,8 +307,8 @@ async def get_products(
         user_id: User UUID (required if use_proxy=True)
         use_proxy: Whether to use user's proxy pool (module='catalog')
 
-    Returns:
-        List of products in internal format
+    Yields:
+        Non-empty lists of products in internal format
 
     Raises:
         KaspiAuthError: If session is invalid
@@ -298,12 +321,12 @@ async def get_products(
     merchant_uid = _get_merchant_uid_from_session(session) or merchant_id
     headers = _get_merchant_headers()
 
-    all_offers = []
+    total = 0
     page = 0
     rate_limiter = get_global_rate_limiter()
 
-    # Get proxy rotator if using proxies
-    rotator = None
+    # Lease a proxy from the user's pool if using proxies
+    lease = None
     proxy_url = None
     if use_proxy:
         if not user_id:
@@ -311,115 +334,131 @@ async def get_products(
 
         try:
             rotator = await get_user_proxy_rotator(user_id, module='catalog')
-            proxy = await rotator.get_current_proxy()
-            proxy_url = f"{proxy.protocol}://{proxy.username}:{proxy.password}@{proxy.host}:{proxy.port}"
-            logger.debug(f"Using proxy {proxy.id} for catalog sync (merchant {merchant_id})")
+            lease = await rotator.acquire()
+            proxy_url = lease.proxy.url
+            logger.debug(f"Using proxy {lease.proxy.id} for catalog sync (merchant {merchant_id})")
         except (NoProxiesAllocatedError, NoProxiesAvailableError) as e:
             logger.warning(f"No proxies available for user {user_id}, module 'catalog': {e}")
             use_proxy = False
 
-    # Create HTTP client with or without proxy
+    # Pooled keep-alive client for the proxy, or the shared direct client
+    proxy_client = None
     if use_proxy and proxy_url:
-        client = httpx.AsyncClient(
-            proxies={"http://": proxy_url, "https://": proxy_url},
-            timeout=httpx.Timeout(30.0),
-        )
-    else:
-        client = await get_http_client()
+        proxy_client = await acquire_proxy_http_client(proxy_url)
+    client = proxy_client or await get_http_client()
 
     breaker = get_kaspi_circuit_breaker()
 
-    while True:
-        url = (
-            f"https://mc.shop.kaspi.kz/bff/offer-view/list"
-            f"?m={merchant_uid}&p={page}&l={page_size}&a=true"
-        )
-
-        retries = 0
-        while retries < max_retries:
-            try:
-                # Acquire rate limit token (skip if using proxy)
-                if not use_proxy:
-                    await rate_limiter.acquire()
-
-                # Use circuit breaker to prevent cascading failures
-                async with breaker:
-                    response = await client.get(
-                        url,
-                        headers=headers,
-                        cookies=cookies
-                    )
+    try:
+        while True:
+            url = (
+                f"https://mc.shop.kaspi.kz/bff/offer-view/list"
+                f"?m={merchant_uid}&p={page}&l={page_size}&a=true"
+            )
 
-                if response.status_code == 401:
-                    if rotator:
-                        await rotator.record_request(success=False)
-                    raise KaspiAuthError("Authentication failed - session expired")
+            offers = None
+            retries = 0
+            while retries < max_retries:
+                try:
+                    # Acquire rate limit token (skip if using proxy)
+                    if not use_proxy:
+                        await rate_limiter.acquire()
+
+                    # Use circuit breaker to prevent cascading failures
+                    started = time.monotonic()
+                    async with breaker:
+                        response = await client.get(
+                            url,
+                            headers=headers,
+                            cookies=cookies
+                        )
 
-                if response.status_code == 429:
-                    # Rate limited - wait and retry
-                    if rotator:
-                        await rotator.record_request(success=False)
-                    wait_time = random.uniform(0.5, 2.0)
-                    logger.warning(f"Rate limited, waiting {wait_time:.2f}s (retry {retries + 1}/{max_retries})")
-                    await asyncio.sleep(wait_time)
-                    retries += 1
-                    continue
+                    if response.status_code == 401:
+                        if lease:
+                            await lease.record(success=False)
+                        raise KaspiAuthError("Authentication failed - session expired")
+
+                    if response.status_code == 429:
+                        # Rate limited - wait and retry
+                        if lease:
+                            await lease.record(success=False)
+                        wait_time = random.uniform(0.5, 2.0)
+                        logger.warning(f"Rate limited, waiting {wait_time:.2f}s (retry {retries + 1}/{max_retries})")
+                        await asyncio.sleep(wait_time)
+                        retries += 1
+                        continue
 
-                response.raise_for_status()
+                    response.raise_for_status()
+
+                    data = response.json()
+                    offers = data.get('data', [])
+
+                    # ✅ Record successful request with proxy
+                    if lease:
+                        await lease.record(success=True, latency=time.monotonic() - started)
+                    break  # Success
+
+                except CircuitOpenError:
+                    logger.warning("Kaspi API circuit is open, aborting product fetch")
+                    if lease:
+                        await lease.record(success=False)
+                    return  # Pages yielded so far stand
+                except httpx.HTTPStatusError as e:
+                    if lease:
+                        await lease.record(success=False)
+                    if e.response.status_code == 429 and retries < max_retries:
+                        retries += 1
+                        continue
+                    logger.error(f"HTTP error fetching products: {e}")
+                    raise
+                except httpx.HTTPError as e:
+                    if lease:
+                        await lease.record(success=False)
+                    logger.error(f"Error fetching products: {e}")
+                    raise
 
-                data = response.json()
-                offers = data.get('data', [])
+            if offers is None:
+                logger.error("Max retries exceeded for rate limiting")
+                raise httpx.HTTPError("Too many rate limit retries")
 
-                # ✅ Record successful request with proxy
-                if rotator:
-                    await rotator.record_request(success=True)
+            if not offers:
+                # No more products
+                logger.info(f"Retrieved {total} total products")
+                return
 
-                if not offers:
-                    # No more products
-                    logger.info(f"Retrieved {len(all_offers)} total products")
-                    if use_proxy and proxy_url:
-                        await client.aclose()
-                    return all_offers
+            total += len(offers)
+            logger.info(f"Retrieved {len(offers)} products from page {page}")
+            yield [_map_offer(offer) for offer in offers]
+            page += 1
+    finally:
+        if proxy_client:
+            await release_proxy_http_client(proxy_client)
+        if lease:
+            await lease.release()
 
-                # Map offers to internal format
-                for offer in offers:
-                    all_offers.append(_map_offer(offer))
 
-                logger.info(f"Retrieved {len(offers)} products from page {page}")
-                page += 1
-                break  # Success, move to next page
+async def get_products(
+    merchant_id: str,
+    session: dict,
+    page_size: int = 100,
+    max_retries: int = 3,
+    user_id: Optional[UUID] = None,
+    use_proxy: bool = False
+) -> List[dict]:
+    """
+    Fetch all products for a merchant using pagination.
 
-            except CircuitOpenError:
-                logger.warning("Kaspi API circuit is open, aborting product fetch")
-                if rotator:
-                    await rotator.record_request(success=False)
-                if use_proxy and proxy_url:
-                    await client.aclose()
-                return all_offers  # Return what we have so far
-            except httpx.HTTPStatusError as e:
-                if rotator:
-                    await rotator.record_request(success=False)
-                if e.response.status_code == 429 and retries < max_retries:
-                    retries += 1
-                    continue
-                logger.error(f"HTTP error fetching products: {e}")
-                raise
-            except httpx.HTTPError as e:
-                if rotator:
-                    await rotator.record_request(success=False)
-                logger.error(f"Error fetching products: {e}")
-                raise
-
-        if retries >= max_retries:
-            logger.error("Max retries exceeded for rate limiting")
-            if use_proxy and proxy_url:
-                await client.aclose()
-            raise httpx.HTTPError("Too many rate limit retries")
-
-    # Cleanup client if needed
-    if use_proxy and proxy_url:
-        await client.aclose()
+    Collects iter_product_pages(); prefer the iterator for large catalogs.
 
+    Returns:
+        List of products in internal format
+    """
+    all_offers = []
+    async for page in iter_product_pages(
+        merchant_id, session, page_size=page_size, max_retries=max_retries,
+        user_id=user_id, use_proxy=use_proxy,
+    ):
+        all_offers.extend(page)
     return all_offers
 
 
@@ -518,6 +557,79 @@ async def fetch_product_image_url(product_id: str) -> Optional[str]:
         return None
 
 
+# Image URLs written per UPDATE batch during image backfill
+_IMAGE_WRITE_BATCH = 50
+
+
+async def backfill_product_images(store_id: str, concurrency: Optional[int] = None) -> Dict[str, int]:
+    """
+    Fill image_url of a store's products that have none.
+
+    Up to `concurrency` lookups run at once (direct requests are paced by the
+    offers rate limiter inside fetch_product_image_url). No pool connection
+    is held while waiting on Kaspi; found URLs are written in batches.
+
+    Args:
+        store_id: Store UUID
+        concurrency: Lookups in flight (default settings.product_image_concurrency)
+
+    Returns:
+        {"updated": images saved, "total": products without image}
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        products = await conn.fetch(
+            """SELECT id, external_kaspi_id FROM products
+               WHERE store_id = $1 AND image_url IS NULL AND external_kaspi_id IS NOT NULL""",
+            uuid_module.UUID(store_id)
+        )
+    if not products:
+        return {"updated": 0, "total": 0}
+
+    logger.info(f"Backfilling images for {len(products)} products in store {store_id}")
+    pending: List[tuple] = []
+    updated = 0
+
+    async def _flush():
+        nonlocal updated
+        batch = pending[:]
+        pending.clear()
+        if not batch:
+            return
+        # A failed write loses this batch only, the other workers keep going
+        try:
+            async with pool.acquire() as conn:
+                await conn.executemany(
+                    "UPDATE products SET image_url = $1, updated_at = NOW() WHERE id = $2",
+                    batch
+                )
+        except Exception as e:
+            logger.error(f"Image backfill for store {store_id}: failed to save {len(batch)} images: {e}")
+            return
+        updated += len(batch)
+
+    remaining = iter(products)
+
+    async def _worker():
+        for product in remaining:
+            try:
+                image_url = await fetch_product_image_url(product['external_kaspi_id'])
+            except Exception as e:
+                logger.warning(f"Image backfill failed for {product['id']}: {e}")
+                continue
+            if image_url:
+                pending.append((image_url, product['id']))
+                if len(pending) >= _IMAGE_WRITE_BATCH:
+                    await _flush()
+
+    workers = min(concurrency or settings.product_image_concurrency, len(products))
+    await asyncio.gather(*[_worker() for _ in range(workers)])
+    await _flush()
+
+    logger.info(f"Image backfill for store {store_id}: {updated}/{len(products)} images saved")
+    return {"updated": updated, "total": len(products)}
+
+
 async def parse_product_by_sku(
     product_id: str,
     session: dict = None,
@@ -525,6 +637,7 @@ async def parse_product_by_sku(
     user_id: Optional[UUID] = None,
     use_proxy: bool = False,
     module: Optional[str] = None,
+    max_age: Optional[float] = None,
 ) -> dict:
     """
     Parse product details by product ID using Kaspi public offers API.
@@ -532,6 +645,10 @@ async def parse_product_by_sku(
     This uses the public yml/offer-view API which doesn't require authentication.
     Rate limited at 8 RPS per IP. On 403 (IP ban), pauses 15s globally.
 
+    Responses are served from the offers cache (in-process LRU + Redis) when
+    fresh enough; concurrent requests for the same product/city share one
+    upstream call.
+
     Args:
         product_id: Kaspi product ID (external_kaspi_id)
         session: Optional session data (not required for public API)
@@ -539,6 +656,8 @@ async def parse_product_by_sku(
         user_id: User UUID (reserved for future proxy support)
         use_proxy: Whether to use proxy (reserved for future)
         module: Proxy module name (reserved for future)
+        max_age: Max acceptable cache age in seconds (0 = bypass cache,
+            None = settings.offers_cache_ttl_seconds)
 
     Returns:
         Product data with offers and prices
@@ -547,6 +666,26 @@ async def parse_product_by_sku(
         Exception: If parsing fails
     """
     effective_city_id = city_id or DEFAULT_CITY_ID
+
+    if max_age == 0 or settings.offers_cache_ttl_seconds <= 0:
+        return await _fetch_offers(product_id, effective_city_id, user_id, use_proxy, module)
+
+    return await get_offers_cache().get_or_fetch(
+        product_id,
+        effective_city_id,
+        lambda: _fetch_offers(product_id, effective_city_id, user_id, use_proxy, module),
+        max_age=max_age,
+    )
+
+
+async def _fetch_offers(
+    product_id: str,
+    effective_city_id: str,
+    user_id: Optional[UUID],
+    use_proxy: bool,
+    module: Optional[str],
+) -> Optional[dict]:
+    """Fetch offers from Kaspi (relay, then direct with retries). Uncached."""
     logger.info(f"Fetching offers for product ID: {product_id}, city: {effective_city_id}")
 
     # VPS mode: proxy through Railway relay to bypass IP block
@@ -589,20 +728,15 @@ async def parse_product_by_sku(
 
     # Select HTTP client: user proxy > config proxy > direct (HTTP/1.1)
     proxy_client = None
-    rotator = None
+    lease = None
     try:
         if use_proxy and user_id:
-            # Use user's proxy rotator (for worker demping)
+            # Lease one of the user's proxies (for worker demping)
             try:
                 rotator = await get_user_proxy_rotator(user_id, module=module or 'demper')
-                proxy = await rotator.get_current_proxy()
-                proxy_url = f"{proxy.protocol}://{proxy.username}:{proxy.password}@{proxy.host}:{proxy.port}"
-                proxy_client = httpx.AsyncClient(
-                    proxy=proxy_url,
-                    timeout=httpx.Timeout(30.0, connect=10.0),
-                    http2=False,
-                )
-                logger.debug(f"Using user proxy {proxy.id} for offers API")
+                lease = await rotator.acquire()
+                proxy_client = await acquire_proxy_http_client(lease.proxy.url)
+                logger.debug(f"Using user proxy {lease.proxy.id} for offers API")
             except (NoProxiesAllocatedError, NoProxiesAvailableError):
                 logger.debug(f"No user proxies available, falling back to offers HTTP client")
 
@@ -614,12 +748,15 @@ async def parse_product_by_sku(
         for attempt in range(max_retries):
             try:
                 # Use circuit breaker to prevent cascading failures
+                started = time.monotonic()
                 async with breaker:
-                    response = await client.post(
-                        url,
-                        json=body,
-                        headers=headers
-                    )
+                    with timed(OFFERS_REQUEST_SECONDS, status="error") as labels:
+                        response = await client.post(
+                            url,
+                            json=body,
+                            headers=headers
+                        )
+                        labels["status"] = str(response.status_code)
 
                 logger.debug(f"Response status: {response.status_code}")
 
@@ -633,8 +770,8 @@ async def parse_product_by_sku(
                 if response.status_code == 403:
                     # IP banned - pause globally and retry
                     await offers_ban_pause()
-                    if rotator:
-                        await rotator.record_request(success=False)
+                    if lease:
+                        await lease.record(success=False)
                     if attempt < max_retries - 1:
                         logger.warning(
                             f"Offers API 403 for product {product_id}, "
@@ -662,8 +799,8 @@ async def parse_product_by_sku(
 
                 response.raise_for_status()
                 result = response.json()
-                if rotator:
-                    await rotator.record_request(success=True)
+                if lease:
+                    await lease.record(success=True, latency=time.monotonic() - started)
                 logger.debug(f"Successfully fetched offers for product {product_id}: {len(result.get('offers', []))} offers")
                 return result
 
@@ -671,8 +808,8 @@ async def parse_product_by_sku(
                 logger.warning(f"Kaspi API circuit is open, skipping product {product_id}")
                 return None
             except httpx.HTTPError as e:
-                if rotator:
-                    await rotator.record_request(success=False)
+                if lease:
+                    await lease.record(success=False)
                 if attempt < max_retries - 1:
                     wait_time = 1 + attempt
                     logger.warning(f"Request error (attempt {attempt + 1}/{max_retries}): {e}")
@@ -683,9 +820,11 @@ async def parse_product_by_sku(
 
         raise Exception(f"Failed to fetch offers for product {product_id} after {max_retries} attempts")
     finally:
-        # Clean up per-request proxy client
+        # Return pooled proxy client (connection stays open for reuse) and the lease
         if proxy_client:
-            await proxy_client.aclose()
+            await release_proxy_http_client(proxy_client)
+        if lease:
+            await lease.release()
 
 
 async def sync_product(
@@ -697,12 +836,16 @@ async def sync_product(
     module: Optional[str] = None,
     city_prices: Optional[Dict[str, int]] = None,
     pre_order_days: Optional[int] = None,
+    update_db: bool = True,
 ) -> dict:
     """
     Sync product price to Kaspi.
 
-    Rate limited at 1.5 RPS per merchant account. On 429 (30-min ban),
-    marks the merchant for cooldown and returns failure immediately.
+    The item is queued in the per-merchant pricefeed batcher, which uploads
+    pending changes for the same account together (rate limited at 1.5 RPS
+    per merchant account). On 429 (30-min ban), marks the merchant for
+    cooldown and returns failure. If a newer change for the same SKU arrives
+    before upload, this call returns error="superseded".
 
     Args:
         product_id: Internal product UUID (can be string or UUID)
@@ -713,6 +856,8 @@ async def sync_product(
         module: Proxy module name (reserved for future)
         city_prices: Optional dict {city_id: price} for per-city pricing
         pre_order_days: Optional pre-order days override (0 = remove pre-order)
+        update_db: Write new price to products table (False when the caller
+            persists it itself, e.g. the demper write buffer)
 
     Returns:
         Success response
@@ -734,7 +879,7 @@ async def sync_product(
         row = await conn.fetchrow(
             """
             SELECT p.id, p.kaspi_product_id, p.kaspi_sku, p.price, p.name, p.store_id,
-                   p.pre_order_days, p.availabilities,
+                   p.pre_order_days, p.availabilities, p.external_kaspi_id,
                    ks.store_points
             FROM products p
             JOIN kaspi_stores ks ON ks.id = p.store_id
@@ -755,10 +900,6 @@ async def sync_product(
     if not merchant_uid:
         raise KaspiAuthError("No merchant UID in session")
 
-    # Prepare price update request
-    headers = _get_merchant_headers()
-    url = "https://mc.shop.kaspi.kz/pricefeed/upload/merchant/process"
-
     # Determine pre-order days: explicit param > DB value
     effective_pre_order = pre_order_days if pre_order_days is not None else (row.get("pre_order_days") or 0)
 
@@ -834,15 +975,80 @@ async def sync_product(
     else:
         body["price"] = new_price
 
+    # Queue for the per-merchant pricefeed aggregator (batched, deduped by SKU)
+    result = await get_pricefeed_batcher().submit(merchant_uid, session, body)
+
+    if not result.get("success"):
+        if result.get("error") == "superseded":
+            logger.info(f"Pricefeed item for product {product_uuid} superseded by a newer change")
+        return {**result, "product_id": str(product_uuid)}
+
+    # Update price in database (use new_price for global, skip for city-only)
+    if update_db and not city_prices:
+        async with pool.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE products
+                SET price = $1, updated_at = NOW()
+                WHERE id = $2
+                """,
+                new_price,
+                product_uuid
+            )
+
+    logger.info(f"Successfully synced product {product_uuid}"
+                 f"{f' with price {new_price}' if not city_prices else f' with {len(city_prices)} city prices'}")
+
+    # Cached offers still show our old price
+    if row["external_kaspi_id"]:
+        await get_offers_cache().invalidate(row["external_kaspi_id"])
+
+    return {
+        "success": True,
+        "product_id": str(product_uuid),
+        "new_price": new_price,
+        "response": result.get("response")
+    }
+
+
+async def upload_pricefeed_items(merchant_uid: str, session: dict, items: List[dict]) -> Dict[str, Any]:
+    """
+    Send one pricefeed upload for a merchant account.
+
+    Called by the pricefeed batcher. Rate limited at 1.5 RPS per merchant
+    account. On 429 (30-min ban), marks the merchant for cooldown.
+
+    Args:
+        merchant_uid: Merchant UID
+        session: Session data with cookies
+        items: Pricefeed items; one item is sent as an object, several as an array
+
+    Returns:
+        {"success": True, "response": ...} or {"success": False, "error": ...};
+        for a multi-item upload whose response has one entry per SKU, also
+        "items": {sku: {"success": ..., "error"?: ...}}
+
+    Raises:
+        KaspiAuthError: If session is invalid
+        httpx.HTTPError: If API request fails
+    """
+    cookies = _get_cookies_from_session(session)
+    if not cookies:
+        raise KaspiAuthError("No cookies found in session")
+
     # Check if this merchant is in pricefeed cooldown (30-min ban)
-    if is_merchant_cooled_down(merchant_uid):
+    if await is_merchant_cooled_down(merchant_uid):
         logger.warning(f"Merchant {merchant_uid} is in pricefeed cooldown, skipping price sync")
-        return {"success": False, "error": "pricefeed_cooldown", "product_id": str(product_uuid)}
+        return {"success": False, "error": "pricefeed_cooldown"}
 
     # Per-merchant rate limiting for pricefeed (1.5 RPS per account)
     pricefeed_limiter = get_pricefeed_rate_limiter(merchant_uid)
     await pricefeed_limiter.acquire()
 
+    headers = _get_merchant_headers()
+    url = "https://mc.shop.kaspi.kz/pricefeed/upload/merchant/process"
+    body = items[0] if len(items) == 1 else items
+
     client = await get_http_client()
     breaker = get_kaspi_circuit_breaker()
 
@@ -852,12 +1058,14 @@ async def sync_product(
 
         # Use circuit breaker to prevent cascading failures
         async with breaker:
-            response = await client.post(
-                url,
-                json=body,
-                headers=headers,
-                cookies=cookies
-            )
+            with timed(PRICEFEED_REQUEST_SECONDS, status="error") as labels:
+                response = await client.post(
+                    url,
+                    json=body,
+                    headers=headers,
+                    cookies=cookies
+                )
+                labels["status"] = str(response.status_code)
 
         # Log the pricefeed response for debugging
         logger.info(f"Pricefeed response: status={response.status_code}, body={response.text[:500]}")
@@ -867,7 +1075,7 @@ async def sync_product(
 
         if response.status_code == 429:
             # Pricefeed 429 = 30-minute ban per merchant account!
-            mark_pricefeed_cooldown(merchant_uid)
+            await mark_pricefeed_cooldown(merchant_uid)
             logger.error(
                 f"Pricefeed 429 for merchant {merchant_uid}: "
                 f"30-minute cooldown activated"
@@ -875,44 +1083,59 @@ async def sync_product(
             return {
                 "success": False,
                 "error": "pricefeed_rate_limited",
-                "product_id": str(product_uuid),
                 "cooldown_seconds": 1800,
             }
 
         response.raise_for_status()
-        response_data = response.json()
-
-        # Update price in database (use new_price for global, skip for city-only)
-        if not city_prices:
-            async with pool.acquire() as conn:
-                await conn.execute(
-                    """
-                    UPDATE products
-                    SET price = $1, updated_at = NOW()
-                    WHERE id = $2
-                    """,
-                    new_price,
-                    product_uuid
-                )
-
-        logger.info(f"Successfully synced product {product_uuid}"
-                     f"{f' with price {new_price}' if not city_prices else f' with {len(city_prices)} city prices'}")
-
-        return {
-            "success": True,
-            "product_id": str(product_uuid),
-            "new_price": new_price,
-            "response": response_data
-        }
+        data = response.json()
+        result = {"success": True, "response": data}
+        if len(items) > 1:
+            item_results = _pricefeed_item_results(items, data)
+            if item_results is not None:
+                result["items"] = item_results
+        return result
 
     except CircuitOpenError:
-        logger.warning(f"Kaspi API circuit is open, cannot sync product {product_uuid}")
-        return {"success": False, "error": "circuit_open", "product_id": str(product_uuid)}
+        logger.warning(f"Kaspi API circuit is open, cannot sync {len(items)} items for merchant {merchant_uid}")
+        return {"success": False, "error": "circuit_open"}
     except httpx.HTTPError as e:
         logger.error(f"Error syncing product: {e}")
         raise
 
 
+_PRICEFEED_ITEM_FAILED_STATUSES = {"ERROR", "FAILED", "REJECTED"}
+
+
+def _pricefeed_item_results(items: List[dict], data: Any) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Per-SKU results of a multi-item pricefeed upload.
+
+    Entries are matched by their "sku" field, or by position when the response
+    is a list as long as the request. None if the response cannot be mapped
+    to every SKU; the batcher then re-sends the items one by one.
+    """
+    if not isinstance(data, list) or not all(isinstance(entry, dict) for entry in data):
+        return None
+
+    by_sku = {str(entry["sku"]): entry for entry in data if entry.get("sku") is not None}
+    if all(str(item["sku"]) in by_sku for item in items):
+        entries = [by_sku[str(item["sku"])] for item in items]
+    elif len(data) == len(items):
+        entries = data
+    else:
+        return None
+
+    results = {}
+    for item, entry in zip(items, entries):
+        error = entry.get("error") or entry.get("errorMessage") or entry.get("errors")
+        status = str(entry.get("status") or "").upper()
+        if error or status in _PRICEFEED_ITEM_FAILED_STATUSES:
+            results[item["sku"]] = {"success": False, "error": str(error or status), "response": entry}
+        else:
+            results[item["sku"]] = {"success": True, "response": entry}
+    return results
+
+
 async def get_competitor_price(product_id: str, city_id: Optional[str] = None) -> Optional[int]:
     """
     Get lowest competitor price for a product.
@@ -1259,6 +1482,200 @@ def _normalize_phone(phone: str) -> str:
     return f"+{digits}"
 
 
+# Staging tables for sync_orders_to_db (dropped at commit)
+_ORDERS_STAGE_SQL = """
+    CREATE TEMP TABLE _orders_stage (
+        kaspi_order_id TEXT NOT NULL,
+        kaspi_order_code TEXT,
+        status TEXT,
+        total_price INTEGER,
+        delivery_cost INTEGER,
+        customer_name TEXT,
+        customer_phone TEXT,
+        delivery_address TEXT,
+        delivery_mode TEXT,
+        payment_mode TEXT,
+        order_date TIMESTAMPTZ
+    ) ON COMMIT DROP;
+
+    CREATE TEMP TABLE _order_items_stage (
+        kaspi_order_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        kaspi_product_id TEXT,
+        name TEXT,
+        sku TEXT,
+        quantity INTEGER,
+        price INTEGER
+    ) ON COMMIT DROP;
+"""
+
+_ORDERS_STAGE_COLUMNS = [
+    "kaspi_order_id", "kaspi_order_code", "status", "total_price", "delivery_cost",
+    "customer_name", "customer_phone", "delivery_address", "delivery_mode",
+    "payment_mode", "order_date",
+]
+_ORDER_ITEMS_STAGE_COLUMNS = ["kaspi_order_id", "position", "kaspi_product_id", "name", "sku", "quantity", "price"]
+
+# Upsert every staged order; `previous` reads the pre-statement snapshot, so
+# old_status is the status before this sync
+_ORDERS_UPSERT_SQL = """
+    WITH previous AS (
+        SELECT o.kaspi_order_id, o.status
+        FROM orders o
+        JOIN _orders_stage s ON s.kaspi_order_id = o.kaspi_order_id
+        WHERE o.store_id = $1
+    ),
+    upserted AS (
+        INSERT INTO orders (
+            store_id, kaspi_order_id, kaspi_order_code, status,
+            total_price, delivery_cost, customer_name, customer_phone,
+            delivery_address, delivery_mode, payment_mode, order_date
+        )
+        SELECT
+            $1, kaspi_order_id, kaspi_order_code, status,
+            total_price, delivery_cost, customer_name, customer_phone,
+            delivery_address, delivery_mode, payment_mode, order_date
+        FROM _orders_stage
+        ON CONFLICT (store_id, kaspi_order_id)
+        DO UPDATE SET
+            status = EXCLUDED.status,
+            previous_status = CASE WHEN orders.status IS DISTINCT FROM EXCLUDED.status THEN orders.status ELSE orders.previous_status END,
+            status_changed_at = CASE WHEN orders.status IS DISTINCT FROM EXCLUDED.status THEN NOW() ELSE orders.status_changed_at END,
+            total_price = EXCLUDED.total_price,
+            customer_name = CASE WHEN EXCLUDED.customer_name != '' THEN EXCLUDED.customer_name ELSE orders.customer_name END,
+            customer_phone = CASE WHEN EXCLUDED.customer_phone != '' AND EXCLUDED.customer_phone NOT LIKE '%00000%' THEN EXCLUDED.customer_phone ELSE orders.customer_phone END,
+            delivery_address = CASE WHEN EXCLUDED.delivery_address != '' THEN EXCLUDED.delivery_address ELSE orders.delivery_address END,
+            updated_at = NOW()
+        RETURNING id, kaspi_order_id, (xmax = 0) AS inserted
+    )
+    SELECT u.id, u.kaspi_order_id, u.inserted, p.status AS old_status
+    FROM upserted u
+    LEFT JOIN previous p ON p.kaspi_order_id = u.kaspi_order_id
+"""
+
+_ORDER_STATUS_HISTORY_SQL = """
+    INSERT INTO order_status_history (order_id, old_status, new_status)
+    SELECT * FROM unnest($1::uuid[], $2::text[], $3::text[])
+"""
+
+# Transactional outbox: events commit together with the orders they describe
+# and are delivered by OrderEventsDispatcher (notifications, WhatsApp)
+_ORDER_EVENTS_ENQUEUE_SQL = """
+    INSERT INTO order_events_outbox (
+        user_id, store_id, order_id, order_code, event_type, old_status, new_status, total_price
+    )
+    SELECT $1, $2, * FROM unnest($3::uuid[], $4::text[], $5::text[], $6::text[], $7::text[], $8::bigint[])
+"""
+
+# Items for orders that have none yet (new orders, or older rows saved without
+# items), matched to products by code/sku, then by name; matched products get
+# their sales_count bumped in the same statement
+_ORDER_ITEMS_INSERT_SQL = """
+    WITH inserted_items AS (
+        INSERT INTO order_items (
+            order_id, product_id, kaspi_product_id,
+            name, sku, quantity, price
+        )
+        SELECT
+            o.id, m.id, i.kaspi_product_id,
+            COALESCE(i.name, ''), i.sku, COALESCE(i.quantity, 1), COALESCE(i.price, 0)
+        FROM _order_items_stage i
+        JOIN orders o ON o.store_id = $1 AND o.kaspi_order_id = i.kaspi_order_id
+        LEFT JOIN LATERAL (
+            SELECT id FROM (
+                (
+                    SELECT p.id, 1 AS match_rank FROM products p
+                    WHERE p.store_id = $1
+                      AND (COALESCE(i.kaspi_product_id, '') != '' OR COALESCE(i.sku, '') != '')
+                      AND (p.kaspi_product_id = i.kaspi_product_id OR p.kaspi_sku = i.sku)
+                    LIMIT 1
+                )
+                UNION ALL
+                (
+                    SELECT p.id, 2 AS match_rank FROM products p
+                    WHERE p.store_id = $1
+                      AND COALESCE(i.name, '') != ''
+                      AND p.name = i.name
+                    LIMIT 1
+                )
+            ) candidates
+            ORDER BY match_rank
+            LIMIT 1
+        ) m ON true
+        WHERE NOT EXISTS (SELECT 1 FROM order_items oi WHERE oi.order_id = o.id)
+        ORDER BY i.kaspi_order_id, i.position
+        RETURNING product_id, quantity
+    ),
+    sold AS (
+        SELECT product_id, SUM(quantity) AS quantity
+        FROM inserted_items
+        WHERE product_id IS NOT NULL
+        GROUP BY product_id
+    ),
+    bumped AS (
+        UPDATE products p
+        SET sales_count = COALESCE(p.sales_count, 0) + sold.quantity
+        FROM sold
+        WHERE p.id = sold.product_id
+        RETURNING p.id
+    )
+    SELECT
+        (SELECT COUNT(*) FROM inserted_items) AS items,
+        (SELECT COUNT(*) FROM bumped) AS products
+"""
+
+# Order days touched by the batch (stored order_date, the rollups' day key)
+_ORDER_DAYS_SQL = """
+    SELECT COALESCE(array_agg(DISTINCT DATE(o.order_date)), '{}')
+    FROM orders o
+    JOIN _orders_stage s ON s.kaspi_order_id = o.kaspi_order_id
+    WHERE o.store_id = $1
+"""
+
+# One row per phone (ON CONFLICT cannot touch the same row twice per statement)
+_CUSTOMER_CONTACTS_UPSERT_SQL = """
+    INSERT INTO customer_contacts (
+        id, user_id, store_id, phone, name,
+        first_order_code, last_order_code, orders_count
+    )
+    SELECT gen_random_uuid(), $1, $2, c.phone, c.name, c.first_code, c.last_code, c.orders
+    FROM unnest($3::text[], $4::text[], $5::text[], $6::text[], $7::int[])
+        AS c(phone, name, first_code, last_code, orders)
+    ON CONFLICT (user_id, phone)
+    DO UPDATE SET
+        last_order_code = COALESCE(EXCLUDED.last_order_code, customer_contacts.last_order_code),
+        orders_count = customer_contacts.orders_count + EXCLUDED.orders_count,
+        name = COALESCE(EXCLUDED.name, customer_contacts.name),
+        store_id = COALESCE(EXCLUDED.store_id, customer_contacts.store_id),
+        updated_at = NOW()
+    RETURNING (xmax = 0) AS is_new
+"""
+
+
+def _aggregate_new_contacts(new_orders: List[dict]) -> Dict[str, dict]:
+    """
+    Fold new orders into one contact row per normalized phone.
+
+    Same result as upserting the orders one by one: first order code of the
+    batch, last non-empty code and name, orders counted.
+    """
+    contacts: Dict[str, dict] = {}
+    for parsed in new_orders:
+        if not _is_valid_phone(parsed["customer_phone"]):
+            continue
+        phone = _normalize_phone(parsed["customer_phone"])
+        name = parsed["customer_name"] or None
+        code = parsed["kaspi_order_code"] or None
+        contact = contacts.get(phone)
+        if contact is None:
+            contacts[phone] = {"name": name, "first_code": code, "last_code": code, "orders": 1}
+        else:
+            contact["name"] = name or contact["name"]
+            contact["last_code"] = code or contact["last_code"]
+            contact["orders"] += 1
+    return contacts
+
+
 async def sync_orders_to_db(
     store_id: str,
     orders: List[dict],
@@ -1267,249 +1684,172 @@ async def sync_orders_to_db(
     """
     Sync orders to database and accumulate customer contacts.
 
+    Set-based: the parsed batch is COPY'd into temp tables, then orders,
+    order_items (+ products.sales_count) and customer_contacts are upserted
+    with one statement each inside a single transaction; status changes are
+    logged to order_status_history and the sales rollups of the touched
+    days are recomputed. New orders and status changes are enqueued to
+    order_events_outbox in the same transaction; notifications and WhatsApp
+    messages are sent by OrderEventsDispatcher, never inline.
+
+    The batch is all or nothing: orders that fail to parse are skipped and
+    counted in errors, but a row the database rejects (COPY or upsert)
+    rolls back every order of the batch and the exception is raised.
+    sync_store_orders retries such batches on the next cycle.
+
     Args:
         store_id: Store UUID
-        orders: List of parsed order dictionaries
+        orders: List of raw orders (Kaspi Open API format)
         user_id: Owner user UUID (for customer contacts accumulation)
 
     Returns:
         Sync result summary
+
+    Raises:
+        asyncpg.PostgresError, or the encoding error of a value COPY cannot
+        send (e.g. OverflowError), when the batch is rejected
     """
-    import uuid as uuid_module
     logger.info(f"Syncing {len(orders)} orders to database for store {store_id}")
 
+    store_uuid = uuid_module.UUID(store_id)
     pool = await get_db_pool()
     inserted = 0
     updated = 0
     contacts_added = 0
     errors = 0
 
-    # Look up user_id if not provided
-    if not user_id:
-        async with pool.acquire() as conn:
-            row = await conn.fetchrow(
-                "SELECT user_id FROM kaspi_stores WHERE id = $1",
-                uuid_module.UUID(store_id)
-            )
-            if row:
-                user_id = str(row['user_id'])
-
+    # Parse and dedupe (the same order can come from both the active and the
+    # ARCHIVE window; the last occurrence wins, as with sequential upserts)
+    parsed_orders: Dict[str, dict] = {}
+    for order in orders:
+        try:
+            parsed = await parse_order_details(order)
+        except Exception as e:
+            logger.error(f"Error parsing order: {e}")
+            errors += 1
+            continue
+        if not parsed["kaspi_order_id"]:
+            logger.error(f"Order without id/code skipped: {order.get('id')}")
+            errors += 1
+            continue
+        parsed_orders.pop(parsed["kaspi_order_id"], None)
+        parsed_orders[parsed["kaspi_order_id"]] = parsed
+
+    order_records = []
+    item_records = []
+    for kaspi_order_id, parsed in parsed_orders.items():
+        order_records.append((
+            kaspi_order_id,
+            parsed["kaspi_order_code"],
+            parsed["status"] or "",
+            parsed["total_price"],
+            parsed["delivery_cost"],
+            parsed["customer_name"],
+            parsed["customer_phone"],
+            parsed["delivery_address"],
+            parsed["delivery_mode"],
+            parsed["payment_mode"],
+            parsed["order_date"],
+        ))
+        for position, entry in enumerate(parsed["entries"]):
+            item_records.append((
+                kaspi_order_id,
+                position,
+                entry["kaspi_product_id"],
+                entry["name"],
+                entry["sku"],
+                entry["quantity"],
+                entry["price"],
+            ))
+
+    events: List[dict] = []
     try:
         async with pool.acquire() as conn:
-            for order in orders:
-                try:
-                    # Parse order details
-                    parsed = await parse_order_details(order)
-
-                    # Get old status for change detection
-                    old_status = await conn.fetchval(
-                        "SELECT status FROM orders WHERE store_id = $1 AND kaspi_order_id = $2",
-                        uuid_module.UUID(store_id),
-                        parsed["kaspi_order_id"]
+            # Look up user_id if not provided
+            if not user_id:
+                user_id = await conn.fetchval("SELECT user_id FROM kaspi_stores WHERE id = $1", store_uuid)
+                user_id = str(user_id) if user_id else None
+
+            if order_records:
+                async with conn.transaction():
+                    await conn.execute(_ORDERS_STAGE_SQL)
+                    await conn.copy_records_to_table(
+                        "_orders_stage", records=order_records, columns=_ORDERS_STAGE_COLUMNS,
                     )
+                    if item_records:
+                        await conn.copy_records_to_table(
+                            "_order_items_stage", records=item_records, columns=_ORDER_ITEMS_STAGE_COLUMNS,
+                        )
 
-                    # Upsert order
-                    result = await conn.fetchrow(
-                        """
-                        INSERT INTO orders (
-                            store_id, kaspi_order_id, kaspi_order_code, status,
-                            total_price, delivery_cost, customer_name, customer_phone,
-                            delivery_address, delivery_mode, payment_mode, order_date
+                    rows = await conn.fetch(_ORDERS_UPSERT_SQL, store_uuid)
+                    items = await conn.fetchrow(_ORDER_ITEMS_INSERT_SQL, store_uuid)
+
+                    new_orders = []
+                    for row in rows:
+                        parsed = parsed_orders[row["kaspi_order_id"]]
+                        if row["inserted"]:
+                            inserted += 1
+                            new_orders.append(parsed)
+                            events.append({"type": "new", "order_id": row["id"], "order": parsed})
+                        else:
+                            updated += 1
+                            if row["old_status"] and row["old_status"] != parsed["status"]:
+                                events.append({
+                                    "type": "status_changed",
+                                    "order_id": row["id"],
+                                    "old_status": row["old_status"],
+                                    "order": parsed,
+                                })
+
+                    changes = [e for e in events if e["type"] == "status_changed"]
+                    if changes:
+                        await conn.execute(
+                            _ORDER_STATUS_HISTORY_SQL,
+                            [e["order_id"] for e in changes],
+                            [e["old_status"] for e in changes],
+                            [e["order"]["status"] for e in changes],
                         )
-                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
-                        ON CONFLICT (store_id, kaspi_order_id)
-                        DO UPDATE SET
-                            status = $4,
-                            total_price = $5,
-                            customer_name = CASE WHEN EXCLUDED.customer_name != '' THEN EXCLUDED.customer_name ELSE orders.customer_name END,
-                            customer_phone = CASE WHEN EXCLUDED.customer_phone != '' AND EXCLUDED.customer_phone NOT LIKE '%00000%' THEN EXCLUDED.customer_phone ELSE orders.customer_phone END,
-                            delivery_address = CASE WHEN EXCLUDED.delivery_address != '' THEN EXCLUDED.delivery_address ELSE orders.delivery_address END,
-                            updated_at = NOW()
-                        RETURNING id, (xmax = 0) as inserted
-                        """,
-                        uuid_module.UUID(store_id),
-                        parsed["kaspi_order_id"],
-                        parsed["kaspi_order_code"],
-                        parsed["status"],
-                        parsed["total_price"],
-                        parsed["delivery_cost"],
-                        parsed["customer_name"],
-                        parsed["customer_phone"],
-                        parsed["delivery_address"],
-                        parsed["delivery_mode"],
-                        parsed["payment_mode"],
-                        parsed["order_date"],
-                    )
 
-                    order_id = result["id"]
-                    is_new_order = result["inserted"]
-                    if is_new_order:
-                        inserted += 1
-                        # Notify store owner about new order
-                        try:
-                            owner = await conn.fetchrow(
-                                "SELECT user_id FROM kaspi_stores WHERE id = $1",
-                                uuid_module.UUID(store_id)
-                            )
-                            if owner:
-                                prefs = await get_user_notification_settings(pool, owner["user_id"])
-                                if prefs.get("orders", True):
-                                    total = parsed.get("total_price", 0)
-                                    code = parsed.get("kaspi_order_code", "")
-                                    await create_notification(
-                                        pool=pool,
-                                        user_id=owner["user_id"],
-                                        notification_type=NotificationType.ORDER_NEW,
-                                        title=f"Новый заказ #{code}",
-                                        message=f"Сумма: {total:,} ₸".replace(",", " ") if total else None,
-                                        data={"order_id": str(order_id), "order_code": code},
-                                    )
-
-                                # Send WhatsApp message if template is active
-                                try:
-                                    wa_result = await process_new_kaspi_order(
-                                        user_id=str(owner["user_id"]),
-                                        store_id=store_id,
-                                        order_code=code,
-                                        kaspi_state=parsed.get("status", "APPROVED"),
-                                        pool=pool,
-                                    )
-                                    wa_status = wa_result.get("status", "unknown")
-                                    if wa_status == "sent":
-                                        logger.info(f"WhatsApp sent for order {code}")
-                                    else:
-                                        logger.info(f"WhatsApp result for order {code}: {wa_status}")
-                                except Exception as wa_err:
-                                    logger.warning(f"Failed to send WhatsApp for order {code}: {wa_err}")
-                        except Exception as notif_err:
-                            logger.warning(f"Failed to send order notification: {notif_err}")
-                    else:
-                        updated += 1
-
-                        # Trigger WhatsApp template on status change
-                        if old_status and old_status != parsed["status"]:
-                            code = parsed.get("kaspi_order_code", "")
-                            new_status = parsed["status"]
-                            logger.info(f"Order {code} status: {old_status} → {new_status}")
-
-                            try:
-                                owner = await conn.fetchrow(
-                                    "SELECT user_id FROM kaspi_stores WHERE id = $1",
-                                    uuid_module.UUID(store_id)
-                                )
-                                if owner:
-                                    try:
-                                        wa_result = await process_new_kaspi_order(
-                                            user_id=str(owner["user_id"]),
-                                            store_id=store_id,
-                                            order_code=code,
-                                            kaspi_state=new_status,
-                                            pool=pool,
-                                        )
-                                        wa_status = wa_result.get("status", "unknown")
-                                        if wa_status == "sent":
-                                            logger.info(f"WhatsApp sent for order {code} (status → {new_status})")
-                                        else:
-                                            logger.info(f"WhatsApp result for order {code} (status → {new_status}): {wa_status}")
-                                    except Exception as wa_err:
-                                        logger.warning(f"Failed to send WhatsApp for order {code}: {wa_err}")
-                            except Exception as e:
-                                logger.error(f"Failed to process status change for order {code}: {e}")
-
-                    # Accumulate customer contact (only for new orders with real phone)
-                    if user_id and result["inserted"] and _is_valid_phone(parsed["customer_phone"]):
+                    if events and user_id:
+                        await conn.execute(
+                            _ORDER_EVENTS_ENQUEUE_SQL,
+                            uuid_module.UUID(user_id),
+                            store_uuid,
+                            [e["order_id"] for e in events],
+                            [e["order"]["kaspi_order_code"] or "" for e in events],
+                            [e["type"] for e in events],
+                            [e.get("old_status") for e in events],
+                            [e["order"]["status"] or "" for e in events],
+                            [e["order"]["total_price"] or 0 for e in events],
+                        )
+
+                    # Dashboard rollups of the touched days, in the same transaction
+                    days = await conn.fetchval(_ORDER_DAYS_SQL, store_uuid)
+                    await refresh_sales_rollups(conn, store_uuid, days)
+
+                    # Accumulate customer contacts (only for new orders with real phone)
+                    contacts = _aggregate_new_contacts(new_orders) if user_id else {}
+                    if contacts:
                         try:
-                            phone = _normalize_phone(parsed["customer_phone"])
-                            name = parsed["customer_name"] or None
-                            order_code = parsed["kaspi_order_code"] or None
-
-                            contact_result = await conn.fetchrow(
-                                """
-                                INSERT INTO customer_contacts (
-                                    id, user_id, store_id, phone, name,
-                                    first_order_code, last_order_code, orders_count
+                            async with conn.transaction():
+                                contact_rows = await conn.fetch(
+                                    _CUSTOMER_CONTACTS_UPSERT_SQL,
+                                    uuid_module.UUID(user_id),
+                                    store_uuid,
+                                    list(contacts),
+                                    [c["name"] for c in contacts.values()],
+                                    [c["first_code"] for c in contacts.values()],
+                                    [c["last_code"] for c in contacts.values()],
+                                    [c["orders"] for c in contacts.values()],
                                 )
-                                VALUES (gen_random_uuid(), $1, $2, $3, $4, $5, $5, 1)
-                                ON CONFLICT (user_id, phone)
-                                DO UPDATE SET
-                                    last_order_code = COALESCE($5, customer_contacts.last_order_code),
-                                    orders_count = customer_contacts.orders_count + 1,
-                                    name = COALESCE($4, customer_contacts.name),
-                                    store_id = COALESCE($2, customer_contacts.store_id),
-                                    updated_at = NOW()
-                                RETURNING (xmax = 0) as is_new
-                                """,
-                                uuid_module.UUID(user_id),
-                                uuid_module.UUID(store_id),
-                                phone,
-                                name,
-                                order_code,
-                            )
-                            if contact_result and contact_result["is_new"]:
-                                contacts_added += 1
+                            contacts_added = sum(1 for r in contact_rows if r["is_new"])
                         except Exception as e:
                             logger.debug(f"Contact upsert error: {e}")
 
-                    # Upsert order items (for new orders, or existing orders missing items)
-                    has_items = False
-                    if not is_new_order:
-                        has_items = await conn.fetchval(
-                            "SELECT EXISTS(SELECT 1 FROM order_items WHERE order_id = $1)",
-                            order_id
-                        )
-                    if not has_items and parsed["entries"]:
-                        for entry in parsed["entries"]:
-                            # Try to find matching product (by code/sku, fallback to name)
-                            product = None
-                            if entry["kaspi_product_id"] or entry["sku"]:
-                                product = await conn.fetchrow(
-                                    """
-                                    SELECT id FROM products
-                                    WHERE store_id = $1 AND (kaspi_product_id = $2 OR kaspi_sku = $3)
-                                    LIMIT 1
-                                    """,
-                                    uuid_module.UUID(store_id),
-                                    entry["kaspi_product_id"],
-                                    entry["sku"]
-                                )
-                            if not product and entry.get("name"):
-                                product = await conn.fetchrow(
-                                    """
-                                    SELECT id FROM products
-                                    WHERE store_id = $1 AND name = $2
-                                    LIMIT 1
-                                    """,
-                                    uuid_module.UUID(store_id),
-                                    entry["name"]
-                                )
-
-                            await conn.execute(
-                                """
-                                INSERT INTO order_items (
-                                    order_id, product_id, kaspi_product_id,
-                                    name, sku, quantity, price
-                                )
-                                VALUES ($1, $2, $3, $4, $5, $6, $7)
-                                """,
-                                order_id,
-                                product["id"] if product else None,
-                                entry["kaspi_product_id"],
-                                entry["name"],
-                                entry["sku"],
-                                entry["quantity"],
-                                entry["price"],
-                            )
-
-                            # Update sales_count for matched product
-                            if product:
-                                await conn.execute(
-                                    "UPDATE products SET sales_count = COALESCE(sales_count, 0) + $1 WHERE id = $2",
-                                    entry["quantity"], product["id"]
-                                )
-
-                except Exception as e:
-                    logger.error(f"Error syncing order: {e}")
-                    errors += 1
+                logger.debug(
+                    f"Orders sync for store {store_id}: {items['items']} items inserted, "
+                    f"{items['products']} products sales_count updated"
+                )
 
             # Update last_orders_sync
             await conn.execute(
@@ -1518,7 +1858,7 @@ async def sync_orders_to_db(
                 SET last_orders_sync = NOW()
                 WHERE id = $1
                 """,
-                uuid_module.UUID(store_id)
+                store_uuid
             )
 
     except Exception as e:
@@ -1582,15 +1922,19 @@ async def get_merchant_session(merchant_id: str) -> Optional[dict]:
 async def batch_sync_products(
     product_updates: List[Dict[str, Any]],
     session: dict,
-    batch_size: int = 10
+    batch_size: int = 50
 ) -> Dict[str, Any]:
     """
-    Sync multiple products in batches.
+    Sync multiple products.
+
+    Updates go to the pricefeed batcher, which groups them per merchant and
+    dedupes repeated SKUs. At most batch_size sync_product calls are in
+    flight, so larger lists reach the batcher batch_size at a time.
 
     Args:
         product_updates: List of {product_id, new_price} dicts
         session: Session data with cookies
-        batch_size: Number of products to sync concurrently
+        batch_size: Max sync_product calls in flight
 
     Returns:
         Summary of sync results
@@ -1603,34 +1947,35 @@ async def batch_sync_products(
         'total': len(product_updates)
     }
 
-    # Process in batches
-    for i in range(0, len(product_updates), batch_size):
-        batch = product_updates[i:i + batch_size]
+    semaphore = asyncio.Semaphore(batch_size)
 
-        tasks = [
-            sync_product(
+    async def _sync_one(update: Dict[str, Any]) -> dict:
+        async with semaphore:
+            return await sync_product(
                 product_id=update['product_id'],
                 new_price=update['new_price'],
                 session=session
             )
-            for update in batch
-        ]
 
-        batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        for update, result in zip(batch, batch_results):
-            if isinstance(result, Exception):
-                logger.error(f"Failed to sync {update['product_id']}: {result}")
-                results['failed'].append({
-                    'product_id': update['product_id'],
-                    'error': str(result)
-                })
-            else:
-                results['success'].append(update['product_id'])
-
-        # Small delay between batches to avoid rate limiting
-        if i + batch_size < len(product_updates):
-            await asyncio.sleep(0.5)
+    batch_results = await asyncio.gather(
+        *[_sync_one(update) for update in product_updates],
+        return_exceptions=True
+    )
+
+    for update, result in zip(product_updates, batch_results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to sync {update['product_id']}: {result}")
+            results['failed'].append({
+                'product_id': update['product_id'],
+                'error': str(result)
+            })
+        elif not result.get('success'):
+            results['failed'].append({
+                'product_id': update['product_id'],
+                'error': result.get('error', 'unknown')
+            })
+        else:
+            results['success'].append(update['product_id'])
 
     logger.info(
         f"Batch sync complete: {len(results['success'])} successful, "
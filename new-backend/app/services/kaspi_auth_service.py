@@ -23,6 +23,7 @@ from ..core.security import encrypt_session, decrypt_session
 from ..core.database import get_db_pool
 from ..core.http_client import get_http_client
 from ..core.circuit_breaker import get_kaspi_auth_circuit_breaker, CircuitOpenError
+from .session_cache import get_session_cache
 
 logger = logging.getLogger(__name__)
 
@@ -804,11 +805,18 @@ async def get_active_session_with_refresh(
         merchant_id: Merchant ID
         auto_refresh: Whether to attempt automatic re-authentication
         skip_validation: If True, skip HTTP validation and trust the session from DB.
-                        Useful for workers to avoid rate limiting.
+                        Useful for workers to avoid rate limiting. Such sessions
+                        are served from the process-local session cache.
 
     Returns:
         Optional[dict]: Decrypted session data or None if not found/invalid/requires SMS
     """
+    session_cache = get_session_cache()
+    if skip_validation:
+        cached = await session_cache.get(merchant_id)
+        if cached is not None:
+            return cached
+
     try:
         pool = await get_db_pool()
         async with pool.acquire() as conn:
@@ -816,7 +824,7 @@ async def get_active_session_with_refresh(
             try:
                 row = await conn.fetchrow(
                     """
-                    SELECT id, guid, name, kaspi_email, kaspi_password FROM kaspi_stores
+                    SELECT id, guid, name, kaspi_email, kaspi_password, session_version FROM kaspi_stores
                     WHERE merchant_id = $1 AND is_active = true
                     """,
                     merchant_id
@@ -856,6 +864,8 @@ async def get_active_session_with_refresh(
                     is_valid = await validate_session(row['guid'])
 
             if is_valid and session_data:
+                if skip_validation:
+                    session_cache.put(merchant_id, session_data, row.get('session_version'))
                 return session_data
 
             # Session expired or decryption failed - attempt refresh if enabled
@@ -948,6 +958,7 @@ async def get_active_session_with_refresh(
                     )
 
                     logger.info(f"Successfully refreshed session for merchant {merchant_id} with {len(new_store_points)} store points")
+                    session_cache.invalidate(merchant_id)
 
                     # Return decrypted session
                     return decrypt_session(new_session['guid'])
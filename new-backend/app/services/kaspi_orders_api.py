@@ -7,15 +7,18 @@ Kaspi Open API (REST) — сервис для работы с заказами 
 - Geo-restricted: работает только с казахстанских IP
 - Формат JSON:API
 """
+import asyncio
 import logging
-from typing import Optional, Dict, Any, List
+import uuid
+from typing import Optional, Dict, Any, List, AsyncIterator
 from datetime import datetime, timedelta
 
 import httpx
 import asyncpg
 
 from ..config import settings
-from ..core.rate_limiter import get_orders_rate_limiter
+from ..core.http_client import get_kaspi_api_http_client
+from ..core.rate_limiter import get_orders_token_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -42,14 +45,40 @@ class KaspiOrdersAPI:
             "User-Agent": "Mozilla/5.0",
         }
 
-    def _get_client_kwargs(self) -> dict:
-        kwargs: dict = {"timeout": self.TIMEOUT}
-        proxy = getattr(settings, 'kaspi_api_proxy', None)
-        if proxy:
-            kwargs["proxy"] = proxy
-        return kwargs
+    MAX_PAGES = 50
 
-    async def fetch_orders(
+    async def _fetch_orders_page(
+        self,
+        client: httpx.AsyncClient,
+        api_token: str,
+        headers: dict,
+        url: str,
+    ) -> dict:
+        """One page of the orders list (rate limited per token)."""
+        # Rate limiting: per API token (orders_api_token_rps)
+        await get_orders_token_rate_limiter(api_token).acquire()
+
+        response = await client.get(
+            url,
+            headers=headers,
+        )
+
+        if response.status_code in (401, 403):
+            raise KaspiTokenInvalidError(
+                f"API token invalid or expired (HTTP {response.status_code})"
+            )
+
+        if response.status_code != 200:
+            error_body = response.text[:500] if response.text else "No response body"
+            logger.warning(
+                f"Kaspi REST API error: {response.status_code}, "
+                f"URL: {response.url}, body: {error_body}"
+            )
+            raise KaspiOrdersAPIError(f"HTTP {response.status_code}")
+
+        return response.json()
+
+    async def iter_order_pages(
         self,
         api_token: str,
         date_from: datetime,
@@ -57,20 +86,25 @@ class KaspiOrdersAPI:
         states: Optional[List[str]] = None,
         page: int = 0,
         size: int = 100,
-    ) -> List[dict]:
+    ) -> AsyncIterator[List[dict]]:
         """
-        Fetch orders from Kaspi REST API.
+        Stream orders from Kaspi REST API page by page.
+
+        The first page gives meta.totalPages; the remaining pages are then
+        fetched concurrently (up to settings.orders_page_concurrency, each
+        request still waiting for the per-token rate limiter) and yielded in
+        completion order, so callers can write each page as it arrives.
 
         Args:
             api_token: X-Auth-Token from Kaspi MC settings
             date_from: Start date filter
             date_to: End date filter
             states: Optional list of order states (omit to get all states)
-            page: Page number (0-based)
+            page: First page number (0-based)
             size: Page size (max 100)
 
-        Returns:
-            List of order data dicts (JSON:API format)
+        Yields:
+            Non-empty lists of order data dicts (JSON:API format)
 
         Raises:
             KaspiTokenInvalidError: If token is invalid/expired
@@ -80,55 +114,46 @@ class KaspiOrdersAPI:
         ts_from = int(date_from.timestamp() * 1000)
         ts_to = int(date_to.timestamp() * 1000)
 
-        all_orders = []
-        max_pages = 50
+        def page_url(number: int) -> str:
+            url = (
+                f"{self.BASE_URL}"
+                f"?page[number]={number}&page[size]={size}"
+                f"&filter[orders][creationDate][$ge]={ts_from}"
+                f"&filter[orders][creationDate][$le]={ts_to}"
+            )
+            if states:
+                url += f"&filter[orders][state]={','.join(states)}"
+            return url
 
         try:
-            async with httpx.AsyncClient(**self._get_client_kwargs()) as client:
-                while page < max_pages:
-                    url = (
-                        f"{self.BASE_URL}"
-                        f"?page[number]={page}&page[size]={size}"
-                        f"&filter[orders][creationDate][$ge]={ts_from}"
-                        f"&filter[orders][creationDate][$le]={ts_to}"
-                    )
-                    if states:
-                        url += f"&filter[orders][state]={','.join(states)}"
-
-                    # Rate limiting: 6 RPS for Orders API
-                    await get_orders_rate_limiter().acquire()
-
-                    response = await client.get(
-                        url,
-                        headers=headers,
-                    )
-
-                    if response.status_code in (401, 403):
-                        raise KaspiTokenInvalidError(
-                            f"API token invalid or expired (HTTP {response.status_code})"
-                        )
-
-                    if response.status_code != 200:
-                        error_body = response.text[:500] if response.text else "No response body"
-                        logger.warning(
-                            f"Kaspi REST API error: {response.status_code}, "
-                            f"URL: {response.url}, body: {error_body}"
-                        )
-                        raise KaspiOrdersAPIError(f"HTTP {response.status_code}")
-
-                    data = response.json()
-                    orders = data.get("data", [])
-
-                    if not orders:
-                        break
-
-                    all_orders.extend(orders)
-
-                    # Check if there are more pages
-                    total_pages = data.get("meta", {}).get("totalPages", 1)
-                    page += 1
-                    if page >= total_pages:
-                        break
+            client = await get_kaspi_api_http_client()
+            data = await self._fetch_orders_page(client, api_token, headers, page_url(page))
+            orders = data.get("data", [])
+            if not orders:
+                return
+            yield orders
+
+            total_pages = min(data.get("meta", {}).get("totalPages", 1), self.MAX_PAGES)
+            if page + 1 >= total_pages:
+                return
+
+            semaphore = asyncio.Semaphore(settings.orders_page_concurrency)
+
+            async def fetch(number: int) -> dict:
+                async with semaphore:
+                    return await self._fetch_orders_page(client, api_token, headers, page_url(number))
+
+            tasks = [asyncio.create_task(fetch(number)) for number in range(page + 1, total_pages)]
+            try:
+                for next_page in asyncio.as_completed(tasks):
+                    orders = (await next_page).get("data", [])
+                    if orders:
+                        yield orders
+            finally:
+                # Consumer stopped early or a page failed: drop the rest
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
 
         except httpx.TimeoutException:
             logger.warning("Kaspi REST API timeout (likely geo-restricted, need KZ IP)")
@@ -137,6 +162,31 @@ class KaspiOrdersAPI:
             logger.error(f"Kaspi REST API network error: {e}")
             raise KaspiOrdersAPIError(f"Network error: {e}")
 
+    async def fetch_orders(
+        self,
+        api_token: str,
+        date_from: datetime,
+        date_to: datetime,
+        states: Optional[List[str]] = None,
+        page: int = 0,
+        size: int = 100,
+    ) -> List[dict]:
+        """
+        Fetch orders from Kaspi REST API into one list.
+
+        Prefer iter_order_pages() for large windows; see it for arguments.
+
+        Returns:
+            List of order data dicts (JSON:API format)
+
+        Raises:
+            KaspiTokenInvalidError: If token is invalid/expired
+            KaspiOrdersAPIError: If API call fails
+        """
+        all_orders = []
+        async for orders in self.iter_order_pages(api_token, date_from, date_to, states, page, size):
+            all_orders.extend(orders)
+
         logger.info(f"Fetched {len(all_orders)} orders via REST API")
         return all_orders
 
@@ -162,23 +212,24 @@ class KaspiOrdersAPI:
         url = f"{self.BASE_URL}/{order_id}"
 
         try:
-            async with httpx.AsyncClient(**self._get_client_kwargs()) as client:
-                response = await client.get(url, headers=headers)
+            client = await get_kaspi_api_http_client()
+            await get_orders_token_rate_limiter(api_token).acquire()
+            response = await client.get(url, headers=headers)
 
-                if response.status_code in (401, 403):
-                    raise KaspiTokenInvalidError(
-                        f"API token invalid or expired (HTTP {response.status_code})"
-                    )
+            if response.status_code in (401, 403):
+                raise KaspiTokenInvalidError(
+                    f"API token invalid or expired (HTTP {response.status_code})"
+                )
 
-                if response.status_code == 404:
-                    return None
+            if response.status_code == 404:
+                return None
 
-                if response.status_code != 200:
-                    logger.warning(f"Kaspi REST API error for order {order_id}: {response.status_code}")
-                    return None
+            if response.status_code != 200:
+                logger.warning(f"Kaspi REST API error for order {order_id}: {response.status_code}")
+                return None
 
-                data = response.json()
-                return data.get("data")
+            data = response.json()
+            return data.get("data")
 
         except httpx.TimeoutException:
             logger.warning(f"Timeout fetching order {order_id} (geo-restricted?)")
@@ -213,33 +264,33 @@ class KaspiOrdersAPI:
         params = {"filter[orders][code]": order_code}
 
         try:
-            async with httpx.AsyncClient(**self._get_client_kwargs()) as client:
-                # Rate limiting: 6 RPS for Orders API
-                await get_orders_rate_limiter().acquire()
-
-                response = await client.get(
-                    self.BASE_URL,
-                    headers=headers,
-                    params=params,
+            client = await get_kaspi_api_http_client()
+            # Rate limiting: per API token (orders_api_token_rps)
+            await get_orders_token_rate_limiter(api_token).acquire()
+
+            response = await client.get(
+                self.BASE_URL,
+                headers=headers,
+                params=params,
+            )
+
+            if response.status_code in (401, 403):
+                raise KaspiTokenInvalidError(
+                    f"API token invalid or expired (HTTP {response.status_code})"
                 )
 
-                if response.status_code in (401, 403):
-                    raise KaspiTokenInvalidError(
-                        f"API token invalid or expired (HTTP {response.status_code})"
-                    )
-
-                if response.status_code != 200:
-                    error_body = response.text[:500] if response.text else "No response body"
-                    logger.warning(
-                        f"Kaspi REST API error searching order {order_code}: {response.status_code}, "
-                        f"body: {error_body}"
-                    )
-                    raise KaspiOrdersAPIError(f"HTTP {response.status_code}")
+            if response.status_code != 200:
+                error_body = response.text[:500] if response.text else "No response body"
+                logger.warning(
+                    f"Kaspi REST API error searching order {order_code}: {response.status_code}, "
+                    f"body: {error_body}"
+                )
+                raise KaspiOrdersAPIError(f"HTTP {response.status_code}")
 
-                data = response.json()
-                orders = data.get("data", [])
+            data = response.json()
+            orders = data.get("data", [])
 
-                return orders[0] if orders else None
+            return orders[0] if orders else None
 
         except httpx.TimeoutException:
             logger.warning(f"Timeout searching order {order_code} (geo-restricted?)")
@@ -253,6 +304,7 @@ class KaspiOrdersAPI:
         api_token: str,
         order_code: str,
         pool: asyncpg.Pool,
+        store_id: Optional[str] = None,
     ) -> Optional[Dict[str, Any]]:
         """
         Get real customer phone number for an order via REST API.
@@ -264,6 +316,7 @@ class KaspiOrdersAPI:
             api_token: X-Auth-Token
             order_code: Kaspi order code (e.g. "790686780")
             pool: DB connection pool
+            store_id: Store UUID; narrows the DB lookup to idx_orders_store_code
 
         Returns:
             Dict with phone, first_name, last_name, full_name, etc. or None
@@ -273,12 +326,20 @@ class KaspiOrdersAPI:
         """
         # Find kaspi_order_id by order_code in DB
         async with pool.acquire() as conn:
-            row = await conn.fetchrow("""
-                SELECT kaspi_order_id
-                FROM orders
-                WHERE kaspi_order_code = $1
-                LIMIT 1
-            """, order_code)
+            if store_id:
+                row = await conn.fetchrow("""
+                    SELECT kaspi_order_id
+                    FROM orders
+                    WHERE store_id = $1 AND kaspi_order_code = $2
+                    LIMIT 1
+                """, uuid.UUID(str(store_id)), order_code)
+            else:
+                row = await conn.fetchrow("""
+                    SELECT kaspi_order_id
+                    FROM orders
+                    WHERE kaspi_order_code = $1
+                    LIMIT 1
+                """, order_code)
 
         order_id = row['kaspi_order_id'] if row else None
         order_data = None
@@ -12,8 +12,8 @@ from typing import Optional, Dict, Any, List
 
 import httpx
 
-from ..config import settings
-from ..core.rate_limiter import get_orders_rate_limiter
+from ..core.http_client import get_kaspi_api_http_client
+from ..core.rate_limiter import get_orders_token_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -42,13 +42,6 @@ class KaspiProductsAPI:
             "User-Agent": "Mozilla/5.0",
         }
 
-    def _get_client_kwargs(self) -> dict:
-        kwargs: dict = {"timeout": self.TIMEOUT}
-        proxy = getattr(settings, 'kaspi_api_proxy', None)
-        if proxy:
-            kwargs["proxy"] = proxy
-        return kwargs
-
     async def fetch_products(
         self,
         api_token: str,
@@ -84,44 +77,44 @@ class KaspiProductsAPI:
         max_pages = 100
 
         try:
-            async with httpx.AsyncClient(**self._get_client_kwargs()) as client:
-                while page < max_pages:
-                    params["page[number]"] = page
+            client = await get_kaspi_api_http_client()
+            while page < max_pages:
+                params["page[number]"] = page
 
-                    # Rate limiting: 6 RPS (same as orders API)
-                    await get_orders_rate_limiter().acquire()
+                # Rate limiting: per API token, shared with the orders API
+                await get_orders_token_rate_limiter(api_token).acquire()
 
-                    response = await client.get(
-                        f"{self.BASE_URL}/products",
-                        headers=headers,
-                        params=params,
-                    )
+                response = await client.get(
+                    f"{self.BASE_URL}/products",
+                    headers=headers,
+                    params=params,
+                )
 
-                    if response.status_code in (401, 403):
-                        raise KaspiTokenInvalidError(
-                            f"API token invalid or expired (HTTP {response.status_code})"
-                        )
+                if response.status_code in (401, 403):
+                    raise KaspiTokenInvalidError(
+                        f"API token invalid or expired (HTTP {response.status_code})"
+                    )
 
-                    if response.status_code != 200:
-                        error_body = response.text[:500] if response.text else "No response body"
-                        logger.warning(
-                            f"Kaspi Products API error: {response.status_code}, body: {error_body}"
-                        )
-                        raise KaspiProductsAPIError(f"HTTP {response.status_code}")
+                if response.status_code != 200:
+                    error_body = response.text[:500] if response.text else "No response body"
+                    logger.warning(
+                        f"Kaspi Products API error: {response.status_code}, body: {error_body}"
+                    )
+                    raise KaspiProductsAPIError(f"HTTP {response.status_code}")
 
-                    data = response.json()
-                    products = data.get("data", [])
+                data = response.json()
+                products = data.get("data", [])
 
-                    if not products:
-                        break
+                if not products:
+                    break
 
-                    all_products.extend(products)
+                all_products.extend(products)
 
-                    # Check pagination
-                    total_pages = data.get("meta", {}).get("totalPages", 1)
-                    page += 1
-                    if page >= total_pages:
-                        break
+                # Check pagination
+                total_pages = data.get("meta", {}).get("totalPages", 1)
+                page += 1
+                if page >= total_pages:
+                    break
 
         except httpx.TimeoutException:
             logger.warning("Kaspi Products API timeout (likely geo-restricted, need KZ IP)")
@@ -155,23 +148,24 @@ class KaspiProductsAPI:
         url = f"{self.BASE_URL}/products/{product_id}"
 
         try:
-            async with httpx.AsyncClient(**self._get_client_kwargs()) as client:
-                response = await client.get(url, headers=headers)
+            client = await get_kaspi_api_http_client()
+            await get_orders_token_rate_limiter(api_token).acquire()
+            response = await client.get(url, headers=headers)
 
-                if response.status_code in (401, 403):
-                    raise KaspiTokenInvalidError(
-                        f"API token invalid or expired (HTTP {response.status_code})"
-                    )
+            if response.status_code in (401, 403):
+                raise KaspiTokenInvalidError(
+                    f"API token invalid or expired (HTTP {response.status_code})"
+                )
 
-                if response.status_code == 404:
-                    return None
+            if response.status_code == 404:
+                return None
 
-                if response.status_code != 200:
-                    logger.warning(f"Kaspi REST API error for product {product_id}: {response.status_code}")
-                    return None
+            if response.status_code != 200:
+                logger.warning(f"Kaspi REST API error for product {product_id}: {response.status_code}")
+                return None
 
-                data = response.json()
-                return data.get("data")
+            data = response.json()
+            return data.get("data")
 
         except httpx.TimeoutException:
             logger.warning(f"Timeout fetching product {product_id} (geo-restricted?)")
@@ -0,0 +1,230 @@
+"""
+Order Customer Resolver - phone and customer data for order events.
+
+Every order event (approved, accepted, delivered, completed, review) needs
+the customer's phone. The phone is already decoded from customer.id during
+ingestion (parse_order_details) and stored on orders.customer_phone, so
+events read it from there. Kaspi is asked only when nothing usable is stored:
+
+1. In-process LRU of recent lookups, keyed by (store_id, order_code)
+2. orders.customer_phone + order_items (no Kaspi request)
+3. REST API order detail (X-Auth-Token); the phone is written back to orders
+4. MC GraphQL (session cookies, phones masked since Feb 5 2026)
+
+Results have the same format as KaspiOrdersAPI.get_customer_phone().
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+import asyncpg
+
+from ..config import settings
+from ..core.metrics import get_metrics
+from .api_parser import _is_valid_phone, _normalize_phone
+from .kaspi_mc_service import get_kaspi_mc_service, KaspiMCError
+from .kaspi_orders_api import get_kaspi_orders_api, KaspiTokenInvalidError
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER_LOOKUPS = get_metrics().counter(
+    "order_customer_lookups_total",
+    "Order customer resolutions by the source that answered",
+    ["source"],
+)
+
+CacheKey = Tuple[str, str]
+
+
+def _customer_from_order_row(order: asyncpg.Record, items) -> Dict[str, Any]:
+    """Stored order -> get_customer_phone() format."""
+    phone = _normalize_phone(order["customer_phone"])
+    full_name = (order["customer_name"] or "").strip() or None
+    first_name, _, last_name = (full_name or "").partition(" ")
+    order_date = order["order_date"]
+    return {
+        "phone": phone,
+        "phone_raw": phone.lstrip("+"),
+        "first_name": first_name or None,
+        "last_name": last_name or None,
+        "full_name": full_name,
+        "order_code": order["kaspi_order_code"],
+        "order_state": order["status"],
+        "order_total": order["total_price"],
+        "order_date": int(order_date.timestamp() * 1000) if order_date else None,
+        "items": [
+            {"productName": item["name"], "quantity": item["quantity"], "basePrice": item["price"]}
+            for item in items
+        ],
+        "delivery_address": order["delivery_address"] or None,
+        "delivery_city": None,  # not stored; REST detail has it
+    }
+
+
+class OrderCustomerResolver:
+    """
+    Resolves the customer of an order, cheapest source first.
+    """
+
+    def __init__(self, ttl: float, size: int):
+        """
+        Args:
+            ttl: Seconds a resolved customer is reused from memory
+            size: Max orders kept in the in-process LRU
+        """
+        self.ttl = ttl
+        self.size = size
+        self._local: "OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    async def resolve(
+        self,
+        pool: asyncpg.Pool,
+        user_id: str,
+        store_id: str,
+        order_code: str,
+        need_city: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Customer data with a usable phone, or None.
+
+        Args:
+            need_city: The message template uses {delivery_city}, which only
+                the Kaspi order detail has; skips the stored-order shortcut
+        """
+        key = (str(store_id), str(order_code))
+        cached = self._get_local(key)
+        if cached is not None and (cached.get("delivery_city") or not need_city):
+            CUSTOMER_LOOKUPS.labels(source="cache").inc()
+            return cached
+
+        async with pool.acquire() as conn:
+            order = await conn.fetchrow(
+                """
+                SELECT id, kaspi_order_code, status, total_price, customer_name,
+                       customer_phone, delivery_address, order_date
+                FROM orders
+                WHERE store_id = $1 AND kaspi_order_code = $2
+                LIMIT 1
+                """,
+                UUID(store_id), order_code,
+            )
+            stored = None
+            if order and _is_valid_phone(order["customer_phone"] or ""):
+                items = await conn.fetch(
+                    """
+                    SELECT name, quantity, price
+                    FROM order_items
+                    WHERE order_id = $1
+                    ORDER BY created_at
+                    """,
+                    order["id"],
+                )
+                stored = _customer_from_order_row(order, items)
+                if not need_city:
+                    self._set_local(key, stored)
+                    CUSTOMER_LOOKUPS.labels(source="db").inc()
+                    return stored
+
+            store = await conn.fetchrow(
+                "SELECT api_key, api_key_valid FROM kaspi_stores WHERE id = $1",
+                UUID(store_id),
+            )
+
+        customer = None
+        api_key = store.get("api_key") if store else None
+        api_key_valid = store.get("api_key_valid", True) if store else True
+        if api_key and api_key_valid:
+            try:
+                customer = await get_kaspi_orders_api().get_customer_phone(
+                    api_token=str(api_key),
+                    order_code=order_code,
+                    pool=pool,
+                    store_id=store_id,
+                )
+            except KaspiTokenInvalidError:
+                logger.warning(f"API token invalid for store {store_id}, marking as invalid")
+                async with pool.acquire() as conn:
+                    await conn.execute(
+                        "UPDATE kaspi_stores SET api_key_valid = FALSE WHERE id = $1",
+                        UUID(store_id)
+                    )
+            except Exception as e:
+                logger.warning(f"REST API failed for order {order_code}: {e}")
+
+            if customer and customer.get("phone"):
+                logger.info(f"Got phone via REST API for order {order_code}: {customer['phone']}")
+                self._set_local(key, customer)
+                CUSTOMER_LOOKUPS.labels(source="rest").inc()
+                if order and stored is None:
+                    await self._store_phone(pool, order["id"], customer["phone"])
+                return customer
+            logger.warning(f"REST API returned no phone for order {order_code}")
+
+        # City wanted but REST could not provide it: the stored phone still works
+        if stored is not None:
+            CUSTOMER_LOOKUPS.labels(source="db").inc()
+            return stored
+
+        # Fallback: MC GraphQL (masked since Feb 5 2026, but kept as backup)
+        try:
+            customer = await get_kaspi_mc_service().get_order_customer_phone(
+                user_id=user_id,
+                store_id=store_id,
+                order_code=order_code,
+                pool=pool,
+            )
+        except KaspiMCError as e:
+            logger.error(f"MC GraphQL fallback also failed: {e}")
+            customer = None
+
+        if customer and customer.get("phone"):
+            self._set_local(key, customer)
+            CUSTOMER_LOOKUPS.labels(source="mc").inc()
+            return customer
+
+        CUSTOMER_LOOKUPS.labels(source="miss").inc()
+        return None
+
+    async def _store_phone(self, pool: asyncpg.Pool, order_id: UUID, phone: str):
+        """Keep a REST-resolved phone on the order for later events."""
+        try:
+            async with pool.acquire() as conn:
+                await conn.execute(
+                    "UPDATE orders SET customer_phone = $2, updated_at = NOW() WHERE id = $1",
+                    order_id, phone,
+                )
+        except Exception as e:
+            logger.debug(f"Failed to store customer phone on order {order_id}: {e}")
+
+    def _get_local(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        stored_at, customer = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return customer
+
+    def _set_local(self, key: CacheKey, customer: Dict[str, Any]):
+        self._local[key] = (time.monotonic(), customer)
+        self._local.move_to_end(key)
+        while len(self._local) > self.size:
+            self._local.popitem(last=False)
+
+
+_order_customer_resolver: Optional[OrderCustomerResolver] = None
+
+
+def get_order_customer_resolver() -> OrderCustomerResolver:
+    """Get global order customer resolver instance"""
+    global _order_customer_resolver
+    if _order_customer_resolver is None:
+        _order_customer_resolver = OrderCustomerResolver(
+            ttl=settings.order_customer_cache_ttl_seconds,
+            size=settings.order_customer_cache_size,
+        )
+    return _order_customer_resolver
@@ -21,8 +21,7 @@ import asyncpg
 
 from ..config import settings
 from ..core.database import get_db_pool
-from .kaspi_mc_service import get_kaspi_mc_service, KaspiMCError
-from .kaspi_orders_api import get_kaspi_orders_api, KaspiTokenInvalidError
+from .order_customer_resolver import get_order_customer_resolver
 from .waha_service import get_waha_service, WahaError
 from .ai_salesman_service import process_order_for_upsell
 
@@ -89,9 +88,6 @@ class OrderEventProcessor:
         "{promo_code}": "promo_code",                 # Промокод
     }
 
-    def __init__(self):
-        self._kaspi_mc = get_kaspi_mc_service()
-
     async def process_order_event(
         self,
         user_id: str,
@@ -141,54 +137,17 @@ class OrderEventProcessor:
                 return {"status": "no_template"}
 
             # 3. Получаем данные заказа и телефон покупателя
-            # Стратегия: REST API (X-Auth-Token) → fallback MC GraphQL
-            order_data = None
-
-            # 3a. Пробуем REST API если есть api_key
-            store_row = await conn.fetchrow(
-                "SELECT api_key, api_key_valid FROM kaspi_stores WHERE id = $1",
-                UUID(store_id)
+            # Стратегия: orders.customer_phone → REST API (X-Auth-Token) → MC GraphQL
+            order_data = await get_order_customer_resolver().resolve(
+                pool,
+                user_id=user_id,
+                store_id=store_id,
+                order_code=order_code,
+                need_city="{delivery_city}" in (template['message'] or ""),
             )
-            api_key = store_row.get('api_key') if store_row else None
-            api_key_valid = store_row.get('api_key_valid', True) if store_row else True
-
-            if api_key and api_key_valid:
-                try:
-                    orders_api = get_kaspi_orders_api()
-                    order_data = await orders_api.get_customer_phone(
-                        api_token=api_key,
-                        order_code=order_code,
-                        pool=pool,
-                    )
-                    if order_data and order_data.get('phone'):
-                        logger.info(f"Got phone via REST API for order {order_code}: {order_data['phone']}")
-                    else:
-                        logger.warning(f"REST API returned no phone for order {order_code}")
-                except KaspiTokenInvalidError:
-                    logger.warning(f"API token invalid for store {store_id}, marking as invalid")
-                    await conn.execute(
-                        "UPDATE kaspi_stores SET api_key_valid = FALSE WHERE id = $1",
-                        UUID(store_id)
-                    )
-                    order_data = None
-                except Exception as e:
-                    logger.warning(f"REST API failed for order {order_code}: {e}")
-                    order_data = None
-
-            # 3b. Fallback: MC GraphQL (masked since Feb 5 2026, but kept as backup)
-            if not order_data or not order_data.get('phone'):
-                try:
-                    order_data = await self._kaspi_mc.get_order_customer_phone(
-                        user_id=user_id,
-                        store_id=store_id,
-                        order_code=order_code,
-                        pool=pool,
-                    )
-                except KaspiMCError as e:
-                    logger.error(f"MC GraphQL fallback also failed: {e}")
 
             if not order_data or not order_data.get('phone'):
-                logger.warning(f"No phone number for order {order_code} (both REST API and MC GraphQL failed)")
+                logger.warning(f"No phone number for order {order_code} (stored order, REST API and MC GraphQL)")
                 return {"status": "no_phone"}
 
             # 4. Получаем данные магазина
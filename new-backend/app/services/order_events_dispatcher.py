@@ -0,0 +1,304 @@
+"""
+Order events dispatcher - delivers order_events_outbox rows.
+
+sync_orders_to_db only enqueues events (new order, status change) in the
+same transaction as the orders themselves. This dispatcher runs inside the
+orders worker and turns them into notifications and WhatsApp messages:
+
+- claims due events with FOR UPDATE SKIP LOCKED, so any number of workers
+  can consume the outbox without handing out an event twice
+- a claim pushes next_attempt_at forward by CLAIM_LEASE; if the process dies
+  mid-event, the event becomes due again by itself
+- events of one order are delivered in order (an older pending event of the
+  same order blocks the newer one)
+- up to order_events_concurrency events in flight, WhatsApp sends paced per
+  user session (get_whatsapp_rate_limiter)
+- errors are retried with exponential backoff; after order_events_max_attempts
+  the event is marked failed
+- the in-app notification of a new order is tracked on its own
+  (notified_at): a retry sends it if an earlier attempt failed to, and never
+  twice; WhatsApp sends are deduplicated by process_new_kaspi_order
+"""
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Dict, Optional, Set
+
+import asyncpg
+
+from ..config import settings
+from ..core.metrics import get_metrics
+from ..core.rate_limiter import get_whatsapp_rate_limiter
+from .notification_service import create_notification, NotificationType, get_user_notification_settings
+from .order_event_processor import process_new_kaspi_order
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENTS = get_metrics().counter(
+    "order_events_total",
+    "Order outbox events handled by the dispatcher",
+    ["result"],
+)
+
+# A claimed event is hidden from other dispatchers this long (must cover the
+# WhatsApp rate limit wait plus WAHA retries)
+CLAIM_LEASE = timedelta(minutes=10)
+
+# Retry backoff: RETRY_BASE * 2^(attempt - 1), capped at RETRY_MAX
+RETRY_BASE = timedelta(seconds=30)
+RETRY_MAX = timedelta(hours=1)
+
+# Delivered and failed events are kept this long for inspection
+RETENTION = timedelta(days=7)
+
+_CLAIM_SQL = """
+    UPDATE order_events_outbox o
+    SET attempts = o.attempts + 1,
+        next_attempt_at = NOW() + $2::interval
+    FROM (
+        SELECT e.id
+        FROM order_events_outbox e
+        WHERE e.status = 'pending'
+          AND e.next_attempt_at <= NOW()
+          AND NOT EXISTS (
+              SELECT 1 FROM order_events_outbox older
+              WHERE older.order_id = e.order_id
+                AND older.status = 'pending'
+                AND older.id < e.id
+          )
+        ORDER BY e.next_attempt_at
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    ) due
+    WHERE o.id = due.id
+    RETURNING o.id, o.user_id, o.store_id, o.order_id, o.order_code, o.event_type,
+              o.old_status, o.new_status, o.total_price, o.attempts, o.notified_at
+"""
+
+
+class OrderEventsDispatcher:
+    """Consumer pool for order_events_outbox."""
+
+    # Seconds between outbox polls while slots are free and the outbox is empty
+    POLL_INTERVAL = 2.0
+    # Seconds between cleanups of delivered / failed events
+    CLEANUP_INTERVAL = 3600
+    # Max seconds to let in-flight events finish on stop
+    DRAIN_TIMEOUT = 30
+
+    def __init__(self, concurrency: Optional[int] = None, max_attempts: Optional[int] = None):
+        self.concurrency = concurrency if concurrency is not None else settings.order_events_concurrency
+        self.max_attempts = max_attempts if max_attempts is not None else settings.order_events_max_attempts
+        self._pool: Optional[asyncpg.Pool] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self._slot_freed = asyncio.Event()
+        self._running = False
+
+        get_metrics().gauge("order_events_in_flight", "Outbox events being delivered",
+                            callback=lambda: {(): len(self._in_flight)})
+
+    async def start(self, pool: asyncpg.Pool):
+        if self._task is not None:
+            return
+        self._pool = pool
+        self._running = True
+        self._task = asyncio.create_task(self._run(), name="order-events-dispatcher")
+        logger.info(f"[ORDER_EVENTS] Dispatcher started (concurrency={self.concurrency})")
+
+    async def stop(self):
+        """Stop claiming; let in-flight events finish up to DRAIN_TIMEOUT."""
+        if self._task is None:
+            return
+        self._running = False
+        self._slot_freed.set()
+        await self._task
+        self._task = None
+
+        if self._in_flight:
+            _, pending = await asyncio.wait(list(self._in_flight), timeout=self.DRAIN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        logger.info("[ORDER_EVENTS] Dispatcher stopped")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_cleanup = loop.time()
+
+        while self._running:
+            claimed = 0
+            free = self.concurrency - len(self._in_flight)
+            if free > 0:
+                try:
+                    events = await self._claim(free)
+                except Exception as e:
+                    logger.error(f"[ORDER_EVENTS] Claim failed: {e}")
+                    events = []
+                claimed = len(events)
+                for event in events:
+                    task = asyncio.create_task(self._handle(event))
+                    self._in_flight.add(task)
+                    task.add_done_callback(self._on_done)
+
+            if loop.time() >= next_cleanup:
+                await self._cleanup()
+                next_cleanup = loop.time() + self.CLEANUP_INTERVAL
+
+            # A full batch means more is probably due; otherwise wait for a
+            # free slot or the next poll
+            if claimed and claimed == free:
+                continue
+            self._slot_freed.clear()
+            try:
+                await asyncio.wait_for(self._slot_freed.wait(), timeout=self.POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def _on_done(self, task: asyncio.Task):
+        self._in_flight.discard(task)
+        self._slot_freed.set()
+
+    async def _claim(self, limit: int):
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(_CLAIM_SQL, limit, CLAIM_LEASE)
+
+    async def _handle(self, event: Dict):
+        try:
+            await self._deliver(event)
+        except Exception as e:
+            await self._retry_or_fail(event, e)
+            return
+
+        ORDER_EVENTS.labels(result="done").inc()
+        try:
+            async with self._pool.acquire() as conn:
+                await conn.execute(
+                    """
+                    UPDATE order_events_outbox
+                    SET status = 'done', processed_at = NOW(), last_error = NULL
+                    WHERE id = $1
+                    """,
+                    event["id"],
+                )
+        except Exception as e:
+            # Redelivered after the lease; WhatsApp sends are deduplicated by
+            # process_order_event (whatsapp_messages per order and event)
+            logger.error(f"[ORDER_EVENTS] Failed to mark event {event['id']} done: {e}")
+
+    async def _deliver(self, event: Dict):
+        """
+        Notification (until one attempt sent it) and WhatsApp message for one event.
+
+        A failed notification does not stop the WhatsApp send; its error is
+        raised afterwards so the event is retried.
+        """
+        user_id = str(event["user_id"])
+        code = event["order_code"]
+        notify_error: Optional[Exception] = None
+
+        if event["event_type"] == "new":
+            if event["notified_at"] is None:
+                try:
+                    await self._notify(event)
+                except Exception as notif_err:
+                    logger.warning(f"Failed to send order notification: {notif_err}")
+                    notify_error = notif_err
+            kaspi_state = event["new_status"] or "APPROVED"
+            suffix = ""
+        else:
+            logger.info(f"Order {code} status: {event['old_status']} → {event['new_status']}")
+            kaspi_state = event["new_status"]
+            suffix = f" (status → {kaspi_state})"
+
+        # Send WhatsApp message if template is active
+        await get_whatsapp_rate_limiter(user_id).acquire()
+        wa_result = await process_new_kaspi_order(
+            user_id=user_id,
+            store_id=str(event["store_id"]),
+            order_code=code,
+            kaspi_state=kaspi_state,
+            pool=self._pool,
+        )
+        wa_status = wa_result.get("status", "unknown")
+        if wa_status == "sent":
+            logger.info(f"WhatsApp sent for order {code}{suffix}")
+        else:
+            logger.info(f"WhatsApp result for order {code}{suffix}: {wa_status}")
+
+        if notify_error is not None:
+            raise notify_error
+
+    async def _notify(self, event: Dict):
+        """New-order notification, recorded in notified_at once sent (or turned off)."""
+        prefs = await get_user_notification_settings(self._pool, event["user_id"])
+        if prefs.get("orders", True):
+            code = event["order_code"]
+            total = event["total_price"]
+            await create_notification(
+                pool=self._pool,
+                user_id=event["user_id"],
+                notification_type=NotificationType.ORDER_NEW,
+                title=f"Новый заказ #{code}",
+                message=f"Сумма: {total:,} ₸".replace(",", " ") if total else None,
+                data={"order_id": str(event["order_id"]), "order_code": code},
+            )
+        try:
+            async with self._pool.acquire() as conn:
+                await conn.execute(
+                    "UPDATE order_events_outbox SET notified_at = NOW() WHERE id = $1",
+                    event["id"],
+                )
+        except Exception as e:
+            # Only costs a duplicate notification if the event is retried
+            logger.error(f"[ORDER_EVENTS] Failed to mark event {event['id']} notified: {e}")
+
+    async def _retry_or_fail(self, event: Dict, error: Exception):
+        attempts = event["attempts"]
+        failed = attempts >= self.max_attempts
+        delay = min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+        ORDER_EVENTS.labels(result="failed" if failed else "retry").inc()
+        if failed:
+            logger.error(
+                f"[ORDER_EVENTS] Event {event['id']} ({event['event_type']} {event['order_code']}) "
+                f"failed after {attempts} attempts: {error}"
+            )
+        else:
+            logger.warning(
+                f"[ORDER_EVENTS] Event {event['id']} ({event['event_type']} {event['order_code']}) "
+                f"attempt {attempts} failed, retry in {delay.total_seconds():.0f}s: {error}"
+            )
+        try:
+            async with self._pool.acquire() as conn:
+                await conn.execute(
+                    """
+                    UPDATE order_events_outbox
+                    SET status = $2::text,
+                        next_attempt_at = NOW() + $3::interval,
+                        last_error = $4,
+                        processed_at = CASE WHEN $2::text = 'failed' THEN NOW() END
+                    WHERE id = $1
+                    """,
+                    event["id"],
+                    "failed" if failed else "pending",
+                    delay,
+                    str(error)[:1000],
+                )
+        except Exception as e:
+            # The claim lease expires and the event is retried anyway
+            logger.error(f"[ORDER_EVENTS] Failed to reschedule event {event['id']}: {e}")
+
+    async def _cleanup(self):
+        try:
+            async with self._pool.acquire() as conn:
+                result = await conn.execute(
+                    """
+                    DELETE FROM order_events_outbox
+                    WHERE status <> 'pending' AND processed_at < NOW() - $1::interval
+                    """,
+                    RETENTION,
+                )
+            logger.debug(f"[ORDER_EVENTS] Cleanup: {result}")
+        except Exception as e:
+            logger.warning(f"[ORDER_EVENTS] Cleanup failed: {e}")
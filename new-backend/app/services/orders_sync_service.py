@@ -1,170 +1,312 @@
 """
-Periodic orders sync service - fetches orders from Kaspi REST API
+Orders sync service - fetches orders of one store from Kaspi REST API
 and saves them to the database. Accumulates customer contacts.
 
-Runs as a background task in the backend (not in workers).
-Cycle: every 8 minutes. Requires valid API token (X-Auth-Token).
-Stores without API token are skipped.
+Driven by the sharded orders engine (app.workers.orders_worker), which
+decides when each store is due. Requires valid API token (X-Auth-Token).
+
+Incremental: orders_sync_state keeps a per-store cursor (newest creationDate
+seen), the statuses of orders not yet in a final state and of final-state
+orders the next cycle will see again. Each cycle fetches the active orders
+list, the ARCHIVE tab only since the cursor, and details only for open
+orders that left the active list. Only new orders and status changes are
+written. A full-window resync runs every FULL_RESYNC_INTERVAL.
 """
+import json
 import logging
-import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 
 import asyncpg
 
-from .kaspi_orders_api import get_kaspi_orders_api, KaspiTokenInvalidError, KaspiOrdersAPIError
+from ..config import settings
+from .kaspi_orders_api import KaspiTokenInvalidError
 from .api_parser import sync_orders_to_db
 
 logger = logging.getLogger(__name__)
 
-# Sync interval in seconds (8 minutes for faster order detection)
-SYNC_INTERVAL = 480
+# Full window fetched on the first sync and on periodic resyncs
+FULL_WINDOW = timedelta(days=14)
+FULL_RESYNC_INTERVAL = timedelta(hours=6)
 
-# Delay between processing each store (seconds)
-STORE_DELAY = 0.3
+# Re-read orders created this long before the cursor (late indexing on Kaspi's side)
+CURSOR_OVERLAP = timedelta(minutes=15)
 
-# Initial delay before first sync (let the app fully start)
-INITIAL_DELAY = 60
+# Order statuses that never change again
+TERMINAL_STATUSES = {"COMPLETED", "CANCELLED", "RETURNED"}
 
-# Max concurrent stores (Semaphore limit)
-MAX_CONCURRENT_STORES = 12
+# Adaptive poll interval: shrinks after cycles with changes, grows while idle
+POLL_BACKOFF_FACTOR = 2
 
 
-async def periodic_orders_sync(pool: asyncpg.Pool):
-    """
-    Background task that periodically syncs active orders from Kaspi.
+# ============================================================================
+# Incremental sync state
+# ============================================================================
 
-    Runs indefinitely, syncing all active stores every SYNC_INTERVAL seconds.
-    Each store is processed sequentially with delays to respect rate limits.
-    """
-    logger.info(f"[ORDERS_SYNC] Starting periodic orders sync (interval: {SYNC_INTERVAL}s)")
+def _order_status(order: dict) -> str:
+    """Order status as parse_order_details reads it."""
+    attributes = order.get("attributes", {}) or {}
+    return attributes.get("status") or attributes.get("state", "") or ""
 
-    # Wait for app to fully initialize
-    await asyncio.sleep(INITIAL_DELAY)
 
-    while True:
-        try:
-            await _run_sync_cycle(pool)
-        except Exception as e:
-            logger.error(f"[ORDERS_SYNC] Unexpected error in sync cycle: {e}")
+def _order_created_at(order: dict) -> Optional[datetime]:
+    created_ms = (order.get("attributes", {}) or {}).get("creationDate")
+    if not created_ms:
+        return None
+    return datetime.fromtimestamp(created_ms / 1000, tz=timezone.utc)
 
-        logger.info(f"[ORDERS_SYNC] Next cycle in {SYNC_INTERVAL}s")
-        await asyncio.sleep(SYNC_INTERVAL)
 
+async def load_sync_state(pool: asyncpg.Pool, store_id) -> dict:
+    """Cursor and open orders of a store (empty state = first sync)."""
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            """
+            SELECT last_created_at, open_orders, settled_orders, last_full_sync_at
+            FROM orders_sync_state
+            WHERE store_id = $1
+            """,
+            store_id,
+        )
+    if not row:
+        return {"last_created_at": None, "open_orders": {}, "settled_orders": {}, "last_full_sync_at": None}
+    open_orders = row["open_orders"]
+    if isinstance(open_orders, str):
+        open_orders = json.loads(open_orders)
+    settled_orders = row["settled_orders"]
+    if isinstance(settled_orders, str):
+        settled_orders = json.loads(settled_orders)
+    return {
+        "last_created_at": row["last_created_at"],
+        "open_orders": open_orders or {},
+        "settled_orders": settled_orders or {},
+        "last_full_sync_at": row["last_full_sync_at"],
+    }
+
+
+async def save_sync_state(pool: asyncpg.Pool, store_id, state: dict, poll_interval: int):
+    """Store the new cursor and schedule the next poll poll_interval seconds from now."""
+    async with pool.acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO orders_sync_state (
+                store_id, last_created_at, open_orders, settled_orders, last_full_sync_at,
+                poll_interval_seconds, next_poll_at, updated_at
+            )
+            VALUES ($1, $2, $3::jsonb, $6::jsonb, $4, $5, NOW() + make_interval(secs => $5), NOW())
+            ON CONFLICT (store_id) DO UPDATE SET
+                last_created_at = EXCLUDED.last_created_at,
+                open_orders = EXCLUDED.open_orders,
+                settled_orders = EXCLUDED.settled_orders,
+                last_full_sync_at = EXCLUDED.last_full_sync_at,
+                poll_interval_seconds = EXCLUDED.poll_interval_seconds,
+                next_poll_at = EXCLUDED.next_poll_at,
+                updated_at = NOW()
+            """,
+            store_id,
+            state["last_created_at"],
+            json.dumps(state["open_orders"]),
+            state["last_full_sync_at"],
+            poll_interval,
+            json.dumps(state["settled_orders"]),
+        )
+
+
+async def schedule_next_poll(pool: asyncpg.Pool, store_id, poll_interval: int):
+    """Push the next poll back without touching the cursor (failed cycles)."""
+    async with pool.acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO orders_sync_state (store_id, poll_interval_seconds, next_poll_at, updated_at)
+            VALUES ($1, $2, NOW() + make_interval(secs => $2), NOW())
+            ON CONFLICT (store_id) DO UPDATE SET
+                poll_interval_seconds = EXCLUDED.poll_interval_seconds,
+                next_poll_at = EXCLUDED.next_poll_at,
+                updated_at = NOW()
+            """,
+            store_id,
+            poll_interval,
+        )
+
+
+def next_poll_interval(
+    previous: Optional[int],
+    changed: int,
+    open_orders: int,
+    polling_enabled: bool,
+) -> int:
+    """
+    Seconds until a store is polled again.
 
-async def _run_sync_cycle(pool: asyncpg.Pool):
-    """Run one full sync cycle across all active stores."""
-    cycle_start = datetime.utcnow()
+    - changes in the last cycle: poll at the minimum interval
+    - open orders (statuses can still move) or WhatsApp automation on
+      (orders_polling_enabled): back off, but no further than the default
+    - idle: back off up to the maximum
+    """
+    low = settings.orders_poll_min_seconds
+    default = settings.orders_poll_default_seconds
+    if changed:
+        return low
+    interval = min(max(previous or default, low) * POLL_BACKOFF_FACTOR, settings.orders_poll_max_seconds)
+    if open_orders or polling_enabled:
+        interval = min(interval, default)
+    return int(interval)
+
+
+async def sync_store_orders(
+    rest_api,
+    api_key: str,
+    store_id: str,
+    user_id: str,
+    store_name: str,
+    state: dict,
+) -> Tuple[dict, dict]:
+    """
+    Write orders that are new or changed status since the last cycle.
+
+    1. Active orders list (everything not yet archived, full window) -
+       that is exactly the set of orders that can still change
+    2. ARCHIVE tab since the cursor - new orders that were archived before
+       we ever saw them (full window on a full resync)
+    3. Detail of each previously open order that left the active list, to
+       read its final status
+
+    Pages are streamed: each page's new/changed orders go to
+    sync_orders_to_db as soon as it arrives, only {id: status} is kept.
+    Orders whose status matches the stored open_orders or settled_orders
+    entry are skipped, so DB writes scale with churn. settled_orders holds
+    final-state orders written last cycle that are still in the active list
+    or the ARCHIVE overlap window, the only ones an incremental cycle re-reads. On a full resync every order is written.
+
+    A page whose sync_orders_to_db batch fails (one bad row rolls back the
+    whole batch) is counted in errors and left out of the new state: its
+    orders count as changed next cycle and the cursor stays at or before
+    the oldest of them.
+
+    Returns:
+        (summed sync_orders_to_db results, new sync state)
+
+    Raises:
+        KaspiTokenInvalidError / KaspiOrdersAPIError from the active list fetch
+    """
+    now = datetime.now(timezone.utc)
+    known: Dict[str, str] = state["open_orders"]
+    settled: Dict[str, str] = state.get("settled_orders") or {}
+    cursor: Optional[datetime] = state["last_created_at"]
+    full_sync = (
+        cursor is None
+        or state["last_full_sync_at"] is None
+        or now - state["last_full_sync_at"] >= FULL_RESYNC_INTERVAL
+    )
 
-    # Get all active stores with valid sessions + check for api_key
-    async with pool.acquire() as conn:
-        stores = await conn.fetch("""
-            SELECT id, user_id, merchant_id, name, api_key, api_key_valid
-            FROM kaspi_stores
-            WHERE is_active = TRUE
-              AND needs_reauth = FALSE
-              AND guid IS NOT NULL
-              AND merchant_id IS NOT NULL
-        """)
-
-    if not stores:
-        logger.info("[ORDERS_SYNC] No active stores to sync")
-        return
-
-    logger.info(f"[ORDERS_SYNC] Starting cycle for {len(stores)} stores")
-
-    total_synced = 0
-    total_errors = 0
-
-    sem = asyncio.Semaphore(MAX_CONCURRENT_STORES)
-
-    async def _sync_one(store):
-        nonlocal total_synced, total_errors
-
-        store_id = str(store['id'])
-        user_id = str(store['user_id'])
-        merchant_id = store['merchant_id']
-        store_name = store['name'] or merchant_id
-        # api_key может быть None, строкой или dict (asyncpg quirk)
-        api_key_raw = store.get('api_key')
-        logger.debug(f"[ORDERS_SYNC] {merchant_id}: api_key_raw type={type(api_key_raw)}, value={api_key_raw!r}")
-        api_key = str(api_key_raw) if api_key_raw else None
-        logger.debug(f"[ORDERS_SYNC] {merchant_id}: api_key (after str)={api_key!r}")
-        api_key_valid = store.get('api_key_valid', True)
-
-        async with sem:
-            # Skip stores without valid API token
-            if not api_key or not api_key_valid:
-                logger.debug(f"[ORDERS_SYNC] {store_name}: no valid API token, skipping")
-                return
-
-            try:
-                rest_api = get_kaspi_orders_api()
-                now = datetime.utcnow()
-                date_from = now - timedelta(days=14)
-
-                # Fetch active orders
-                orders = await rest_api.fetch_orders(
-                    api_token=api_key,
-                    date_from=date_from,
-                    date_to=now,
-                    size=100,
-                )
-
-                # Also fetch archived orders to catch COMPLETED transitions
-                try:
-                    archive_orders = await rest_api.fetch_orders(
-                        api_token=api_key,
-                        date_from=now - timedelta(days=3),
-                        date_to=now,
-                        states=["ARCHIVE"],
-                        size=100,
-                    )
-                    if archive_orders:
-                        existing_ids = {o.get("id") for o in orders}
-                        for ao in archive_orders:
-                            if ao.get("id") not in existing_ids:
-                                orders.append(ao)
-                except Exception as e:
-                    logger.debug(f"[ORDERS_SYNC] {store_name}: archive fetch failed: {e}")
-
-                logger.info(f"[ORDERS_SYNC] {store_name}: {len(orders)} orders via REST API")
-
-                if orders:
-                    result = await sync_orders_to_db(store_id, orders, user_id=user_id)
-                    synced = result.get('inserted', 0) + result.get('updated', 0)
-                    contacts = result.get('contacts_added', 0)
-                    total_synced += synced
-                    logger.info(
-                        f"[ORDERS_SYNC] {store_name}: {synced} orders synced "
-                        f"({result.get('inserted', 0)} new, {result.get('updated', 0)} updated"
-                        f"{f', {contacts} contacts' if contacts else ''})"
-                    )
+    totals = {"inserted": 0, "updated": 0, "contacts_added": 0, "errors": 0}
+    seen: Dict[str, str] = {}
+    # Final-state orders seen this cycle -> creationDate (None = in the active list)
+    settled_seen: Dict[str, Optional[datetime]] = {}
+    # creationDate of orders whose batch failed to save
+    retry_from: List[datetime] = []
+    newest = cursor
+
+    async def ingest(orders: List[dict], active: bool = False):
+        nonlocal newest
+        changed = []
+        for order in orders:
+            order_id = order.get("id")
+            # Active list wins over ARCHIVE for orders returned by both
+            if not order_id or order_id in seen:
+                continue
+            status = _order_status(order)
+            seen[order_id] = status
+            if full_sync or (known.get(order_id) or settled.get(order_id)) != status:
+                changed.append(order)
+            created_at = _order_created_at(order)
+            if created_at and (newest is None or created_at > newest):
+                newest = created_at
+            if status in TERMINAL_STATUSES:
+                settled_seen[order_id] = None if active else created_at
+        if not changed:
+            return
+        try:
+            result = await sync_orders_to_db(store_id, changed, user_id=user_id)
+        except Exception as e:
+            # The batch rolled back as a whole: forget it so the next cycle
+            # writes it again (and keep its orders inside the ARCHIVE window)
+            logger.error(f"[ORDERS_SYNC] {store_name}: {len(changed)} orders not saved: {e}")
+            totals["errors"] += len(changed)
+            for order in changed:
+                order_id = order["id"]
+                settled_seen.pop(order_id, None)
+                if order_id in known:
+                    seen[order_id] = known[order_id]
                 else:
-                    logger.debug(f"[ORDERS_SYNC] {store_name}: no active orders")
-
-            except KaspiTokenInvalidError:
-                total_errors += 1
-                logger.warning(f"[ORDERS_SYNC] {store_name}: API token invalid, marking as invalid")
-                async with pool.acquire() as conn:
-                    await conn.execute(
-                        "UPDATE kaspi_stores SET api_key_valid = FALSE WHERE id = $1",
-                        store['id']
-                    )
-            except KaspiOrdersAPIError as e:
-                total_errors += 1
-                logger.warning(f"[ORDERS_SYNC] {store_name}: REST API error - {e}")
-            except Exception as e:
-                total_errors += 1
-                logger.error(f"[ORDERS_SYNC] {store_name}: unexpected error - {e}", exc_info=True)
-
-            # Delay between stores to spread load
-            await asyncio.sleep(STORE_DELAY)
-
-    await asyncio.gather(*[_sync_one(s) for s in stores])
-
-    elapsed = (datetime.utcnow() - cycle_start).total_seconds()
-    logger.info(
-        f"[ORDERS_SYNC] Cycle complete in {elapsed:.0f}s: "
-        f"{len(stores)} stores, {total_synced} orders synced, {total_errors} errors"
+                    del seen[order_id]
+                created_at = _order_created_at(order)
+                if created_at:
+                    retry_from.append(created_at)
+            return
+        for key in totals:
+            totals[key] += result.get(key, 0)
+
+    async for page in rest_api.iter_order_pages(
+        api_token=api_key,
+        date_from=now - FULL_WINDOW,
+        date_to=now,
+        size=100,
+    ):
+        await ingest(page, active=True)
+
+    archive_from = now - FULL_WINDOW if full_sync else max(cursor - CURSOR_OVERLAP, now - FULL_WINDOW)
+    try:
+        async for page in rest_api.iter_order_pages(
+            api_token=api_key,
+            date_from=archive_from,
+            date_to=now,
+            states=["ARCHIVE"],
+            size=100,
+        ):
+            await ingest(page)
+    except KaspiTokenInvalidError:
+        raise
+    except Exception as e:
+        logger.debug(f"[ORDERS_SYNC] {store_name}: archive fetch failed: {e}")
+
+    # Open orders that disappeared from the active list: finished or archived
+    # outside the cursor window; read their final state one by one
+    still_open: Dict[str, str] = {}
+    details = []
+    for order_id in [order_id for order_id in known if order_id not in seen]:
+        try:
+            detail = await rest_api.fetch_order_detail(api_key, order_id)
+        except KaspiTokenInvalidError:
+            raise
+        except Exception as e:
+            logger.debug(f"[ORDERS_SYNC] {store_name}: detail fetch for {order_id} failed: {e}")
+            still_open[order_id] = known[order_id]  # retry next cycle
+            continue
+        if detail:
+            details.append(detail)
+        # None = order no longer visible to this token: stop tracking it
+    if details:
+        await ingest(details)
+
+    open_orders = dict(still_open)
+    open_orders.update(
+        (order_id, status) for order_id, status in seen.items() if status not in TERMINAL_STATUSES
     )
+    # Final-state orders the next cycle fetches again: still in the active list
+    # or inside the next ARCHIVE overlap window
+    overlap_from = (newest or now) - CURSOR_OVERLAP
+    settled_orders = {
+        order_id: seen[order_id]
+        for order_id, created_at in settled_seen.items()
+        if created_at is None or created_at >= overlap_from
+    }
+    next_cursor = newest or now
+    if retry_from:
+        next_cursor = min(next_cursor, min(retry_from))
+    new_state = {
+        "last_created_at": next_cursor,
+        "open_orders": open_orders,
+        "settled_orders": settled_orders,
+        "last_full_sync_at": now if full_sync else state["last_full_sync_at"],
+    }
+    return totals, new_state
@@ -0,0 +1,232 @@
+"""
+Pricefeed Batcher - per-merchant aggregator for Kaspi price uploads.
+
+Every price change (demper single-city and multi-city paths, manual syncs,
+batch_sync_products) goes through sync_product, which submits its pricefeed
+item here instead of posting it directly. For each merchant account:
+
+- pending items are kept in submission order, keyed by SKU; a newer change to
+  a SKU that is still waiting replaces the older one (the older caller gets
+  error="superseded")
+- one drain task per merchant sends up to settings.pricefeed_batch_size items
+  per upload, each upload costing one pricefeed token (1.5 RPS per account)
+- every caller gets its own per-item result back
+
+Kaspi documents pricefeed/upload/merchant/process for a single SKU per
+request, so the default batch size is 1; raise PRICEFEED_BATCH_SIZE only for
+accounts where multi-item uploads are confirmed to work.
+
+A multi-item upload is only reported per item when the upload result carries
+per-SKU results ("items"). A failed upload (HTTP error, 429, cooldown) failed
+for every item. A successful one without per-SKU results cannot tell which
+SKUs were accepted: its items are re-sent one by one (same prices, so
+idempotent) and the merchant is uploaded one item at a time from then on.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# upload(merchant_uid, session, items) -> {"success": bool, "error"?: str, "response"?: Any}
+UploadFunc = Callable[[str, dict, List[dict]], Awaitable[Dict[str, Any]]]
+
+
+@dataclass
+class _PendingItem:
+    body: dict
+    futures: List[asyncio.Future] = field(default_factory=list)
+
+
+@dataclass
+class _MerchantQueue:
+    session: dict
+    pending: "OrderedDict[str, _PendingItem]" = field(default_factory=OrderedDict)
+    task: Optional[asyncio.Task] = None
+
+
+class PricefeedBatcher:
+    """
+    Collects pricefeed items per merchant and uploads them in batches.
+    """
+
+    def __init__(self, upload: UploadFunc, batch_size: int = 1, batch_window: float = 0.2):
+        """
+        Initialize batcher.
+
+        Args:
+            upload: Coroutine that performs one pricefeed upload
+            batch_size: Max items per upload
+            batch_window: Seconds to wait for more items before a multi-item upload
+        """
+        self._upload = upload
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self._queues: Dict[str, _MerchantQueue] = {}
+        self.stats = {
+            "submitted": 0, "superseded": 0, "uploads": 0, "items_sent": 0,
+            "failed_uploads": 0, "unmapped_batches": 0,
+        }
+        # Merchants whose multi-item upload results could not be mapped per SKU
+        self._unbatched: Set[str] = set()
+
+    async def submit(self, merchant_uid: str, session: dict, body: dict) -> Dict[str, Any]:
+        """
+        Queue one pricefeed item and wait for its result.
+
+        Args:
+            merchant_uid: Merchant account the item belongs to
+            session: Merchant session (cookies) used for the upload
+            body: Pricefeed item ({"merchantUid", "sku", "price", ...})
+
+        Returns:
+            Per-item result dict with "success" and either "response" or "error"
+
+        Raises:
+            KaspiAuthError / httpx.HTTPError from the upload
+        """
+        self.stats["submitted"] += 1
+        future = asyncio.get_running_loop().create_future()
+
+        queue = self._queues.get(merchant_uid)
+        if queue is None:
+            queue = self._queues[merchant_uid] = _MerchantQueue(session=session)
+        queue.session = session
+
+        sku = body["sku"]
+        item = queue.pending.get(sku)
+        if item is not None:
+            # Newer change to the same SKU wins, keeps its place in line
+            self.stats["superseded"] += 1
+            for old_future in item.futures:
+                if not old_future.done():
+                    old_future.set_result({"success": False, "error": "superseded", "sku": sku})
+            item.body = body
+            item.futures = [future]
+        else:
+            queue.pending[sku] = _PendingItem(body=body, futures=[future])
+
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.create_task(self._drain(merchant_uid, queue))
+
+        return await future
+
+    async def _drain(self, merchant_uid: str, queue: _MerchantQueue):
+        """Upload pending items for one merchant until its queue is empty."""
+        while queue.pending:
+            batch_size = 1 if merchant_uid in self._unbatched else self.batch_size
+            if batch_size > 1 and len(queue.pending) < batch_size and self.batch_window > 0:
+                # Give concurrent callers a moment to join this upload
+                await asyncio.sleep(self.batch_window)
+
+            batch: List[_PendingItem] = []
+            while queue.pending and len(batch) < batch_size:
+                _, item = queue.pending.popitem(last=False)
+                batch.append(item)
+
+            try:
+                result = await self._upload(merchant_uid, queue.session, [item.body for item in batch])
+                self.stats["uploads"] += 1
+
+                item_results = result.get("items") if len(batch) > 1 else None
+                if len(batch) > 1 and result.get("success") and item_results is None:
+                    # Accepted as a whole, but which SKUs? Ask again one by one
+                    self.stats["unmapped_batches"] += 1
+                    self._unbatched.add(merchant_uid)
+                    logger.warning(
+                        f"[PRICEFEED] Merchant {merchant_uid}: multi-item response has no per-SKU "
+                        f"results, re-sending {len(batch)} items one by one"
+                    )
+                    for item in reversed(batch):
+                        sku = item.body["sku"]
+                        newer = queue.pending.get(sku)
+                        if newer is not None:
+                            # Changed again meanwhile: only the newer price is re-sent
+                            self.stats["superseded"] += 1
+                            for future in item.futures:
+                                if not future.done():
+                                    future.set_result({"success": False, "error": "superseded", "sku": sku})
+                            item = newer
+                        queue.pending[sku] = item
+                        queue.pending.move_to_end(sku, last=False)
+                    continue
+
+                if result.get("success"):
+                    self.stats["items_sent"] += len(batch)
+                else:
+                    self.stats["failed_uploads"] += 1
+                if len(batch) > 1:
+                    logger.info(
+                        f"[PRICEFEED] Merchant {merchant_uid}: uploaded {len(batch)} items "
+                        f"(success={result.get('success')})"
+                    )
+                for item in batch:
+                    sku = item.body["sku"]
+                    item_result = {k: v for k, v in result.items() if k != "items"}
+                    if item_results is not None:
+                        item_result.update(item_results.get(sku) or {"success": False, "error": "missing_item_result"})
+                    for future in item.futures:
+                        if not future.done():
+                            future.set_result({**item_result, "sku": sku, "batch_size": len(batch)})
+            except asyncio.CancelledError:
+                for item in batch + list(queue.pending.values()):
+                    for future in item.futures:
+                        future.cancel()
+                queue.pending.clear()
+                raise
+            except Exception as e:
+                self.stats["failed_uploads"] += 1
+                for item in batch:
+                    for future in item.futures:
+                        if not future.done():
+                            future.set_exception(e)
+
+        # No await since the loop check, so nothing can have been queued meanwhile
+        if self._queues.get(merchant_uid) is queue:
+            del self._queues[merchant_uid]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counters for monitoring."""
+        return {
+            **self.stats,
+            "pending": sum(len(q.pending) for q in self._queues.values()),
+            "merchants": len(self._queues),
+            "batch_size": self.batch_size,
+        }
+
+
+# ============================================================================
+# Global instance
+# ============================================================================
+
+_pricefeed_batcher: Optional[PricefeedBatcher] = None
+
+
+def get_pricefeed_batcher() -> PricefeedBatcher:
+    """Get global pricefeed batcher instance"""
+    global _pricefeed_batcher
+    if _pricefeed_batcher is None:
+        from ..config import settings
+        from .api_parser import upload_pricefeed_items
+        _pricefeed_batcher = PricefeedBatcher(
+            upload=upload_pricefeed_items,
+            batch_size=settings.pricefeed_batch_size,
+            batch_window=settings.pricefeed_batch_window_ms / 1000,
+        )
+        from ..core.metrics import get_metrics
+        batcher = _pricefeed_batcher
+        get_metrics().counter(
+            "pricefeed_batcher_events_total",
+            "Pricefeed batcher submissions and uploads",
+            ["event"],
+            callback=lambda: {(event,): count for event, count in batcher.stats.items()},
+        )
+        get_metrics().gauge(
+            "pricefeed_batcher_pending",
+            "Pricefeed items waiting for upload",
+            callback=lambda: {(): sum(len(q.pending) for q in batcher._queues.values())},
+        )
+    return _pricefeed_batcher
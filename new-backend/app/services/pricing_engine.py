@@ -0,0 +1,270 @@
+"""
+Pricing Engine - vectorized target price computation for a batch of offer lists.
+
+The demper's per-product path sorts offers, applies exclusions and the
+delivery filter, finds our position and the cheapest competitor, runs the
+strategy and clamps to min/max with Decimal arithmetic, one product at a
+time. This module does the same for a whole batch of product-cities with
+NumPy:
+
+- offers of all slots are packed into padded int64 matrices (prices are whole
+  tenge) and sorted with one stable argsort, matching Python's stable sort
+- exclusion, delivery-rank filtering, position finding, standard /
+  always_first / stay_top_n targets and min/max clamping are array ops
+
+Results are identical to DemperWorker._calculate_target_price plus the
+surrounding per-city logic in _process_product_cities (test_pricing_engine.py).
+
+Packing offers is still Python, so the engine only pays off on large batches
+(~1.5x at 250+ slots, slower below ~30; scripts/benchmark_pricing_engine.py).
+The demper prices 1-5 cities of one product at a time and keeps the
+per-product path; use this for bulk repricing across many products.
+
+Prices must be whole tenge: fractional values raise ValueError instead of
+being truncated.
+"""
+
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Iterable, List, Optional, Set, Union
+
+import numpy as np
+
+# Kaspi does not accept prices below 10 tenge
+KASPI_MIN_PRICE = 10
+
+# Delivery ranks (lower = faster); offers without deliveryDuration always pass
+DELIVERY_DURATION_RANK = {
+    "TODAY": 1,
+    "TOMORROW": 2,
+    "TILL_3_DAYS": 3,
+    "TILL_5_DAYS": 5,
+    "TILL_7_DAYS": 7,
+    "OTHER": 99,
+}
+UNKNOWN_DURATION_RANK = 99
+
+# delivery_filter -> max allowed rank (None = dynamic / no limit)
+DELIVERY_FILTER_MAX_RANK = {
+    "today_tomorrow": 2,
+    "till_3_days": 3,
+    "till_5_days": 5,
+    "same_or_faster": None,
+}
+
+# Result statuses
+STATUS_OK = "ok"                          # target_price is set (may equal current)
+STATUS_NO_COMPETITORS = "no_competitors"  # every offer is ours or excluded
+STATUS_NO_TARGET = "no_target"            # strategy produced no price
+STATUS_BELOW_MIN = "below_min"            # competitor under our min and we are at min: hold
+
+_NO_LIMIT = np.iinfo(np.int32).max
+_PAD_PRICE = np.iinfo(np.int64).max
+
+
+@dataclass
+class PricingInput:
+    """One product (or product-city) to price."""
+    offers: List[dict]                     # Raw Kaspi offers (merchantId, price, deliveryDuration)
+    merchant_id: str
+    current_price: int
+    price_step: int
+    min_price: int = 0                     # 0 = no product minimum (Kaspi minimum still applies)
+    max_price: int = 0                     # 0 = no cap
+    strategy: str = "standard"
+    top_n: int = 3                         # stay_top_n position
+    excluded_merchant_ids: Set[str] = field(default_factory=set)
+    delivery_demping: bool = False
+    delivery_filter: Optional[str] = "same_or_faster"
+
+
+@dataclass
+class PricingResult:
+    status: str
+    target_price: Optional[int]
+    min_competitor_price: Optional[int]
+    our_position: Optional[int]
+    effective_min_price: int
+
+
+def strategy_top_n(strategy_params) -> int:
+    """
+    stay_top_n position from strategy_params, as the per-product path compares it.
+
+    A non-integer value never equals a competitor count there, so it maps to
+    -1 (falls through to "match the last competitor").
+    """
+    if isinstance(strategy_params, str):
+        strategy_params = json.loads(strategy_params)  # raw JSONB column
+    top_n = (strategy_params or {}).get("top_position", 3)
+    if isinstance(top_n, (int, float)) and float(top_n).is_integer():
+        return int(top_n)
+    return -1
+
+
+def _whole_tenge(value: Union[int, float, Decimal, str], what: str) -> int:
+    """Exact int value of a price; ValueError for fractions or non-numbers."""
+    if isinstance(value, bool):
+        raise ValueError(f"{what} must be a whole number of tenge, got {value!r}")
+    if isinstance(value, int):
+        return value
+    try:
+        exact = Decimal(str(value))
+    except ArithmeticError:
+        raise ValueError(f"{what} must be a whole number of tenge, got {value!r}")
+    if not exact.is_finite() or exact != exact.to_integral_value():
+        raise ValueError(f"{what} must be a whole number of tenge, got {value!r}")
+    return int(exact)
+
+
+def _delivery_threshold(item: PricingInput) -> int:
+    """Max competitor delivery rank for this slot (_NO_LIMIT = filter off)."""
+    if not item.delivery_demping:
+        return _NO_LIMIT
+    if item.delivery_filter == "same_or_faster":
+        # Our duration comes from the first offer of ours, priced or not
+        our_duration = next(
+            (o.get("deliveryDuration") for o in item.offers if o.get("merchantId") == item.merchant_id),
+            None,
+        )
+        if not our_duration:
+            return _NO_LIMIT
+        return DELIVERY_DURATION_RANK.get(our_duration, UNKNOWN_DURATION_RANK)
+    max_rank = DELIVERY_FILTER_MAX_RANK.get(item.delivery_filter)
+    return _NO_LIMIT if max_rank is None else max_rank
+
+
+def compute_targets(items: Iterable[PricingInput]) -> List[PricingResult]:
+    """
+    Price a batch of slots.
+
+    Args:
+        items: Slots to price; each carries its own offers and settings
+
+    Returns:
+        One PricingResult per input, in order
+
+    Raises:
+        ValueError: A price, step or min/max is not a whole number of tenge
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    n = len(items)
+    width = max(1, max(len(item.offers) for item in items))
+
+    prices = np.full((n, width), _PAD_PRICE, dtype=np.int64)
+    valid = np.zeros((n, width), dtype=bool)
+    ours = np.zeros((n, width), dtype=bool)
+    excluded = np.zeros((n, width), dtype=bool)
+    ranks = np.zeros((n, width), dtype=np.int32)
+
+    threshold = np.empty(n, dtype=np.int32)
+    is_top_n = np.empty(n, dtype=bool)
+    top_n = np.empty(n, dtype=np.int64)
+    step = np.empty(n, dtype=np.int64)
+    current = np.empty(n, dtype=np.int64)
+    min_price = np.empty(n, dtype=np.int64)
+    max_price = np.empty(n, dtype=np.int64)
+
+    # Pack (string matching stays in Python, everything after is vectorized)
+    flat_rows: List[int] = []
+    flat_cols: List[int] = []
+    flat_prices: List[int] = []
+    flat_ours: List[bool] = []
+    flat_excluded: List[bool] = []
+    flat_ranks: List[int] = []
+    for row, item in enumerate(items):
+        threshold[row] = _delivery_threshold(item)
+        is_top_n[row] = item.strategy == "stay_top_n"
+        top_n[row] = item.top_n
+        step[row] = _whole_tenge(item.price_step, "price_step")
+        current[row] = _whole_tenge(item.current_price, "current_price")
+        min_price[row] = _whole_tenge(item.min_price, "min_price")
+        max_price[row] = _whole_tenge(item.max_price, "max_price")
+
+        col = 0
+        for offer in item.offers:
+            price = offer.get("price")
+            if price is None:
+                continue
+            merchant = offer.get("merchantId")
+            duration = offer.get("deliveryDuration")
+            flat_rows.append(row)
+            flat_cols.append(col)
+            flat_prices.append(_whole_tenge(price, "offer price"))
+            flat_ours.append(merchant == item.merchant_id)
+            flat_excluded.append(merchant in item.excluded_merchant_ids)
+            flat_ranks.append(DELIVERY_DURATION_RANK.get(duration, UNKNOWN_DURATION_RANK) if duration else 0)
+            col += 1
+
+    index = (np.array(flat_rows, dtype=np.intp), np.array(flat_cols, dtype=np.intp))
+    prices[index] = flat_prices
+    valid[index] = True
+    ours[index] = flat_ours
+    excluded[index] = flat_excluded
+    ranks[index] = flat_ranks
+
+    # Slow-delivery competitors count as excluded (never ours / already excluded)
+    excluded |= ~ours & ~excluded & (ranks > threshold[:, None])
+
+    # Stable sort by price; padding sorts last
+    order = np.argsort(prices, axis=1, kind="stable")
+    prices = np.take_along_axis(prices, order, axis=1)
+    valid = np.take_along_axis(valid, order, axis=1)
+    ours = np.take_along_axis(ours, order, axis=1)
+    excluded = np.take_along_axis(excluded, order, axis=1)
+    rows = np.arange(n)
+
+    # Our position among all offers (including excluded), 1-indexed
+    has_ours = ours.any(axis=1)
+    our_position = ours.argmax(axis=1) + 1
+
+    # Cheapest non-excluded competitor
+    competitor = valid & ~excluded
+    has_competitor = competitor.any(axis=1)
+    min_competitor = np.where(has_competitor, prices[rows, competitor.argmax(axis=1)], 0)
+
+    # stay_top_n counts every offer that is not ours, excluded or not
+    not_ours = valid & ~ours
+    count = np.cumsum(not_ours, axis=1)
+    nth = not_ours & (count == top_n[:, None])
+    has_nth = nth.any(axis=1)
+    nth_price = np.where(has_nth, prices[rows, nth.argmax(axis=1)], 0)
+    has_not_ours = count[:, -1] > 0
+    last_index = width - 1 - not_ours[:, ::-1].argmax(axis=1)
+    last_price = np.where(has_not_ours, prices[rows, last_index], 0)
+
+    top_n_price = np.where(has_nth, nth_price, last_price)
+    base = np.where(is_top_n, top_n_price, min_competitor)
+    has_target = has_competitor & (~is_top_n | has_nth | has_not_ours)
+    target = np.where(has_target, base - step, 0)
+
+    # Clamp: below min -> min if we are above it, else hold; then cap at max
+    effective_min = np.where(min_price > 0, np.maximum(min_price, KASPI_MIN_PRICE), KASPI_MIN_PRICE)
+    below = target < effective_min
+    hold = below & (current <= effective_min)
+    target = np.where(below, effective_min, target)
+    capped = (max_price != 0) & (target > max_price)
+    target = np.where(capped, max_price, target)
+
+    results = []
+    for row in range(n):
+        if not has_competitor[row]:
+            status = STATUS_NO_COMPETITORS
+        elif not has_target[row]:
+            status = STATUS_NO_TARGET
+        elif hold[row]:
+            status = STATUS_BELOW_MIN
+        else:
+            status = STATUS_OK
+        results.append(PricingResult(
+            status=status,
+            target_price=int(target[row]) if status == STATUS_OK else None,
+            min_competitor_price=int(min_competitor[row]) if has_competitor[row] else None,
+            our_position=int(our_position[row]) if has_ours[row] else None,
+            effective_min_price=int(effective_min[row]),
+        ))
+    return results
@@ -77,7 +77,8 @@ class ProxyAllocator:
                     result[module] = []
                     continue
 
-                # Select and allocate available proxies
+                # Select and allocate available proxies: healthy and fastest
+                # first (health prober stats), never-probed ones after them
                 query = """
                     UPDATE proxies
                     SET user_id = $1,
@@ -88,7 +89,11 @@ class ProxyAllocator:
                         SELECT id FROM proxies
                         WHERE status = 'available'
                           AND user_id IS NULL
-                        ORDER BY created_at ASC
+                        ORDER BY
+                            COALESCE(quarantined_until > NOW(), false),
+                            latency_p50_ms ASC NULLS LAST,
+                            latency_p95_ms ASC NULLS LAST,
+                            created_at ASC
                         LIMIT $3
                         FOR UPDATE SKIP LOCKED
                     )
@@ -0,0 +1,236 @@
+"""
+Background health prober for the proxy pool.
+
+Every settings.proxy_probe_interval_seconds, sends one cheap request
+(settings.proxy_probe_url) through each available, allocated and resting
+proxy, so broken or slow proxies are found before the demper picks them:
+
+1. Latency of successful probes is kept per proxy (last PROBE_SAMPLES);
+   p50/p95 are written to proxies.latency_p50_ms / latency_p95_ms
+2. probe_failures counts consecutive failed probes
+3. A proxy with probe_failures >= proxy_probe_max_failures, or p95 above
+   proxy_probe_max_p95_ms, is quarantined for proxy_quarantine_minutes:
+   allocated/resting ones rest until then (in the table and in Redis for
+   running rotators), available ones go last in ProxyAllocator
+
+Probes do not go to Kaspi and do not count against the 249-request budget.
+For local testing, scripts/proxy_probe_server.py stands in for proxies.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import asyncpg
+import httpx
+
+from ..config import settings
+from ..core.metrics import get_metrics
+from ..core.proxy_rotator import quarantine_proxy_shared
+
+logger = logging.getLogger(__name__)
+
+PROXY_PROBES = get_metrics().counter(
+    "proxy_probes_total",
+    "Proxy health probes",
+    ["result"],
+)
+PROXY_PROBE_SECONDS = get_metrics().histogram(
+    "proxy_probe_seconds",
+    "Latency of successful proxy health probes",
+)
+PROXY_QUARANTINED = get_metrics().counter(
+    "proxy_quarantined_total",
+    "Proxies quarantined by the health prober",
+    ["reason"],
+)
+
+# Latency samples per proxy the percentiles are computed over
+PROBE_SAMPLES = 20
+# Samples needed before a slow p95 quarantines a proxy
+MIN_SAMPLES_FOR_P95 = 5
+
+# proxy id -> recent successful probe latencies (ms)
+_latencies: Dict[UUID, Deque[float]] = {}
+
+_PROBE_TARGETS_SQL = """
+    SELECT id, host, port, protocol, username, password, status, probe_failures
+    FROM proxies
+    WHERE status IN ('available', 'allocated', 'resting')
+"""
+
+_PROBE_RESULTS_SQL = """
+    UPDATE proxies p
+    SET latency_p50_ms = COALESCE(d.p50, p.latency_p50_ms),
+        latency_p95_ms = COALESCE(d.p95, p.latency_p95_ms),
+        probe_failures = d.failures,
+        last_error = COALESCE(d.error, p.last_error),
+        last_health_check = NOW(),
+        quarantined_until = COALESCE(d.quarantined_until, p.quarantined_until),
+        status = CASE
+            WHEN d.quarantined_until IS NOT NULL AND p.status = 'allocated' THEN 'resting'
+            ELSE p.status
+        END,
+        available_at = CASE
+            WHEN d.quarantined_until IS NOT NULL AND p.status IN ('allocated', 'resting')
+                THEN GREATEST(COALESCE(p.available_at, NOW()), d.quarantined_until)
+            ELSE p.available_at
+        END
+    FROM unnest($1::uuid[], $2::int[], $3::int[], $4::int[], $5::text[], $6::timestamptz[])
+        AS d(id, p50, p95, failures, error, quarantined_until)
+    WHERE p.id = d.id
+      AND p.status <> 'dead'
+"""
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _proxy_url(row: asyncpg.Record) -> str:
+    if row["username"]:
+        return f"{row['protocol']}://{row['username']}:{row['password']}@{row['host']}:{row['port']}"
+    return f"{row['protocol']}://{row['host']}:{row['port']}"
+
+
+async def probe_proxy(proxy_url: str) -> Tuple[Optional[float], Optional[str]]:
+    """
+    Send the probe request through one proxy.
+
+    A fresh client per probe, so the latency includes the connection setup a
+    cold pooled client pays too. Building the client (SSL context, CPU-bound
+    and serialized across concurrent probes) is not timed.
+
+    Returns:
+        (latency in ms, None) on success, (None, error) on failure
+    """
+    try:
+        async with httpx.AsyncClient(
+            proxy=proxy_url,
+            timeout=settings.proxy_probe_timeout_seconds,
+            http2=False,
+        ) as client:
+            started = time.monotonic()
+            response = await client.get(settings.proxy_probe_url)
+        if response.status_code >= 400:
+            return None, f"probe HTTP {response.status_code}"
+        return (time.monotonic() - started) * 1000, None
+    except Exception as e:
+        return None, f"probe {type(e).__name__}: {e}"[:500]
+
+
+async def probe_proxies(pool: asyncpg.Pool) -> Dict[str, int]:
+    """
+    Run one probe cycle over the pool and store the results.
+
+    Returns:
+        Counts of probed, failed and quarantined proxies
+    """
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(_PROBE_TARGETS_SQL)
+
+    summary = {"probed": len(rows), "failed": 0, "quarantined": 0}
+    if not rows:
+        return summary
+
+    semaphore = asyncio.Semaphore(max(1, settings.proxy_probe_concurrency))
+
+    async def probe(row):
+        async with semaphore:
+            return await probe_proxy(_proxy_url(row))
+
+    results = await asyncio.gather(*(probe(row) for row in rows))
+
+    now = datetime.now(timezone.utc)
+    quarantine_until = now + timedelta(minutes=settings.proxy_quarantine_minutes)
+    ids, p50s, p95s, failures, errors, quarantined = [], [], [], [], [], []
+    to_rest: List[UUID] = []
+
+    for row, (latency_ms, error) in zip(rows, results):
+        proxy_id = row["id"]
+        samples = _latencies.get(proxy_id)
+        if samples is None:
+            samples = _latencies[proxy_id] = deque(maxlen=PROBE_SAMPLES)
+
+        if latency_ms is not None:
+            PROXY_PROBES.labels(result="success").inc()
+            PROXY_PROBE_SECONDS.observe(latency_ms / 1000)
+            samples.append(latency_ms)
+            failed = 0
+        else:
+            PROXY_PROBES.labels(result="failure").inc()
+            summary["failed"] += 1
+            failed = (row["probe_failures"] or 0) + 1
+
+        p50 = p95 = None
+        if samples:
+            ordered = sorted(samples)
+            p50 = round(_percentile(ordered, 0.5))
+            p95 = round(_percentile(ordered, 0.95))
+
+        reason = None
+        if failed >= settings.proxy_probe_max_failures:
+            reason = "failures"
+        elif latency_ms is not None and len(samples) >= MIN_SAMPLES_FOR_P95 and p95 > settings.proxy_probe_max_p95_ms:
+            reason = "slow"
+
+        if reason:
+            PROXY_QUARANTINED.labels(reason=reason).inc()
+            summary["quarantined"] += 1
+            if row["status"] in ("allocated", "resting"):
+                to_rest.append(proxy_id)
+            logger.warning(
+                f"[PROXY_PROBE] Quarantining proxy {proxy_id} ({row['host']}:{row['port']}) "
+                f"for {settings.proxy_quarantine_minutes} min: "
+                + (f"{failed} failed probes, last: {error}" if reason == "failures" else f"p95 {p95} ms")
+            )
+
+        ids.append(proxy_id)
+        p50s.append(p50)
+        p95s.append(p95)
+        failures.append(failed)
+        errors.append(error)
+        quarantined.append(quarantine_until if reason else None)
+
+    async with pool.acquire() as conn:
+        await conn.execute(_PROBE_RESULTS_SQL, ids, p50s, p95s, failures, errors, quarantined)
+
+    # Running rotators only re-read the table on restart
+    for proxy_id in to_rest:
+        await quarantine_proxy_shared(proxy_id, settings.proxy_quarantine_minutes * 60)
+
+    # Forget proxies that left the pool (dead, deleted)
+    probed = {row["id"] for row in rows}
+    for proxy_id in [pid for pid in _latencies if pid not in probed]:
+        del _latencies[proxy_id]
+
+    return summary
+
+
+async def periodic_proxy_probe(pool: asyncpg.Pool):
+    """Main loop: probe the proxy pool every proxy_probe_interval_seconds."""
+    logger.info(f"[PROXY_PROBE] Proxy prober started (url: {settings.proxy_probe_url})")
+
+    # Initial delay to let other services start
+    await asyncio.sleep(30)
+
+    while True:
+        started = time.monotonic()
+        try:
+            summary = await probe_proxies(pool)
+            if summary["probed"]:
+                logger.info(
+                    f"[PROXY_PROBE] Probed {summary['probed']} proxies in {time.monotonic() - started:.1f}s: "
+                    f"{summary['failed']} failed, {summary['quarantined']} quarantined"
+                )
+        except Exception as e:
+            logger.error(f"[PROXY_PROBE] Error in probe cycle: {e}")
+
+        await asyncio.sleep(settings.proxy_probe_interval_seconds)
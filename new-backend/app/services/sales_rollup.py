@@ -0,0 +1,126 @@
+"""
+Sales rollups - per store and day aggregates behind the store dashboard.
+
+The analytics endpoints (stats, daily analytics, top products, breakdowns)
+read these tables instead of scanning orders/order_items, so their cost
+depends on the period length, not on the store's order volume:
+
+- store_daily_sales: orders, revenue, items, cancels, delivery cost
+- store_daily_product_sales: quantity and revenue per product
+- store_daily_order_breakdowns: orders and revenue per payment mode,
+  delivery mode and city
+
+sync_orders_to_db calls refresh_sales_rollups() in its transaction for the
+order days touched by the batch; a day is recomputed from orders as a whole,
+so refreshing a day twice or out of order never double-counts. Days are
+DATE(order_date), as the analytics queries used before.
+"""
+from datetime import date
+from typing import List
+from uuid import UUID
+
+import asyncpg
+
+# Statuses that do not count as sales (counted in `cancels` instead)
+CANCELLED_STATUSES = ("CANCELLED", "CANCELLING", "RETURNED")
+
+_EXCLUDED = "('" + "', '".join(CANCELLED_STATUSES) + "')"
+
+_DAILY_SALES_REFRESH_SQL = f"""
+    INSERT INTO store_daily_sales (
+        store_id, date, orders, revenue, items, cancels, delivery_cost, updated_at
+    )
+    SELECT
+        $1,
+        d.date,
+        COUNT(o.id) FILTER (WHERE o.status NOT IN {_EXCLUDED}),
+        COALESCE(SUM(o.total_price) FILTER (WHERE o.status NOT IN {_EXCLUDED}), 0),
+        COALESCE(SUM(oi.items) FILTER (WHERE o.status NOT IN {_EXCLUDED}), 0),
+        COUNT(o.id) FILTER (WHERE o.status IN {_EXCLUDED}),
+        COALESCE(SUM(o.delivery_cost) FILTER (WHERE o.status NOT IN {_EXCLUDED}), 0),
+        NOW()
+    FROM unnest($2::date[]) AS d(date)
+    LEFT JOIN orders o
+        ON o.store_id = $1
+        AND o.order_date >= d.date AND o.order_date < d.date + 1
+    LEFT JOIN LATERAL (
+        SELECT SUM(quantity) AS items FROM order_items WHERE order_id = o.id
+    ) oi ON true
+    GROUP BY d.date
+    ON CONFLICT (store_id, date) DO UPDATE SET
+        orders = EXCLUDED.orders,
+        revenue = EXCLUDED.revenue,
+        items = EXCLUDED.items,
+        cancels = EXCLUDED.cancels,
+        delivery_cost = EXCLUDED.delivery_cost,
+        updated_at = NOW()
+"""
+
+# Product and breakdown keys can disappear from a day (order cancelled), so
+# those days are cleared and rebuilt
+_PRODUCT_SALES_CLEAR_SQL = """
+    DELETE FROM store_daily_product_sales WHERE store_id = $1 AND date = ANY($2::date[])
+"""
+
+_PRODUCT_SALES_REFRESH_SQL = f"""
+    INSERT INTO store_daily_product_sales (
+        store_id, date, product_key, product_id, sku, name, quantity, revenue
+    )
+    SELECT
+        $1,
+        d.date,
+        COALESCE(oi.product_id::text, oi.sku, oi.name),
+        oi.product_id,
+        MAX(oi.sku),
+        MAX(oi.name),
+        SUM(oi.quantity),
+        SUM(oi.quantity * oi.price)
+    FROM unnest($2::date[]) AS d(date)
+    JOIN orders o
+        ON o.store_id = $1
+        AND o.order_date >= d.date AND o.order_date < d.date + 1
+    JOIN order_items oi ON oi.order_id = o.id
+    WHERE o.status NOT IN {_EXCLUDED}
+    GROUP BY d.date, COALESCE(oi.product_id::text, oi.sku, oi.name), oi.product_id
+"""
+
+_BREAKDOWNS_CLEAR_SQL = """
+    DELETE FROM store_daily_order_breakdowns WHERE store_id = $1 AND date = ANY($2::date[])
+"""
+
+# City = first part of delivery_address before comma
+_BREAKDOWNS_REFRESH_SQL = f"""
+    INSERT INTO store_daily_order_breakdowns (store_id, date, dimension, key, orders, revenue)
+    SELECT $1, date, dimension, key, COUNT(*), COALESCE(SUM(total_price), 0)
+    FROM (
+        SELECT d.date, o.total_price, k.dimension, k.key
+        FROM unnest($2::date[]) AS d(date)
+        JOIN orders o
+            ON o.store_id = $1
+            AND o.order_date >= d.date AND o.order_date < d.date + 1
+        CROSS JOIN LATERAL (VALUES
+            ('payment', NULLIF(o.payment_mode, '')),
+            ('delivery', NULLIF(o.delivery_mode, '')),
+            ('city', NULLIF(TRIM(SPLIT_PART(o.delivery_address, ',', 1)), ''))
+        ) AS k(dimension, key)
+        WHERE o.status NOT IN {_EXCLUDED}
+            AND k.key IS NOT NULL
+    ) keyed
+    GROUP BY date, dimension, key
+"""
+
+
+async def refresh_sales_rollups(conn: asyncpg.Connection, store_id: UUID, dates: List[date]):
+    """
+    Recompute the rollups of the given order days of one store.
+
+    Run inside the transaction that changed the orders, so the dashboard
+    never sees orders without their rollup.
+    """
+    if not dates:
+        return
+    await conn.execute(_DAILY_SALES_REFRESH_SQL, store_id, dates)
+    await conn.execute(_PRODUCT_SALES_CLEAR_SQL, store_id, dates)
+    await conn.execute(_PRODUCT_SALES_REFRESH_SQL, store_id, dates)
+    await conn.execute(_BREAKDOWNS_CLEAR_SQL, store_id, dates)
+    await conn.execute(_BREAKDOWNS_REFRESH_SQL, store_id, dates)
@@ -0,0 +1,209 @@
+"""
+Session Cache - process-local cache of decrypted Kaspi merchant sessions.
+
+Workers call get_active_session_with_refresh(merchant_id, skip_validation=True)
+for every product. Without a cache that is a kaspi_stores SELECT plus a Fernet
+decrypt per product, even though a store's session rarely changes.
+
+Entries are keyed by merchant_id and tagged with kaspi_stores.session_version,
+which a DB trigger bumps whenever guid/is_active change (any writer, any
+process). Invalidation:
+- LISTEN kaspi_session_changed: the same trigger notifies, entries are dropped
+  immediately (when the listener is running; it reconnects after a lost
+  connection and drops all entries, since notifications may have been missed)
+- TTL: after ttl seconds an entry is revalidated with a cheap version lookup;
+  if the version is unchanged the entry is kept without decrypting again
+
+Cached dicts are shared between callers and must be treated as read-only.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import asyncpg
+
+from ..config import settings
+from ..core.database import get_db_pool
+
+logger = logging.getLogger(__name__)
+
+SESSION_CHANNEL = "kaspi_session_changed"
+
+# LISTEN connection: health check interval / timeout, reconnect delay (seconds)
+LISTENER_CHECK_SECONDS = 30.0
+LISTENER_CHECK_TIMEOUT = 5.0
+LISTENER_RETRY_SECONDS = 5.0
+
+
+@dataclass
+class _CachedSession:
+    session: dict
+    version: int
+    checked_at: float
+
+
+class SessionCache:
+    """
+    Decrypted session dicts per merchant with version-based invalidation.
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        """
+        Initialize session cache.
+
+        Args:
+            ttl: Seconds before an entry's version is re-checked in the DB
+        """
+        self.ttl = ttl
+        self._entries: Dict[str, _CachedSession] = {}
+        self._listener_conn: Optional[asyncpg.Connection] = None
+        self._listener_task: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "invalidated": 0}
+
+    async def get(self, merchant_id: str) -> Optional[dict]:
+        """
+        Return the cached session, or None if absent/stale.
+
+        Within TTL this is a dict lookup. After TTL the first caller checks
+        session_version; concurrent callers keep using the entry meanwhile.
+        """
+        entry = self._entries.get(merchant_id)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        if time.monotonic() - entry.checked_at < self.ttl:
+            self.stats["hits"] += 1
+            return entry.session
+
+        # Claim revalidation so other callers don't query too
+        entry.checked_at = time.monotonic()
+        version = await self._fetch_version(merchant_id)
+        if version is None or version != entry.version:
+            self.invalidate(merchant_id)
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["revalidated"] += 1
+        return entry.session
+
+    def put(self, merchant_id: str, session: dict, version: Optional[int]):
+        """Cache a decrypted session loaded at the given session_version."""
+        if version is None:
+            return
+        self._entries[merchant_id] = _CachedSession(
+            session=session, version=version, checked_at=time.monotonic()
+        )
+
+    def invalidate(self, merchant_id: str):
+        """Drop a merchant's cached session."""
+        if self._entries.pop(merchant_id, None) is not None:
+            self.stats["invalidated"] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    async def _fetch_version(self, merchant_id: str) -> Optional[int]:
+        try:
+            pool = await get_db_pool()
+            async with pool.acquire() as conn:
+                return await conn.fetchval(
+                    """
+                    SELECT session_version FROM kaspi_stores
+                    WHERE merchant_id = $1 AND is_active = true
+                    """,
+                    merchant_id
+                )
+        except Exception as e:
+            logger.warning(f"Session version check failed for merchant {merchant_id}: {e}")
+            return None
+
+    # ------------------------------------------------------------------
+    # LISTEN/NOTIFY
+    # ------------------------------------------------------------------
+
+    async def start_listener(self):
+        """Listen for session changes on a dedicated connection (not from the pool)."""
+        if self._listener_task is not None:
+            return
+        self._listener_task = asyncio.create_task(self._listen_loop(), name="session-cache-listener")
+
+    async def stop_listener(self):
+        if self._listener_task is None:
+            return
+        self._listener_task.cancel()
+        try:
+            await self._listener_task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._listener_task = None
+
+    async def _listen_loop(self):
+        """
+        Keep the LISTEN connection alive: reconnect after it is terminated
+        or fails a health check (DB restart, network blip). Entries are dropped
+        on every loss, since notifications may have been missed meanwhile.
+        """
+        while True:
+            try:
+                conn = await asyncpg.connect(settings.database_url)
+            except Exception as e:
+                # TTL revalidation still bounds staleness
+                logger.warning(
+                    f"Session cache listener unavailable, relying on TTL "
+                    f"(retry in {LISTENER_RETRY_SECONDS:.0f}s): {e}"
+                )
+                await asyncio.sleep(LISTENER_RETRY_SECONDS)
+                continue
+
+            lost = asyncio.Event()
+            self._listener_conn = conn
+            try:
+                conn.add_termination_listener(lambda _conn: lost.set())
+                await conn.add_listener(SESSION_CHANNEL, self._on_notify)
+                logger.info(f"Session cache listening on '{SESSION_CHANNEL}'")
+
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), timeout=LISTENER_CHECK_SECONDS)
+                    except asyncio.TimeoutError:
+                        await asyncio.wait_for(conn.fetchval("SELECT 1"), timeout=LISTENER_CHECK_TIMEOUT)
+                logger.warning("Session cache listener connection terminated, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Session cache listener failed, reconnecting: {e}")
+            finally:
+                self._listener_conn = None
+                try:
+                    await asyncio.wait_for(conn.close(), timeout=LISTENER_CHECK_TIMEOUT)
+                except Exception:
+                    conn.terminate()
+
+            self.clear()
+            await asyncio.sleep(LISTENER_RETRY_SECONDS)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        if payload:
+            self.invalidate(payload)
+        else:
+            self.clear()
+
+
+# ============================================================================
+# Global instance
+# ============================================================================
+
+_session_cache: Optional[SessionCache] = None
+
+
+def get_session_cache() -> SessionCache:
+    """Get global session cache instance"""
+    global _session_cache
+    if _session_cache is None:
+        _session_cache = SessionCache(ttl=settings.session_cache_ttl_seconds)
+    return _session_cache
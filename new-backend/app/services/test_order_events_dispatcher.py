@@ -0,0 +1,250 @@
+"""
+Tests for the order events outbox dispatcher: claim order and lease, retry
+backoff up to failed, and notification delivery across retries.
+
+Needs TEST_DATABASE_URL (see app/conftest.py); notifications and WhatsApp
+sends are mocked.
+
+Run with: pytest app/services/test_order_events_dispatcher.py -v
+"""
+
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+import pytest_asyncio
+
+from .order_events_dispatcher import CLAIM_LEASE, RETRY_BASE, RETRY_MAX, OrderEventsDispatcher
+from ..conftest import create_store, create_user
+
+
+@pytest_asyncio.fixture
+async def outbox(db_pool):
+    """Store with two orders; add(order, event_type) enqueues an event."""
+    async with db_pool.acquire() as conn:
+        user_id = await create_user(conn)
+        store_id = await create_store(conn, user_id)
+        order_ids = [
+            await conn.fetchval(
+                """
+                INSERT INTO orders (store_id, kaspi_order_id, kaspi_order_code, status, total_price, order_date)
+                VALUES ($1, $2, $2, 'APPROVED_BY_BANK', 15000, NOW())
+                RETURNING id
+                """,
+                store_id, code,
+            )
+            for code in ("100", "200")
+        ]
+
+    async def add(order_index: int, event_type: str = "new", new_status: str = "APPROVED_BY_BANK") -> int:
+        async with db_pool.acquire() as conn:
+            return await conn.fetchval(
+                """
+                INSERT INTO order_events_outbox (
+                    user_id, store_id, order_id, order_code, event_type, old_status, new_status, total_price
+                )
+                VALUES ($1, $2, $3, $4, $5, $6, $7, 15000)
+                RETURNING id
+                """,
+                user_id, store_id, order_ids[order_index], ("100", "200")[order_index], event_type,
+                None if event_type == "new" else "APPROVED_BY_BANK", new_status,
+            )
+
+    return add
+
+
+def _dispatcher(db_pool, max_attempts: int = 3) -> OrderEventsDispatcher:
+    dispatcher = OrderEventsDispatcher(concurrency=10, max_attempts=max_attempts)
+    dispatcher._pool = db_pool
+    return dispatcher
+
+
+async def _event(db_pool, event_id):
+    async with db_pool.acquire() as conn:
+        return await conn.fetchrow(
+            """
+            SELECT status, attempts, next_attempt_at - NOW() AS due_in, processed_at, notified_at, last_error
+            FROM order_events_outbox WHERE id = $1
+            """,
+            event_id,
+        )
+
+
+async def _expire_lease(db_pool, event_id):
+    async with db_pool.acquire() as conn:
+        await conn.execute(
+            "UPDATE order_events_outbox SET next_attempt_at = NOW() - INTERVAL '1 second' WHERE id = $1",
+            event_id,
+        )
+
+
+@pytest.mark.asyncio
+class TestClaim:
+    """Per-order ordering and the claim lease"""
+
+    async def test_older_pending_event_blocks_newer(self, db_pool, outbox):
+        first = await outbox(0)
+        second = await outbox(0, "status_changed", "ACCEPTED_BY_MERCHANT")
+        other_order = await outbox(1)
+        dispatcher = _dispatcher(db_pool)
+
+        assert {e["id"] for e in await dispatcher._claim(10)} == {first, other_order}
+        # The older event is leased, not done: it still blocks
+        assert await dispatcher._claim(10) == []
+
+        async with db_pool.acquire() as conn:
+            await conn.execute("UPDATE order_events_outbox SET status = 'done' WHERE id = $1", first)
+        assert [e["id"] for e in await dispatcher._claim(10)] == [second]
+
+    async def test_failed_event_stops_blocking(self, db_pool, outbox):
+        first = await outbox(0)
+        second = await outbox(0, "status_changed", "ACCEPTED_BY_MERCHANT")
+        async with db_pool.acquire() as conn:
+            await conn.execute("UPDATE order_events_outbox SET status = 'failed' WHERE id = $1", first)
+
+        assert [e["id"] for e in await _dispatcher(db_pool)._claim(10)] == [second]
+
+    async def test_lease_expiry_hands_event_out_again(self, db_pool, outbox):
+        event_id = await outbox(0)
+        dispatcher = _dispatcher(db_pool)
+
+        [claimed] = await dispatcher._claim(10)
+        assert claimed["attempts"] == 1
+        stored = await _event(db_pool, event_id)
+        assert CLAIM_LEASE - timedelta(seconds=5) < stored["due_in"] <= CLAIM_LEASE
+
+        # Dispatcher died mid-event: nobody else gets it until the lease ends
+        assert await _dispatcher(db_pool)._claim(10) == []
+        await _expire_lease(db_pool, event_id)
+        [reclaimed] = await _dispatcher(db_pool)._claim(10)
+        assert reclaimed["id"] == event_id
+        assert reclaimed["attempts"] == 2
+
+    async def test_claim_limit(self, db_pool, outbox):
+        await outbox(0)
+        await outbox(1)
+        assert len(await _dispatcher(db_pool)._claim(1)) == 1
+
+
+@pytest.mark.asyncio
+class TestRetries:
+    """Exponential backoff, then failed"""
+
+    async def test_backoff_then_failed(self, db_pool, outbox):
+        event_id = await outbox(0, "status_changed", "ACCEPTED_BY_MERCHANT")
+        dispatcher = _dispatcher(db_pool, max_attempts=3)
+        dispatcher._deliver = AsyncMock(side_effect=RuntimeError("WAHA down"))
+
+        for attempt in (1, 2):
+            [event] = await dispatcher._claim(10)
+            await dispatcher._handle(event)
+            stored = await _event(db_pool, event_id)
+            delay = min(RETRY_BASE * 2 ** (attempt - 1), RETRY_MAX)
+            assert stored["status"] == "pending"
+            assert stored["attempts"] == attempt
+            assert delay - timedelta(seconds=5) < stored["due_in"] <= delay
+            assert stored["last_error"] == "WAHA down"
+            assert stored["processed_at"] is None
+            await _expire_lease(db_pool, event_id)
+
+        [event] = await dispatcher._claim(10)
+        await dispatcher._handle(event)
+        stored = await _event(db_pool, event_id)
+        assert stored["status"] == "failed"
+        assert stored["attempts"] == 3
+        assert stored["processed_at"] is not None
+
+        await _expire_lease(db_pool, event_id)
+        assert await dispatcher._claim(10) == []
+
+    async def test_delivered_event_done(self, db_pool, outbox):
+        event_id = await outbox(0, "status_changed", "ACCEPTED_BY_MERCHANT")
+        dispatcher = _dispatcher(db_pool)
+        dispatcher._deliver = AsyncMock()
+
+        [event] = await dispatcher._claim(10)
+        await dispatcher._handle(event)
+
+        stored = await _event(db_pool, event_id)
+        assert stored["status"] == "done"
+        assert stored["processed_at"] is not None
+
+
+@pytest.mark.asyncio
+class TestNotifications:
+    """The new-order notification is retried on its own and sent once"""
+
+    @pytest.fixture
+    def delivery(self):
+        limiter = MagicMock()
+        limiter.acquire = AsyncMock()
+        module = "app.services.order_events_dispatcher"
+        with patch(f"{module}.create_notification", AsyncMock()) as notify, \
+                patch(f"{module}.get_user_notification_settings", AsyncMock(return_value={"orders": True})), \
+                patch(f"{module}.process_new_kaspi_order", AsyncMock(return_value={"status": "sent"})) as whatsapp, \
+                patch(f"{module}.get_whatsapp_rate_limiter", return_value=limiter):
+            yield notify, whatsapp
+
+    async def _attempt(self, db_pool, dispatcher, event_id):
+        await _expire_lease(db_pool, event_id)
+        [event] = await dispatcher._claim(10)
+        await dispatcher._handle(event)
+        return await _event(db_pool, event_id)
+
+    async def test_failed_notification_retried(self, db_pool, outbox, delivery):
+        notify, whatsapp = delivery
+        event_id = await outbox(0)
+        dispatcher = _dispatcher(db_pool)
+
+        notify.side_effect = RuntimeError("notifications table locked")
+        stored = await self._attempt(db_pool, dispatcher, event_id)
+        assert stored["status"] == "pending"
+        assert stored["notified_at"] is None
+        assert whatsapp.await_count == 1  # not held back by the notification
+
+        notify.side_effect = None
+        stored = await self._attempt(db_pool, dispatcher, event_id)
+        assert stored["status"] == "done"
+        assert stored["notified_at"] is not None
+        assert notify.await_count == 2
+
+    async def test_notification_not_repeated_on_whatsapp_retry(self, db_pool, outbox, delivery):
+        notify, whatsapp = delivery
+        event_id = await outbox(0)
+        dispatcher = _dispatcher(db_pool)
+
+        whatsapp.side_effect = RuntimeError("WAHA down")
+        stored = await self._attempt(db_pool, dispatcher, event_id)
+        assert stored["status"] == "pending"
+        assert stored["notified_at"] is not None
+
+        whatsapp.side_effect = None
+        whatsapp.return_value = {"status": "sent"}
+        stored = await self._attempt(db_pool, dispatcher, event_id)
+        assert stored["status"] == "done"
+        assert notify.await_count == 1
+
+    async def test_notifications_turned_off(self, db_pool, outbox, delivery):
+        notify, _ = delivery
+        event_id = await outbox(0)
+        dispatcher = _dispatcher(db_pool)
+
+        with patch(
+            "app.services.order_events_dispatcher.get_user_notification_settings",
+            AsyncMock(return_value={"orders": False}),
+        ):
+            stored = await self._attempt(db_pool, dispatcher, event_id)
+
+        assert stored["status"] == "done"
+        assert stored["notified_at"] is not None
+        assert notify.await_count == 0
+
+    async def test_status_change_sends_no_notification(self, db_pool, outbox, delivery):
+        notify, whatsapp = delivery
+        event_id = await outbox(0, "status_changed", "ACCEPTED_BY_MERCHANT")
+
+        stored = await self._attempt(db_pool, _dispatcher(db_pool), event_id)
+
+        assert stored["status"] == "done"
+        assert notify.await_count == 0
+        assert whatsapp.await_args.kwargs["kaspi_state"] == "ACCEPTED_BY_MERCHANT"
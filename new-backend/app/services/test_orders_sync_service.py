@@ -0,0 +1,231 @@
+"""
+Tests for the incremental orders sync: which orders sync_store_orders
+writes and what it keeps in the sync state.
+
+Kaspi is a fake REST API (active list, ARCHIVE tab, order details) and
+sync_orders_to_db is stubbed, so the tests need no database.
+
+Run with: pytest app/services/test_orders_sync_service.py -v
+"""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from .kaspi_orders_api import KaspiTokenInvalidError
+from .orders_sync_service import FULL_RESYNC_INTERVAL, FULL_WINDOW, sync_store_orders
+
+NOW = datetime.now(timezone.utc)
+
+
+def _order(order_id, status, created_at=None):
+    created_at = created_at or NOW - timedelta(hours=1)
+    return {
+        "id": order_id,
+        "attributes": {"code": order_id, "status": status, "creationDate": int(created_at.timestamp() * 1000)},
+    }
+
+
+class FakeRestApi:
+    """Active orders, ARCHIVE tab and details as Kaspi would return them."""
+
+    def __init__(self, active=(), archive=(), details=None, failing_details=()):
+        self.active = list(active)
+        self.archive = list(archive)
+        self.details = details or {}
+        self.failing_details = set(failing_details)
+        self.archive_from = None
+        self.detail_requests = []
+
+    async def iter_order_pages(self, api_token, date_from, date_to, states=None, size=100):
+        if states == ["ARCHIVE"]:
+            self.archive_from = date_from
+            orders = [o for o in self.archive if o["attributes"]["creationDate"] >= date_from.timestamp() * 1000]
+        else:
+            orders = self.active
+        for start in range(0, len(orders), size):
+            yield orders[start:start + size]
+
+    async def fetch_order_detail(self, api_key, order_id):
+        self.detail_requests.append(order_id)
+        if order_id in self.failing_details:
+            raise RuntimeError("detail unavailable")
+        return self.details.get(order_id)
+
+
+def _state(open_orders=None, settled_orders=None, cursor=NOW - timedelta(minutes=30), last_full=NOW - timedelta(hours=1)):
+    return {
+        "last_created_at": cursor,
+        "open_orders": dict(open_orders or {}),
+        "settled_orders": dict(settled_orders or {}),
+        "last_full_sync_at": last_full,
+    }
+
+
+async def _sync(rest_api, state, result=None, side_effect=None):
+    """Run one cycle; returns (totals, new state, ids of every written order)."""
+    stub = AsyncMock(
+        return_value=result or {"inserted": 0, "updated": 0, "contacts_added": 0, "errors": 0},
+        side_effect=side_effect,
+    )
+    with patch("app.services.orders_sync_service.sync_orders_to_db", stub):
+        totals, new_state = await sync_store_orders(rest_api, "token", "store-1", "user-1", "Store", state)
+    written = [order["id"] for call in stub.await_args_list for order in call.args[1]]
+    return totals, new_state, written
+
+
+@pytest.mark.asyncio
+class TestIncrementalSync:
+    """Only new orders and status changes are written"""
+
+    async def test_unchanged_orders_skipped(self):
+        rest_api = FakeRestApi(active=[_order("A", "APPROVED_BY_BANK"), _order("B", "ACCEPTED_BY_MERCHANT"), _order("C", "KASPI_DELIVERY")])
+        state = _state(open_orders={"A": "APPROVED_BY_BANK", "B": "APPROVED_BY_BANK"})
+
+        _, new_state, written = await _sync(rest_api, state)
+
+        assert sorted(written) == ["B", "C"]
+        assert new_state["open_orders"] == {
+            "A": "APPROVED_BY_BANK", "B": "ACCEPTED_BY_MERCHANT", "C": "KASPI_DELIVERY",
+        }
+        assert rest_api.detail_requests == []
+
+    async def test_final_state_orders_not_rewritten(self):
+        completed_at = NOW - timedelta(minutes=20)
+        rest_api = FakeRestApi(
+            active=[_order("A", "COMPLETED")],
+            archive=[_order("B", "CANCELLED", created_at=completed_at)],
+        )
+        state = _state(settled_orders={"A": "COMPLETED", "B": "CANCELLED"})
+
+        _, new_state, written = await _sync(rest_api, state)
+
+        assert written == []
+        assert new_state["open_orders"] == {}
+        # Both are fetched again next cycle (active list / ARCHIVE overlap)
+        assert new_state["settled_orders"] == {"A": "COMPLETED", "B": "CANCELLED"}
+
+        # Written once when they first reach the final state
+        _, new_state, written = await _sync(rest_api, _state(open_orders={"A": "KASPI_DELIVERY"}))
+        assert sorted(written) == ["A", "B"]
+        assert new_state["settled_orders"] == {"A": "COMPLETED", "B": "CANCELLED"}
+
+    async def test_open_orders_that_left_the_list_resolved_by_detail(self):
+        rest_api = FakeRestApi(
+            active=[_order("A", "APPROVED_BY_BANK")],
+            details={"B": _order("B", "COMPLETED", created_at=NOW - timedelta(days=3))},
+        )
+        state = _state(open_orders={"A": "APPROVED_BY_BANK", "B": "KASPI_DELIVERY", "C": "KASPI_DELIVERY"})
+
+        _, new_state, written = await _sync(rest_api, state)
+
+        assert sorted(rest_api.detail_requests) == ["B", "C"]
+        assert written == ["B"]
+        # C is no longer visible to the token: not tracked any more
+        assert new_state["open_orders"] == {"A": "APPROVED_BY_BANK"}
+        # Created before the overlap window: never fetched again
+        assert new_state["settled_orders"] == {}
+
+    async def test_detail_failures_kept_open(self):
+        rest_api = FakeRestApi(failing_details={"B"})
+        state = _state(open_orders={"B": "KASPI_DELIVERY"})
+
+        _, new_state, written = await _sync(rest_api, state)
+
+        assert written == []
+        assert new_state["open_orders"] == {"B": "KASPI_DELIVERY"}
+
+    async def test_detail_token_error_raised(self):
+        rest_api = FakeRestApi()
+        rest_api.fetch_order_detail = AsyncMock(side_effect=KaspiTokenInvalidError("expired"))
+
+        with pytest.raises(KaspiTokenInvalidError):
+            await _sync(rest_api, _state(open_orders={"B": "KASPI_DELIVERY"}))
+
+    async def test_archive_read_since_cursor(self):
+        cursor = NOW - timedelta(hours=2)
+        rest_api = FakeRestApi(archive=[
+            _order("OLD", "COMPLETED", created_at=cursor - timedelta(hours=1)),
+            _order("NEW", "COMPLETED", created_at=cursor + timedelta(minutes=5)),
+        ])
+
+        _, new_state, written = await _sync(rest_api, _state(cursor=cursor))
+
+        assert written == ["NEW"]
+        assert rest_api.archive_from > cursor - timedelta(hours=1)
+        assert new_state["last_created_at"] == datetime.fromtimestamp(
+            rest_api.archive[1]["attributes"]["creationDate"] / 1000, tz=timezone.utc
+        )
+
+
+@pytest.mark.asyncio
+class TestFullResync:
+    """Every order is written after FULL_RESYNC_INTERVAL"""
+
+    async def test_full_resync_after_interval(self):
+        rest_api = FakeRestApi(
+            active=[_order("A", "APPROVED_BY_BANK")],
+            archive=[_order("B", "COMPLETED", created_at=NOW - timedelta(days=10))],
+        )
+        last_full = NOW - FULL_RESYNC_INTERVAL - timedelta(minutes=1)
+        state = _state(open_orders={"A": "APPROVED_BY_BANK"}, settled_orders={"B": "COMPLETED"}, last_full=last_full)
+
+        _, new_state, written = await _sync(rest_api, state)
+
+        assert sorted(written) == ["A", "B"]
+        assert NOW - FULL_WINDOW - timedelta(minutes=1) < rest_api.archive_from < NOW - FULL_WINDOW + timedelta(minutes=1)
+        assert new_state["last_full_sync_at"] > last_full
+
+    async def test_no_full_resync_before_interval(self):
+        rest_api = FakeRestApi(active=[_order("A", "APPROVED_BY_BANK")])
+        last_full = NOW - FULL_RESYNC_INTERVAL + timedelta(minutes=5)
+        state = _state(open_orders={"A": "APPROVED_BY_BANK"}, last_full=last_full)
+
+        _, new_state, written = await _sync(rest_api, state)
+
+        assert written == []
+        assert new_state["last_full_sync_at"] == last_full
+
+    async def test_first_sync_is_full(self):
+        rest_api = FakeRestApi(active=[_order("A", "APPROVED_BY_BANK")])
+        state = {"last_created_at": None, "open_orders": {}, "settled_orders": {}, "last_full_sync_at": None}
+
+        _, new_state, written = await _sync(rest_api, state)
+
+        assert written == ["A"]
+        assert new_state["last_full_sync_at"] is not None
+
+
+@pytest.mark.asyncio
+class TestFailedBatches:
+    """A batch sync_orders_to_db rejects is written again next cycle"""
+
+    async def test_failed_batch_left_out_of_state(self):
+        cursor = NOW - timedelta(hours=2)
+        failed_created_at = cursor + timedelta(minutes=5)
+        rest_api = FakeRestApi(
+            active=[_order("A", "ACCEPTED_BY_MERCHANT"), _order("B", "APPROVED_BY_BANK", created_at=failed_created_at)],
+            archive=[_order("C", "COMPLETED", created_at=cursor + timedelta(minutes=50))],
+        )
+        state = _state(open_orders={"A": "APPROVED_BY_BANK"}, cursor=cursor)
+
+        async def sync_orders(store_id, orders, user_id=None):
+            if any(order["id"] == "B" for order in orders):
+                raise OverflowError("value out of int32 range")
+            return {"inserted": len(orders), "updated": 0, "contacts_added": 0, "errors": 0}
+
+        totals, new_state, written = await _sync(rest_api, state, side_effect=sync_orders)
+
+        assert totals["errors"] == 2
+        assert totals["inserted"] == 1
+        assert sorted(written) == ["A", "B", "C"]
+        # A keeps its old status, B is unknown: both count as changed next cycle
+        assert new_state["open_orders"] == {"A": "APPROVED_BY_BANK"}
+        assert new_state["settled_orders"] == {"C": "COMPLETED"}
+        assert new_state["last_created_at"] == datetime.fromtimestamp(
+            int(failed_created_at.timestamp() * 1000) / 1000, tz=timezone.utc
+        )
+
+        _, _, written = await _sync(rest_api, new_state)
+        assert sorted(written) == ["A", "B"]
@@ -0,0 +1,274 @@
+"""
+Tests for the batch pricing engine: compute_targets() must return exactly
+what the demper's per-product path returns.
+
+Random offer lists (seeded) cover duplicate and missing prices, our own and
+excluded merchants, every delivery duration and filter, all strategies and
+min/max edge cases. scripts/benchmark_pricing_engine.py reuses the generator
+and the reference for timing.
+
+Run with: pytest app/services/test_pricing_engine.py -v
+"""
+
+import logging
+import random
+from decimal import Decimal
+
+import pytest
+
+from .pricing_engine import (
+    DELIVERY_DURATION_RANK,
+    PricingInput,
+    PricingResult,
+    STATUS_BELOW_MIN,
+    STATUS_NO_COMPETITORS,
+    STATUS_NO_TARGET,
+    STATUS_OK,
+    compute_targets,
+    strategy_top_n,
+)
+from ..workers.demper_instance import DemperWorker, _offer_passes_delivery_filter
+
+OUR_MERCHANT = "30000001"
+DURATIONS = list(DELIVERY_DURATION_RANK) + ["SOMETHING_NEW", "", None]
+FILTERS = ["today_tomorrow", "till_3_days", "till_5_days", "same_or_faster", "bogus", None]
+STRATEGIES = ["standard", "always_first", "stay_top_n", "unknown"]
+
+
+def random_case(rng: random.Random) -> dict:
+    """One product-city: offers plus the settings the demper would use."""
+    merchants = [OUR_MERCHANT] + [str(30000100 + i) for i in range(rng.randint(0, 12))]
+    base = rng.choice([15, 500, 10_000, 250_000])
+    offers = []
+    for _ in range(rng.randint(0, 25)):
+        offers.append({
+            "merchantId": rng.choice(merchants),
+            "price": None if rng.random() < 0.05 else max(1, base + rng.randint(-base // 2, base // 2)),
+            "deliveryDuration": rng.choice(DURATIONS),
+        })
+    excluded = set(rng.sample(merchants, rng.randint(0, min(3, len(merchants)))))
+    excluded.add(OUR_MERCHANT)
+
+    strategy = rng.choice(STRATEGIES)
+    strategy_params = {}
+    if strategy == "stay_top_n" and rng.random() < 0.9:
+        strategy_params["top_position"] = rng.choice([0, 1, 2, 3, 5, 10, 2.0, "3"])
+
+    return {
+        "offers": offers,
+        "excluded": excluded,
+        "strategy": strategy,
+        "strategy_params": strategy_params,
+        "current_price": rng.choice([5, 10, base, base - 1, base + 1, rng.randint(1, 2 * base)]),
+        "min_price": rng.choice([0, 0, 5, 10, base // 2, base, 2 * base]),
+        "max_price": rng.choice([0, 0, base, 2 * base, base // 3]),
+        "price_step": rng.choice([1, 1, 5, 100]),
+        "delivery_demping": rng.random() < 0.4,
+        "delivery_filter": rng.choice(FILTERS),
+    }
+
+
+def reference(case: dict) -> PricingResult:
+    """Per-product path, as in DemperWorker._process_product_cities."""
+    merchant_id = OUR_MERCHANT
+    offers = case["offers"]
+    current_price = Decimal(str(case["current_price"]))
+    city_min = Decimal(str(case["min_price"] or 0))
+    city_max = Decimal(str(case["max_price"])) if case["max_price"] else None
+    price_step = Decimal(str(case["price_step"]))
+    excluded_merchant_ids = case["excluded"]
+    is_delivery_demping = case["delivery_demping"]
+    delivery_filter = case["delivery_filter"]
+
+    KASPI_MIN_PRICE = Decimal("10")
+    effective_min = max(city_min, KASPI_MIN_PRICE) if city_min > 0 else KASPI_MIN_PRICE
+
+    our_delivery_duration = None
+    if is_delivery_demping:
+        for offer in offers:
+            if offer.get("merchantId") == merchant_id:
+                our_delivery_duration = offer.get("deliveryDuration")
+                break
+
+    sorted_offers = []
+    our_position = None
+    for offer in offers:
+        offer_merchant_id = offer.get("merchantId")
+        offer_price = offer.get("price")
+        if offer_price is not None:
+            is_ours = offer_merchant_id == merchant_id
+            is_excluded = offer_merchant_id in excluded_merchant_ids
+            if is_delivery_demping and not is_ours and not is_excluded:
+                if not _offer_passes_delivery_filter(offer, delivery_filter, our_delivery_duration):
+                    is_excluded = True
+            sorted_offers.append({
+                "merchant_id": offer_merchant_id,
+                "price": Decimal(str(offer_price)),
+                "is_ours": is_ours,
+                "is_excluded": is_excluded,
+            })
+    sorted_offers.sort(key=lambda x: x["price"])
+
+    for i, offer in enumerate(sorted_offers):
+        if offer["is_ours"]:
+            our_position = i + 1
+            break
+
+    min_competitor_price = None
+    for offer in sorted_offers:
+        if not offer["is_excluded"]:
+            min_competitor_price = offer["price"]
+            break
+
+    def result(status, target=None):
+        return PricingResult(
+            status=status,
+            target_price=int(target) if target is not None else None,
+            min_competitor_price=int(min_competitor_price) if min_competitor_price is not None else None,
+            our_position=our_position,
+            effective_min_price=int(effective_min),
+        )
+
+    if min_competitor_price is None:
+        return result(STATUS_NO_COMPETITORS)
+
+    target_price = DemperWorker._calculate_target_price(
+        None,
+        strategy=case["strategy"],
+        strategy_params=case["strategy_params"],
+        current_price=current_price,
+        min_competitor_price=min_competitor_price,
+        sorted_offers=sorted_offers,
+        our_position=our_position,
+        price_step=price_step,
+        merchant_id=merchant_id,
+    )
+    if target_price is None:
+        return result(STATUS_NO_TARGET)
+
+    if target_price < effective_min:
+        if current_price > effective_min:
+            target_price = effective_min
+        else:
+            return result(STATUS_BELOW_MIN)
+
+    if city_max and target_price > city_max:
+        target_price = city_max
+
+    return result(STATUS_OK, target_price)
+
+
+def to_input(case: dict) -> PricingInput:
+    strategy = case["strategy"]
+    return PricingInput(
+        offers=case["offers"],
+        merchant_id=OUR_MERCHANT,
+        current_price=case["current_price"],
+        price_step=case["price_step"],
+        min_price=case["min_price"],
+        max_price=case["max_price"],
+        strategy=strategy,
+        top_n=strategy_top_n(case["strategy_params"]) if strategy == "stay_top_n" else 3,
+        excluded_merchant_ids=case["excluded"],
+        delivery_demping=case["delivery_demping"],
+        delivery_filter=case["delivery_filter"],
+    )
+
+
+def _offer(merchant: str, price, duration: str = "TOMORROW") -> dict:
+    return {"merchantId": merchant, "price": price, "deliveryDuration": duration}
+
+
+class TestEquivalence:
+    """Randomized cases against the per-product path"""
+
+    @pytest.fixture(autouse=True)
+    def _quiet_demper(self):
+        # "Unknown strategy" warnings from the per-product path
+        logger = logging.getLogger("app.workers.demper_instance")
+        level = logger.level
+        logger.setLevel(logging.ERROR)
+        yield
+        logger.setLevel(level)
+
+    @pytest.mark.parametrize("seed", [1, 2, 3, 4, 5])
+    @pytest.mark.parametrize("batch", [1, 3, 64])
+    def test_matches_per_product_path(self, seed, batch):
+        rng = random.Random(seed)
+        cases = [random_case(rng) for _ in range(600)]
+
+        actual = []
+        for start in range(0, len(cases), batch):
+            actual.extend(compute_targets(to_input(c) for c in cases[start:start + batch]))
+
+        for case, result in zip(cases, actual):
+            assert result == reference(case), case
+
+    def test_reachable_statuses_are_covered(self):
+        rng = random.Random(1)
+        statuses = {reference(random_case(rng)).status for _ in range(600)}
+        # no_target needs a competitor but no offer that is not ours: unreachable
+        assert statuses == {STATUS_OK, STATUS_NO_COMPETITORS, STATUS_BELOW_MIN}
+
+
+class TestComputeTargets:
+    """Hand-written cases and input validation"""
+
+    def test_empty_batch(self):
+        assert compute_targets([]) == []
+
+    def test_standard_undercuts_cheapest_competitor(self):
+        [result] = compute_targets([PricingInput(
+            offers=[_offer("A", 1000), _offer(OUR_MERCHANT, 1050), _offer("B", 990)],
+            merchant_id=OUR_MERCHANT,
+            current_price=1050,
+            price_step=5,
+            excluded_merchant_ids={OUR_MERCHANT},
+        )])
+        assert result == PricingResult(
+            status=STATUS_OK, target_price=985, min_competitor_price=990,
+            our_position=3, effective_min_price=10,
+        )
+
+    def test_holds_when_competitor_below_min(self):
+        [result] = compute_targets([PricingInput(
+            offers=[_offer("A", 400), _offer(OUR_MERCHANT, 500)],
+            merchant_id=OUR_MERCHANT,
+            current_price=500,
+            price_step=1,
+            min_price=500,
+            excluded_merchant_ids={OUR_MERCHANT},
+        )])
+        assert result.status == STATUS_BELOW_MIN
+        assert result.target_price is None
+
+    def test_whole_decimal_and_float_prices_accepted(self):
+        [result] = compute_targets([PricingInput(
+            offers=[_offer("A", Decimal("1000.00")), _offer("B", 1200.0)],
+            merchant_id=OUR_MERCHANT,
+            current_price=Decimal("1100"),
+            price_step=Decimal("1"),
+            max_price=2000.0,
+        )])
+        assert result.target_price == 999
+
+    @pytest.mark.parametrize("field, value", [
+        ("offer", 999.5),
+        ("offer", Decimal("999.99")),
+        ("offer", "abc"),
+        ("current_price", Decimal("1000.5")),
+        ("price_step", 0.5),
+        ("min_price", Decimal("10.01")),
+        ("max_price", float("inf")),
+    ])
+    def test_fractional_values_rejected(self, field, value):
+        item = PricingInput(
+            offers=[_offer("A", value if field == "offer" else 1000)],
+            merchant_id=OUR_MERCHANT,
+            current_price=1100,
+            price_step=1,
+        )
+        if field != "offer":
+            setattr(item, field, value)
+        with pytest.raises(ValueError):
+            compute_targets([item])
@@ -0,0 +1,190 @@
+"""
+Tests for the proxy health prober against scripts/proxy_probe_server.py.
+
+Stand-in proxies on local ports (healthy, slow, failing) are probed for
+several cycles: p50/p95 must follow the configured delays, the slow and the
+failing proxy must be quarantined at their thresholds and no earlier, and
+ProxyAllocator must hand quarantined proxies out last (needs
+TEST_DATABASE_URL, see app/conftest.py).
+
+Run with: pytest app/services/test_proxy_prober.py -v
+"""
+
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+
+import pytest
+
+from . import proxy_prober
+from .proxy_allocator import ProxyAllocator
+from .proxy_prober import MIN_SAMPLES_FOR_P95, probe_proxies
+from ..config import settings
+from ..conftest import create_user
+
+_spec = importlib.util.spec_from_file_location(
+    "proxy_probe_server",
+    Path(__file__).resolve().parents[2] / "scripts" / "proxy_probe_server.py",
+)
+proxy_probe_server = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(proxy_probe_server)
+
+SLOW_DELAY_MS = 300
+MEDIUM_DELAY_MS = 60
+MAX_P95_MS = 200
+MAX_FAILURES = 3
+
+
+@asynccontextmanager
+async def probe_servers(*specs):
+    """Start stand-in proxies, one per (delay_ms, fail_rate); yields their ports."""
+    servers = []
+    try:
+        for delay_ms, fail_rate in specs:
+            server = await asyncio.start_server(
+                proxy_probe_server.make_handler(0, delay_ms, fail_rate), "127.0.0.1", 0
+            )
+            servers.append(server)
+        yield [server.sockets[0].getsockname()[1] for server in servers]
+    finally:
+        for server in servers:
+            server.close()
+            await server.wait_closed()
+
+
+@contextmanager
+def probe_settings():
+    with patch.object(settings, "proxy_probe_url", "http://probe.test/"), \
+            patch.object(settings, "proxy_probe_timeout_seconds", 5.0), \
+            patch.object(settings, "proxy_probe_max_failures", MAX_FAILURES), \
+            patch.object(settings, "proxy_probe_max_p95_ms", MAX_P95_MS), \
+            patch.object(settings, "proxy_quarantine_minutes", 30), \
+            patch.object(proxy_prober, "quarantine_proxy_shared", AsyncMock()) as quarantine_shared, \
+            patch.dict(proxy_prober._latencies, clear=True):
+        yield quarantine_shared
+
+
+class FakePool:
+    """Proxy rows in memory; stores what the prober writes back."""
+
+    def __init__(self, rows):
+        self.rows = {row["id"]: row for row in rows}
+        self.results = {}
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    async def fetch(self, query):
+        assert query == proxy_prober._PROBE_TARGETS_SQL
+        return [dict(row) for row in self.rows.values()]
+
+    async def execute(self, query, ids, p50s, p95s, failures, errors, quarantined):
+        assert query == proxy_prober._PROBE_RESULTS_SQL
+        for proxy_id, p50, p95, failed, error, until in zip(ids, p50s, p95s, failures, errors, quarantined):
+            self.rows[proxy_id]["probe_failures"] = failed
+            self.results[proxy_id] = {"p50": p50, "p95": p95, "error": error, "quarantined_until": until}
+
+
+def _row(port, status="allocated"):
+    return {
+        "id": uuid4(), "host": "127.0.0.1", "port": port, "protocol": "http",
+        "username": None, "password": None, "status": status, "probe_failures": 0,
+    }
+
+
+@pytest.mark.asyncio
+class TestProbeCycles:
+    """Latency percentiles and quarantine thresholds"""
+
+    async def test_percentiles_and_quarantine(self):
+        async with probe_servers((0, 0), (SLOW_DELAY_MS, 0), (0, 1)) as (fast, slow, failing):
+            rows = [_row(fast), _row(slow), _row(failing, status="available")]
+            pool = FakePool(rows)
+            fast_id, slow_id, failing_id = (row["id"] for row in rows)
+
+            with probe_settings() as quarantine_shared:
+                for cycle in range(1, MIN_SAMPLES_FOR_P95 + 1):
+                    summary = await probe_proxies(pool)
+                    assert summary["probed"] == 3
+                    assert summary["failed"] == 1
+
+                    # Slow: p95 counts only with enough samples
+                    slow_quarantined = pool.results[slow_id]["quarantined_until"] is not None
+                    assert slow_quarantined == (cycle >= MIN_SAMPLES_FOR_P95)
+                    # Failing: after MAX_FAILURES consecutive failures
+                    failing_quarantined = pool.results[failing_id]["quarantined_until"] is not None
+                    assert failing_quarantined == (cycle >= MAX_FAILURES)
+                    assert pool.results[fast_id]["quarantined_until"] is None
+
+            assert pool.results[fast_id]["p95"] < MAX_P95_MS
+            assert pool.results[fast_id]["p50"] <= pool.results[fast_id]["p95"]
+            assert SLOW_DELAY_MS <= pool.results[slow_id]["p50"] <= pool.results[slow_id]["p95"]
+            assert pool.results[slow_id]["p95"] < SLOW_DELAY_MS + 1000
+
+            assert pool.results[failing_id]["p50"] is None
+            assert pool.results[failing_id]["error"] == "probe HTTP 502"
+            assert pool.rows[failing_id]["probe_failures"] == MIN_SAMPLES_FOR_P95
+
+            # Only allocated proxies are pushed to running rotators, once per cycle
+            rested = [call.args[0] for call in quarantine_shared.await_args_list]
+            assert set(rested) == {slow_id}
+
+    async def test_success_resets_failures(self):
+        async with probe_servers((0, 0)) as (port,):
+            row = _row(port)
+            row["probe_failures"] = MAX_FAILURES - 1
+            pool = FakePool([row])
+
+            with probe_settings():
+                await probe_proxies(pool)
+
+            assert pool.rows[row["id"]]["probe_failures"] == 0
+            assert pool.results[row["id"]]["quarantined_until"] is None
+
+
+@pytest.mark.asyncio
+class TestAllocatorRanking:
+    """Probe results stored in proxies decide allocation order"""
+
+    async def test_quarantined_proxies_allocated_last(self, db_pool):
+        specs = [(SLOW_DELAY_MS, 0), (0, 1), (MEDIUM_DELAY_MS, 0), (0, 0)]
+        async with probe_servers(*specs) as (slow, failing, medium, fast):
+            async with db_pool.acquire() as conn:
+                user_id = await create_user(conn)
+                # Insertion order (created_at) is the opposite of the expected ranking
+                for port in (failing, slow, medium, fast):
+                    await conn.execute(
+                        "INSERT INTO proxies (host, port, protocol) VALUES ('127.0.0.1', $1, 'http')",
+                        port,
+                    )
+
+            with probe_settings():
+                for _ in range(MIN_SAMPLES_FOR_P95):
+                    await probe_proxies(db_pool)
+
+            async with db_pool.acquire() as conn:
+                stored = {
+                    row["port"]: row for row in await conn.fetch(
+                        "SELECT port, status, latency_p50_ms, probe_failures, quarantined_until FROM proxies"
+                    )
+                }
+            assert stored[slow]["quarantined_until"] is not None
+            assert stored[slow]["latency_p50_ms"] >= SLOW_DELAY_MS
+            assert stored[failing]["quarantined_until"] is not None
+            assert stored[failing]["probe_failures"] == MIN_SAMPLES_FOR_P95
+            assert stored[medium]["quarantined_until"] is None
+            assert stored[fast]["quarantined_until"] is None
+            # Available proxies stay available, quarantine only ranks them
+            assert {row["status"] for row in stored.values()} == {"available"}
+
+            allocator = ProxyAllocator()
+            order = []
+            for _ in specs:
+                allocated = await allocator.allocate_proxies_to_user(user_id, count=1, distribution={"demper": 1})
+                order.append(allocated["demper"][0].port)
+
+            assert order == [fast, medium, slow, failing]
@@ -0,0 +1,307 @@
+"""
+Tests for sync_orders_to_db: the set-based upsert must leave the tables as
+the per-order upserts it replaced did.
+
+Covers the old status read by the `previous` CTE, the xmax = 0 insert flag,
+items only for orders that have none, the sales_count bump, contact folding
+(checked against the old per-order contact upsert) and the all-or-nothing
+batch. Needs TEST_DATABASE_URL (see app/conftest.py).
+
+Run with: pytest app/services/test_sync_orders_to_db.py -v
+"""
+
+import random
+
+import pytest
+import pytest_asyncio
+
+from .api_parser import _aggregate_new_contacts, _is_valid_phone, _normalize_phone, sync_orders_to_db
+from ..conftest import create_store, create_user
+
+CREATED_MS = 1767261600000  # 2026-01-01 10:00 UTC
+
+
+def _order(code, status="APPROVED_BY_BANK", total=10_000, entries=(), phone="", first_name="", created_ms=CREATED_MS):
+    """Raw order in Kaspi Open API format."""
+    return {
+        "id": f"id-{code}",
+        "attributes": {
+            "code": code,
+            "status": status,
+            "totalPrice": total,
+            "deliveryCost": 0,
+            "creationDate": created_ms,
+            "customer": {"cellPhone": phone, "firstName": first_name, "lastName": ""},
+            "entries": list(entries),
+        },
+    }
+
+
+def _entry(code="", name="", sku="", quantity=1, price=5000):
+    return {"product": {"code": code, "name": name, "sku": sku}, "quantity": quantity, "basePrice": price}
+
+
+# The contact upsert sync_orders_to_db ran once per new order before it was set-based
+_PER_ORDER_CONTACT_SQL = """
+    INSERT INTO customer_contacts (
+        id, user_id, store_id, phone, name,
+        first_order_code, last_order_code, orders_count
+    )
+    VALUES (gen_random_uuid(), $1, $2, $3, $4, $5, $5, 1)
+    ON CONFLICT (user_id, phone)
+    DO UPDATE SET
+        last_order_code = COALESCE($5, customer_contacts.last_order_code),
+        orders_count = customer_contacts.orders_count + 1,
+        name = COALESCE($4, customer_contacts.name),
+        store_id = COALESCE($2, customer_contacts.store_id),
+        updated_at = NOW()
+"""
+
+
+@pytest_asyncio.fixture
+async def store(db_pool):
+    async with db_pool.acquire() as conn:
+        user_id = await create_user(conn)
+        store_id = await create_store(conn, user_id)
+    return {"user_id": user_id, "store_id": store_id}
+
+
+async def _orders_by_code(conn, store_id):
+    rows = await conn.fetch(
+        "SELECT id, kaspi_order_id, status, previous_status FROM orders WHERE store_id = $1",
+        store_id,
+    )
+    return {row["kaspi_order_id"]: row for row in rows}
+
+
+@pytest.mark.asyncio
+class TestOrdersUpsert:
+    """Insert flag, old status and status history"""
+
+    async def test_inserted_and_updated_counts(self, db_pool, store):
+        store_id = str(store["store_id"])
+        result = await sync_orders_to_db(store_id, [_order("100"), _order("101")])
+        assert result == {"inserted": 2, "updated": 0, "contacts_added": 0, "errors": 0}
+
+        # Same order twice in one batch (active list + ARCHIVE): last one wins
+        result = await sync_orders_to_db(
+            store_id,
+            [_order("101", status="ACCEPTED_BY_MERCHANT"), _order("102"), _order("101", status="COMPLETED")],
+        )
+        assert result == {"inserted": 1, "updated": 1, "contacts_added": 0, "errors": 0}
+
+        async with db_pool.acquire() as conn:
+            orders = await _orders_by_code(conn, store["store_id"])
+        assert set(orders) == {"100", "101", "102"}
+        assert orders["101"]["status"] == "COMPLETED"
+
+    async def test_old_status_is_the_status_before_the_sync(self, db_pool, store):
+        store_id = str(store["store_id"])
+        await sync_orders_to_db(store_id, [_order("200"), _order("201"), _order("202")])
+
+        await sync_orders_to_db(store_id, [
+            _order("200", status="ACCEPTED_BY_MERCHANT"),
+            _order("201"),  # unchanged
+            _order("202", status="CANCELLED"),
+            _order("203"),  # new
+        ])
+
+        async with db_pool.acquire() as conn:
+            orders = await _orders_by_code(conn, store["store_id"])
+            history = await conn.fetch("SELECT order_id, old_status, new_status FROM order_status_history")
+            events = await conn.fetch(
+                "SELECT order_code, event_type, old_status, new_status FROM order_events_outbox"
+            )
+
+        assert orders["200"]["previous_status"] == "APPROVED_BY_BANK"
+        assert orders["201"]["previous_status"] is None
+        assert {(row["order_id"], row["old_status"], row["new_status"]) for row in history} == {
+            (orders["200"]["id"], "APPROVED_BY_BANK", "ACCEPTED_BY_MERCHANT"),
+            (orders["202"]["id"], "APPROVED_BY_BANK", "CANCELLED"),
+        }
+        changes = {(e["order_code"], e["old_status"], e["new_status"]) for e in events if e["event_type"] == "status_changed"}
+        assert changes == {
+            ("200", "APPROVED_BY_BANK", "ACCEPTED_BY_MERCHANT"),
+            ("202", "APPROVED_BY_BANK", "CANCELLED"),
+        }
+        assert sorted(e["order_code"] for e in events if e["event_type"] == "new") == ["200", "201", "202", "203"]
+
+    async def test_orders_of_other_stores_untouched(self, db_pool, store):
+        async with db_pool.acquire() as conn:
+            other_user = await create_user(conn, "other@example.com")
+            other_store = await create_store(conn, other_user, merchant_id="30000002")
+        await sync_orders_to_db(str(other_store), [_order("300", status="COMPLETED")])
+
+        # Same Kaspi code in another store: new here, no old status
+        result = await sync_orders_to_db(str(store["store_id"]), [_order("300")])
+        assert result["inserted"] == 1
+
+        async with db_pool.acquire() as conn:
+            assert (await _orders_by_code(conn, other_store))["300"]["status"] == "COMPLETED"
+            assert await conn.fetchval("SELECT COUNT(*) FROM order_status_history") == 0
+
+    async def test_bad_row_aborts_the_batch(self, db_pool, store):
+        store_id = str(store["store_id"])
+        with pytest.raises(Exception):
+            # total_price overflows INTEGER: the COPY fails
+            await sync_orders_to_db(store_id, [_order("400"), _order("401", total=2**40)])
+
+        async with db_pool.acquire() as conn:
+            assert await conn.fetchval("SELECT COUNT(*) FROM orders") == 0
+            assert await conn.fetchval("SELECT COUNT(*) FROM order_events_outbox") == 0
+
+
+@pytest.mark.asyncio
+class TestOrderItems:
+    """Items only for orders without items, matched products' sales_count"""
+
+    async def _product(self, conn, store_id, kaspi_product_id, name, sku=None, sales_count=0):
+        return await conn.fetchval(
+            """
+            INSERT INTO products (store_id, kaspi_product_id, kaspi_sku, name, price, sales_count)
+            VALUES ($1, $2, $3, $4, 1000, $5)
+            RETURNING id
+            """,
+            store_id, kaspi_product_id, sku, name, sales_count,
+        )
+
+    async def test_items_matched_and_sales_counted(self, db_pool, store):
+        async with db_pool.acquire() as conn:
+            by_code = await self._product(conn, store["store_id"], "P1", "Phone", sales_count=5)
+            by_sku = await self._product(conn, store["store_id"], "P2", "Case", sku="SKU-2")
+            by_name = await self._product(conn, store["store_id"], "P3", "Charger")
+
+        await sync_orders_to_db(str(store["store_id"]), [
+            _order("500", entries=[_entry(code="P1", quantity=2), _entry(sku="SKU-2", name="Other name")]),
+            _order("501", entries=[_entry(code="P1"), _entry(name="Charger", quantity=3), _entry(name="Unknown")]),
+        ])
+
+        async with db_pool.acquire() as conn:
+            items = await conn.fetch(
+                """
+                SELECT o.kaspi_order_id, i.product_id, i.quantity
+                FROM order_items i JOIN orders o ON o.id = i.order_id
+                """
+            )
+            sales = dict(await conn.fetch("SELECT id, sales_count FROM products"))
+
+        assert {(i["kaspi_order_id"], i["product_id"], i["quantity"]) for i in items} == {
+            ("500", by_code, 2), ("500", by_sku, 1),
+            ("501", by_code, 1), ("501", by_name, 3), ("501", None, 1),
+        }
+        assert sales == {by_code: 5 + 3, by_sku: 1, by_name: 3}
+
+    async def test_items_only_for_orders_without_items(self, db_pool, store):
+        async with db_pool.acquire() as conn:
+            product = await self._product(conn, store["store_id"], "P1", "Phone")
+            # Saved by an older version without items
+            await conn.execute(
+                """
+                INSERT INTO orders (store_id, kaspi_order_id, status, total_price, order_date)
+                VALUES ($1, '601', 'APPROVED_BY_BANK', 10000, NOW())
+                """,
+                store["store_id"],
+            )
+
+        entries = [_entry(code="P1")]
+        await sync_orders_to_db(str(store["store_id"]), [_order("600", entries=entries)])
+        await sync_orders_to_db(str(store["store_id"]), [
+            _order("600", status="ACCEPTED_BY_MERCHANT", entries=entries),
+            _order("601", entries=entries),
+        ])
+
+        async with db_pool.acquire() as conn:
+            counts = dict(await conn.fetch(
+                """
+                SELECT o.kaspi_order_id, COUNT(i.id)
+                FROM orders o LEFT JOIN order_items i ON i.order_id = o.id
+                GROUP BY o.kaspi_order_id
+                """
+            ))
+            sales_count = await conn.fetchval("SELECT sales_count FROM products WHERE id = $1", product)
+
+        assert counts == {"600": 1, "601": 1}
+        assert sales_count == 2
+
+
+def _random_contact_orders(rng: random.Random, first: int, count: int) -> list:
+    """New orders over a few phones; some without code, name or a real phone."""
+    phones = ["+77011111111", "87022222222", "7033333333", "+7 (704) 444-44-44", "+0(000)-000-00-00", "123", ""]
+    orders = []
+    for i in range(first, first + count):
+        order = _order(
+            code="" if rng.random() < 0.2 else str(i),
+            phone=rng.choice(phones),
+            first_name=rng.choice(["", "", "Aida", "Berik"]),
+        )
+        order["id"] = f"id-{i}"  # kaspi_order_id when the code is missing
+        orders.append(order)
+    return orders
+
+
+@pytest.mark.asyncio
+class TestCustomerContacts:
+    """Folded contact upsert against the old per-order upsert"""
+
+    @pytest.mark.parametrize("seed", [1, 2, 3])
+    async def test_matches_per_order_upsert(self, db_pool, seed):
+        rng = random.Random(seed)
+        existing = {"+77011111111": ("Old name", "900", 4), "+77033333333": (None, None, 1)}
+
+        async with db_pool.acquire() as conn:
+            stores = {}
+            for label in ("per_order", "batched"):
+                user_id = await create_user(conn, f"{label}@example.com")
+                stores[label] = (user_id, await create_store(conn, user_id, merchant_id=label))
+                for phone, (name, code, orders_count) in existing.items():
+                    await conn.execute(
+                        """
+                        INSERT INTO customer_contacts (user_id, phone, name, first_order_code, last_order_code, orders_count)
+                        VALUES ($1, $2, $3, $4, $4, $5)
+                        """,
+                        user_id, phone, name, code, orders_count,
+                    )
+        per_order_user, per_order_store = stores["per_order"]
+        batched_user, batched_store = stores["batched"]
+
+        for first in (1000, 2000):
+            batch = _random_contact_orders(rng, first, 25)
+            result = await sync_orders_to_db(str(batched_store), batch, user_id=str(batched_user))
+            assert result["inserted"] == len(batch)
+
+            async with db_pool.acquire() as conn:
+                for order in batch:
+                    attributes = order["attributes"]
+                    phone = attributes["customer"]["cellPhone"]
+                    if not _is_valid_phone(phone):
+                        continue
+                    await conn.execute(
+                        _PER_ORDER_CONTACT_SQL,
+                        per_order_user,
+                        per_order_store,
+                        _normalize_phone(phone),
+                        attributes["customer"]["firstName"] or None,
+                        attributes["code"] or None,
+                    )
+
+        query = """
+            SELECT phone, name, first_order_code, last_order_code, orders_count
+            FROM customer_contacts WHERE user_id = $1 ORDER BY phone
+        """
+        async with db_pool.acquire() as conn:
+            batched = [dict(row) for row in await conn.fetch(query, batched_user)]
+            per_order = [dict(row) for row in await conn.fetch(query, per_order_user)]
+        assert len(batched) == 4
+        assert batched == per_order
+
+    def test_fold_keeps_last_non_empty_code_and_name(self):
+        contacts = _aggregate_new_contacts([
+            {"customer_phone": "77011111111", "customer_name": "Aida", "kaspi_order_code": "1"},
+            {"customer_phone": "+0(000)-000-00-00", "customer_name": "Masked", "kaspi_order_code": "2"},
+            {"customer_phone": "+77011111111", "customer_name": "", "kaspi_order_code": ""},
+            {"customer_phone": "7011111111", "customer_name": "Aida B.", "kaspi_order_code": "4"},
+            {"customer_phone": "+77011111111", "customer_name": "", "kaspi_order_code": ""},
+        ])
+        assert contacts == {
+            "+77011111111": {"name": "Aida B.", "first_code": "1", "last_code": "4", "orders": 4},
+        }
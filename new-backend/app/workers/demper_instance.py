@@ -10,9 +10,16 @@ This worker implements automatic price demping (price reduction) to stay competi
 
 Architecture:
     - Multiple worker instances can run in parallel
-    - Each instance handles products where: mod(abs(hashtext(id::text)), INSTANCE_COUNT) = INSTANCE_INDEX
+    - Each instance handles products where: mod(shard_key, INSTANCE_COUNT) = INSTANCE_INDEX
+      (products.shard_key = mod(abs(hashtext(id::text)), 1024), persisted)
+    - Streaming scheduler: a feeder pulls due products from the DB into a
+      priority queue keyed by next-due time, a fixed pool of workers drains it.
+      A slow product only occupies one worker, never a whole cycle.
+    - Write-behind buffer batches last_check_time, price and price_history
+      writes (see write_buffer.py for durability guarantees)
     - Global rate limiter ensures we don't exceed Kaspi API limits
-    - Browser farm provides pooled browser contexts for scraping
+    - No Chromium at startup: the hot path is httpx; the browser farm is
+      started lazily by the login paths that need Playwright
     - Async/await throughout for optimal performance
 
 Usage:
@@ -26,52 +33,55 @@ Usage:
 """
 
 import asyncio
+import heapq
+import itertools
 import json
 import logging
 import random
 import signal
 import sys
 import time
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Set, Tuple
 from uuid import UUID
 
 from ..config import settings
 from ..core.database import get_db_pool, close_pool
-from ..core.browser_farm import get_browser_farm, close_browser_farm
-from ..core.rate_limiter import get_global_rate_limiter, is_merchant_cooled_down
+from ..core.browser_farm import close_browser_farm
+from ..core.http_client import close_http_client
+from ..core.proxy_stats_journal import close_proxy_stats_journal
+from ..core.rate_limiter import get_global_rate_limiter, is_merchant_cooled_down, merchant_cooldown_remaining
 from ..core.circuit_breaker import get_kaspi_circuit_breaker, CircuitState
+from ..core.metrics import LAG_BUCKETS, MetricsExporter, get_metrics
 from ..services.api_parser import parse_product_by_sku, sync_product, get_merchant_session
 from ..services.kaspi_auth_service import get_active_session_with_refresh
+from ..services.session_cache import get_session_cache
+from ..services.pricing_engine import DELIVERY_DURATION_RANK, DELIVERY_FILTER_MAX_RANK
 from ..services.notification_service import notify_price_changed, notify_min_price_reached, get_user_notification_settings
+from .write_buffer import DemperWriteBuffer
 
 logger = logging.getLogger(__name__)
 
+PRODUCT_SECONDS = get_metrics().histogram(
+    "demper_product_seconds",
+    "Time to process one product (offers, pricing, pricefeed)",
+    ["result"],
+)
+# Now minus the product's due time when a worker picks it up; sustained lag
+# means max_concurrent_tasks / INSTANCE_COUNT is too low for the load
+QUEUE_LAG_SECONDS = get_metrics().histogram(
+    "demper_queue_lag_seconds",
+    "Delay between a product becoming due and a worker starting it",
+    buckets=LAG_BUCKETS,
+)
+
 
 # ============================================================================
-# Delivery Duration Ranking (for delivery demping)
-# Lower = faster delivery. Used to filter competitors by delivery speed.
+# Delivery filter (for delivery demping)
+# Ranks live in pricing_engine; lower = faster delivery.
 # ============================================================================
 
-DELIVERY_DURATION_RANK = {
-    "TODAY": 1,
-    "TOMORROW": 2,
-    "TILL_3_DAYS": 3,
-    "TILL_5_DAYS": 5,
-    "TILL_7_DAYS": 7,
-    "OTHER": 99,
-}
-
-# Maps our delivery_filter setting to max allowed deliveryDuration rank
-DELIVERY_FILTER_MAX_RANK = {
-    "today_tomorrow": 2,   # Only TODAY, TOMORROW
-    "till_3_days": 3,      # TODAY, TOMORROW, TILL_3_DAYS
-    "till_5_days": 5,      # Up to TILL_5_DAYS
-    "same_or_faster": None, # Dynamic: use our own delivery speed as threshold
-}
-
-
 def _offer_passes_delivery_filter(
     offer: dict,
     delivery_filter: str,
@@ -156,7 +166,7 @@ class DemperWorker:
             instance_index: Shard index (0 to instance_count-1), defaults to settings.instance_index
             instance_count: Total number of shards, defaults to settings.instance_count
             max_concurrent_tasks: Max concurrent product processing, defaults to settings.max_concurrent_tasks
-            check_interval: Seconds between check cycles, defaults to 5
+            check_interval: Seconds between scheduler feeds from the DB, defaults to 5
         """
         self.instance_index = instance_index if instance_index is not None else settings.instance_index
         self.instance_count = instance_count if instance_count is not None else settings.instance_count
@@ -170,13 +180,47 @@ class DemperWorker:
                 f"instance_count ({self.instance_count})"
             )
 
-        # Concurrency control
-        self.semaphore = asyncio.Semaphore(self.max_concurrent_tasks)
+        # Scheduler state: heap of (due_at, priority_rank, seq, product)
+        self.feed_batch_size = settings.demper_feed_batch_size
+        self._feed_low_watermark = max(self.max_concurrent_tasks, self.feed_batch_size // 2)
+        self._queue: List[Tuple[float, int, int, Dict[str, Any]]] = []
+        self._queued_ids: Set[UUID] = set()
+        self._in_flight: Set[UUID] = set()
+        self._queue_seq = itertools.count()
+        self._queue_changed = asyncio.Event()
+        self._feed_wanted = asyncio.Event()
+        self._last_session_sync = 0.0
+        self._last_feed_at = 0.0
+        # product id -> consecutive processing errors (cleared by a completed check)
+        self._error_counts: Dict[UUID, int] = {}
+        self._stats = {"updated": 0, "skipped": 0, "errors": 0}
+
+        # Batched DB writes (last_check_time, price, price_history)
+        self.write_buffer = DemperWriteBuffer(
+            flush_interval=settings.demper_flush_interval_seconds,
+            max_pending=settings.demper_flush_max_pending,
+        )
 
         # Worker state
         self._running = False
         self._shutdown_event = asyncio.Event()
 
+        # Scheduler gauges, served on metrics_port + shard index
+        metrics = get_metrics()
+        metrics.gauge("demper_queue_depth", "Products queued in the scheduler",
+                      callback=lambda: {(): len(self._queue)})
+        metrics.gauge("demper_in_flight", "Products being processed",
+                      callback=lambda: {(): len(self._in_flight)})
+        metrics.gauge("demper_write_buffer_pending", "Buffered DB writes awaiting flush",
+                      callback=lambda: {(): self.write_buffer.pending_count()})
+        metrics.gauge("demper_max_concurrent_tasks", "Configured worker pool size",
+                      callback=lambda: {(): self.max_concurrent_tasks})
+        self._metrics_exporter = MetricsExporter(
+            instance=f"demper-{self.instance_index}",
+            port=settings.metrics_port + self.instance_index if settings.metrics_port else 0,
+            publish_interval=settings.metrics_publish_interval_seconds,
+        )
+
         # Setup logging with shard context
         self._setup_logging()
 
@@ -230,16 +274,24 @@ class DemperWorker:
         self._shutdown_event.set()
 
     async def _initialize(self):
-        """Initialize database and browser farm"""
+        """Initialize database, buffers and rate limiters"""
         logger.info("Initializing infrastructure...")
 
         # Initialize database pool
         await get_db_pool()
         logger.info("Database pool initialized")
 
-        # Initialize browser farm
-        await get_browser_farm()
-        logger.info("Browser farm initialized")
+        # Start write-behind buffer
+        await self.write_buffer.start()
+
+        # Serve /metrics and publish snapshots for /health/metrics
+        await self._metrics_exporter.start()
+
+        # Drop cached sessions as soon as a store's guid changes
+        await get_session_cache().start_listener()
+
+        # No browser farm here: the demper hot path is pure httpx; Playwright
+        # is started on demand by the code that needs it (Kaspi login)
 
         # Initialize rate limiter
         get_global_rate_limiter()
@@ -252,9 +304,19 @@ class DemperWorker:
         """Clean shutdown of resources"""
         logger.info("Shutting down worker...")
 
-        # Close browser farm
+        # Flush buffered writes while the pool is still open
+        await self.write_buffer.stop()
+        await get_session_cache().stop_listener()
+        await self._metrics_exporter.stop()
+
+        # Close browser farm (if a login path started it)
         await close_browser_farm()
-        logger.info("Browser farm closed")
+
+        # Close shared and per-proxy HTTP clients
+        await close_http_client()
+
+        # Write journaled proxy stats before the pool goes away
+        await close_proxy_stats_journal()
 
         # Close database pool
         await close_pool()
@@ -263,105 +325,263 @@ class DemperWorker:
         self._running = False
         logger.info("Worker shutdown complete")
 
+    # Seconds between store session syncs and scheduler stats lines
+    SESSION_SYNC_INTERVAL = 300
+    STATS_LOG_INTERVAL = 60
+    # Feed refetches requested by workers are at most this frequent
+    FEED_MIN_INTERVAL = 2.0
+    # Products skipped for a merchant cooldown are due again after at least this
+    MIN_DEFER_SECONDS = 60
+    # Products whose processing raised are retried after MIN_DEFER_SECONDS,
+    # doubling per consecutive error up to this
+    MAX_ERROR_DEFER_SECONDS = 1800
+    # Max seconds to let in-flight products finish on shutdown
+    DRAIN_TIMEOUT = 30
+
     async def _main_loop(self):
-        """Main processing loop"""
-        cycle_count = 0
+        """
+        Main processing loop.
 
+        Runs one feeder task (DB -> priority queue) and a fixed pool of
+        max_concurrent_tasks workers (priority queue -> process_product).
+        Returns when shutdown is requested.
+        """
+        feeder = asyncio.create_task(self._feed_loop(), name="demper-feeder")
+        workers = [
+            asyncio.create_task(self._worker_loop(i), name=f"demper-worker-{i}")
+            for i in range(self.max_concurrent_tasks)
+        ]
+        logger.info(f"Scheduler started: {len(workers)} workers, feed batch {self.feed_batch_size}")
+
+        last_stats = time.time()
         while self._running:
-            try:
-                cycle_count += 1
+            if await self._wait_event(self._shutdown_event, self.STATS_LOG_INTERVAL):
+                break
+            now = time.time()
+            logger.info(
+                f"Scheduler: queued={len(self._queue)} in_flight={len(self._in_flight)} | "
+                f"last {now - last_stats:.0f}s: {self._stats['updated']} updated, "
+                f"{self._stats['skipped']} skipped, {self._stats['errors']} errors"
+            )
+            self._stats = {"updated": 0, "skipped": 0, "errors": 0}
+            last_stats = now
+
+        # Stop feeding, wake idle workers and let in-flight products finish
+        feeder.cancel()
+        self._queue_changed.set()
+        _, pending = await asyncio.wait(workers, timeout=self.DRAIN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(feeder, *workers, return_exceptions=True)
+        if pending:
+            logger.warning(f"Cancelled {len(pending)} workers still busy after {self.DRAIN_TIMEOUT}s")
+
+    @staticmethod
+    async def _wait_event(event: asyncio.Event, timeout: float) -> bool:
+        """Wait for event up to timeout seconds. Returns True if the event is set."""
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _enqueue_products(self, products: List[Dict[str, Any]]) -> int:
+        """Push products onto the due-time heap, skipping ones already scheduled."""
+        added = 0
+        for product in products:
+            product_id = product["id"]
+            if product_id in self._queued_ids or product_id in self._in_flight:
+                continue
+            priority_rank = 0 if product.get("is_priority") else 1
+            heapq.heappush(
+                self._queue,
+                (product["due_at"], priority_rank, next(self._queue_seq), product)
+            )
+            self._queued_ids.add(product_id)
+            added += 1
+        if added:
+            self._queue_changed.set()
+        return added
+
+    async def _feed_loop(self):
+        """
+        Keep the priority queue topped up from the DB.
 
-                # Check if Kaspi API circuit breaker is open
+        Polls every check_interval seconds, or sooner when workers drain the
+        queue below the low watermark. Products already queued or in flight are
+        excluded in SQL so the same product is never scheduled twice.
+        """
+        while self._running:
+            try:
                 breaker = get_kaspi_circuit_breaker()
                 if breaker.state == CircuitState.OPEN:
                     logger.warning(
-                        f"Cycle #{cycle_count}: Kaspi API circuit is OPEN, skipping cycle "
+                        f"Kaspi API circuit is OPEN, pausing feed "
                         f"(will retry in {breaker.config.timeout_seconds}s)"
                     )
-                    await asyncio.sleep(30)  # Wait before checking again
+                    await self._wait_event(self._shutdown_event, 30)
                     continue
 
-                logger.info(f"Starting demper cycle #{cycle_count}")
-                cycle_start = time.time()
+                if time.time() - self._last_session_sync >= self.SESSION_SYNC_INTERVAL:
+                    self._last_session_sync = time.time()
+                    await self.sync_store_sessions()
 
-                # Fetch products for this shard
-                products = await self.fetch_products_for_instance()
-                logger.info(f"Fetched {len(products)} active products for shard {self.instance_index}")
+                if len(self._queue) < self._feed_low_watermark:
+                    # Also exclude products whose last_check_time is still buffered
+                    scheduled = self._queued_ids | self._in_flight | self.write_buffer.pending_product_ids()
+                    self._last_feed_at = time.monotonic()
+                    products = await self.fetch_products_for_instance(
+                        exclude_ids=list(scheduled),
+                        limit=self.feed_batch_size,
+                    )
+                    added = self._enqueue_products(products)
+                    if added:
+                        logger.debug(f"Queued {added} products (queue={len(self._queue)})")
+                    # Full page means there is more backlog - fetch again right away
+                    if len(products) >= self.feed_batch_size:
+                        continue
 
-                if not products:
-                    logger.info("No products to process in this cycle")
-                else:
-                    # Sync store sessions before processing
-                    await self.sync_store_sessions()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in scheduler feed: {e}", exc_info=True)
 
-                    # Process products concurrently
-                    tasks = [
-                        asyncio.create_task(self.process_product(product))
-                        for product in products
-                    ]
+            self._feed_wanted.clear()
+            await self._wait_event(self._feed_wanted, self.check_interval)
 
-                    if tasks:
-                        # Wait for all tasks to complete
-                        results = await asyncio.gather(*tasks, return_exceptions=True)
+            # Workers ask on every pop below the watermark: don't refetch per pop
+            wait = self._last_feed_at + self.FEED_MIN_INTERVAL - time.monotonic()
+            if wait > 0:
+                await self._wait_event(self._shutdown_event, wait)
 
-                        # Count results by category
-                        updated = sum(1 for r in results if r is True)
-                        skipped = sum(1 for r in results if r is False)
-                        errors = sum(1 for r in results if isinstance(r, Exception))
+    async def _next_due_product(self) -> Optional[Dict[str, Any]]:
+        """Pop the earliest product whose due time has passed, waiting if needed."""
+        while self._running:
+            if not self._queue:
+                self._feed_wanted.set()
+                self._queue_changed.clear()
+                await self._wait_event(self._queue_changed, 1.0)
+                continue
 
-                        # Log errors for debugging
-                        for r in results:
-                            if isinstance(r, Exception):
-                                logger.error(f"Product processing error: {r}")
+            due_at = self._queue[0][0]
+            delay = due_at - time.time()
+            if delay > 0:
+                # Wake early if a sooner product is pushed
+                self._queue_changed.clear()
+                await self._wait_event(self._queue_changed, min(delay, 1.0))
+                continue
 
-                        logger.info(
-                            f"Cycle #{cycle_count}: {updated} updated, "
-                            f"{skipped} skipped, {errors} errors"
-                        )
+            _, _, _, product = heapq.heappop(self._queue)
+            self._queued_ids.discard(product["id"])
+            QUEUE_LAG_SECONDS.observe(max(0.0, -delay))
+            if len(self._queue) < self._feed_low_watermark:
+                self._feed_wanted.set()
+            return product
+        return None
 
-                cycle_duration = time.time() - cycle_start
-                logger.info(
-                    f"Cycle #{cycle_count} took {cycle_duration:.2f}s "
-                    f"({len(products)} products)"
-                )
+    async def _worker_loop(self, worker_index: int):
+        """Drain the priority queue one product at a time."""
+        while self._running:
+            breaker = get_kaspi_circuit_breaker()
+            if breaker.state == CircuitState.OPEN:
+                await self._wait_event(self._shutdown_event, 5)
+                continue
 
-            except Exception as e:
-                logger.error(f"Error in main loop cycle #{cycle_count}: {e}", exc_info=True)
+            product = await self._next_due_product()
+            if product is None:
+                break
 
-            # Wait before next cycle (or until shutdown)
+            product_id = product["id"]
+            self._in_flight.add(product_id)
+            started = time.monotonic()
+            result = "errors"
             try:
-                await asyncio.wait_for(
-                    self._shutdown_event.wait(),
-                    timeout=self.check_interval
-                )
-                # If we get here, shutdown was requested
-                break
-            except asyncio.TimeoutError:
-                # Normal timeout, continue to next cycle
-                pass
+                updated = await self.process_product(product)
+                result = "updated" if updated else "skipped"
+                self._stats[result] += 1
+            except asyncio.CancelledError:
+                result = "cancelled"
+                raise
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.error(f"Product processing error ({product_id}): {e}", exc_info=True)
+                self._defer_after_error(product)
+            finally:
+                self._in_flight.discard(product_id)
+                PRODUCT_SECONDS.labels(result=result).observe(time.monotonic() - started)
 
-    async def fetch_products_for_instance(self) -> List[Dict[str, Any]]:
+    async def fetch_products_for_instance(
+        self,
+        exclude_ids: Optional[List[UUID]] = None,
+        limit: int = 500,
+    ) -> List[Dict[str, Any]]:
         """
         Fetch products assigned to this worker instance.
 
-        Uses hash-based sharding: mod(abs(hashtext(id::text)), INSTANCE_COUNT) = INSTANCE_INDEX
+        Uses hash-based sharding: mod(shard_key, INSTANCE_COUNT) = INSTANCE_INDEX
+        (shard_key is the persisted mod(abs(hashtext(id::text)), 1024))
 
         Filters:
         - Only products with bot_active = true
         - Only stores that are active and don't need re-auth
         - Only within store's working hours
-        - Only products that haven't been checked within check_interval_minutes
+        - Only products that are due (or become due within the feed lookahead)
+        - Not already queued or in flight (exclude_ids)
+
+        Eligible stores are resolved first (kaspi_stores is small), then each
+        store's due products are read by a range scan on idx_products_demper_due
+        (store_id, next_check_at), at most `limit` per store. The per-user
+        merchant list is aggregated once per user, not per product row.
+
+        Args:
+            exclude_ids: Product IDs already held by the scheduler
+            limit: Max rows to return
 
         Returns:
-            List of product records
+            List of product records, each with a due_at epoch timestamp
         """
         pool = await get_db_pool()
 
         try:
             async with pool.acquire() as conn:
-                # Get current time in Almaty timezone (UTC+5 for Kazakhstan)
-                # Note: You might want to use proper timezone handling
                 query = """
+                    WITH eligible_stores AS (
+                        SELECT ks.id
+                        FROM kaspi_stores ks
+                        LEFT JOIN demping_settings ds ON ds.store_id = ks.id
+                        WHERE ks.is_active = TRUE
+                          AND ks.guid IS NOT NULL
+                          AND COALESCE(ks.needs_reauth, false) = FALSE
+                          AND COALESCE(ds.is_enabled, true) = TRUE
+                          -- Working hours in Almaty time (UTC+5)
+                          AND COALESCE(ds.work_hours_start, '00:00')::time <= (NOW() AT TIME ZONE 'Asia/Almaty')::time
+                          AND COALESCE(ds.work_hours_end, '23:59')::time >= (NOW() AT TIME ZONE 'Asia/Almaty')::time
+                    ),
+                    due AS (
+                        SELECT d.id, d.next_check_at
+                        FROM eligible_stores es
+                        CROSS JOIN LATERAL (
+                            SELECT p.id, p.next_check_at
+                            FROM products p
+                            WHERE p.store_id = es.id
+                              AND (p.bot_active = true OR p.delivery_demping_enabled = true)
+                              AND p.external_kaspi_id IS NOT NULL
+                              -- Due now or within the lookahead window ($3 seconds)
+                              AND p.next_check_at < NOW() + make_interval(secs => $3)
+                              AND mod(p.shard_key, $1) = $2
+                              AND NOT (p.id = ANY($4::uuid[]))
+                            ORDER BY p.next_check_at
+                            LIMIT $5
+                        ) d
+                        ORDER BY d.next_check_at
+                        LIMIT $5
+                    ),
+                    user_merchants AS (
+                        SELECT user_id, array_agg(merchant_id) AS merchant_ids
+                        FROM kaspi_stores
+                        WHERE is_active = TRUE AND merchant_id IS NOT NULL
+                        GROUP BY user_id
+                    )
                     SELECT
                         products.id,
                         products.store_id,
@@ -391,45 +611,27 @@ class DemperWorker:
                         COALESCE(ds.price_step, 1) as store_price_step,
                         COALESCE(ds.is_enabled, true) as demping_enabled,
                         COALESCE(ds.excluded_merchant_ids, '{}') as excluded_merchant_ids,
-                        ARRAY(
-                            SELECT ks2.merchant_id FROM kaspi_stores ks2
-                            WHERE ks2.user_id = kaspi_stores.user_id
-                              AND ks2.is_active = TRUE
-                              AND ks2.merchant_id IS NOT NULL
-                        ) as user_merchant_ids
-                    FROM products
+                        EXTRACT(EPOCH FROM due.next_check_at)::float8 as due_at,
+                        COALESCE(um.merchant_ids, '{}') as user_merchant_ids
+                    FROM due
+                    JOIN products ON products.id = due.id
                     JOIN kaspi_stores ON kaspi_stores.id = products.store_id
                     LEFT JOIN demping_settings ds ON ds.store_id = products.store_id
-                    WHERE (products.bot_active = TRUE OR products.delivery_demping_enabled = TRUE)
-                      AND kaspi_stores.is_active = TRUE
-                      AND kaspi_stores.guid IS NOT NULL
-                      AND products.external_kaspi_id IS NOT NULL
-                      AND COALESCE(kaspi_stores.needs_reauth, false) = FALSE
-                      AND COALESCE(ds.is_enabled, true) = TRUE
-                      AND (
-                          COALESCE(ds.work_hours_start, '00:00')::time <= (NOW() AT TIME ZONE 'Asia/Almaty')::time
-                          AND COALESCE(ds.work_hours_end, '23:59')::time >= (NOW() AT TIME ZONE 'Asia/Almaty')::time
-                      )
-                      -- Check if enough time passed since last check
-                      -- Priority products use $3 (3 min), others use store interval
-                      AND (
-                          products.last_check_time IS NULL
-                          OR products.last_check_time < NOW() - (
-                              CASE WHEN COALESCE(products.is_priority, false)
-                                  THEN ($3::text || ' minutes')::interval
-                                  ELSE (COALESCE(ds.check_interval_minutes, 15) || ' minutes')::interval
-                              END
-                          )
-                      )
-                      AND mod(abs(hashtext(products.id::text)), $1) = $2
-                    ORDER BY COALESCE(products.is_priority, false) DESC, products.last_check_time ASC NULLS FIRST
-                    LIMIT 500
+                    LEFT JOIN user_merchants um ON um.user_id = kaspi_stores.user_id
+                    ORDER BY due.next_check_at
                 """
 
-                rows = await conn.fetch(query, self.instance_count, self.instance_index, str(settings.priority_check_interval_minutes))
+                rows = await conn.fetch(
+                    query,
+                    self.instance_count,
+                    self.instance_index,
+                    float(settings.demper_feed_lookahead_seconds),
+                    exclude_ids or [],
+                    limit,
+                )
 
                 if rows:
-                    logger.info(
+                    logger.debug(
                         f"Found {len(rows)} products ready for checking "
                         f"(shard {self.instance_index}/{self.instance_count})"
                     )
@@ -504,306 +706,321 @@ class DemperWorker:
         Returns:
             True if successful, False otherwise
         """
-        async with self.semaphore:
-            product_id = product["id"]
-            sku = product["kaspi_sku"]
-            product_name = product.get("product_name") or sku
-            external_id = product["external_kaspi_id"]
-            current_price = Decimal(str(product["price"]))
-            merchant_id = product["merchant_id"]
-
-            # Skip if merchant is in pricefeed cooldown (30-min ban after 429)
-            if is_merchant_cooled_down(merchant_id):
-                logger.debug(f"[{sku}] Merchant {merchant_id} is in pricefeed cooldown, skipping")
-                return False
-
-            # Get price constraints from product-level or store-level settings
-            min_price = Decimal(str(product.get("min_price") or product.get("min_profit") or 0))
-            max_price = product.get("max_price")
-            if max_price:
-                max_price = Decimal(str(max_price))
+        product_id = product["id"]
+        sku = product["kaspi_sku"]
+        product_name = product.get("product_name") or sku
+        external_id = product["external_kaspi_id"]
+        current_price = Decimal(str(product["price"]))
+        merchant_id = product["merchant_id"]
 
-            # Get price step (product override or store default)
-            price_step = Decimal(str(product.get("price_step_override") or product.get("store_price_step") or 1))
+        # Skip if merchant is in pricefeed cooldown (30-min ban after 429)
+        if await is_merchant_cooled_down(merchant_id):
+            logger.debug(f"[{sku}] Merchant {merchant_id} is in pricefeed cooldown, skipping")
+            # Not due again before the cooldown ends (else the feed re-selects it at once)
+            self._defer_product(product, max(merchant_cooldown_remaining(merchant_id), self.MIN_DEFER_SECONDS))
+            return False
 
-            # Get strategy
-            strategy = product.get("demping_strategy") or "standard"
-            strategy_params = product.get("strategy_params") or {}
+        # Get price constraints from product-level or store-level settings
+        min_price = Decimal(str(product.get("min_price") or product.get("min_profit") or 0))
+        max_price = product.get("max_price")
+        if max_price:
+            max_price = Decimal(str(max_price))
 
-            # Get excluded merchant IDs (own stores that should not be considered as competitors)
-            excluded_merchant_ids = set(product.get("excluded_merchant_ids") or [])
-            # Auto-exclude ALL stores of the same user
-            excluded_merchant_ids.update(product.get("user_merchant_ids") or [])
-            excluded_merchant_ids.add(merchant_id)
+        # Get price step (product override or store default)
+        price_step = Decimal(str(product.get("price_step_override") or product.get("store_price_step") or 1))
 
-            session = None
-            try:
-                # Small random delay to avoid synchronized bursts
-                await asyncio.sleep(random.uniform(0.01, 0.1))
+        # Get strategy
+        strategy = product.get("demping_strategy") or "standard"
+        strategy_params = product.get("strategy_params") or {}
 
-                # Get session for this store (skip validation to avoid rate limiting)
-                session = await get_active_session_with_refresh(merchant_id, skip_validation=True)
-                if not session:
-                    logger.warning(f"[{sku}] No active session for merchant {merchant_id}")
-                    return False
-                logger.debug(f"[{sku}] Got session for merchant {merchant_id}")
+        # Get excluded merchant IDs (own stores that should not be considered as competitors)
+        excluded_merchant_ids = set(product.get("excluded_merchant_ids") or [])
+        # Auto-exclude ALL stores of the same user
+        excluded_merchant_ids.update(product.get("user_merchant_ids") or [])
+        excluded_merchant_ids.add(merchant_id)
 
-                # Check if product has multiple cities (PP→city mapping)
-                cities = self._get_product_cities(product)
-                if len(cities) > 1:
-                    return await self._process_product_cities(product, cities, session)
+        session = None
+        try:
+            # Small random delay to avoid synchronized bursts
+            await asyncio.sleep(random.uniform(0.01, 0.1))
+
+            # Get session for this store (skip validation to avoid rate limiting)
+            session = await get_active_session_with_refresh(merchant_id, skip_validation=True)
+            if not session:
+                logger.warning(f"[{sku}] No active session for merchant {merchant_id}")
+                self._defer_product(product, self._check_interval_minutes(product) * 60)
+                return False
+            logger.debug(f"[{sku}] Got session for merchant {merchant_id}")
+
+            # Check if product has multiple cities (PP→city mapping)
+            cities = self._get_product_cities(product)
+            if len(cities) > 1:
+                return await self._process_product_cities(product, cities, session)
+
+            # Single-city: use real city from store_points (not hardcoded Almaty)
+            single_city_id = cities[0]["city_id"] if cities else None
+
+            # Fetch competitor prices (with proxy rotation for module='demper')
+            user_id = product.get("user_id")
+            product_data = await parse_product_by_sku(
+                str(external_id),
+                session,
+                city_id=single_city_id,
+                user_id=user_id,
+                use_proxy=True,
+                module='demper',
+                max_age=self._offers_max_age(product)
+            )
 
-                # Single-city: use real city from store_points (not hardcoded Almaty)
-                single_city_id = cities[0]["city_id"] if cities else None
+            # Update last_check_time regardless of result
+            await self._update_last_check_time(product)
 
-                # Fetch competitor prices (with proxy rotation for module='demper')
-                user_id = product.get("user_id")
-                product_data = await parse_product_by_sku(
-                    str(external_id),
-                    session,
-                    city_id=single_city_id,
-                    user_id=user_id,
-                    use_proxy=True,
-                    module='demper'
-                )
-
-                # Update last_check_time regardless of result
-                await self._update_last_check_time(product_id)
+            if not product_data:
+                logger.debug(f"No competitor data for product {sku}")
+                return False
 
-                if not product_data:
-                    logger.debug(f"No competitor data for product {sku}")
-                    return False
+            # Extract offers from response
+            offers = product_data.get("offers", []) if isinstance(product_data, dict) else product_data
 
-                # Extract offers from response
-                offers = product_data.get("offers", []) if isinstance(product_data, dict) else product_data
+            if not offers or len(offers) == 0:
+                logger.debug(f"No offers found for product {sku}")
+                return False
 
-                if not offers or len(offers) == 0:
-                    logger.debug(f"No offers found for product {sku}")
-                    return False
+            # Log offers for debugging (only for specific merchant)
+            if merchant_id != '30391544' and len(offers) > 0:
+                logger.info(f"Found {len(offers)} offers for SKU {sku} (merchant {merchant_id})")
 
-                # Log offers for debugging (only for specific merchant)
-                if merchant_id != '30391544' and len(offers) > 0:
-                    logger.info(f"Found {len(offers)} offers for SKU {sku} (merchant {merchant_id})")
+            # Delivery demping: find our deliveryDuration and apply filter
+            is_delivery_demping = product.get("delivery_demping_enabled", False)
+            delivery_filter = product.get("delivery_filter", "same_or_faster")
+            our_delivery_duration = None
 
-                # Delivery demping: find our deliveryDuration and apply filter
-                is_delivery_demping = product.get("delivery_demping_enabled", False)
-                delivery_filter = product.get("delivery_filter", "same_or_faster")
-                our_delivery_duration = None
+            if is_delivery_demping:
+                # Find our own delivery duration from raw offers
+                for offer in offers:
+                    if offer.get("merchantId") == merchant_id:
+                        our_delivery_duration = offer.get("deliveryDuration")
+                        break
+                logger.info(
+                    f"[{sku}] Delivery demping: filter={delivery_filter}, "
+                    f"our_duration={our_delivery_duration}"
+                )
 
-                if is_delivery_demping:
-                    # Find our own delivery duration from raw offers
-                    for offer in offers:
-                        if offer.get("merchantId") == merchant_id:
-                            our_delivery_duration = offer.get("deliveryDuration")
-                            break
-                    logger.info(
-                        f"[{sku}] Delivery demping: filter={delivery_filter}, "
-                        f"our_duration={our_delivery_duration}"
-                    )
+            # Sort offers by price and find our position
+            # Mark offers as excluded if they belong to excluded_merchant_ids
+            # For delivery demping: also exclude offers that don't match delivery filter
+            sorted_offers = []
+            our_price = None
+            our_position = None
+            filtered_out_count = 0
+
+            for offer in offers:
+                offer_merchant_id = offer.get("merchantId")
+                offer_price = offer.get("price")
+                if offer_price is not None:
+                    is_ours = offer_merchant_id == merchant_id
+                    is_excluded = offer_merchant_id in excluded_merchant_ids
+
+                    # Delivery demping: filter competitors by delivery speed
+                    if is_delivery_demping and not is_ours and not is_excluded:
+                        if not _offer_passes_delivery_filter(offer, delivery_filter, our_delivery_duration):
+                            filtered_out_count += 1
+                            is_excluded = True  # Treat slow-delivery competitors as excluded
+
+                    sorted_offers.append({
+                        "merchant_id": offer_merchant_id,
+                        "price": Decimal(str(offer_price)),
+                        "is_ours": is_ours,
+                        "is_excluded": is_excluded
+                    })
+                    if is_ours:
+                        our_price = Decimal(str(offer_price))
+
+            if is_delivery_demping and filtered_out_count > 0:
+                logger.info(
+                    f"[{sku}] Delivery filter excluded {filtered_out_count} slow-delivery competitors"
+                )
 
-                # Sort offers by price and find our position
-                # Mark offers as excluded if they belong to excluded_merchant_ids
-                # For delivery demping: also exclude offers that don't match delivery filter
-                sorted_offers = []
-                our_price = None
-                our_position = None
-                filtered_out_count = 0
+            sorted_offers.sort(key=lambda x: x["price"])
 
-                for offer in offers:
-                    offer_merchant_id = offer.get("merchantId")
-                    offer_price = offer.get("price")
-                    if offer_price is not None:
-                        is_ours = offer_merchant_id == merchant_id
-                        is_excluded = offer_merchant_id in excluded_merchant_ids
+            # Find our position among ALL offers (including excluded)
+            for i, offer in enumerate(sorted_offers):
+                if offer["is_ours"]:
+                    our_position = i + 1
+                    break
 
-                        # Delivery demping: filter competitors by delivery speed
-                        if is_delivery_demping and not is_ours and not is_excluded:
-                            if not _offer_passes_delivery_filter(offer, delivery_filter, our_delivery_duration):
-                                filtered_out_count += 1
-                                is_excluded = True  # Treat slow-delivery competitors as excluded
-
-                        sorted_offers.append({
-                            "merchant_id": offer_merchant_id,
-                            "price": Decimal(str(offer_price)),
-                            "is_ours": is_ours,
-                            "is_excluded": is_excluded
-                        })
-                        if is_ours:
-                            our_price = Decimal(str(offer_price))
+            # Find minimum competitor price (excluding our own and excluded merchants)
+            min_competitor_price = None
+            for offer in sorted_offers:
+                if not offer["is_excluded"]:
+                    min_competitor_price = offer["price"]
+                    break
 
-                if is_delivery_demping and filtered_out_count > 0:
+            if min_competitor_price is None:
+                # No competitors — raise price to max_price if set
+                if max_price and current_price < max_price:
                     logger.info(
-                        f"[{sku}] Delivery filter excluded {filtered_out_count} slow-delivery competitors"
+                        f"No competitors for {sku}, raising price to max_price: "
+                        f"{current_price} → {max_price}"
                     )
-
-                sorted_offers.sort(key=lambda x: x["price"])
-
-                # Find our position among ALL offers (including excluded)
-                for i, offer in enumerate(sorted_offers):
-                    if offer["is_ours"]:
-                        our_position = i + 1
-                        break
-
-                # Find minimum competitor price (excluding our own and excluded merchants)
-                min_competitor_price = None
-                for offer in sorted_offers:
-                    if not offer["is_excluded"]:
-                        min_competitor_price = offer["price"]
-                        break
-
-                if min_competitor_price is None:
-                    # No competitors — raise price to max_price if set
-                    if max_price and current_price < max_price:
-                        logger.info(
-                            f"No competitors for {sku}, raising price to max_price: "
-                            f"{current_price} → {max_price}"
-                        )
-                        target_price = max_price
-                        pre_order_days = product.get("pre_order_days", 0) or 0
-                        sync_result = await sync_product(
-                            product_id=str(product_id),
+                    target_price = max_price
+                    pre_order_days = product.get("pre_order_days", 0) or 0
+                    sync_result = await sync_product(
+                        product_id=str(product_id),
+                        new_price=int(target_price),
+                        session=session,
+                        user_id=user_id,
+                        use_proxy=True,
+                        module='demper',
+                        pre_order_days=pre_order_days,
+                        update_db=False,
+                    )
+                    if sync_result and sync_result.get("success"):
+                        await self._update_product_price(product_id, int(target_price))
+                        await self._record_price_change(
+                            product_id=product_id,
+                            old_price=int(current_price),
                             new_price=int(target_price),
-                            sku=sku,
-                            merchant_id=merchant_id,
-                            pre_order_days=pre_order_days,
-                            module='demper',
+                            competitor_price=None,
+                            change_reason="no_competitors_raise_to_max",
                         )
-                        if sync_result:
-                            await self._update_product_price(product_id, int(target_price))
-                            await self._record_price_change(
-                                product_id=product_id,
-                                old_price=int(current_price),
-                                new_price=int(target_price),
-                                competitor_price=None,
-                                change_reason="no_competitors_raise_to_max",
-                            )
-                        return sync_result
-                    logger.debug(f"No competitor offers for product {sku} (all offers are from excluded merchants)")
+                        return True
                     return False
+                logger.debug(f"No competitor offers for product {sku} (all offers are from excluded merchants)")
+                return False
 
-                # Calculate target price based on strategy
-                target_price = self._calculate_target_price(
-                    strategy=strategy,
-                    strategy_params=strategy_params,
-                    current_price=current_price,
-                    min_competitor_price=min_competitor_price,
-                    sorted_offers=sorted_offers,
-                    our_position=our_position,
-                    price_step=price_step,
-                    merchant_id=merchant_id
-                )
+            # Calculate target price based on strategy
+            target_price = self._calculate_target_price(
+                strategy=strategy,
+                strategy_params=strategy_params,
+                current_price=current_price,
+                min_competitor_price=min_competitor_price,
+                sorted_offers=sorted_offers,
+                our_position=our_position,
+                price_step=price_step,
+                merchant_id=merchant_id
+            )
 
-                if target_price is None:
-                    logger.debug(f"No target price calculated for {sku}")
-                    return False
+            if target_price is None:
+                logger.debug(f"No target price calculated for {sku}")
+                return False
 
-                # Apply price constraints
-                # Kaspi не позволяет выставлять цену ниже 10 тенге
-                KASPI_MIN_PRICE = Decimal("10")
-                effective_min_price = max(min_price, KASPI_MIN_PRICE) if min_price > 0 else KASPI_MIN_PRICE
-
-                if target_price < effective_min_price:
-                    # Конкурент ниже нашего минимума - ждём, не меняем цену
-                    # Но если мы сами выше min_price, остаёмся на min_price
-                    if current_price > effective_min_price:
-                        target_price = effective_min_price
-                        logger.debug(
-                            f"Target price for {sku} adjusted to min_price: {target_price} "
-                            f"(competitor below our min)"
-                        )
-                    else:
-                        # Мы уже на минимуме или ниже, ждём повышения конкурента
-                        logger.debug(
-                            f"Competitor price for {sku} is below our min_price, waiting..."
-                        )
-                        # Notify user that min price was reached
-                        try:
-                            pool = await get_db_pool()
-                            prefs = await get_user_notification_settings(pool, user_id)
-                            if prefs.get("price_changes", True):
-                                await notify_min_price_reached(
-                                    pool, user_id, product_name,
-                                    int(effective_min_price), product_id
-                                )
-                        except Exception as notif_err:
-                            logger.warning(f"Failed to send min_price notification: {notif_err}")
-                        return False
+            # Apply price constraints
+            # Kaspi не позволяет выставлять цену ниже 10 тенге
+            KASPI_MIN_PRICE = Decimal("10")
+            effective_min_price = max(min_price, KASPI_MIN_PRICE) if min_price > 0 else KASPI_MIN_PRICE
 
-                if max_price and target_price > max_price:
-                    target_price = max_price
+            if target_price < effective_min_price:
+                # Конкурент ниже нашего минимума - ждём, не меняем цену
+                # Но если мы сами выше min_price, остаёмся на min_price
+                if current_price > effective_min_price:
+                    target_price = effective_min_price
                     logger.debug(
-                        f"Target price for {sku} capped at max_price: {target_price}"
+                        f"Target price for {sku} adjusted to min_price: {target_price} "
+                        f"(competitor below our min)"
                     )
-
-                # Only update if price changed
-                if target_price == current_price:
-                    logger.debug(f"No price change needed for {sku}: already at {current_price}")
+                else:
+                    # Мы уже на минимуме или ниже, ждём повышения конкурента
+                    logger.debug(
+                        f"Competitor price for {sku} is below our min_price, waiting..."
+                    )
+                    # Notify user that min price was reached
+                    try:
+                        pool = await get_db_pool()
+                        prefs = await get_user_notification_settings(pool, user_id)
+                        if prefs.get("price_changes", True):
+                            await notify_min_price_reached(
+                                pool, user_id, product_name,
+                                int(effective_min_price), product_id
+                            )
+                    except Exception as notif_err:
+                        logger.warning(f"Failed to send min_price notification: {notif_err}")
                     return False
 
-                # Update price via Kaspi API (with proxy rotation for module='demper')
-                pre_order_days = product.get("pre_order_days", 0) or 0
-                sync_result = await sync_product(
-                    product_id=str(product_id),
-                    new_price=int(target_price),
-                    session=session,
-                    user_id=user_id,
-                    use_proxy=True,
-                    module='demper',
-                    pre_order_days=pre_order_days
+            if max_price and target_price > max_price:
+                target_price = max_price
+                logger.debug(
+                    f"Target price for {sku} capped at max_price: {target_price}"
                 )
 
-                if not sync_result or not sync_result.get("success"):
-                    logger.error(f"[{sku}] Failed to sync price: {sync_result}")
-                    return False
+            # Only update if price changed
+            if target_price == current_price:
+                logger.debug(f"No price change needed for {sku}: already at {current_price}")
+                return False
 
-                logger.info(f"[{sku}] sync_product success")
+            # Update price via Kaspi API (with proxy rotation for module='demper')
+            pre_order_days = product.get("pre_order_days", 0) or 0
+            sync_result = await sync_product(
+                product_id=str(product_id),
+                new_price=int(target_price),
+                session=session,
+                user_id=user_id,
+                use_proxy=True,
+                module='demper',
+                pre_order_days=pre_order_days,
+                update_db=False,
+            )
 
-                # Explicitly update price in DB (backup in case sync_product didn't)
-                await self._update_product_price(product_id, int(target_price))
+            if not sync_result or not sync_result.get("success"):
+                logger.error(f"[{sku}] Failed to sync price: {sync_result}")
+                return False
 
-                # Record price change to history
-                reason_prefix = "delivery_demper" if is_delivery_demping else "demper"
-                await self._record_price_change(
-                    product_id=product_id,
-                    old_price=int(current_price),
-                    new_price=int(target_price),
-                    competitor_price=int(min_competitor_price),
-                    change_reason=f"{reason_prefix}_{strategy}"
-                )
+            logger.info(f"[{sku}] sync_product success")
 
-                mode_label = f"Delivery[{delivery_filter}]" if is_delivery_demping else f"[{strategy}]"
-                logger.info(
-                    f"✓ Demper {mode_label}: Updated {sku} from {current_price} to {target_price} "
-                    f"(competitor: {min_competitor_price})"
-                )
+            # Update price in DB (buffered, sync_product skipped it)
+            await self._update_product_price(product_id, int(target_price))
 
-                # Notify user about price change
-                try:
-                    pool = await get_db_pool()
-                    prefs = await get_user_notification_settings(pool, user_id)
-                    if prefs.get("price_changes", True):
-                        await notify_price_changed(
-                            pool, user_id, product_name,
-                            int(current_price), int(target_price), product_id
-                        )
-                except Exception as notif_err:
-                    logger.warning(f"Failed to send price_changed notification: {notif_err}")
+            # Record price change to history
+            reason_prefix = "delivery_demper" if is_delivery_demping else "demper"
+            await self._record_price_change(
+                product_id=product_id,
+                old_price=int(current_price),
+                new_price=int(target_price),
+                competitor_price=int(min_competitor_price),
+                change_reason=f"{reason_prefix}_{strategy}"
+            )
 
-                return True
+            mode_label = f"Delivery[{delivery_filter}]" if is_delivery_demping else f"[{strategy}]"
+            logger.info(
+                f"✓ Demper {mode_label}: Updated {sku} from {current_price} to {target_price} "
+                f"(competitor: {min_competitor_price})"
+            )
 
-            except Exception as e:
-                logger.error(f"Error processing product {sku}: {e}", exc_info=True)
-                return False
-            finally:
-                # City-based demping (runs regardless of main result)
-                try:
-                    if session:
-                        await self._process_city_prices(product, session)
-                except Exception as city_err:
-                    logger.error(f"[{sku}] City prices error: {city_err}", exc_info=True)
+            # Notify user about price change
+            try:
+                pool = await get_db_pool()
+                prefs = await get_user_notification_settings(pool, user_id)
+                if prefs.get("price_changes", True):
+                    await notify_price_changed(
+                        pool, user_id, product_name,
+                        int(current_price), int(target_price), product_id
+                    )
+            except Exception as notif_err:
+                logger.warning(f"Failed to send price_changed notification: {notif_err}")
+
+            return True
 
-                # Random delay between product processing
-                await asyncio.sleep(random.uniform(0.1, 0.3))
+        except Exception as e:
+            logger.error(f"Error processing product {sku}: {e}", exc_info=True)
+            self._defer_after_error(product)
+            return False
+        finally:
+            # City-based demping (runs regardless of main result)
+            try:
+                if session:
+                    await self._process_city_prices(product, session)
+            except Exception as city_err:
+                logger.error(f"[{sku}] City prices error: {city_err}", exc_info=True)
+
+            # Random delay between product processing
+            await asyncio.sleep(random.uniform(0.1, 0.3))
+
+    @staticmethod
+    def _offers_max_age(product: Dict[str, Any]) -> float:
+        """Max acceptable age of cached offers for this product."""
+        if product.get("is_priority"):
+            return settings.offers_cache_priority_ttl_seconds
+        return settings.offers_cache_ttl_seconds
 
     def _get_product_cities(self, product: Dict[str, Any]) -> List[Dict]:
         """Get cities where product is available, based on store_points PP→city mapping.
@@ -893,6 +1110,7 @@ class DemperWorker:
 
         city_target_prices: Dict[str, int] = {}
         any_change = False
+        city_errors = 0
 
         for city_info in cities:
             city_id = city_info["city_id"]
@@ -922,7 +1140,8 @@ class DemperWorker:
                     user_id=user_id,
                     use_proxy=True,
                     module='demper',
-                    city_id=city_id
+                    city_id=city_id,
+                    max_age=self._offers_max_age(product)
                 )
 
                 if not product_data:
@@ -1024,10 +1243,16 @@ class DemperWorker:
 
             except Exception as e:
                 logger.error(f"[{sku}] Error processing city {city_name}: {e}", exc_info=True)
+                city_errors += 1
                 continue
 
+        if city_errors and not city_target_prices:
+            # Every city raised: nothing was checked, back off like a failed product
+            self._defer_after_error(product)
+            return False
+
         # Update last_check_time regardless
-        await self._update_last_check_time(product_id)
+        await self._update_last_check_time(product)
 
         if not city_target_prices:
             logger.debug(f"[{sku}] No city prices calculated")
@@ -1157,7 +1382,8 @@ class DemperWorker:
                             city_id=city_id,
                             user_id=user_id,
                             use_proxy=True,
-                            module='demper'
+                            module='demper',
+                            max_age=self._offers_max_age(product)
                         )
 
                         if not product_data:
@@ -1229,7 +1455,7 @@ class DemperWorker:
 
                 # Batched sync with ALL city prices
                 if any_change:
-                    if is_merchant_cooled_down(merchant_id):
+                    if await is_merchant_cooled_down(merchant_id):
                         logger.debug(f"[{sku}] Merchant in pricefeed cooldown, skipping city sync")
                         return
 
@@ -1340,40 +1566,51 @@ class DemperWorker:
             logger.warning(f"Unknown strategy: {strategy}, using standard")
             return min_competitor_price - price_step
 
-    async def _update_last_check_time(self, product_id: UUID):
-        """Update last_check_time for a product."""
-        pool = await get_db_pool()
+    @staticmethod
+    def _check_interval_minutes(product: Dict[str, Any]) -> int:
+        if product.get("is_priority"):
+            return settings.priority_check_interval_minutes
+        return product.get("check_interval_minutes") or 15
 
-        try:
-            async with pool.acquire() as conn:
-                await conn.execute(
-                    "UPDATE products SET last_check_time = NOW() WHERE id = $1",
-                    product_id
-                )
-        except Exception as e:
-            logger.error(f"Error updating last_check_time: {e}", exc_info=True)
+    async def _update_last_check_time(self, product: Dict[str, Any]):
+        """
+        Queue last_check_time = NOW() and the next due time for a product
+        (written by the write buffer).
+        """
+        self._error_counts.pop(product["id"], None)
+        checked_at = datetime.now(timezone.utc)
+        self.write_buffer.mark_checked(
+            product["id"],
+            next_check_at=checked_at + timedelta(minutes=self._check_interval_minutes(product)),
+            checked_at=checked_at,
+        )
 
-    async def _update_product_price(self, product_id: UUID, new_price: int):
+    def _defer_product(self, product: Dict[str, Any], seconds: float):
+        """Product skipped without a check: queue it as due again in `seconds`."""
+        self.write_buffer.defer(
+            product["id"],
+            next_check_at=datetime.now(timezone.utc) + timedelta(seconds=seconds),
+        )
+
+    def _defer_after_error(self, product: Dict[str, Any]):
         """
-        Update product price in database.
+        Processing raised: back off before the next attempt (else the feed
+        re-selects the still-due product on every pass).
+        """
+        errors = self._error_counts.get(product["id"], 0) + 1
+        self._error_counts[product["id"]] = errors
+        seconds = min(self.MIN_DEFER_SECONDS * 2 ** (errors - 1), self.MAX_ERROR_DEFER_SECONDS)
+        self._defer_product(product, seconds)
 
-        This is a backup update in case sync_product didn't update the DB.
+    async def _update_product_price(self, product_id: UUID, new_price: int):
+        """
+        Queue product price update in database (written by the write buffer).
 
         Args:
             product_id: Product UUID
             new_price: New price in tenge (KZT)
         """
-        pool = await get_db_pool()
-
-        try:
-            async with pool.acquire() as conn:
-                await conn.execute(
-                    "UPDATE products SET price = $1, updated_at = NOW() WHERE id = $2",
-                    new_price,
-                    product_id
-                )
-        except Exception as e:
-            logger.error(f"Error updating product price: {e}", exc_info=True)
+        self.write_buffer.set_price(product_id, new_price)
 
     async def _record_price_change(
         self,
@@ -1384,7 +1621,7 @@ class DemperWorker:
         change_reason: str
     ):
         """
-        Record price change to price_history table.
+        Queue price change for the price_history table (written by the write buffer).
 
         Args:
             product_id: Product UUID
@@ -1393,27 +1630,10 @@ class DemperWorker:
             competitor_price: Competitor price that triggered change (в тенге KZT)
             change_reason: Reason for change (e.g., "demper", "manual")
         """
-        pool = await get_db_pool()
-
-        try:
-            async with pool.acquire() as conn:
-                await conn.execute(
-                    """
-                    INSERT INTO price_history (
-                        id, product_id, old_price, new_price,
-                        competitor_price, change_reason, created_at
-                    )
-                    VALUES (gen_random_uuid(), $1, $2, $3, $4, $5, NOW())
-                    """,
-                    product_id,
-                    old_price,
-                    new_price,
-                    competitor_price,
-                    change_reason
-                )
-                logger.info(f"Recorded price history: {old_price} → {new_price} (reason: {change_reason})")
-        except Exception as e:
-            logger.error(f"Error recording price change for product {product_id}: {e}", exc_info=True)
+        self.write_buffer.record_price_change(
+            product_id, old_price, new_price, competitor_price, change_reason
+        )
+        logger.info(f"Recorded price history: {old_price} → {new_price} (reason: {change_reason})")
 
 
 # ============================================================================
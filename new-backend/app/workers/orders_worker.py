@@ -1,480 +1,305 @@
 """
-Orders Worker - автоматический мониторинг заказов Kaspi и отправка WhatsApp
+Orders Worker - шардированный движок синхронизации заказов Kaspi
 
 Функции:
-- Опрос Kaspi API для получения новых/обновлённых заказов
-- Отслеживание изменений статусов
-- Автоматическая отправка WhatsApp сообщений по событиям
-- Парсинг номеров телефонов из Kaspi MC
+- Синхронизация заказов через Kaspi REST API (X-Auth-Token), инкрементально
+  по orders_sync_state (см. orders_sync_service)
+- Отслеживание изменений статусов (order_status_history)
+- Доставка событий заказов (уведомления, WhatsApp) из order_events_outbox
+  (OrderEventsDispatcher), отдельно от синхронизации
+
+Архитектура:
+    - Магазины шардируются по процессам так же, как товары в демпере:
+      mod(abs(hashtext(store_id::text)), ORDERS_INSTANCE_COUNT) = ORDERS_INSTANCE_INDEX
+    - У каждого магазина свой адаптивный интервал опроса (orders_sync_state.next_poll_at):
+      магазины с изменениями опрашиваются чаще, простаивающие - реже
+    - До orders_max_concurrent_stores магазинов синхронизируются параллельно,
+      свободный слот сразу забирает следующий магазин, у которого подошло время
+
+FastAPI-процесс заказы не синхронизирует, только обслуживает HTTP.
 
 Запуск:
     $ python -m app.workers.orders_worker
 
-Или с переменными окружения:
-    $ ORDERS_POLLING_INTERVAL=60 python -m app.workers.orders_worker
+Или с переменными окружения (4 шарда):
+    $ ORDERS_INSTANCE_INDEX=0 ORDERS_INSTANCE_COUNT=4 python -m app.workers.orders_worker
 """
 
 import asyncio
 import logging
 import signal
 import sys
-import os
-from datetime import datetime, timedelta
+import time
 from typing import Optional, List, Dict, Any
 from uuid import UUID
 
 from ..config import settings
 from ..core.database import get_db_pool, close_pool
-from ..core.proxy_rotator import get_user_proxy_rotator, NoProxiesAllocatedError, NoProxiesAvailableError
-from ..services.kaspi_auth_service import get_active_session_with_refresh, KaspiAuthError
-from ..services.kaspi_mc_service import get_kaspi_mc_service, KaspiMCError
-from ..services.kaspi_orders_api import get_kaspi_orders_api, KaspiTokenInvalidError
-from ..services.order_event_processor import (
-    get_order_event_processor,
-    OrderEvent,
-    KASPI_STATE_TO_EVENT,
+from ..core.http_client import close_http_client
+from ..core.proxy_stats_journal import close_proxy_stats_journal
+from ..core.metrics import MetricsExporter, get_metrics
+from ..services.kaspi_orders_api import (
+    get_kaspi_orders_api,
+    KaspiTokenInvalidError,
+    KaspiOrdersAPIError,
+)
+from ..services.order_events_dispatcher import OrderEventsDispatcher
+from ..services.orders_sync_service import (
+    load_sync_state,
+    save_sync_state,
+    schedule_next_poll,
+    next_poll_interval,
+    sync_store_orders,
 )
 
 logger = logging.getLogger(__name__)
 
-
-# Kaspi API order states
-KASPI_ORDER_STATES = [
-    "APPROVED",  # Оплачен
-    "ACCEPTED_BY_MERCHANT",  # Принят продавцом
-    "DELIVERY",  # В доставке
-    "DELIVERED",  # Доставлен
-    "COMPLETED",  # Завершён
-    "CANCELLED",  # Отменён
-    "CANCELLING",  # Отменяется
-    "RETURNED",  # Возврат
-]
+STORE_SYNC_SECONDS = get_metrics().histogram(
+    "orders_store_sync_seconds",
+    "Time to sync the orders of one store",
+    ["result"],
+)
 
 
 class OrdersWorker:
     """
-    Воркер для мониторинга заказов и отправки WhatsApp уведомлений.
+    Движок синхронизации заказов одного шарда.
 
-    Опрашивает Kaspi API каждые N секунд, отслеживает изменения статусов
-    и триггерит отправку WhatsApp сообщений через order_event_processor.
+    Выбирает из БД магазины своего шарда, у которых подошло время опроса,
+    синхронизирует их параллельно и планирует следующий опрос каждого
+    магазина по его активности.
     """
 
+    # Seconds between polls of the due-stores query while slots are free
+    CHECK_INTERVAL = 5
+    # Max seconds to let in-flight stores finish on shutdown
+    DRAIN_TIMEOUT = 30
+
     def __init__(
         self,
-        polling_interval: int = 600,  # ✅ Changed from 60s to 600s (10 minutes) for proxy pool
-        batch_size: int = 50,
+        instance_index: Optional[int] = None,
+        instance_count: Optional[int] = None,
+        max_concurrent_stores: Optional[int] = None,
     ):
         """
         Args:
-            polling_interval: Интервал опроса в секундах (по умолчанию 600 = 10 минут)
-            batch_size: Количество заказов за один запрос (по умолчанию 50)
+            instance_index: Индекс шарда (0..instance_count-1), по умолчанию settings.orders_instance_index
+            instance_count: Количество шардов, по умолчанию settings.orders_instance_count
+            max_concurrent_stores: Магазинов параллельно, по умолчанию settings.orders_max_concurrent_stores
         """
-        self.polling_interval = int(os.getenv("ORDERS_POLLING_INTERVAL", polling_interval))
-        self.batch_size = batch_size
+        self.instance_index = instance_index if instance_index is not None else settings.orders_instance_index
+        self.instance_count = instance_count if instance_count is not None else settings.orders_instance_count
+        self.max_concurrent_stores = (
+            max_concurrent_stores if max_concurrent_stores is not None
+            else settings.orders_max_concurrent_stores
+        )
+
+        if self.instance_index >= self.instance_count:
+            raise ValueError(
+                f"orders_instance_index ({self.instance_index}) must be less than "
+                f"orders_instance_count ({self.instance_count})"
+            )
+
         self._running = False
         self._pool = None
-        self._event_processor = None
-        self._mc_service = None
+        self._wakeup = asyncio.Event()
+        self._in_flight: Dict[UUID, asyncio.Task] = {}
+        self._stats = {"synced": 0, "stores": 0, "errors": 0}
+
+        # Slow WAHA sends never hold up a store's sync
+        self._events_dispatcher = OrderEventsDispatcher()
+
+        metrics = get_metrics()
+        metrics.gauge("orders_stores_in_flight", "Stores being synced",
+                      callback=lambda: {(): len(self._in_flight)})
+        self._metrics_exporter = MetricsExporter(
+            instance=f"orders-{self.instance_index}",
+            port=settings.orders_metrics_port + self.instance_index if settings.orders_metrics_port else 0,
+            publish_interval=settings.metrics_publish_interval_seconds,
+        )
 
     async def start(self):
         """Запустить воркер"""
-        logger.info(f"Starting Orders Worker (polling interval: {self.polling_interval}s)")
+        logger.info(
+            f"Starting Orders Worker: shard {self.instance_index}/{self.instance_count}, "
+            f"max_concurrent_stores={self.max_concurrent_stores}, "
+            f"poll {settings.orders_poll_min_seconds}-{settings.orders_poll_max_seconds}s"
+        )
 
         self._running = True
         self._pool = await get_db_pool()
-        self._event_processor = get_order_event_processor()
-        self._mc_service = get_kaspi_mc_service()
+        await self._metrics_exporter.start()
+        await self._events_dispatcher.start(self._pool)
 
         # Setup signal handlers
+        loop = asyncio.get_running_loop()
         for sig in (signal.SIGTERM, signal.SIGINT):
-            asyncio.get_event_loop().add_signal_handler(
-                sig, lambda: asyncio.create_task(self.stop())
-            )
+            loop.add_signal_handler(sig, self.stop)
 
         try:
-            while self._running:
-                try:
-                    await self._poll_all_stores()
-                except Exception as e:
-                    logger.error(f"Error in polling cycle: {e}", exc_info=True)
-
-                # Wait for next cycle
-                await asyncio.sleep(self.polling_interval)
-
+            await self._main_loop()
         except asyncio.CancelledError:
             logger.info("Worker cancelled")
         finally:
-            await self.stop()
+            await self._shutdown()
 
-    async def stop(self):
-        """Остановить воркер"""
+    def stop(self):
+        """Остановить воркер (текущие магазины дорабатывают до DRAIN_TIMEOUT)"""
         logger.info("Stopping Orders Worker...")
         self._running = False
+        self._wakeup.set()
+
+    async def _shutdown(self):
+        if self._in_flight:
+            logger.info(f"Waiting for {len(self._in_flight)} stores to finish...")
+            _, pending = await asyncio.wait(list(self._in_flight.values()), timeout=self.DRAIN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        await self._events_dispatcher.stop()
+        await self._metrics_exporter.stop()
+        await close_http_client()
+        await close_proxy_stats_journal()
         await close_pool()
+        logger.info("Orders Worker stopped")
 
-    async def _poll_all_stores(self):
-        """Опросить все активные магазины"""
-        async with self._pool.acquire() as conn:
-            # Получаем магазины с включенным опросом заказов
-            stores = await conn.fetch("""
-                SELECT
-                    s.id, s.user_id, s.merchant_id, s.name,
-                    s.orders_polling_interval_seconds,
-                    s.last_orders_sync,
-                    s.api_key, s.api_key_valid
-                FROM kaspi_stores s
-                WHERE s.is_active = TRUE
-                AND s.orders_polling_enabled = TRUE
-            """)
+    # Seconds between stats lines
+    STATS_LOG_INTERVAL = 300
 
-            if not stores:
-                logger.debug("No stores with orders polling enabled")
-                return
+    async def _main_loop(self):
+        """Fill free slots with due stores until stopped."""
+        last_stats = time.monotonic()
 
-            logger.info(f"Polling {len(stores)} stores for orders")
-
-            for store in stores:
+        while self._running:
+            free = self.max_concurrent_stores - len(self._in_flight)
+            if free > 0:
                 try:
-                    await self._poll_store_orders(store, conn)
+                    stores = await self._fetch_due_stores(free)
                 except Exception as e:
-                    logger.error(f"Error polling store {store['name']}: {e}")
-
-    async def _poll_store_orders(self, store: dict, conn):
-        """Опросить заказы одного магазина"""
-        store_id = store['id']
-        user_id = store['user_id']
-        merchant_id = store['merchant_id']
-
-        logger.debug(f"Polling orders for store: {store['name']}")
-
-        orders = None
-        api_key = store.get('api_key')
-        api_key_valid = store.get('api_key_valid', True)
-
-        # Strategy 1: REST API with X-Auth-Token (returns real phone numbers)
-        if api_key and api_key_valid:
-            try:
-                orders_api = get_kaspi_orders_api()
-                now = datetime.utcnow()
-                orders = await orders_api.fetch_orders(
-                    api_token=api_key,
-                    date_from=now - timedelta(days=7),
-                    date_to=now,
-                    states=KASPI_ORDER_STATES[:6],
-                    size=self.batch_size,
-                )
-                logger.info(f"Fetched {len(orders)} orders via REST API for {store['name']}")
-            except KaspiTokenInvalidError:
-                logger.warning(f"API token invalid for store {store['name']}, marking as invalid")
-                async with self._pool.acquire() as mark_conn:
-                    await mark_conn.execute(
-                        "UPDATE kaspi_stores SET api_key_valid = FALSE WHERE id = $1",
-                        store_id
+                    logger.error(f"Error fetching due stores: {e}", exc_info=True)
+                    stores = []
+                for store in stores:
+                    self._in_flight[store['id']] = asyncio.create_task(
+                        self._run_store(store), name=f"orders-store-{store['id']}"
                     )
-                orders = None
-            except Exception as e:
-                logger.warning(f"REST API failed for store {store['name']}: {e}")
-                orders = None
-
-        # Strategy 2: Fallback to cookies-based API (legacy, masked phones since Feb 5 2026)
-        if orders is None:
-            try:
-                session = await get_active_session_with_refresh(
-                    str(user_id), str(store_id), self._pool
-                )
-            except KaspiAuthError as e:
-                logger.warning(f"No active session for store {store['name']}: {e}")
-                return
-
-            if not session:
-                logger.warning(f"No session for store {store['name']}")
-                return
 
-            try:
-                orders = await self._fetch_kaspi_orders(
-                    session,
-                    merchant_id,
-                    user_id=user_id
+            if time.monotonic() - last_stats >= self.STATS_LOG_INTERVAL:
+                logger.info(
+                    f"Orders shard {self.instance_index}/{self.instance_count}: "
+                    f"{self._stats['stores']} stores synced, {self._stats['synced']} orders written, "
+                    f"{self._stats['errors']} errors, {len(self._in_flight)} in flight"
                 )
-            except Exception as e:
-                logger.error(f"Error fetching orders from Kaspi: {e}")
-                return
-
-        if not orders:
-            logger.debug(f"No orders for store {store['name']}")
-            return
+                self._stats = {"synced": 0, "stores": 0, "errors": 0}
+                last_stats = time.monotonic()
 
-        logger.info(f"Processing {len(orders)} orders for {store['name']}")
-
-        # Обрабатываем каждый заказ
-        for order_data in orders:
+            # A finished store frees a slot; otherwise look for due stores again shortly
+            self._wakeup.clear()
             try:
-                await self._process_order(store, order_data, conn)
-            except Exception as e:
-                logger.error(f"Error processing order {order_data.get('code')}: {e}")
-
-        # Обновляем время последней синхронизации
-        await conn.execute(
-            "UPDATE kaspi_stores SET last_orders_sync = NOW() WHERE id = $1",
-            store_id
-        )
-
-    async def _fetch_kaspi_orders(
-        self,
-        session: dict,
-        merchant_id: str,
-        user_id: Optional[UUID] = None,
-        days_back: int = 7,
-    ) -> List[Dict[str, Any]]:
-        """
-        Получить заказы из Kaspi API.
-
-        Использует /v2/orders endpoint с фильтром по дате.
-        С поддержкой proxy rotation для module='orders'.
-        """
-        import httpx
-
-        # Format cookies for request
-        cookies = session.get('cookies', [])
-        if isinstance(cookies, list):
-            cookies_dict = {c.get('name', ''): c.get('value', '') for c in cookies if isinstance(c, dict)}
-        else:
-            cookies_dict = cookies or {}
-
-        # Calculate date range
-        date_to = datetime.utcnow()
-        date_from = date_to - timedelta(days=days_back)
-
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-        }
-
-        # Kaspi API endpoint
-        url = f"https://kaspi.kz/shop/api/v2/orders"
-        params = {
-            "filter[orders][state]": ",".join(KASPI_ORDER_STATES[:6]),  # Active states
-            "filter[orders][creationDate][$gte]": date_from.strftime("%Y-%m-%d"),
-            "filter[orders][creationDate][$lte]": date_to.strftime("%Y-%m-%d"),
-            "page[number]": 0,
-            "page[size]": self.batch_size,
-        }
-
-        # Get proxy rotator for orders module
-        rotator = None
-        proxy_url = None
-        use_proxy = user_id is not None
-
-        if use_proxy:
-            try:
-                rotator = await get_user_proxy_rotator(user_id, module='orders')
-                proxy = await rotator.get_current_proxy()
-                proxy_url = f"{proxy.protocol}://{proxy.username}:{proxy.password}@{proxy.host}:{proxy.port}"
-                logger.debug(f"Using proxy {proxy.id} for orders (merchant {merchant_id})")
-            except (NoProxiesAllocatedError, NoProxiesAvailableError) as e:
-                logger.warning(f"No proxies available for user {user_id}, module 'orders': {e}")
-                use_proxy = False
-
-        try:
-            # Create HTTP client with or without proxy
-            if use_proxy and proxy_url:
-                client = httpx.AsyncClient(
-                    timeout=30.0,
-                    cookies=cookies_dict,
-                    proxies={"http://": proxy_url, "https://": proxy_url}
-                )
-            else:
-                client = httpx.AsyncClient(timeout=30.0, cookies=cookies_dict)
-
-            async with client:
-                response = await client.get(url, headers=headers, params=params)
-
-                if response.status_code == 401:
-                    if rotator:
-                        await rotator.record_request(success=False)
-                    raise KaspiAuthError("Session expired")
-
-                if response.status_code != 200:
-                    logger.warning(f"Kaspi API error: {response.status_code}")
-                    if rotator:
-                        await rotator.record_request(success=False)
-                    return []
-
-                data = response.json()
-
-                # ✅ Record successful request with proxy
-                if rotator:
-                    await rotator.record_request(success=True)
-
-                return data.get("data", [])
-
-        except httpx.RequestError as e:
-            logger.error(f"Network error fetching orders: {e}")
-            if rotator:
-                await rotator.record_request(success=False)
-            return []
-
-    async def _process_order(self, store: dict, order_data: dict, conn):
-        """Обработать один заказ - проверить изменение статуса и отправить WA"""
-        kaspi_order_id = order_data.get("id")
-        order_code = order_data.get("attributes", {}).get("code") or order_data.get("code")
-        new_status = order_data.get("attributes", {}).get("state") or order_data.get("state")
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
 
-        if not order_code or not new_status:
-            return
+    async def _fetch_due_stores(self, limit: int) -> List[Dict[str, Any]]:
+        """Stores of this shard whose next poll is due, longest overdue first."""
+        async with self._pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT
+                    s.id, s.user_id, s.merchant_id, s.name, s.api_key,
+                    COALESCE(s.orders_polling_enabled, FALSE) AS polling_enabled,
+                    st.poll_interval_seconds
+                FROM kaspi_stores s
+                LEFT JOIN orders_sync_state st ON st.store_id = s.id
+                WHERE s.is_active = TRUE
+                  AND s.needs_reauth = FALSE
+                  AND s.guid IS NOT NULL
+                  AND s.merchant_id IS NOT NULL
+                  AND s.api_key IS NOT NULL
+                  AND COALESCE(s.api_key_valid, TRUE) = TRUE
+                  AND mod(abs(hashtext(s.id::text)), $1) = $2
+                  AND (st.next_poll_at IS NULL OR st.next_poll_at <= NOW())
+                  AND NOT (s.id = ANY($3::uuid[]))
+                ORDER BY st.next_poll_at ASC NULLS FIRST
+                LIMIT $4
+                """,
+                self.instance_count,
+                self.instance_index,
+                list(self._in_flight),
+                limit,
+            )
 
+    async def _run_store(self, store: dict):
+        """Sync one store and schedule its next poll."""
         store_id = store['id']
-        user_id = store['user_id']
-
-        # Проверяем существующий заказ в БД
-        existing = await conn.fetchrow("""
-            SELECT id, status, customer_phone,
-                   wa_approved_sent_at, wa_shipped_sent_at,
-                   wa_delivered_sent_at, wa_completed_sent_at
-            FROM orders
-            WHERE store_id = $1 AND (kaspi_order_id = $2 OR kaspi_order_code = $3)
-        """, store_id, kaspi_order_id, order_code)
-
-        if existing:
-            old_status = existing['status']
-            order_id = existing['id']
-
-            # Если статус изменился
-            if old_status != new_status:
-                logger.info(f"Order {order_code}: {old_status} -> {new_status}")
-
-                # Обновляем статус в БД
-                await conn.execute("""
-                    UPDATE orders
-                    SET status = $1, previous_status = $2, status_changed_at = NOW(), updated_at = NOW()
-                    WHERE id = $3
-                """, new_status, old_status, order_id)
-
-                # Записываем в историю
-                await conn.execute("""
-                    INSERT INTO order_status_history (order_id, old_status, new_status)
-                    VALUES ($1, $2, $3)
-                """, order_id, old_status, new_status)
-
-                # Триггерим WhatsApp если ещё не отправляли
-                await self._trigger_whatsapp_if_needed(
-                    store, order_code, new_status, existing, conn
-                )
-        else:
-            # Новый заказ - создаём запись
-            await self._create_order_record(store, order_data, conn)
-
-            # Триггерим WhatsApp для нового заказа
-            if new_status == "APPROVED":
-                await self._trigger_whatsapp_for_event(
-                    store, order_code, OrderEvent.ORDER_APPROVED, conn
-                )
+        store_name = store['name'] or store['merchant_id']
+        # api_key может быть строкой или dict (asyncpg quirk)
+        api_key = str(store['api_key'])
+        previous_interval = store['poll_interval_seconds']
+        started = time.monotonic()
+        result = "error"
 
-    async def _trigger_whatsapp_if_needed(
-        self,
-        store: dict,
-        order_code: str,
-        new_status: str,
-        existing: dict,
-        conn,
-    ):
-        """Отправить WhatsApp если ещё не отправляли для этого статуса"""
-        # Маппинг статуса на поле wa_*_sent_at
-        status_to_field = {
-            "APPROVED": "wa_approved_sent_at",
-            "DELIVERY": "wa_shipped_sent_at",
-            "DELIVERED": "wa_delivered_sent_at",
-            "COMPLETED": "wa_completed_sent_at",
-        }
-
-        field = status_to_field.get(new_status)
-        if not field:
-            return
-
-        # Проверяем не отправляли ли уже
-        if existing.get(field):
-            logger.debug(f"WA already sent for {order_code} status {new_status}")
-            return
-
-        # Получаем событие
-        event = KASPI_STATE_TO_EVENT.get(new_status)
-        if not event:
-            return
-
-        # Отправляем
-        result = await self._trigger_whatsapp_for_event(store, order_code, event, conn)
-
-        # Обновляем флаг отправки
-        if result and result.get("status") == "sent":
-            await conn.execute(f"""
-                UPDATE orders SET {field} = NOW() WHERE kaspi_order_code = $1 AND store_id = $2
-            """, order_code, store['id'])
-
-    async def _trigger_whatsapp_for_event(
-        self,
-        store: dict,
-        order_code: str,
-        event: OrderEvent,
-        conn,
-    ) -> Optional[Dict[str, Any]]:
-        """Вызвать order_event_processor для отправки WhatsApp"""
         try:
-            result = await self._event_processor.process_order_event(
-                user_id=str(store['user_id']),
-                store_id=str(store['id']),
-                order_code=order_code,
-                event=event,
-                pool=self._pool,
+            state = await load_sync_state(self._pool, store_id)
+            totals, new_state = await sync_store_orders(
+                get_kaspi_orders_api(), api_key, str(store_id), str(store['user_id']), store_name, state,
             )
 
-            if result:
-                logger.info(f"WA trigger result for {order_code}/{event.value}: {result.get('status')}")
-            return result
+            synced = totals['inserted'] + totals['updated']
+            interval = next_poll_interval(
+                previous_interval, synced, len(new_state['open_orders']), store['polling_enabled'],
+            )
+            # Advance the cursor only after the changes are stored
+            await save_sync_state(self._pool, store_id, new_state, interval)
+
+            result = "changed" if synced else "unchanged"
+            self._stats['synced'] += synced
+            if synced or totals['errors']:
+                contacts = totals['contacts_added']
+                logger.info(
+                    f"[ORDERS] {store_name}: {synced} orders synced "
+                    f"({totals['inserted']} new, {totals['updated']} updated"
+                    f"{f', {contacts} contacts' if contacts else ''}), "
+                    f"{len(new_state['open_orders'])} open, next poll in {interval}s"
+                )
+            else:
+                logger.debug(f"[ORDERS] {store_name}: no order changes, next poll in {interval}s")
 
+        except KaspiTokenInvalidError:
+            # Store drops out of the due-stores query until the token is replaced
+            result = "token_invalid"
+            logger.warning(f"[ORDERS] {store_name}: API token invalid, marking as invalid")
+            await self._mark_token_invalid(store_id)
         except Exception as e:
-            logger.error(f"Error triggering WA for {order_code}: {e}")
-            return None
-
-    async def _create_order_record(self, store: dict, order_data: dict, conn):
-        """Создать запись о новом заказе"""
-        attrs = order_data.get("attributes", {})
-
-        kaspi_order_id = order_data.get("id")
-        order_code = attrs.get("code") or order_data.get("code")
-        status = attrs.get("state") or order_data.get("state")
-        total_price = int(attrs.get("totalPrice", 0) * 100)  # В тиынах
-        delivery_cost = int(attrs.get("deliveryCost", 0) * 100)
-        customer_name = attrs.get("customer", {}).get("name")
-        delivery_mode = attrs.get("deliveryMode")
-        payment_mode = attrs.get("paymentMode")
-
-        # Дата заказа
-        created_at_str = attrs.get("creationDate")
-        order_date = datetime.utcnow()
-        if created_at_str:
+            if isinstance(e, KaspiOrdersAPIError):
+                logger.warning(f"[ORDERS] {store_name}: REST API error - {e}")
+            else:
+                logger.error(f"[ORDERS] {store_name}: unexpected error - {e}", exc_info=True)
+            # Back off as for an idle store so a failing store does not hog a slot
             try:
-                order_date = datetime.fromisoformat(created_at_str.replace("Z", "+00:00"))
-            except Exception:
-                pass
-
+                await schedule_next_poll(
+                    self._pool, store_id, next_poll_interval(previous_interval, 0, 0, False),
+                )
+            except Exception as schedule_error:
+                logger.error(f"[ORDERS] {store_name}: failed to schedule next poll: {schedule_error}")
+        finally:
+            STORE_SYNC_SECONDS.labels(result=result).observe(time.monotonic() - started)
+            self._stats['stores'] += 1
+            if result in ("error", "token_invalid"):
+                self._stats['errors'] += 1
+            self._in_flight.pop(store_id, None)
+            self._wakeup.set()
+
+    async def _mark_token_invalid(self, store_id: UUID):
         try:
-            await conn.execute("""
-                INSERT INTO orders (
-                    store_id, kaspi_order_id, kaspi_order_code, status,
-                    total_price, delivery_cost, customer_name,
-                    delivery_mode, payment_mode, order_date
+            async with self._pool.acquire() as conn:
+                await conn.execute(
+                    "UPDATE kaspi_stores SET api_key_valid = FALSE WHERE id = $1",
+                    store_id
                 )
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-                ON CONFLICT (store_id, kaspi_order_id) DO UPDATE SET
-                    status = EXCLUDED.status,
-                    updated_at = NOW()
-            """,
-                store['id'], kaspi_order_id, order_code, status,
-                total_price, delivery_cost, customer_name,
-                delivery_mode, payment_mode, order_date
-            )
         except Exception as e:
-            logger.error(f"Error creating order record: {e}")
+            logger.error(f"[ORDERS] Failed to mark API token invalid for store {store_id}: {e}")
 
 
 async def main():
@@ -491,7 +316,7 @@ async def main():
     logging.getLogger("httpcore").setLevel(logging.WARNING)
 
     logger.info("=" * 60)
-    logger.info("ORDERS WORKER - Kaspi Order Monitoring & WhatsApp Automation")
+    logger.info("ORDERS WORKER - Kaspi Order Sync & WhatsApp Automation")
     logger.info("=" * 60)
 
     worker = OrdersWorker()
@@ -0,0 +1,287 @@
+"""
+Write-behind buffer for demper DB writes.
+
+The demper used to open a pool connection per product for each of
+last_check_time, the price backup update and the price_history insert.
+DemperWriteBuffer collects these in memory and writes them in three batched
+statements per flush (one connection, one transaction):
+
+- UPDATE products ... FROM unnest(...)  (last_check_time, next_check_at;
+  next_check_at only for deferred products)
+- UPDATE products ... FROM unnest(...)  (price)
+- COPY into price_history
+
+Flushes run every flush_interval seconds, as soon as max_pending writes are
+queued, and on worker shutdown.
+
+Durability:
+    Writes are acknowledged to the caller before they reach Postgres. A crash
+    (SIGKILL, OOM) loses at most one flush interval of buffered writes:
+    - last_check_time: the product is simply checked again
+    - price: products.price lags the price already sent to Kaspi until the
+      next check re-reads offers and re-syncs; Kaspi stays authoritative
+    - price_history: those history rows are lost
+    A failed flush (DB unavailable) puts the batch back and retries on the
+    next interval; last_check_time updates are dropped first if the backlog
+    exceeds 10x max_pending. Graceful shutdown (SIGTERM) always flushes.
+"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+import asyncpg
+
+from ..core.database import get_db_pool
+
+logger = logging.getLogger(__name__)
+
+# (id, product_id, old_price, new_price, competitor_price, change_reason, created_at)
+PriceHistoryRecord = Tuple[UUID, UUID, int, int, Optional[int], str, datetime]
+
+PRICE_HISTORY_COLUMNS = [
+    "id", "product_id", "old_price", "new_price",
+    "competitor_price", "change_reason", "created_at",
+]
+
+
+class DemperWriteBuffer:
+    """
+    Coalesces per-product demper writes into periodic batched statements.
+    """
+
+    def __init__(self, flush_interval: float = 2.0, max_pending: int = 1000):
+        """
+        Initialize write buffer.
+
+        Args:
+            flush_interval: Seconds between background flushes
+            max_pending: Queue size that triggers an early flush
+        """
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        # Latest value wins per product; (checked_at or None if deferred, next_check_at)
+        self._checked: Dict[UUID, Tuple[Optional[datetime], datetime]] = {}
+        self._prices: Dict[UUID, int] = {}
+        self._history: List[PriceHistoryRecord] = []
+
+        self._flush_lock = asyncio.Lock()
+        self._flush_wanted = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+    # ------------------------------------------------------------------
+    # Producers (non-blocking)
+    # ------------------------------------------------------------------
+
+    def mark_checked(
+        self,
+        product_id: UUID,
+        next_check_at: datetime,
+        checked_at: Optional[datetime] = None,
+    ):
+        """Queue last_check_time = checked_at (default: now) and next_check_at."""
+        self._checked[product_id] = (checked_at or datetime.now(timezone.utc), next_check_at)
+        self._maybe_flush_early()
+
+    def defer(self, product_id: UUID, next_check_at: datetime):
+        """
+        Queue next_check_at only (product skipped, not checked).
+
+        A queued update for the product keeps its last_check_time and the
+        later of the two due times, so a defer never brings a check forward.
+        """
+        queued = self._checked.get(product_id)
+        if queued is not None:
+            checked_at, queued_next = queued
+            self._checked[product_id] = (checked_at, max(queued_next, next_check_at))
+        else:
+            self._checked[product_id] = (None, next_check_at)
+        self._maybe_flush_early()
+
+    def set_price(self, product_id: UUID, price: int):
+        """Queue products.price = price."""
+        self._prices[product_id] = price
+        self._maybe_flush_early()
+
+    def record_price_change(
+        self,
+        product_id: UUID,
+        old_price: int,
+        new_price: int,
+        competitor_price: Optional[int],
+        change_reason: str,
+    ):
+        """Queue a price_history row."""
+        self._history.append((
+            uuid.uuid4(), product_id, old_price, new_price,
+            competitor_price, change_reason, datetime.now(timezone.utc),
+        ))
+        self._maybe_flush_early()
+
+    def pending_product_ids(self) -> Set[UUID]:
+        """Products whose last_check_time is not yet in the DB."""
+        return set(self._checked)
+
+    def pending_count(self) -> int:
+        return len(self._checked) + len(self._prices) + len(self._history)
+
+    def _maybe_flush_early(self):
+        if self.pending_count() >= self.max_pending:
+            self._flush_wanted.set()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        """Start background flush loop."""
+        if self._running:
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._flush_loop(), name="demper-write-buffer")
+        logger.info(
+            f"Write buffer started (interval={self.flush_interval}s, max_pending={self.max_pending})"
+        )
+
+    async def stop(self):
+        """Stop background loop and flush everything still buffered."""
+        self._running = False
+        if self._task:
+            # Not in the middle of a flush: its swapped-out batch would be lost
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self.pending_count():
+            logger.error(f"Write buffer stopped with {self.pending_count()} unflushed writes")
+        else:
+            logger.info("Write buffer flushed and stopped")
+
+    async def _flush_loop(self):
+        while self._running:
+            try:
+                await asyncio.wait_for(self._flush_wanted.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wanted.clear()
+            await self.flush()
+
+    # ------------------------------------------------------------------
+    # Flush
+    # ------------------------------------------------------------------
+
+    async def flush(self) -> bool:
+        """
+        Write all buffered changes in one transaction.
+
+        Returns:
+            True if the buffer was empty or flushed, False on DB error
+        """
+        async with self._flush_lock:
+            if not self.pending_count():
+                return True
+
+            checked, self._checked = self._checked, {}
+            prices, self._prices = self._prices, {}
+            history, self._history = self._history, []
+
+            try:
+                pool = await get_db_pool()
+                async with pool.acquire() as conn:
+                    async with conn.transaction():
+                        if checked:
+                            await self._flush_checked(conn, checked)
+                        if prices:
+                            await self._flush_prices(conn, prices)
+                        if history:
+                            await self._flush_history(conn, history)
+
+                logger.debug(
+                    f"Write buffer flushed: {len(checked)} checks, "
+                    f"{len(prices)} prices, {len(history)} history rows"
+                )
+                return True
+
+            except Exception as e:
+                logger.error(f"Write buffer flush failed, will retry: {e}", exc_info=True)
+                self._requeue(checked, prices, history)
+                return False
+
+    def _requeue(
+        self,
+        checked: Dict[UUID, Tuple[Optional[datetime], datetime]],
+        prices: Dict[UUID, int],
+        history: List[PriceHistoryRecord],
+    ):
+        """Put a failed batch back without overwriting newer values."""
+        for product_id, check in checked.items():
+            self._checked.setdefault(product_id, check)
+        for product_id, price in prices.items():
+            self._prices.setdefault(product_id, price)
+        self._history[:0] = history
+
+        if self.pending_count() > self.max_pending * 10 and self._checked:
+            logger.warning(f"Write buffer backlog too large, dropping {len(self._checked)} last_check_time updates")
+            self._checked.clear()
+
+    async def _flush_checked(self, conn: asyncpg.Connection, checked: Dict[UUID, Tuple[Optional[datetime], datetime]]):
+        await conn.execute(
+            """
+            UPDATE products AS p
+            SET last_check_time = COALESCE(v.checked_at, p.last_check_time),
+                next_check_at = v.next_check_at
+            FROM unnest($1::uuid[], $2::timestamptz[], $3::timestamptz[]) AS v(id, checked_at, next_check_at)
+            WHERE p.id = v.id
+            """,
+            list(checked.keys()),
+            [check[0] for check in checked.values()],
+            [check[1] for check in checked.values()],
+        )
+
+    async def _flush_prices(self, conn: asyncpg.Connection, prices: Dict[UUID, int]):
+        await conn.execute(
+            """
+            UPDATE products AS p
+            SET price = v.price, updated_at = NOW()
+            FROM unnest($1::uuid[], $2::integer[]) AS v(id, price)
+            WHERE p.id = v.id
+            """,
+            list(prices.keys()),
+            list(prices.values()),
+        )
+
+    async def _flush_history(self, conn: asyncpg.Connection, history: List[PriceHistoryRecord]):
+        try:
+            # Savepoint: COPY aborts as a whole if a product was deleted meanwhile
+            async with conn.transaction():
+                await conn.copy_records_to_table(
+                    "price_history", records=history, columns=PRICE_HISTORY_COLUMNS
+                )
+        except asyncpg.ForeignKeyViolationError:
+            # Slow path: skip rows whose product no longer exists
+            columns = list(zip(*history))
+            await conn.execute(
+                """
+                INSERT INTO price_history (
+                    id, product_id, old_price, new_price,
+                    competitor_price, change_reason, created_at
+                )
+                SELECT v.id, v.product_id, v.old_price, v.new_price,
+                       v.competitor_price, v.change_reason, v.created_at
+                FROM unnest(
+                    $1::uuid[], $2::uuid[], $3::integer[], $4::integer[],
+                    $5::integer[], $6::text[], $7::timestamptz[]
+                ) AS v(id, product_id, old_price, new_price, competitor_price, change_reason, created_at)
+                JOIN products p ON p.id = v.product_id
+                """,
+                *[list(col) for col in columns],
+            )
@@ -0,0 +1,57 @@
+"""Add session_version to kaspi_stores for worker session caching
+
+Revision ID: 20260301100000
+Revises: 20260220120000
+Create Date: 2026-03-01 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20260301100000'
+down_revision: Union[str, None] = '20260220120000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        ALTER TABLE kaspi_stores
+        ADD COLUMN IF NOT EXISTS session_version BIGINT NOT NULL DEFAULT 0
+    """)
+
+    # Bump version and notify listeners whenever the session blob or
+    # activity flag changes, no matter which code path wrote it
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_kaspi_session_version()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF NEW.guid IS DISTINCT FROM OLD.guid
+               OR NEW.is_active IS DISTINCT FROM OLD.is_active
+               OR NEW.merchant_id IS DISTINCT FROM OLD.merchant_id THEN
+                NEW.session_version := OLD.session_version + 1;
+                PERFORM pg_notify('kaspi_session_changed', COALESCE(OLD.merchant_id, ''));
+                IF NEW.merchant_id IS DISTINCT FROM OLD.merchant_id THEN
+                    PERFORM pg_notify('kaspi_session_changed', COALESCE(NEW.merchant_id, ''));
+                END IF;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER kaspi_stores_session_version
+        BEFORE UPDATE ON kaspi_stores
+        FOR EACH ROW
+        EXECUTE FUNCTION bump_kaspi_session_version();
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS kaspi_stores_session_version ON kaspi_stores")
+    op.execute("DROP FUNCTION IF EXISTS bump_kaspi_session_version()")
+    op.execute("ALTER TABLE kaspi_stores DROP COLUMN IF EXISTS session_version")
@@ -0,0 +1,140 @@
+"""Add shard_key and next_check_at to products for the demper due-product scan
+
+Revision ID: 20260301110000
+Revises: 20260301100000
+Create Date: 2026-03-01 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20260301110000'
+down_revision: Union[str, None] = '20260301100000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Persisted shard bucket: mod(shard_key, INSTANCE_COUNT) gives the same
+    # assignment as mod(abs(hashtext(id::text)), INSTANCE_COUNT) whenever
+    # INSTANCE_COUNT divides 1024
+    op.execute("""
+        ALTER TABLE products
+        ADD COLUMN IF NOT EXISTS shard_key SMALLINT
+        GENERATED ALWAYS AS (abs(mod(hashtext(id::text), 1024))::smallint) STORED
+    """)
+
+    # When the product is next due for a demper check ('epoch' = never checked).
+    # The demper writes it together with last_check_time; the trigger below
+    # covers every other writer.
+    op.execute("""
+        ALTER TABLE products
+        ADD COLUMN IF NOT EXISTS next_check_at TIMESTAMPTZ NOT NULL DEFAULT 'epoch'
+    """)
+    op.execute(f"""
+        UPDATE products p
+        SET next_check_at = p.last_check_time + make_interval(mins => CASE
+            WHEN p.is_priority THEN {settings.priority_check_interval_minutes}
+            ELSE COALESCE(
+                (SELECT ds.check_interval_minutes FROM demping_settings ds
+                 WHERE ds.store_id = p.store_id),
+                15
+            )
+        END)
+        WHERE p.last_check_time IS NOT NULL
+    """)
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION products_set_next_check_at()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                -- Writer set it explicitly (demper write buffer)
+                IF NEW.next_check_at IS DISTINCT FROM OLD.next_check_at THEN
+                    RETURN NEW;
+                END IF;
+                -- Newly prioritized: check as soon as possible
+                IF NEW.last_check_time IS NOT DISTINCT FROM OLD.last_check_time THEN
+                    IF NEW.is_priority AND NOT OLD.is_priority THEN
+                        NEW.next_check_at := LEAST(NEW.next_check_at, NOW());
+                    END IF;
+                    RETURN NEW;
+                END IF;
+            END IF;
+
+            NEW.next_check_at := COALESCE(
+                NEW.last_check_time + make_interval(mins => COALESCE(
+                    (SELECT ds.check_interval_minutes FROM demping_settings ds
+                     WHERE ds.store_id = NEW.store_id),
+                    15
+                )),
+                'epoch'
+            );
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER products_next_check_at
+        BEFORE INSERT OR UPDATE OF last_check_time, is_priority ON products
+        FOR EACH ROW
+        EXECUTE FUNCTION products_set_next_check_at();
+    """)
+
+    # Store check interval changed: reschedule its regular products
+    op.execute("""
+        CREATE OR REPLACE FUNCTION demping_settings_reschedule_products()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE'
+               AND NEW.check_interval_minutes IS NOT DISTINCT FROM OLD.check_interval_minutes THEN
+                RETURN NULL;
+            END IF;
+            UPDATE products
+            SET next_check_at = last_check_time
+                + make_interval(mins => COALESCE(NEW.check_interval_minutes, 15))
+            WHERE store_id = NEW.store_id
+              AND last_check_time IS NOT NULL
+              AND NOT is_priority;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER demping_settings_reschedule
+        AFTER INSERT OR UPDATE OF check_interval_minutes ON demping_settings
+        FOR EACH ROW
+        EXECUTE FUNCTION demping_settings_reschedule_products();
+    """)
+
+    # Per-store range scan over due products; shard_key is included so the
+    # shard filter is checked on the index tuple
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_products_demper_due
+        ON products(store_id, next_check_at) INCLUDE (shard_key)
+        WHERE (bot_active = true OR delivery_demping_enabled = true)
+          AND external_kaspi_id IS NOT NULL
+    """)
+    # Superseded: the demper query never filtered on bot_active alone
+    op.execute("DROP INDEX IF EXISTS idx_products_demper")
+
+
+def downgrade() -> None:
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_products_demper
+        ON products(bot_active, last_check_time)
+        WHERE bot_active = true
+    """)
+    op.execute("DROP INDEX IF EXISTS idx_products_demper_due")
+    op.execute("DROP TRIGGER IF EXISTS demping_settings_reschedule ON demping_settings")
+    op.execute("DROP FUNCTION IF EXISTS demping_settings_reschedule_products()")
+    op.execute("DROP TRIGGER IF EXISTS products_next_check_at ON products")
+    op.execute("DROP FUNCTION IF EXISTS products_set_next_check_at()")
+    op.execute("ALTER TABLE products DROP COLUMN IF EXISTS next_check_at")
+    op.execute("ALTER TABLE products DROP COLUMN IF EXISTS shard_key")
@@ -0,0 +1,38 @@
+"""Add orders_sync_state for incremental orders sync
+
+Revision ID: 20260301120000
+Revises: 20260301110000
+Create Date: 2026-03-01 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20260301120000'
+down_revision: Union[str, None] = '20260301110000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Per-store high-water mark of the REST orders sync:
+    # - last_created_at: newest order creationDate seen (next window starts here)
+    # - open_orders: {kaspi order id: status} of orders not yet in a final state
+    # - last_full_sync_at: last full-window resync (self-healing)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS orders_sync_state (
+            store_id UUID PRIMARY KEY REFERENCES kaspi_stores(id) ON DELETE CASCADE,
+            last_created_at TIMESTAMPTZ,
+            open_orders JSONB NOT NULL DEFAULT '{}'::jsonb,
+            last_full_sync_at TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS orders_sync_state")
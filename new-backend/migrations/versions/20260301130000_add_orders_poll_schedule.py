@@ -0,0 +1,42 @@
+"""Add adaptive poll schedule to orders_sync_state
+
+Revision ID: 20260301130000
+Revises: 20260301120000
+Create Date: 2026-03-01 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20260301130000'
+down_revision: Union[str, None] = '20260301120000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Per-store poll schedule of the orders engine:
+    # - poll_interval_seconds: current adaptive interval (busy stores short, idle long)
+    # - next_poll_at: when the store is due again (stores without a row are due now)
+    op.execute("""
+        ALTER TABLE orders_sync_state
+        ADD COLUMN IF NOT EXISTS poll_interval_seconds INTEGER,
+        ADD COLUMN IF NOT EXISTS next_poll_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_sync_state_next_poll
+        ON orders_sync_state(next_poll_at)
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_orders_sync_state_next_poll")
+    op.execute("""
+        ALTER TABLE orders_sync_state
+        DROP COLUMN IF EXISTS next_poll_at,
+        DROP COLUMN IF EXISTS poll_interval_seconds
+    """)
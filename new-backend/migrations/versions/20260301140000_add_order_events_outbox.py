@@ -0,0 +1,66 @@
+"""Add order_events_outbox for queued order notifications and WhatsApp
+
+Revision ID: 20260301140000
+Revises: 20260301130000
+Create Date: 2026-03-01 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20260301140000'
+down_revision: Union[str, None] = '20260301130000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Written by sync_orders_to_db in the orders transaction, consumed by
+    # OrderEventsDispatcher with FOR UPDATE SKIP LOCKED:
+    # - event_type: 'new' | 'status_changed'
+    # - status: 'pending' -> 'done' | 'failed' (retries exhausted)
+    # - next_attempt_at: due time; a claim pushes it forward as a lease, so
+    #   events of a crashed dispatcher become due again by themselves
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS order_events_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            store_id UUID NOT NULL REFERENCES kaspi_stores(id) ON DELETE CASCADE,
+            order_id UUID REFERENCES orders(id) ON DELETE CASCADE,
+            order_code VARCHAR(255) NOT NULL,
+            event_type VARCHAR(20) NOT NULL,
+            old_status VARCHAR(50),
+            new_status VARCHAR(50) NOT NULL,
+            total_price BIGINT NOT NULL DEFAULT 0,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            last_error TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            processed_at TIMESTAMPTZ
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_order_events_outbox_due
+        ON order_events_outbox(next_attempt_at)
+        WHERE status = 'pending'
+    """)
+    # Per-order ordering check (older pending event of the same order first)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_order_events_outbox_order
+        ON order_events_outbox(order_id, id)
+        WHERE status = 'pending'
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_order_events_outbox_processed
+        ON order_events_outbox(processed_at)
+        WHERE status <> 'pending'
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS order_events_outbox")
@@ -0,0 +1,54 @@
+"""Add covering indexes for order lookups and analytics
+
+Revision ID: 20260301150000
+Revises: 20260301140000
+Create Date: 2026-03-01 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20260301150000'
+down_revision: Union[str, None] = '20260301140000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Order by code within a store (customer resolver, REST phone lookup,
+    # AI salesman, WhatsApp events)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_store_code
+        ON orders(store_id, kaspi_order_code)
+    """)
+
+    # Analytics: period range scan per store; the INCLUDE columns let stats,
+    # pipeline and breakdown queries run as index-only scans
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_store_date
+        ON orders(store_id, order_date)
+        INCLUDE (status, total_price, delivery_cost, payment_mode, delivery_mode)
+    """)
+
+    # Items per order with the columns the analytics sum (replaces the plain
+    # order_id index)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_order_items_order_covering
+        ON order_items(order_id)
+        INCLUDE (quantity, price, product_id)
+    """)
+    op.execute("DROP INDEX IF EXISTS idx_order_items_order_id")
+
+
+def downgrade() -> None:
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_order_items_order_id
+        ON order_items(order_id)
+    """)
+    op.execute("DROP INDEX IF EXISTS idx_order_items_order_covering")
+    op.execute("DROP INDEX IF EXISTS idx_orders_store_date")
+    op.execute("DROP INDEX IF EXISTS idx_orders_store_code")
@@ -0,0 +1,127 @@
+"""Add daily sales rollups for store analytics
+
+Revision ID: 20260301160000
+Revises: 20260301150000
+Create Date: 2026-03-01 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20260301160000'
+down_revision: Union[str, None] = '20260301150000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+EXCLUDED = "('CANCELLED', 'CANCELLING', 'RETURNED')"
+
+
+def upgrade() -> None:
+    # Per store and day (DATE(order_date)); kept up to date by the orders sync
+    # (app.services.sales_rollup), read by the analytics endpoints
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS store_daily_sales (
+            store_id UUID NOT NULL REFERENCES kaspi_stores(id) ON DELETE CASCADE,
+            date DATE NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            revenue BIGINT NOT NULL DEFAULT 0,
+            items INTEGER NOT NULL DEFAULT 0,
+            cancels INTEGER NOT NULL DEFAULT 0,
+            delivery_cost BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ DEFAULT NOW(),
+            PRIMARY KEY (store_id, date)
+        )
+    """)
+
+    # product_key = product_id, or sku / name for items not matched to a product
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS store_daily_product_sales (
+            store_id UUID NOT NULL REFERENCES kaspi_stores(id) ON DELETE CASCADE,
+            date DATE NOT NULL,
+            product_key TEXT NOT NULL,
+            product_id UUID,
+            sku VARCHAR(255),
+            name VARCHAR(500),
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (store_id, date, product_key)
+        )
+    """)
+
+    # dimension: payment (payment_mode), delivery (delivery_mode), city
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS store_daily_order_breakdowns (
+            store_id UUID NOT NULL REFERENCES kaspi_stores(id) ON DELETE CASCADE,
+            date DATE NOT NULL,
+            dimension VARCHAR(20) NOT NULL,
+            key TEXT NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            revenue BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (store_id, date, dimension, key)
+        )
+    """)
+
+    # Backfill from existing orders
+    op.execute(f"""
+        INSERT INTO store_daily_sales (store_id, date, orders, revenue, items, cancels, delivery_cost)
+        SELECT
+            o.store_id,
+            DATE(o.order_date),
+            COUNT(*) FILTER (WHERE o.status NOT IN {EXCLUDED}),
+            COALESCE(SUM(o.total_price) FILTER (WHERE o.status NOT IN {EXCLUDED}), 0),
+            COALESCE(SUM(oi.items) FILTER (WHERE o.status NOT IN {EXCLUDED}), 0),
+            COUNT(*) FILTER (WHERE o.status IN {EXCLUDED}),
+            COALESCE(SUM(o.delivery_cost) FILTER (WHERE o.status NOT IN {EXCLUDED}), 0)
+        FROM orders o
+        LEFT JOIN (
+            SELECT order_id, SUM(quantity) AS items FROM order_items GROUP BY order_id
+        ) oi ON oi.order_id = o.id
+        WHERE o.store_id IS NOT NULL
+        GROUP BY o.store_id, DATE(o.order_date)
+        ON CONFLICT (store_id, date) DO NOTHING
+    """)
+
+    op.execute(f"""
+        INSERT INTO store_daily_product_sales (
+            store_id, date, product_key, product_id, sku, name, quantity, revenue
+        )
+        SELECT
+            o.store_id,
+            DATE(o.order_date),
+            COALESCE(oi.product_id::text, oi.sku, oi.name),
+            oi.product_id,
+            MAX(oi.sku),
+            MAX(oi.name),
+            SUM(oi.quantity),
+            SUM(oi.quantity * oi.price)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.store_id IS NOT NULL AND o.status NOT IN {EXCLUDED}
+        GROUP BY o.store_id, DATE(o.order_date), COALESCE(oi.product_id::text, oi.sku, oi.name), oi.product_id
+        ON CONFLICT (store_id, date, product_key) DO NOTHING
+    """)
+
+    op.execute(f"""
+        INSERT INTO store_daily_order_breakdowns (store_id, date, dimension, key, orders, revenue)
+        SELECT o.store_id, DATE(o.order_date), k.dimension, k.key, COUNT(*), COALESCE(SUM(o.total_price), 0)
+        FROM orders o
+        CROSS JOIN LATERAL (VALUES
+            ('payment', NULLIF(o.payment_mode, '')),
+            ('delivery', NULLIF(o.delivery_mode, '')),
+            ('city', NULLIF(TRIM(SPLIT_PART(o.delivery_address, ',', 1)), ''))
+        ) AS k(dimension, key)
+        WHERE o.store_id IS NOT NULL AND o.status NOT IN {EXCLUDED} AND k.key IS NOT NULL
+        GROUP BY o.store_id, DATE(o.order_date), k.dimension, k.key
+        ON CONFLICT (store_id, date, dimension, key) DO NOTHING
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS store_daily_order_breakdowns")
+    op.execute("DROP TABLE IF EXISTS store_daily_product_sales")
+    op.execute("DROP TABLE IF EXISTS store_daily_sales")
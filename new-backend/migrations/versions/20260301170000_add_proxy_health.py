@@ -0,0 +1,39 @@
+"""Add proxy health probe columns
+
+Revision ID: 20260301170000
+Revises: 20260301160000
+Create Date: 2026-03-01 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20260301170000'
+down_revision: Union[str, None] = '20260301160000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Written by the proxy prober (app.services.proxy_prober), read by the allocator
+    op.execute("""
+        ALTER TABLE proxies
+            ADD COLUMN IF NOT EXISTS latency_p50_ms INTEGER,
+            ADD COLUMN IF NOT EXISTS latency_p95_ms INTEGER,
+            ADD COLUMN IF NOT EXISTS probe_failures INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS quarantined_until TIMESTAMPTZ
+    """)
+
+
+def downgrade() -> None:
+    op.execute("""
+        ALTER TABLE proxies
+            DROP COLUMN IF EXISTS quarantined_until,
+            DROP COLUMN IF EXISTS probe_failures,
+            DROP COLUMN IF EXISTS latency_p95_ms,
+            DROP COLUMN IF EXISTS latency_p50_ms
+    """)
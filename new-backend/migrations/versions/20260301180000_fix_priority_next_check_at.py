@@ -0,0 +1,80 @@
+"""Schedule priority products on the priority interval in the next_check_at trigger
+
+Revision ID: 20260301180000
+Revises: 20260301170000
+Create Date: 2026-03-01 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20260301180000'
+down_revision: Union[str, None] = '20260301170000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _set_next_check_at_function(interval_sql: str) -> str:
+    return f"""
+        CREATE OR REPLACE FUNCTION products_set_next_check_at()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                -- Writer set it explicitly (demper write buffer)
+                IF NEW.next_check_at IS DISTINCT FROM OLD.next_check_at THEN
+                    RETURN NEW;
+                END IF;
+                -- Newly prioritized: check as soon as possible
+                IF NEW.last_check_time IS NOT DISTINCT FROM OLD.last_check_time THEN
+                    IF NEW.is_priority AND NOT OLD.is_priority THEN
+                        NEW.next_check_at := LEAST(NEW.next_check_at, NOW());
+                    END IF;
+                    RETURN NEW;
+                END IF;
+            END IF;
+
+            NEW.next_check_at := COALESCE(
+                NEW.last_check_time + make_interval(mins => {interval_sql}),
+                'epoch'
+            );
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+
+
+STORE_INTERVAL_SQL = """COALESCE(
+                    (SELECT ds.check_interval_minutes FROM demping_settings ds
+                     WHERE ds.store_id = NEW.store_id),
+                    15
+                )"""
+
+
+def upgrade() -> None:
+    # last_check_time written by other writers (e.g. manual check from the UI)
+    # used the store interval for priority products too
+    op.execute(_set_next_check_at_function(f"""CASE
+                    WHEN NEW.is_priority THEN {settings.priority_check_interval_minutes}
+                    ELSE {STORE_INTERVAL_SQL}
+                END"""))
+
+    # Priority products rescheduled by the old trigger
+    op.execute(f"""
+        UPDATE products
+        SET next_check_at = last_check_time
+            + make_interval(mins => {settings.priority_check_interval_minutes})
+        WHERE is_priority
+          AND last_check_time IS NOT NULL
+          AND next_check_at > last_check_time
+            + make_interval(mins => {settings.priority_check_interval_minutes})
+    """)
+
+
+def downgrade() -> None:
+    op.execute(_set_next_check_at_function(STORE_INTERVAL_SQL))
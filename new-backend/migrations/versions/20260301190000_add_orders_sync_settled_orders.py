@@ -0,0 +1,31 @@
+"""Add settled_orders to orders_sync_state
+
+Revision ID: 20260301190000
+Revises: 20260301180000
+Create Date: 2026-03-01 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20260301190000'
+down_revision: Union[str, None] = '20260301180000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # {kaspi order id: status} of final-state orders seen in the last cycle
+    # (active list, ARCHIVE overlap window): unchanged ones are not rewritten
+    op.execute("""
+        ALTER TABLE orders_sync_state
+        ADD COLUMN IF NOT EXISTS settled_orders JSONB NOT NULL DEFAULT '{}'::jsonb
+    """)
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE orders_sync_state DROP COLUMN IF EXISTS settled_orders")
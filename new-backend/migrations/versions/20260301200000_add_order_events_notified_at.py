@@ -0,0 +1,31 @@
+"""Track notification delivery of order events
+
+Revision ID: 20260301200000
+Revises: 20260301190000
+Create Date: 2026-03-01 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20260301200000'
+down_revision: Union[str, None] = '20260301190000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Set once the in-app notification of a 'new' event is sent (or turned
+    # off by the user), so retries of the event send it at most once
+    op.execute("""
+        ALTER TABLE order_events_outbox
+        ADD COLUMN IF NOT EXISTS notified_at TIMESTAMPTZ
+    """)
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE order_events_outbox DROP COLUMN IF EXISTS notified_at")
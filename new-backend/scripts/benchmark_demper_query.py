@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN benchmark for the demper due-product query.
+
+Seeds a scratch schema with synthetic stores/products, then runs
+EXPLAIN (ANALYZE, BUFFERS) for the previous query (hashtext shard filter,
+per-row interval math and merchant subquery) and the current one
+(idx_products_demper_due range scan per eligible store).
+
+Usage:
+    DATABASE_URL=postgresql://... python scripts/benchmark_demper_query.py
+    python scripts/benchmark_demper_query.py --products 1000000 --stores 2000 --instances 4
+
+The scratch schema (demper_bench) is dropped at the end unless --keep is set.
+Nothing outside that schema is touched.
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import sys
+import time
+
+import asyncpg
+
+
+SCHEMA = "demper_bench"
+
+SCHEMA_SQL = """
+    CREATE TABLE kaspi_stores (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        user_id UUID NOT NULL,
+        merchant_id VARCHAR(255),
+        guid JSONB,
+        store_points JSONB,
+        is_active BOOLEAN DEFAULT true,
+        needs_reauth BOOLEAN DEFAULT false
+    );
+    CREATE TABLE demping_settings (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        store_id UUID NOT NULL UNIQUE REFERENCES kaspi_stores(id),
+        price_step INTEGER NOT NULL DEFAULT 100,
+        check_interval_minutes INTEGER NOT NULL DEFAULT 15,
+        work_hours_start VARCHAR(5) NOT NULL DEFAULT '00:00',
+        work_hours_end VARCHAR(5) NOT NULL DEFAULT '23:59',
+        is_enabled BOOLEAN NOT NULL DEFAULT true,
+        excluded_merchant_ids TEXT[] DEFAULT '{}'
+    );
+    CREATE TABLE products (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        store_id UUID NOT NULL REFERENCES kaspi_stores(id),
+        kaspi_product_id VARCHAR(255) NOT NULL,
+        kaspi_sku VARCHAR(255),
+        external_kaspi_id VARCHAR(255),
+        name VARCHAR(500) NOT NULL,
+        price INTEGER NOT NULL,
+        min_profit INTEGER DEFAULT 0,
+        min_price INTEGER,
+        max_price INTEGER,
+        price_step_override INTEGER,
+        demping_strategy VARCHAR(20) DEFAULT 'standard',
+        strategy_params JSONB,
+        pre_order_days INTEGER DEFAULT 0,
+        is_priority BOOLEAN NOT NULL DEFAULT false,
+        availabilities JSONB,
+        delivery_demping_enabled BOOLEAN DEFAULT false,
+        delivery_filter VARCHAR(20),
+        bot_active BOOLEAN DEFAULT true,
+        last_check_time TIMESTAMPTZ
+    );
+"""
+
+STORES_SQL = """
+    INSERT INTO kaspi_stores (user_id, merchant_id, guid, is_active, needs_reauth)
+    SELECT
+        md5('user' || (g / 3))::uuid,  -- ~3 stores per user
+        'M' || g,
+        '{"cookies": []}'::jsonb,
+        random() > 0.1,
+        random() > 0.95
+    FROM generate_series(1, $1) g
+"""
+
+SETTINGS_SQL = """
+    INSERT INTO demping_settings (store_id, check_interval_minutes, is_enabled)
+    SELECT id, (ARRAY[5, 10, 15, 30])[1 + floor(random() * 4)::int], random() > 0.05
+    FROM kaspi_stores
+"""
+
+PRODUCTS_SQL = """
+    INSERT INTO products (
+        store_id, kaspi_product_id, kaspi_sku, external_kaspi_id, name, price,
+        is_priority, bot_active, last_check_time
+    )
+    SELECT
+        s.ids[1 + (g % s.n)],
+        'P' || g,
+        'SKU' || g,
+        CASE WHEN random() > 0.02 THEN (100000000 + g)::text END,
+        'Product ' || g,
+        1000 + (g % 50000),
+        random() < 0.005,
+        random() < 0.6,
+        CASE WHEN random() > 0.05 THEN NOW() - random() * interval '40 minutes' END
+    FROM generate_series(1, $1) g,
+         (SELECT array_agg(id) AS ids, count(*)::int AS n FROM kaspi_stores) s
+"""
+
+OLD_INDEX_SQL = """
+    CREATE INDEX idx_products_demper ON products(bot_active, last_check_time)
+    WHERE bot_active = true
+"""
+
+NEW_SCHEMA_SQL = """
+    ALTER TABLE products
+    ADD COLUMN shard_key SMALLINT
+    GENERATED ALWAYS AS (abs(mod(hashtext(id::text), 1024))::smallint) STORED;
+
+    ALTER TABLE products ADD COLUMN next_check_at TIMESTAMPTZ NOT NULL DEFAULT 'epoch';
+
+    UPDATE products p
+    SET next_check_at = p.last_check_time + make_interval(mins => CASE
+        WHEN p.is_priority THEN 3
+        ELSE COALESCE(
+            (SELECT ds.check_interval_minutes FROM demping_settings ds
+             WHERE ds.store_id = p.store_id),
+            15
+        )
+    END)
+    WHERE p.last_check_time IS NOT NULL;
+
+    CREATE INDEX idx_products_demper_due
+    ON products(store_id, next_check_at) INCLUDE (shard_key)
+    WHERE (bot_active = true OR delivery_demping_enabled = true)
+      AND external_kaspi_id IS NOT NULL;
+"""
+
+# Query as it was before the shard_key/next_check_at migration
+OLD_QUERY = """
+    SELECT
+        products.id, products.store_id, products.kaspi_product_id, products.kaspi_sku,
+        products.name as product_name, products.external_kaspi_id, products.price,
+        products.min_profit, products.min_price, products.max_price,
+        products.price_step_override, products.demping_strategy, products.strategy_params,
+        COALESCE(products.pre_order_days, 0) as pre_order_days,
+        COALESCE(products.is_priority, false) as is_priority,
+        products.availabilities as product_availabilities,
+        products.delivery_demping_enabled, products.delivery_filter,
+        kaspi_stores.merchant_id, kaspi_stores.guid, kaspi_stores.user_id, kaspi_stores.store_points,
+        COALESCE(ds.check_interval_minutes, 15) as check_interval_minutes,
+        COALESCE(ds.work_hours_start, '00:00') as work_hours_start,
+        COALESCE(ds.work_hours_end, '23:59') as work_hours_end,
+        COALESCE(ds.price_step, 1) as store_price_step,
+        COALESCE(ds.is_enabled, true) as demping_enabled,
+        COALESCE(ds.excluded_merchant_ids, '{}') as excluded_merchant_ids,
+        EXTRACT(EPOCH FROM COALESCE(products.last_check_time + ci.check_every, NOW()))::float8 as due_at,
+        ARRAY(
+            SELECT ks2.merchant_id FROM kaspi_stores ks2
+            WHERE ks2.user_id = kaspi_stores.user_id
+              AND ks2.is_active = TRUE
+              AND ks2.merchant_id IS NOT NULL
+        ) as user_merchant_ids
+    FROM products
+    JOIN kaspi_stores ON kaspi_stores.id = products.store_id
+    LEFT JOIN demping_settings ds ON ds.store_id = products.store_id
+    CROSS JOIN LATERAL (
+        SELECT CASE WHEN COALESCE(products.is_priority, false)
+            THEN ($3::text || ' minutes')::interval
+            ELSE (COALESCE(ds.check_interval_minutes, 15) || ' minutes')::interval
+        END AS check_every
+    ) ci
+    WHERE (products.bot_active = TRUE OR products.delivery_demping_enabled = TRUE)
+      AND kaspi_stores.is_active = TRUE
+      AND kaspi_stores.guid IS NOT NULL
+      AND products.external_kaspi_id IS NOT NULL
+      AND COALESCE(kaspi_stores.needs_reauth, false) = FALSE
+      AND COALESCE(ds.is_enabled, true) = TRUE
+      AND (
+          COALESCE(ds.work_hours_start, '00:00')::time <= (NOW() AT TIME ZONE 'Asia/Almaty')::time
+          AND COALESCE(ds.work_hours_end, '23:59')::time >= (NOW() AT TIME ZONE 'Asia/Almaty')::time
+      )
+      AND (
+          products.last_check_time IS NULL
+          OR products.last_check_time + ci.check_every < NOW() + make_interval(secs => $5)
+      )
+      AND mod(abs(hashtext(products.id::text)), $1) = $2
+      AND NOT (products.id = ANY($4::uuid[]))
+    ORDER BY COALESCE(products.is_priority, false) DESC, due_at ASC
+    LIMIT $6
+"""
+
+
+def load_new_query() -> str:
+    """Current query, taken from DemperWorker.fetch_products_for_instance source."""
+    path = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "app", "workers", "demper_instance.py",
+    )
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    method = source[source.index("async def fetch_products_for_instance"):]
+    match = re.search(r'query = """(.*?)"""', method, re.S)
+    return match.group(1)
+
+
+async def explain(conn, query: str, args: list) -> float:
+    plan = await conn.fetch(f"EXPLAIN (ANALYZE, BUFFERS) {query}", *args)
+    lines = [row[0] for row in plan]
+    print("\n".join(lines))
+    for line in reversed(lines):
+        if line.startswith("Execution Time:"):
+            return float(line.split()[2])
+    return 0.0
+
+
+async def main(args):
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL не найден")
+        return 1
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        await conn.execute(f"SET search_path TO {SCHEMA}, public")
+        await conn.execute(SCHEMA_SQL)
+
+        started = time.monotonic()
+        await conn.execute(STORES_SQL, args.stores)
+        await conn.execute(SETTINGS_SQL)
+        await conn.execute(PRODUCTS_SQL, args.products)
+        await conn.execute(OLD_INDEX_SQL)
+        await conn.execute(NEW_SCHEMA_SQL)
+        await conn.execute("VACUUM ANALYZE products")
+        await conn.execute("ANALYZE kaspi_stores")
+        await conn.execute("ANALYZE demping_settings")
+        print(f"[BENCH] Seeded {args.products} products / {args.stores} stores "
+              f"in {time.monotonic() - started:.1f}s")
+
+        results = {"old": [], "new": []}
+        for instance_index in range(min(args.instances, 2)):
+            print(f"\n=== OLD query (shard {instance_index}/{args.instances}) ===")
+            results["old"].append(await explain(conn, OLD_QUERY, [
+                args.instances, instance_index, "3", [], float(args.lookahead), args.limit,
+            ]))
+            print(f"\n=== NEW query (shard {instance_index}/{args.instances}) ===")
+            results["new"].append(await explain(conn, load_new_query(), [
+                args.instances, instance_index, float(args.lookahead), [], args.limit,
+            ]))
+
+        print("\n[BENCH] Execution time (ms):")
+        for name, times in results.items():
+            print(f"  {name}: " + ", ".join(f"{t:.1f}" for t in times))
+        return 0
+    finally:
+        if not args.keep:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EXPLAIN benchmark for the demper due-product query")
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--stores", type=int, default=2000)
+    parser.add_argument("--instances", type=int, default=4, help="INSTANCE_COUNT to simulate")
+    parser.add_argument("--limit", type=int, default=500, help="DEMPER_FEED_BATCH_SIZE")
+    parser.add_argument("--lookahead", type=int, default=30, help="DEMPER_FEED_LOOKAHEAD_SECONDS")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch schema")
+    sys.exit(asyncio.run(main(parser.parse_args())))
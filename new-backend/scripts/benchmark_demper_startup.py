@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the demper worker with and without the browser farm.
+
+Each run starts a fresh interpreter that performs DemperWorker._initialize()
+(DB pool, write buffer, metrics exporter, session cache listener, rate
+limiters), then - in "eager" mode - launches every browser shard as
+_initialize() did before the farm became lazy. Reported per mode: time to
+ready and resident memory of the whole process tree (Chromium included).
+
+Usage:
+    DATABASE_URL=postgresql://... REDIS_URL=redis://... python scripts/benchmark_demper_startup.py
+    python scripts/benchmark_demper_startup.py --runs 5 --shards 4
+
+Needs the same environment as the worker (database, Redis, Playwright
+chromium for the eager mode). Linux only (/proc).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def tree_rss_mb(root_pid: int) -> float:
+    """Resident memory of root_pid and all its descendants, in MB."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # comm may contain spaces; ppid is the 2nd field after ')'
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total_kb = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+async def child(mode: str, shards: int):
+    """One measured worker startup; prints a JSON result line."""
+    from app.core.browser_farm import get_browser_farm
+    from app.workers.demper_instance import DemperWorker
+
+    worker = DemperWorker()
+    started = time.perf_counter()
+    await worker._initialize()
+    if mode == "eager":
+        farm = await get_browser_farm()
+        await farm.warm_up()
+    ready = time.perf_counter() - started
+
+    print(json.dumps({"mode": mode, "seconds": ready, "rss_mb": tree_rss_mb(os.getpid())}), flush=True)
+    await worker._shutdown()
+
+
+def run_mode(mode: str, args) -> list:
+    results = []
+    env = dict(os.environ, BROWSER_SHARDS=str(args.shards))
+    for _ in range(args.runs):
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode],
+            capture_output=True, text=True, env=env,
+        )
+        line = next((l for l in proc.stdout.splitlines() if l.startswith("{")), None)
+        if proc.returncode != 0 or line is None:
+            print(f"❌ {mode} run failed:\n{proc.stderr[-2000:]}")
+            sys.exit(1)
+        results.append(json.loads(line))
+    return results
+
+
+def main(args) -> int:
+    if args.child:
+        asyncio.run(child(args.child, args.shards))
+        return 0
+
+    if not os.path.isdir("/proc"):
+        print("❌ /proc не найден (нужен Linux)")
+        return 1
+
+    print(f"[BENCH] {args.runs} runs per mode, {args.shards} browser shards in eager mode")
+    for mode in ("lazy", "eager"):
+        results = run_mode(mode, args)
+        seconds = [r["seconds"] for r in results]
+        rss = [r["rss_mb"] for r in results]
+        print(
+            f"  {mode:<6} ready in {statistics.median(seconds):6.2f}s (max {max(seconds):.2f}s), "
+            f"RSS {statistics.median(rss):7.1f} MB (max {max(rss):.1f} MB)"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Demper worker startup benchmark (lazy vs eager browser farm)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--shards", type=int, default=4, help="browser_shards for the eager mode")
+    parser.add_argument("--child", choices=["lazy", "eager"], help=argparse.SUPPRESS)
+    sys.exit(main(parser.parse_args()))
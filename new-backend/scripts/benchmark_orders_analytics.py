@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark for the store analytics endpoints and the rollup refresh.
+
+Seeds a scratch schema with synthetic stores/orders/order_items (1M orders by
+default) on the current schema (indexes of 20260301150000, store_daily_*
+rollups of 20260301160000, built with refresh_sales_rollups), then:
+
+1. Times what stats, daily analytics, top products and order breakdowns
+   read now (store_daily_sales / _product_sales / _order_breakdowns) against
+   the orders-table queries they served before the rollups
+2. Times refresh_sales_rollups() for 1, 3 and 14 touched days - the cost
+   every sync_orders_to_db transaction pays on top of the upserts (14 days
+   is a full resync window)
+
+Prints p50/p95 per query and per refresh size over random stores.
+
+Usage:
+    DATABASE_URL=postgresql://... python scripts/benchmark_orders_analytics.py
+    python scripts/benchmark_orders_analytics.py --orders 1000000 --stores 500 --runs 50
+
+The scratch schema (orders_bench) is dropped at the end unless --keep is set.
+Nothing outside that schema is touched; refreshes run in rolled back
+transactions.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import asyncpg
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.sales_rollup import CANCELLED_STATUSES, refresh_sales_rollups  # noqa: E402
+
+
+SCHEMA = "orders_bench"
+
+# Tables and indexes as created by 20260118180000_add_orders_table, with the
+# lookup indexes and rollup tables added since
+SCHEMA_SQL = """
+    CREATE TABLE kaspi_stores (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        name VARCHAR(255)
+    );
+    CREATE TABLE products (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        store_id UUID NOT NULL REFERENCES kaspi_stores(id),
+        kaspi_sku VARCHAR(255),
+        name VARCHAR(500) NOT NULL,
+        price INTEGER NOT NULL
+    );
+    CREATE TABLE orders (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        store_id UUID REFERENCES kaspi_stores(id) ON DELETE CASCADE,
+        kaspi_order_id VARCHAR(255) NOT NULL,
+        kaspi_order_code VARCHAR(255),
+        status VARCHAR(50) NOT NULL,
+        total_price INTEGER NOT NULL,
+        delivery_cost INTEGER DEFAULT 0,
+        customer_name VARCHAR(255),
+        customer_phone VARCHAR(50),
+        delivery_address TEXT,
+        delivery_mode VARCHAR(50),
+        payment_mode VARCHAR(50),
+        order_date TIMESTAMPTZ NOT NULL,
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        updated_at TIMESTAMPTZ DEFAULT NOW(),
+        UNIQUE(store_id, kaspi_order_id)
+    );
+    CREATE INDEX idx_orders_store_id ON orders(store_id);
+    CREATE INDEX idx_orders_order_date ON orders(order_date);
+    CREATE INDEX idx_orders_status ON orders(status);
+    CREATE TABLE order_items (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        order_id UUID REFERENCES orders(id) ON DELETE CASCADE,
+        product_id UUID REFERENCES products(id) ON DELETE SET NULL,
+        kaspi_product_id VARCHAR(255),
+        name VARCHAR(500) NOT NULL,
+        sku VARCHAR(255),
+        quantity INTEGER NOT NULL DEFAULT 1,
+        price INTEGER NOT NULL,
+        created_at TIMESTAMPTZ DEFAULT NOW()
+    );
+    CREATE INDEX idx_order_items_product_id ON order_items(product_id);
+
+    -- 20260301150000_add_orders_lookup_indexes
+    CREATE INDEX idx_orders_store_code ON orders(store_id, kaspi_order_code);
+    CREATE INDEX idx_orders_store_date ON orders(store_id, order_date)
+        INCLUDE (status, total_price, delivery_cost, payment_mode, delivery_mode);
+    CREATE INDEX idx_order_items_order_covering ON order_items(order_id)
+        INCLUDE (quantity, price, product_id);
+
+    -- 20260301160000_add_store_sales_rollups
+    CREATE TABLE store_daily_sales (
+        store_id UUID NOT NULL REFERENCES kaspi_stores(id) ON DELETE CASCADE,
+        date DATE NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue BIGINT NOT NULL DEFAULT 0,
+        items INTEGER NOT NULL DEFAULT 0,
+        cancels INTEGER NOT NULL DEFAULT 0,
+        delivery_cost BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ DEFAULT NOW(),
+        PRIMARY KEY (store_id, date)
+    );
+    CREATE TABLE store_daily_product_sales (
+        store_id UUID NOT NULL REFERENCES kaspi_stores(id) ON DELETE CASCADE,
+        date DATE NOT NULL,
+        product_key TEXT NOT NULL,
+        product_id UUID,
+        sku VARCHAR(255),
+        name VARCHAR(500),
+        quantity INTEGER NOT NULL DEFAULT 0,
+        revenue BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (store_id, date, product_key)
+    );
+    CREATE TABLE store_daily_order_breakdowns (
+        store_id UUID NOT NULL REFERENCES kaspi_stores(id) ON DELETE CASCADE,
+        date DATE NOT NULL,
+        dimension VARCHAR(20) NOT NULL,
+        key TEXT NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (store_id, date, dimension, key)
+    );
+"""
+
+STORES_SQL = """
+    INSERT INTO kaspi_stores (name) SELECT 'Store ' || g FROM generate_series(1, $1) g
+"""
+
+PRODUCTS_SQL = """
+    INSERT INTO products (store_id, kaspi_sku, name, price)
+    SELECT s.id, 'SKU' || s.n || '-' || g, 'Product ' || g, 1000 + g * 37 % 50000
+    FROM (SELECT id, row_number() OVER () AS n FROM kaspi_stores) s,
+         generate_series(1, $1) g
+"""
+
+# Store sizes are skewed (a few large stores, many small ones), like production
+ORDERS_SQL = """
+    INSERT INTO orders (
+        store_id, kaspi_order_id, kaspi_order_code, status, total_price, delivery_cost,
+        customer_name, customer_phone, delivery_address, delivery_mode, payment_mode, order_date
+    )
+    SELECT
+        s.ids[1 + floor(power(random(), 2) * s.n)::int],
+        'K' || g,
+        (700000000 + g)::text,
+        (ARRAY['APPROVED_BY_BANK', 'ACCEPTED_BY_MERCHANT', 'COMPLETED', 'COMPLETED', 'COMPLETED',
+               'CANCELLED', 'RETURNED', 'KASPI_DELIVERY'])[1 + floor(random() * 8)::int],
+        1000 + floor(random() * 200000)::int,
+        (ARRAY[0, 0, 500, 1000, 1500])[1 + floor(random() * 5)::int],
+        'Customer ' || g,
+        '+7702' || lpad((g % 10000000)::text, 7, '0'),
+        CASE WHEN random() > 0.05 THEN
+            (ARRAY['Алматы', 'Астана', 'Шымкент', 'Караганда', 'Актобе'])[1 + floor(random() * 5)::int]
+            || ', ул. Абая, д. ' || (g % 200)
+        END,
+        (ARRAY['DELIVERY_PICKUP', 'DELIVERY_LOCAL', 'DELIVERY_REGIONAL_TODOOR',
+               'DELIVERY_REGIONAL_PICKUP'])[1 + floor(random() * 4)::int],
+        (ARRAY['PREPAID', 'PREPAID', 'PAY_WITH_CREDIT'])[1 + floor(random() * 3)::int],
+        NOW() - random() * interval '120 days'
+    FROM generate_series(1, $1) g,
+         (SELECT array_agg(id) AS ids, count(*)::int AS n FROM kaspi_stores) s
+"""
+
+ORDER_ITEMS_SQL = """
+    INSERT INTO order_items (order_id, product_id, kaspi_product_id, name, sku, quantity, price)
+    SELECT o.id, p.id, p.kaspi_sku, p.name, p.kaspi_sku, 1 + floor(random() * 3)::int, p.price
+    FROM orders o
+    CROSS JOIN LATERAL generate_series(1, 1 + (hashtext(o.id::text) & 3)) i
+    LEFT JOIN LATERAL (
+        SELECT id, kaspi_sku, name, price FROM products
+        WHERE store_id = o.store_id
+        OFFSET (abs(hashtext(o.id::text || i)) % $1) LIMIT 1
+    ) p ON true
+"""
+
+EXCLUDED = "('" + "', '".join(CANCELLED_STATUSES) + "')"
+
+# Orders-table queries of 20260301150000, served before the rollups
+# (parameters: $1 store_id, $2 period start timestamp)
+ORDERS_QUERIES = {
+    "stats": [(f"""
+        SELECT
+            COUNT(*) FILTER (WHERE order_date >= CURRENT_DATE) as today_orders,
+            COALESCE(SUM(total_price) FILTER (WHERE order_date >= CURRENT_DATE), 0) as today_revenue,
+            (
+                SELECT COALESCE(SUM(oi.quantity), 0)
+                FROM orders today
+                JOIN order_items oi ON oi.order_id = today.id
+                WHERE today.store_id = $1
+                    AND today.order_date >= CURRENT_DATE
+                    AND today.status NOT IN {EXCLUDED}
+            ) as today_items_sold,
+            COUNT(*) FILTER (WHERE order_date >= NOW() - INTERVAL '7 days') as week_orders,
+            COALESCE(SUM(total_price) FILTER (WHERE order_date >= NOW() - INTERVAL '7 days'), 0) as week_revenue,
+            COUNT(*) FILTER (WHERE order_date >= NOW() - INTERVAL '30 days') as month_orders,
+            COALESCE(SUM(total_price) FILTER (WHERE order_date >= NOW() - INTERVAL '30 days'), 0) as month_revenue,
+            COUNT(*) as total_orders,
+            COALESCE(SUM(total_price), 0) as total_revenue
+        FROM orders
+        WHERE store_id = $1 AND status NOT IN {EXCLUDED}
+    """, ("store_id",))],
+    "analytics": [(f"""
+        WITH period_orders AS (
+            SELECT id, DATE(order_date) as date, total_price
+            FROM orders
+            WHERE store_id = $1 AND order_date >= $2 AND status NOT IN {EXCLUDED}
+        ),
+        daily_items AS (
+            SELECT po.date, SUM(oi.quantity) as items
+            FROM period_orders po
+            JOIN order_items oi ON oi.order_id = po.id
+            GROUP BY po.date
+        )
+        SELECT d.date, d.orders, d.revenue, COALESCE(i.items, 0) as items
+        FROM (
+            SELECT date, COUNT(*) as orders, COALESCE(SUM(total_price), 0) as revenue
+            FROM period_orders
+            GROUP BY date
+        ) d
+        LEFT JOIN daily_items i ON i.date = d.date
+        ORDER BY d.date ASC
+    """, ("store_id", "start_ts"))],
+    "top_products": [(f"""
+        SELECT
+            COALESCE(p.id, oi.product_id) as id,
+            COALESCE(p.kaspi_sku, oi.sku) as kaspi_sku,
+            COALESCE(p.name, oi.name) as name,
+            COALESCE(p.price, 0) as current_price,
+            SUM(oi.quantity) as sales_count,
+            SUM(oi.quantity * oi.price) as revenue
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        LEFT JOIN products p ON p.id = oi.product_id
+        WHERE o.store_id = $1 AND o.order_date >= $2 AND o.status NOT IN {EXCLUDED}
+        GROUP BY COALESCE(p.id, oi.product_id), COALESCE(p.kaspi_sku, oi.sku),
+                 COALESCE(p.name, oi.name), COALESCE(p.price, 0)
+        ORDER BY sales_count DESC
+        LIMIT 10
+    """, ("store_id", "start_ts"))],
+    "breakdowns": [(f"""
+        WITH period_orders AS (
+            SELECT
+                payment_mode,
+                delivery_mode,
+                TRIM(SPLIT_PART(NULLIF(delivery_address, ''), ',', 1)) as city,
+                total_price,
+                delivery_cost
+            FROM orders
+            WHERE store_id = $1 AND order_date >= $2 AND status NOT IN {EXCLUDED}
+        )
+        SELECT
+            GROUPING(payment_mode, delivery_mode, city) as grouping_set,
+            payment_mode, delivery_mode, city,
+            COUNT(*) as cnt,
+            COALESCE(SUM(total_price), 0) as rev,
+            COALESCE(SUM(delivery_cost), 0) as delivery_cost
+        FROM period_orders
+        GROUP BY GROUPING SETS ((payment_mode), (delivery_mode), (city), ())
+        ORDER BY grouping_set, cnt DESC
+    """, ("store_id", "start_ts"))],
+}
+
+# What the endpoints in app/routers/kaspi.py read now
+# (parameters: $1 store_id, $2 first day of the period)
+ROLLUP_QUERIES = {
+    "stats": [("""
+        SELECT
+            COALESCE(SUM(orders) FILTER (WHERE date = CURRENT_DATE), 0) as today_orders,
+            COALESCE(SUM(revenue) FILTER (WHERE date = CURRENT_DATE), 0)::bigint as today_revenue,
+            COALESCE(SUM(items) FILTER (WHERE date = CURRENT_DATE), 0) as today_items_sold,
+            COALESCE(SUM(orders) FILTER (WHERE date > CURRENT_DATE - 7), 0) as week_orders,
+            COALESCE(SUM(revenue) FILTER (WHERE date > CURRENT_DATE - 7), 0)::bigint as week_revenue,
+            COALESCE(SUM(orders) FILTER (WHERE date > CURRENT_DATE - 30), 0) as month_orders,
+            COALESCE(SUM(revenue) FILTER (WHERE date > CURRENT_DATE - 30), 0)::bigint as month_revenue,
+            COALESCE(SUM(orders), 0) as total_orders,
+            COALESCE(SUM(revenue), 0)::bigint as total_revenue
+        FROM store_daily_sales
+        WHERE store_id = $1
+    """, ("store_id",))],
+    "analytics": [("""
+        SELECT date, orders, revenue, items
+        FROM store_daily_sales
+        WHERE store_id = $1 AND date >= $2
+        ORDER BY date ASC
+    """, ("store_id", "start_date"))],
+    "top_products": [("""
+        SELECT
+            COALESCE(p.id, t.product_id) as id,
+            COALESCE(p.kaspi_sku, t.sku) as kaspi_sku,
+            COALESCE(p.name, t.name) as name,
+            COALESCE(p.price, 0) as current_price,
+            t.sales_count,
+            t.revenue
+        FROM (
+            SELECT
+                product_key,
+                product_id,
+                MAX(sku) as sku,
+                MAX(name) as name,
+                SUM(quantity) as sales_count,
+                SUM(revenue)::bigint as revenue
+            FROM store_daily_product_sales
+            WHERE store_id = $1 AND date >= $2
+            GROUP BY product_key, product_id
+            ORDER BY sales_count DESC
+            LIMIT 10
+        ) t
+        LEFT JOIN products p ON p.id = t.product_id
+        ORDER BY t.sales_count DESC
+    """, ("store_id", "start_date"))],
+    "breakdowns": [
+        ("""
+        SELECT dimension, key, SUM(orders) as cnt, SUM(revenue)::bigint as rev
+        FROM store_daily_order_breakdowns
+        WHERE store_id = $1 AND date >= $2
+        GROUP BY dimension, key
+        ORDER BY cnt DESC
+        """, ("store_id", "start_date")),
+        ("""
+        SELECT COALESCE(SUM(delivery_cost), 0)::bigint
+        FROM store_daily_sales
+        WHERE store_id = $1 AND date >= $2
+        """, ("store_id", "start_date")),
+    ],
+}
+
+# Order days touched by one sync batch: a quiet cycle, a busy one, a full resync
+REFRESH_DAYS = (1, 3, 14)
+
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def time_queries(conn, queries, samples) -> dict:
+    """{name: [ms per sample]}; multi-statement entries are summed (one endpoint call)."""
+    timings = {}
+    for name, statements in queries.items():
+        timings[name] = []
+        for sample in samples:
+            started = time.perf_counter()
+            for sql, params in statements:
+                await conn.fetch(sql, *(sample[param] for param in params))
+            timings[name].append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def time_refreshes(conn, samples) -> dict:
+    """{days touched: [ms per refresh]}; each refresh is rolled back."""
+    timings = {}
+    today = datetime.utcnow().date()
+    for days in REFRESH_DAYS:
+        timings[days] = []
+        dates = [today - timedelta(days=i) for i in range(days)]
+        for sample in samples:
+            tr = conn.transaction()
+            await tr.start()
+            try:
+                started = time.perf_counter()
+                await refresh_sales_rollups(conn, sample["store_id"], dates)
+                timings[days].append((time.perf_counter() - started) * 1000)
+            finally:
+                await tr.rollback()
+    return timings
+
+
+async def backfill_rollups(conn):
+    """Build every store's rollups with the sync's own refresh."""
+    rows = await conn.fetch(
+        "SELECT store_id, array_agg(DISTINCT DATE(order_date)) AS days FROM orders GROUP BY store_id"
+    )
+    for row in rows:
+        await refresh_sales_rollups(conn, row["store_id"], row["days"])
+
+
+async def main(args):
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL не найден")
+        return 1
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        await conn.execute(f"SET search_path TO {SCHEMA}, public")
+        await conn.execute(SCHEMA_SQL)
+
+        started = time.monotonic()
+        await conn.execute(STORES_SQL, args.stores)
+        await conn.execute(PRODUCTS_SQL, args.products_per_store)
+        await conn.execute(ORDERS_SQL, args.orders)
+        await conn.execute(ORDER_ITEMS_SQL, args.products_per_store)
+        items = await conn.fetchval("SELECT count(*) FROM order_items")
+        print(f"[BENCH] Seeded {args.orders} orders / {items} items / {args.stores} stores "
+              f"in {time.monotonic() - started:.1f}s")
+
+        started = time.monotonic()
+        await backfill_rollups(conn)
+        await conn.execute("VACUUM ANALYZE")
+        days = await conn.fetchval("SELECT count(*) FROM store_daily_sales")
+        print(f"[BENCH] Rollups of {days} store-days built in {time.monotonic() - started:.1f}s")
+
+        rng = random.Random(args.seed)
+        rows = await conn.fetch(
+            "SELECT store_id FROM orders TABLESAMPLE SYSTEM (1) LIMIT $1",
+            args.runs,
+        )
+        samples = []
+        for row in rows:
+            period = rng.choice([7, 30, 90])
+            samples.append({
+                "store_id": row["store_id"],
+                "start_ts": datetime.utcnow() - timedelta(days=period),
+                "start_date": (datetime.utcnow() - timedelta(days=period - 1)).date(),
+            })
+
+        # Warm-up, then measure
+        await time_queries(conn, ORDERS_QUERIES, samples[:3])
+        orders = await time_queries(conn, ORDERS_QUERIES, samples)
+        await time_queries(conn, ROLLUP_QUERIES, samples[:3])
+        rollups = await time_queries(conn, ROLLUP_QUERIES, samples)
+        await time_refreshes(conn, samples[:3])
+        refreshes = await time_refreshes(conn, samples)
+
+        print(f"\n[BENCH] Endpoint reads over {len(samples)} random stores (ms)")
+        print(f"  {'query':<15}{'orders p50':>12}{'orders p95':>12}{'rollup p50':>12}{'rollup p95':>12}")
+        for name in ROLLUP_QUERIES:
+            print(
+                f"  {name:<15}"
+                f"{percentile(orders[name], 50):>12.1f}{percentile(orders[name], 95):>12.1f}"
+                f"{percentile(rollups[name], 50):>12.1f}{percentile(rollups[name], 95):>12.1f}"
+            )
+
+        print("\n[BENCH] refresh_sales_rollups per sync_orders_to_db transaction (ms)")
+        print(f"  {'days touched':<15}{'p50':>12}{'p95':>12}")
+        for days in REFRESH_DAYS:
+            print(f"  {days:<15}{percentile(refreshes[days], 50):>12.1f}{percentile(refreshes[days], 95):>12.1f}")
+        return 0
+    finally:
+        if not args.keep:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store analytics read / rollup refresh latency benchmark")
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--stores", type=int, default=500)
+    parser.add_argument("--products-per-store", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=50, help="Random stores sampled per query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch schema")
+    sys.exit(asyncio.run(main(parser.parse_args())))
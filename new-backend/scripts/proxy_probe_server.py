@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for pool proxies, for testing the proxy health prober.
+
+Listens on one port per simulated proxy and answers every proxied request
+itself (no upstream): 204 after the configured delay, or 502 with the
+configured probability. Point the prober at an http:// URL (https probes
+need CONNECT, which is refused) and register the ports as proxies:
+
+    python scripts/proxy_probe_server.py --proxy 8901 --proxy 8902:800 --proxy 8903:0:1
+    PROXY_PROBE_URL=http://probe.test/ uvicorn app.main:app
+
+    INSERT INTO proxies (host, port, protocol) VALUES
+        ('127.0.0.1', 8901, 'http'), ('127.0.0.1', 8902, 'http'), ('127.0.0.1', 8903, 'http');
+
+Format of --proxy: PORT[:DELAY_MS[:FAIL_RATE]] (fail rate 0..1). The example
+gives one fast, one slow (p95 800 ms) and one broken proxy.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+
+
+def parse_proxy(value: str) -> tuple:
+    parts = value.split(":")
+    try:
+        port = int(parts[0])
+        delay_ms = float(parts[1]) if len(parts) > 1 else 0.0
+        fail_rate = float(parts[2]) if len(parts) > 2 else 0.0
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected PORT[:DELAY_MS[:FAIL_RATE]], got {value!r}")
+    return port, delay_ms, fail_rate
+
+
+def make_handler(port: int, delay_ms: float, fail_rate: float):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                # Headers (the prober sends no body)
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+
+                method = request_line.split(b" ", 1)[0]
+                if method == b"CONNECT":
+                    status = "405 Method Not Allowed"
+                else:
+                    await asyncio.sleep(delay_ms / 1000)
+                    status = "502 Bad Gateway" if random.random() < fail_rate else "204 No Content"
+
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n\r\n".encode())
+                await writer.drain()
+                print(f"  :{port} {request_line.decode(errors='replace').strip()} -> {status}", flush=True)
+                if method == b"CONNECT":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def main(args) -> int:
+    servers = []
+    for port, delay_ms, fail_rate in args.proxy:
+        server = await asyncio.start_server(make_handler(port, delay_ms, fail_rate), args.host, port)
+        servers.append(server)
+        print(f"[PROBE_SERVER] {args.host}:{port} delay {delay_ms:.0f} ms, fail rate {fail_rate:.0%}")
+
+    print("[PROBE_SERVER] Ready (Ctrl+C to stop)")
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in proxies for the proxy health prober")
+    parser.add_argument(
+        "--proxy", type=parse_proxy, action="append", required=True,
+        help="PORT[:DELAY_MS[:FAIL_RATE]], repeat for several proxies",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    try:
+        sys.exit(asyncio.run(main(parser.parse_args())))
+    except KeyboardInterrupt:
+        sys.exit(0)